@@ -0,0 +1,96 @@
+# Copyright 2018 SuperDARN Canada
+#
+# imfcache.py
+"""
+Process safe cache of the IMF files made from the OMNI data.
+
+Several ConvectionMaps of the same date (hemispheres, integration times,
+data sources) keep the OMNI and IMF files of the date in the same path. The
+fetch of a date runs under a lock file of the date: exactly one process
+checks the OMNI file for updates, archives the outdated file, downloads and
+converts, the others wait for the lock and then find the result up to date.
+The OMNI and IMF files are written under temporary names and renamed, so a
+reader never sees a partial file.
+"""
+
+import os
+import shutil
+import logging
+
+from datetime import datetime
+
+from DARNprocessing.IMF_scripts.omni import Omni
+from DARNprocessing.utils.filelock import FileLock
+from DARNprocessing.utils.convectionMapConstants import OmniConst
+from DARNprocessing.utils.convectionMapWarnings import OmniFileNotFoundWarning
+
+logger = logging.getLogger(__name__)
+
+
+class IMFCache():
+    """
+    IMF files of the dates fetched into a path.
+
+        :param path: directory of the OMNI and IMF files
+        :param lock_timeout: seconds to wait for another process fetching
+                             the same date, None waits forever
+    """
+    LOCK_EXT = '.lock'
+
+    def __init__(self, path, lock_timeout=OmniConst.LOCK_TIMEOUT):
+        self.path = path
+        self.lock_timeout = lock_timeout
+
+    def lock_path(self, date):
+        """
+        :return: path of the lock file of a date
+        """
+        return os.path.join(self.path,
+                            ".{date}_omni{ext}".format(date=date,
+                                                       ext=self.LOCK_EXT))
+
+    def _archive(self, omni, archive_date):
+        """
+        Moves an outdated OMNI file aside, named after the archive date.
+        """
+        old_omni_file = "{path}/{date}_omni_{currentdate}.txt"\
+                        "".format(path=self.path, date=omni.date,
+                                  currentdate=archive_date.strftime("%Y%m%d"))
+        try:
+            shutil.move(omni.omni_path, old_omni_file)
+        except IOError as err:
+            logger.exception(err)
+
+    def imf_file(self, date, archive_date=None):
+        """
+        Gets the IMF file of a date, downloading and converting the OMNI data
+        when the OMNI file is missing or outdated.
+
+            :param date: str date YYYYMMDD
+            :param archive_date: datetime the outdated OMNI files are named
+                                 after, default now
+            :return: str path of the IMF file
+            :raise OmniException: the OMNI website could not be queried
+            :raise OmniFileNotGeneratedWarning: the download failed
+            :raise OmniBadDataWarning: the OMNI data has no good values
+            :raise LockTimeoutException: another process held the date for
+                                         longer than the lock timeout
+        """
+        omni = Omni(date, self.path)
+        with FileLock(self.lock_path(date), self.lock_timeout):
+            try:
+                update = omni.check_for_updates()
+            except OmniFileNotFoundWarning as warning_msg:
+                logger.info(warning_msg)
+                update = None
+
+            if update is False and os.path.exists(omni.imf_path):
+                # up to date, possibly fetched by another process while
+                # this one waited for the lock
+                return omni.imf_path
+            if update:
+                self._archive(omni, archive_date or datetime.now())
+            if update is not False:
+                omni.get_omni_file()
+            omni.omnifile_to_IMFfile()
+            return omni.imf_path
@@ -8,7 +8,9 @@
 # 2018-01-26
 
 import os
+import time
 import logging
+import threading
 from datetime import datetime, timedelta
 from subprocess import check_output, call, CalledProcessError
 
@@ -16,6 +18,15 @@ from DARNprocessing.utils.convectionMapWarnings import (OmniBadDataWarning,
                                                         OmniFileNotFoundWarning,
                                                         OmniFileNotGeneratedWarning)
 from DARNprocessing.utils.convectionMapExceptions import OmniException
+from DARNprocessing.utils.convectionMapConstants import OmniConst
+from DARNprocessing.utils.filelock import atomic_output
+
+logger = logging.getLogger(__name__)
+
+# OMNI data availability date and when it was fetched, shared by the runs of
+# a long running process (see OmniConst.AVAILABILITY_TTL)
+_availability = {'date': None, 'time': 0.0}
+_availability_lock = threading.Lock()
 
 
 class Omni():
@@ -26,13 +37,9 @@ class Omni():
 
     def __init__(self, date, omni_path):
 
-        if not logging:
-            logfile = date + "_omni.log"
-            logging.basicConfig(logfile, level=logging.DEBUG)
-        else:
-            logging.info("*"*30)
-            logging.info("Omni Class")
-            logging.info("*"*30)
+        logger.info("*"*30)
+        logger.info("Omni Class")
+        logger.info("*"*30)
 
         self.date = date
         self.omni_filename = "{}_omni.txt".format(self.date)
@@ -41,9 +48,9 @@ class Omni():
                                                     filename=self.omni_filename)
         self.imf_path = "{path}/{filename}".format(path=omni_path,
                                                    filename=self.imf_filename)
-        logging.info("File names:")
-        logging.info(self.omni_filename)
-        logging.info(self.imf_filename)
+        logger.info("File names:")
+        logger.info(self.omni_filename)
+        logger.info(self.imf_filename)
 
         self.start_time = str(date) + " 00:00"
         omni_start_datetime = datetime.strptime(self.start_time, "%Y%m%d %H:%M") -\
@@ -57,6 +64,11 @@ class Omni():
             :retun datetime: retruns a datetime object that is the current
                              data avialability date.
         """
+        with _availability_lock:
+            if _availability['date'] is not None and \
+               time.time() - _availability['time'] < OmniConst.AVAILABILITY_TTL:
+                return _availability['date']
+
         omni_date = datetime.strptime(self.start_time, "%Y%m%d %H:%M")
         omni_year = omni_date.strftime("%Y")
 
@@ -64,17 +76,22 @@ class Omni():
         # by looking for the most recent year 1963 in their database and IMF
         # label.
         curl_command = "curl https://omniweb.gsfc.nasa.gov/html/ow_data.html 2>/dev/null | grep '1963.*IMF' "
-        logging.info(curl_command)
+        logger.info(curl_command)
 
         try:
             omni_update_time = check_output(curl_command, shell=True)
         except CalledProcessError as e:
-            logging.warn("could not get the date the"
+            logger.warning("could not get the date the"
                          " last time the file was updated")
             raise OmniException(e)
 
         # returns the omni updated time as a datetime object
-        return datetime.strptime(omni_update_time.split(" ")[3],"%Y-%m-%d")
+        availability_date = datetime.strptime(omni_update_time.decode().split(" ")[3],
+                                              "%Y-%m-%d")
+        with _availability_lock:
+            _availability.update({'date': availability_date,
+                                  'time': time.time()})
+        return availability_date
 
     def check_for_updates(self, omni_filename=None):
         """
@@ -85,21 +102,16 @@ class Omni():
         Returns true if the omni file on the website has been updated since
         the last download.
         """
-        logging.info("Checking for updats on the omni file")
-        if omni_filename:
-            self.omni_filename = omni_filename
-
-        omni_file_path = "{omnipath}/{omnifile}"\
-                         "".format(omnipath=self.omni_path,
-                                   omnifile=self.omni_filename)
+        logger.info("Checking for updats on the omni file")
+        omni_file_path = self._omni_file_path(omni_filename)
 
         if not os.path.isfile(omni_file_path):
-            raise OmniFileNotFoundWarning(omni_filename)
+            raise OmniFileNotFoundWarning(self.omni_filename)
 
         try:
             omni_modified_date = self.get_data_avialability()
         except OmniException as e:
-            logging.warning("Exception from get_update_omni_date {}".format(e))
+            logger.warning("Exception from get_update_omni_date {}".format(e))
             return False
 
         local_omni_modified_date = datetime.fromtimestamp(
@@ -112,11 +124,23 @@ class Omni():
         else:
             return True
 
+    def _omni_file_path(self, omni_filename=None):
+        """
+        :param omni_filename: name of an omni file in the omni path, None
+                              for the omni file of the date
+        :return: path of the omni file
+        """
+        if omni_filename:
+            self.omni_filename = omni_filename
+            return os.path.join(os.path.dirname(self.omni_path),
+                                omni_filename)
+        return self.omni_path
+
     def get_omni_file(self):
         """
         Downloads the omni file for the given date.
         """
-        logging.info("get_omni_file")
+        logger.info("get_omni_file")
         curl_command = 'curl -d  '\
                        '"activity=ftp&res=min&spacecraft=omni_min&'\
                        'start_date={start_time}&end_date={date}23&vars=13&'\
@@ -126,7 +150,7 @@ class Omni():
                        ' | grep -oh http.*.lst'.format(start_time=self.omni_start_time,
                                                        date=self.date)
 
-        logging.info(curl_command)
+        logger.info(curl_command)
         # I am aware that using shell=True on a subprocess method is
         # a security risk, however, to get the curl command to work
         # I have to use shell=True
@@ -142,39 +166,36 @@ class Omni():
             omnifile_url = str(omnifile_url).replace('http', 'https')
         omnifile_url = omnifile_url.strip("b'")
         omnifile_url = omnifile_url.strip("\\n'")
-        download_file_command = "curl -o {omni_file}"\
-                " {link}".format(link=omnifile_url,
-                                 omni_file=self.omni_path)
-        logging.info(download_file_command)
-
-        try:
-            call(download_file_command.split())
-        except CalledProcessError as e:
-            raise OmniFileNotGeneratedWarning(self.omni_filename,
-                                              self.date)
-
-        if (not os.path.isfile(self.omni_path) and
-           os.path.getsize(self.omni_path) < 0):
-            raise OmniFileNotGeneratedWarning(self.omni_filename,
-                                              self.date)
+        # downloaded under a temporary name, the omni file only appears
+        # once it is complete
+        with atomic_output(self.omni_path) as tmp_path:
+            download_file_command = "curl -o {omni_file}"\
+                    " {link}".format(link=omnifile_url,
+                                     omni_file=tmp_path)
+            logger.info(download_file_command)
+
+            if call(download_file_command.split()) != 0 or \
+               not os.path.isfile(tmp_path) or \
+               os.path.getsize(tmp_path) == 0:
+                raise OmniFileNotGeneratedWarning(self.omni_filename,
+                                                  self.date)
 
     def omnifile_to_IMFfile(self, omni_filename=None):
         """
         Parses the omni file into a IMF file format such that the RST code can
         use it the convection map process.
         """
-        logging.info("omnifile to IMFfile")
-        if omni_filename:
-            self.omni_filename = omni_filename
+        logger.info("omnifile to IMFfile")
+        omni_file_path = self._omni_file_path(omni_filename)
 
         try:
-            with open(self.omni_path, 'r') as omni_file:
+            with open(omni_file_path, 'r') as omni_file:
                 omni_data_list = omni_file.read().splitlines()
         except (IOError, NameError):
             raise OmniFileNotFoundWarning(self.omni_filename)
 
         # TODO: implement a scheme to parse out solar wind when included in the omni data
-        imf_file = open(self.imf_path, 'w')
+        imf_lines = []
         bad_data_counter = 0
 
         #  Generate the IMF file from the omni data
@@ -199,13 +220,16 @@ class Omni():
                                                  minute=omni_minute,
                                                  hour=omni_hour, Bx=omni_Bx,
                                                  By=omni_By, Bz=omni_Bz)
-            imf_file.write(imf_line)
+            imf_lines.append(imf_line)
             if float(omni_BM) > 999.0:
                 bad_data_counter = bad_data_counter + 1
-        imf_file.close()
         if bad_data_counter == len(omni_data_list):
-            os.remove(self.imf_path)
+            if os.path.exists(self.imf_path):
+                os.remove(self.imf_path)
             raise OmniBadDataWarning(self.date)
+        with atomic_output(self.imf_path) as tmp_path:
+            with open(tmp_path, 'w') as imf_file:
+                imf_file.writelines(imf_lines)
 
 
 if __name__ == '__main__':
@@ -13,9 +13,13 @@ import logging
 import shutil
 import os
 import re
+import shlex
+import threading
+import contextvars
 
 from datetime import datetime
-from subprocess import call, check_output, CalledProcessError
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from glob import glob
 
 from DARNprocessing.utils.utils import (file_exists,
@@ -25,9 +29,16 @@ from DARNprocessing.utils.utils import (file_exists,
 
 from DARNprocessing.utils.convectionMapConstants import (NorthRadar,
                                                          SouthRadar,
-                                                         CanadianRadar,
                                                          RstConst,
-                                                         RadarConst)
+                                                         RadarConst,
+                                                         CacheConst,
+                                                         PlotConst,
+                                                         ExecutorConst,
+                                                         MapFitConst,
+                                                         MapChainConst,
+                                                         CombineConst,
+                                                         CompressionConst,
+                                                         ValidateConst)
 
 from DARNprocessing.utils.convectionMapWarnings import (ConvertWarning,
                                                         OmniFileNotFoundWarning,
@@ -40,10 +51,50 @@ from DARNprocessing.utils.convectionMapExceptions import (NoGridFilesException,
                                                           RSTException,
                                                           FileDoesNotExistException,
                                                           RSTFileEmptyException,
+                                                          RSTTimeoutException,
                                                           PathDoesNotExistException,
+                                                          LockTimeoutException,
                                                           UnsupportedTypeException)
 
-from DARNprocessing.IMF_scripts.omni import Omni
+from DARNprocessing.utils.filecache import (FileCache,
+                                            file_fingerprint,
+                                            content_fingerprint)
+from DARNprocessing.utils.bzip2 import decompress_parallel
+from DARNprocessing.utils.scheduler import Scheduler, CPU, IO, WAIT
+from DARNprocessing.utils.executor import Command, DEVNULL, make_executor
+from DARNprocessing.utils.raster import pnm_to_png, RasterFormatError
+from DARNprocessing.utils.dirindex import directory_index
+from DARNprocessing.utils.gridmerge import GridCombiner, merge_grid_files
+from DARNprocessing.utils.demux import demultiplex
+from DARNprocessing.utils.dmap import DmapFormatError
+from DARNprocessing.utils.validate import Quarantine, validate_dmap
+from DARNprocessing.utils.radars import RadarRegistry, RadarKey
+from DARNprocessing.utils.compression import (check_compression,
+                                              compress_file,
+                                              decompress_file,
+                                              compressed_variants)
+from DARNprocessing.utils.manifest import RunManifest
+from DARNprocessing.utils.profiling import Profiler
+from DARNprocessing.utils.runlog import (RadarStatus,
+                                         log_context,
+                                         new_run_id,
+                                         register_run,
+                                         unregister_run,
+                                         flush_logs,
+                                         with_run_context)
+from DARNprocessing.IMF_scripts.imfcache import IMFCache
+
+logger = logging.getLogger(__name__)
+
+# parameters holding paths, resolved against the working path
+PATH_PARAMETERS = ['logpath', 'data_path', 'plot_path', 'map_path',
+                   'grid_path', 'imf_path', 'key_path', 'cache_path',
+                   'stage_cache_path', 'export_path']
+
+# integration time (resolution) of the steps run in the current context, see
+# ConvectionMaps._resolution
+_resolution = contextvars.ContextVar('DARNprocessing_resolution',
+                                     default=None)
 
 
 class ConvectionMaps():
@@ -64,7 +115,7 @@ class ConvectionMaps():
     * Currently not implemented *
     """
 
-    def __init__(self, arguements=None, parameters=None):
+    def __init__(self, arguements=None, parameters=None, working_path=None):
         """
         Reads in user command line options and parses them to correct member
         fields.
@@ -72,6 +123,9 @@ class ConvectionMaps():
         :param arguements: sys.args from command line
         :param parameters: Dictionary of the command line arguements; used for testing or
                python scripts
+        :param working_path: directory the default and relative paths are
+               in and the RST commands run in, None for the current
+               directory; used by the daemon running jobs of other processes
                 key name: defualt value
                 -----------------------
                 'date': None,
@@ -80,47 +134,98 @@ class ConvectionMaps():
                 'start_time': '00:00',
                 'end_time': 23:59,
                 'image_ext': 'pdf',
-                'integration_time': 120,
+                'integration_time': 120 or a list of integration times,
                 'data_path': self._current_path,
                 'plot_path': self._current_path,
                 'map_path': self._current_path,
                 'grid_path': self._current_path,
                 'imf_path': self._current_path,
                 'key_path': self._current_path,
-                'num_proc': 1
+                'cache_path': None,
+                'cache_size': 10240,
+                'num_proc': 1,
+                'io_slots': 2,
+                'resume': False,
+                'profile': False,
+                'profile_prefix': None,
+                'executor': 'local',
+                'batch_submit': 'sbatch --parsable',
+                'batch_status': 'squeue -h -j',
+                'timeout': None,
+                'stage_timeouts': {'make_grid': 3600, ...},
+                'stall_timeout': 1800,
+                'fit_order': 8,
+                'map_grd_options': '-l 50',
+                'map_addimf_options': '-d 00:10',
+                'map_addmodel_options': '-d l',
+                'stage_cache_path': None,
+                'stage_cache_size': 2048,
+                'export_path': None,
+                'grid_combiner': 'rst',
+                'compression': None,
+                'compression_level': None,
+                'compression_threads': 2
 
         :raise ValueError: date parameter is required
 
         """
 
         self._current_date = datetime.now()
-        self._current_path = os.getcwd()
+        self._current_path = working_path or os.getcwd()
+
+        self.parameter = {'date': None,
+                          'channel': 5,
+                          'integration_time': 120,
+                          'hemisphere': 'north',
+                          'start_time': '00:00',
+                          'end_time': '23:59',
+                          'rst_version': 4.1,
+                          'image_ext': 'pdf',
+                          'logpath': self._current_path,
+                          'data_path': self._current_path,
+                          'plot_path': self._current_path,
+                          'map_path': self._current_path,
+                          'grid_path': self._current_path,
+                          'imf_path': self._current_path,
+                          'key_path': self._current_path,
+                          'cache_path': None,
+                          'cache_size': CacheConst.SIZE,
+                          'num_proc': 1,
+                          'io_slots': 2,
+                          'resume': False,
+                          'profile': False,
+                          'profile_prefix': None,
+                          'executor': 'local',
+                          'batch_submit': ExecutorConst.BATCH_SUBMIT,
+                          'batch_status': ExecutorConst.BATCH_STATUS,
+                          'timeout': ExecutorConst.TIMEOUT,
+                          'stage_timeouts': {},
+                          'stall_timeout': ExecutorConst.STALL_TIMEOUT,
+                          'fit_order': MapFitConst.ORDER,
+                          'map_grd_options': MapChainConst.GRD_OPTIONS,
+                          'map_addimf_options': MapChainConst.IMF_OPTIONS,
+                          'map_addmodel_options': MapChainConst.MODEL_OPTIONS,
+                          'stage_cache_path': None,
+                          'stage_cache_size': CacheConst.STAGE_SIZE,
+                          'export_path': None,
+                          'grid_combiner': 'rst',
+                          'compression': None,
+                          'compression_level': None,
+                          'compression_threads': CompressionConst.THREADS}
 
         if not parameters:
             self.arguement_parser(arguements)
         else:
-            self.parameter = {'date': None,
-                              'channel': 5,
-                              'integration_time': 120,
-                              'hemisphere': 'north',
-                              'start_time': '00:00',
-                              'end_time': '23:59',
-                              'rst_version': 4.1,
-                              'image_ext': 'pdf',
-                              'logpath': self._current_path,
-                              'data_path': self._current_path,
-                              'plot_path': self._current_path,
-                              'map_path': self._current_path,
-                              'grid_path': self._current_path,
-                              'imf_path': self._current_path,
-                              'key_path': self._current_path,
-                              'num_proc': 1}
-
             self.parameter.update(parameters)
             # Required field
             if not self.parameter['date']:
                 raise ValueError("Date of the date was not passed in, please"
                                  "include in the parameters dictionary")
+
+        for key in PATH_PARAMETERS:
+            path = self.parameter[key]
+            if path and not os.path.isabs(path):
+                self.parameter[key] = os.path.join(self._current_path, path)
         
         if self.parameter['hemisphere'] == 'north':
             hemisphere_identifier = 'n'
@@ -135,16 +240,23 @@ class ConvectionMaps():
         # check if the data path exists otherwise we cannot porceed.
         path_exists(self.parameter['data_path'])
 
+        # several integration times share the data files, their decompression
+        # and channel split, then each is gridded and mapped on its own
+        self.integration_times = self._parse_integration_times(self.parameter['integration_time'])
+
         # the possible letter channels that a fitted file names can contain
         # that pertains to the stero channel value. Most used by alaskian radars.
         self.channel = ['', 'a', 'b', 'c', 'd']
 
-        # Logging information setup
-        FORMAT = "%(levelname)s %(asctime)-15s: %(message)s"
-        logging.basicConfig(filename=self.parameter['logfile'],
-                            format=FORMAT,
-                            level=logging.DEBUG)
-        logging.info("Parameter list:" + str(self.parameter))
+        # Logging information setup, the records of this instance (and of
+        # its tasks on other threads) go to its own log file
+        self.run_id = new_run_id()
+        self._log_fields = {'run': self.run_id,
+                            'date': self.parameter['date'],
+                            'hemisphere': self.parameter['hemisphere']}
+        register_run(self.run_id, self.parameter['logfile'])
+        with log_context(**self._log_fields):
+            logger.info("Parameter list:" + str(self.parameter))
 
         # Generate map path and plot path if they do not exist
         self._generate_paths()
@@ -154,16 +266,89 @@ class ConvectionMaps():
 
         # Logging information on radars used, missing and ones the gave errors
         # during gridding process
-        self.radars_used = "Radar files uses in the Convection Map process:\n"
-        self.radars_missing = "Radar files missing"\
-                              " (not used in the Convection Map process):\n"
-        self.radars_errors = "Radars files that raised errors:\n"
+        self.radar_status = RadarStatus()
 
         if self.parameter['hemisphere'] == 'south':
             self.hem_ext = 's'
         else:
             self.hem_ext = 'n'
 
+        # Completed stages are recorded so a failed run can be resumed
+        manifest_path = "{plot_path}/{date}.{hemisphere}.manifest.json"\
+                        "".format(plot_path=self.parameter['plot_path'],
+                                  date=self.parameter['date'],
+                                  hemisphere=self.hem_ext)
+        self.manifest = RunManifest(manifest_path,
+                                    load=self.parameter['resume'])
+
+        # Corrupt data files are listed with the reason in the map path and
+        # skipped by later runs until they change
+        quarantine_path = "{map_path}/{date}.{hemisphere}.{ext}"\
+                          "".format(map_path=self.parameter['map_path'],
+                                    date=self.parameter['date'],
+                                    hemisphere=self.hem_ext,
+                                    ext=ValidateConst.QUARANTINE_EXT)
+        self.quarantine = Quarantine(quarantine_path)
+
+        # resolves every data file to one radar (site and channel)
+        self.radar_registry = RadarRegistry(self.parameter['hemisphere'])
+
+        # Profiling of the orchestration, a profile prefix implies profiling
+        self.profiler = None
+        if self.parameter['profile'] or self.parameter['profile_prefix']:
+            profile_prefix = self.parameter['profile_prefix']
+            if profile_prefix is None:
+                profile_prefix = "{plot_path}/{date}.{hemisphere}.profile"\
+                                 "".format(plot_path=self.parameter['plot_path'],
+                                           date=self.parameter['date'],
+                                           hemisphere=self.hem_ext)
+            self.profiler = Profiler(profile_prefix)
+
+        # option for map_plot and the input of map_addmodel, they depend on
+        # IMF data being available
+        self._imf_option = " -imf"
+
+        # Decompressed data files are shared between runs through the cache
+        # when a cache path is given, e.g. rerunning a date with another
+        # integration time does not decompress the data again.
+        self.file_cache = None
+        if self.parameter['cache_path']:
+            self.file_cache = FileCache(self.parameter['cache_path'],
+                                        self.parameter['cache_size'] * 1024**2)
+
+        # The map files are cached by the content of their input and the
+        # options of their step when a stage cache path is given, e.g. a
+        # sweep of the map_addmodel options only runs map_addmodel and
+        # map_fit again.
+        self.stage_cache = None
+        if self.parameter['stage_cache_path']:
+            self.stage_cache = FileCache(self.parameter['stage_cache_path'],
+                                         self.parameter['stage_cache_size'] * 1024**2)
+
+        # backend running the RST commands
+        self.executor = self._make_executor()
+
+        # time limits of the commands by program name, a hung command
+        # (e.g. on a corrupt data file) is killed
+        self._timeouts = dict(ExecutorConst.STAGE_TIMEOUTS)
+        self._timeouts.update(self._parse_timeouts(self.parameter['stage_timeouts']))
+
+        # merges the radar grid files while they are written, by integration
+        # time, set by run with the python grid combiner
+        self._grid_combiners = {}
+
+        # fitacf files of a radar: the files split by channel, shared by the
+        # integration times of a run
+        self._channel_files = {}
+        self._channel_locks = {}
+        self._channel_lock = threading.Lock()
+
+        # saved files compressed in the background
+        if self.parameter['compression']:
+            check_compression(self.parameter['compression'])
+        self._compression_pool = None
+        self._compressions = []
+
     # TODO: Look for more possible options to add here for changing convection maps
     def arguement_parser(self, arguements):
         """
@@ -189,6 +374,30 @@ class ConvectionMaps():
                         ('-m', '--map-path'),
                         ('-g', '--grid-path'),
                         ('-k', '--key-path'),
+                        ('--cache-path'),
+                        ('--cache-size'),
+                        ('-n', '--num-proc'),
+                        ('--io-slots'),
+                        ('--resume'),
+                        ('--profile'),
+                        ('--profile-prefix'),
+                        ('--executor'),
+                        ('--batch-submit'),
+                        ('--batch-status'),
+                        ('--timeout'),
+                        ('--stage-timeout'),
+                        ('--stall-timeout'),
+                        ('-o', '--fit-order'),
+                        ('--map-grd-options'),
+                        ('--map-addimf-options'),
+                        ('--map-addmodel-options'),
+                        ('--stage-cache-path'),
+                        ('--stage-cache-size'),
+                        ('--export-path'),
+                        ('--grid-combiner'),
+                        ('--compression'),
+                        ('--compression-level'),
+                        ('--compression-threads'),
                         ('-v', '--verbose')]
         option_settings = [{'type': str,
                             'metavar': 'YYYYMMDD',
@@ -200,8 +409,11 @@ class ConvectionMaps():
                             ' to use for the convection map process.'
                             ' Default: 5 - use all channels'},
                            {'type': int,
-                            'default': '120',
-                            'help': 'Integration time between each plot in seconds.'
+                            'nargs': '+',
+                            'default': [120],
+                            'help': 'Integration time between each plot in seconds,'
+                            ' several times make maps of each from one read'
+                            ' of the data files.'
                             ' Default: 120 - 2 minute convection plots'},
                            {'type': str,
                             'choices': ['north', 'south', 'Canadian'],
@@ -222,7 +434,10 @@ class ConvectionMaps():
                             'metavar': 'EXTENSION',
                             'default': 'png',
                             'help': 'The image format of convection maps.'
-                            ' Default: pdf'},
+                            ' ps, pdf and eps maps are made from PostScript,'
+                            ' other formats from raster frames (png is encoded'
+                            ' directly).'
+                            ' Default: png'},
                            {'type': str,
                             'metavar': 'PATH',
                             'default': self._current_path,
@@ -263,12 +478,156 @@ class ConvectionMaps():
                             'help': "The absolute path to the key file for"
                             "the convection maps."
                             " Default: {}".format(self._current_path)},
+                           {'type': str,
+                            'metavar': 'PATH',
+                            'default': None,
+                            'help': "The absolute path of a cache directory for"
+                            " decompressed data files that can be shared between"
+                            " runs. Default: no cache"},
+                           {'type': int,
+                            'metavar': 'MB',
+                            'default': CacheConst.SIZE,
+                            'help': "The size limit of the data file cache in"
+                            " megabytes. Default: {}".format(CacheConst.SIZE)},
+                           {'type': int,
+                            'default': 1,
+                            'help': "Number of processes to use, large bz2 data"
+                            " files are decompressed on all cores when 1."
+                            " Default: 1"},
+                           {'type': int,
+                            'default': 2,
+                            'help': "Number of I/O bound tasks (e.g. downloads)"
+                            " running at once. Default: 2"},
+                           {'action': 'store_true',
+                            'help': "Resume a failed run, skipping the steps"
+                            " whose outputs are present and whose inputs have"
+                            " not changed."},
+                           {'action': 'store_true',
+                            'help': "Profile the python side of the process,"
+                            " writing PREFIX.prof and PREFIX.collapsed (flame"
+                            " graph stacks) and a hotspot summary in the log,"
+                            " see --profile-prefix."},
+                           {'type': str,
+                            'default': None,
+                            'metavar': 'PREFIX',
+                            'help': "Prefix of the profile files, implies"
+                            " --profile. Default: <plot path>/<date>."
+                            "<hemisphere>.profile"},
+                           {'type': str,
+                            'choices': ['serial', 'local', 'batch'],
+                            'default': 'local',
+                            'help': "Backend running the RST commands: serial,"
+                            " local (num_proc commands at once) or batch"
+                            " (jobs of a batch cluster, the paths have to be"
+                            " shared with the nodes). Default: local"},
+                           {'type': str,
+                            'metavar': 'COMMAND',
+                            'default': ExecutorConst.BATCH_SUBMIT,
+                            'help': "Batch backend command submitting a job"
+                            " script, printing the job id last."
+                            " Default: {}".format(ExecutorConst.BATCH_SUBMIT)},
+                           {'type': str,
+                            'metavar': 'COMMAND',
+                            'default': ExecutorConst.BATCH_STATUS,
+                            'help': "Batch backend command given a job id,"
+                            " printing nothing once the job is gone; empty to"
+                            " only wait for the job to finish."
+                            " Default: {}".format(ExecutorConst.BATCH_STATUS)},
+                           {'type': int,
+                            'metavar': 'SECONDS',
+                            'default': ExecutorConst.TIMEOUT,
+                            'help': "Time limit of every RST command, a command"
+                            " going over it is killed with its children and"
+                            " its radar is reported as an error; 0 for no"
+                            " limit. Default: no limit"},
+                           {'action': 'append',
+                            'metavar': 'COMMAND=SECONDS',
+                            'dest': 'stage_timeouts',
+                            'default': [],
+                            'help': "Time limit of a command over --timeout,"
+                            " e.g. make_grid=600; can be given several times."
+                            " Default: {}".format(" ".join("{}={}".format(name, seconds)
+                                                         for name, seconds in sorted(ExecutorConst.STAGE_TIMEOUTS.items())))},
+                           {'type': int,
+                            'metavar': 'SECONDS',
+                            'default': ExecutorConst.STALL_TIMEOUT,
+                            'help': "Kill a command whose output file does not"
+                            " grow for this long; 0 to never."
+                            " Default: {}".format(ExecutorConst.STALL_TIMEOUT)},
+                           {'type': int,
+                            'default': MapFitConst.ORDER,
+                            'help': "Order of the spherical harmonic fit."
+                            " Default: {}".format(MapFitConst.ORDER)},
+                           {'type': str,
+                            'metavar': 'OPTIONS',
+                            'default': MapChainConst.GRD_OPTIONS,
+                            'help': "Options of map_grd."
+                            " Default: {}".format(MapChainConst.GRD_OPTIONS)},
+                           {'type': str,
+                            'metavar': 'OPTIONS',
+                            'default': MapChainConst.IMF_OPTIONS,
+                            'help': "Options of map_addimf besides the OMNI"
+                            " IMF file."
+                            " Default: {}".format(MapChainConst.IMF_OPTIONS)},
+                           {'type': str,
+                            'metavar': 'OPTIONS',
+                            'default': MapChainConst.MODEL_OPTIONS,
+                            'help': "Options of map_addmodel besides the order"
+                            " of the fit."
+                            " Default: {}".format(MapChainConst.MODEL_OPTIONS)},
+                           {'type': str,
+                            'metavar': 'PATH',
+                            'default': None,
+                            'help': "The absolute path of a cache directory for"
+                            " the map files of every step, keyed by the content"
+                            " of the input and the options of the step, so runs"
+                            " with other options only run the steps after the"
+                            " changed option. Default: no cache"},
+                           {'type': int,
+                            'metavar': 'MB',
+                            'default': CacheConst.STAGE_SIZE,
+                            'help': "The size limit of the map step cache in"
+                            " megabytes, the least recently used files are"
+                            " removed first. Default: {}".format(CacheConst.STAGE_SIZE)},
+                           {'type': str,
+                            'metavar': 'PATH',
+                            'default': None,
+                            'help': "The absolute path of a columnar store the"
+                            " fit results of the map files (potential drop,"
+                            " HMB latitude, coefficients, ...) are exported"
+                            " to, chunked by day, needs numpy."
+                            " Default: not exported"},
+                           {'type': str,
+                            'choices': CombineConst.COMBINERS,
+                            'default': 'rst',
+                            'help': "Backend combining the radar grid files:"
+                            " rst (combine_grid) or python (streaming merge,"
+                            " which runs while the radars are gridded when"
+                            " the steps run as a task graph). Default: rst"},
+                           {'type': str,
+                            'choices': CompressionConst.EXT,
+                            'default': None,
+                            'help': "Save the map file (map path) and the grd"
+                            " file (grid path) compressed, zst needs the"
+                            " zstandard package. Default: map file not"
+                            " compressed, grd file not saved"},
+                           {'type': int,
+                            'metavar': 'LEVEL',
+                            'default': None,
+                            'help': "Compression level of the saved files."
+                            " Default: the default of the compression"},
+                           {'type': int,
+                            'default': CompressionConst.THREADS,
+                            'help': "Number of files compressed at once in"
+                            " the background."
+                            " Default: {}".format(CompressionConst.THREADS)},
                            {'action': 'store_true',
                             'help': 'Turns on verbose mode.'}]
-        self.parameter = flag_options('fitacf2convectionmap',
-                                      'Converts fitted data files to convection maps',
-                                      option_names,
-                                      option_settings)
+        self.parameter.update(flag_options('fitacf2convectionmap',
+                                           'Converts fitted data files to convection maps',
+                                           option_names,
+                                           option_settings,
+                                           arguements))
 
     def set_data_path(self, new_data_path):
         """
@@ -317,6 +676,7 @@ class ConvectionMaps():
 
     # TODO: finish other set functions.
 
+    @with_run_context
     def _generate_paths(self):
         """
         generate the folder paths for the various file paths
@@ -324,172 +684,421 @@ class ConvectionMaps():
         for path in [self.parameter['plot_path'],
                      self.parameter['map_path'],
                      self.parameter['grid_path']]:
+            # checked on every run, a resident process may outlive a path
             try:
                 path_exists(path)
             except PathDoesNotExistException as err:
                 try:
                     os.makedirs(path)
                 except OSError as err:
-                        logging.info(err)
+                        logger.info(err)
                         pass
 
 
-        logging.info("The following data files will be"
+        logger.info("The following data files will be"
                      " stored in the following paths")
-        logging.info("Plot path: " + self.parameter['plot_path'])
-        logging.info("Grid path: " + self.parameter['grid_path'])
-        logging.info("Map files path: " + self.parameter['map_path'])
-        logging.info("Omni files path: " + self.parameter['map_path'])
-        logging.info("The data for the convections maps is obtained from")
-        logging.info("Data path: " + self.parameter['data_path'])
+        logger.info("Plot path: " + self.parameter['plot_path'])
+        logger.info("Grid path: " + self.parameter['grid_path'])
+        logger.info("Map files path: " + self.parameter['map_path'])
+        logger.info("Omni files path: " + self.parameter['map_path'])
+        logger.info("The data for the convections maps is obtained from")
+        logger.info("Data path: " + self.parameter['data_path'])
+
+    def _make_executor(self):
+        """
+        :return: the Executor of the executor parameter
+        """
+        if self.parameter['executor'] == 'batch':
+            job_path = "{plot_path}/jobs".format(plot_path=self.parameter['plot_path'])
+            status_command = None
+            if self.parameter['batch_status']:
+                status_command = shlex.split(self.parameter['batch_status'])
+            return make_executor('batch',
+                                 job_path=job_path,
+                                 submit_command=shlex.split(self.parameter['batch_submit']),
+                                 status_command=status_command)
+        elif self.parameter['executor'] == 'local':
+            return make_executor('local', processes=self.parameter['num_proc'])
+        return make_executor(self.parameter['executor'])
+
+    @staticmethod
+    def _parse_timeouts(timeouts):
+        """
+        :param timeouts: dictionary program name: seconds, or list of
+                         'name=seconds' str (command line)
+        :return: dictionary program name: seconds, None for no limit
+        :raise ValueError: badly formatted limit
+        """
+        if isinstance(timeouts, dict):
+            timeouts = timeouts.items()
+        else:
+            pairs = []
+            for timeout in timeouts:
+                name, separator, seconds = timeout.partition('=')
+                if not separator:
+                    raise ValueError("Time limit {} is not of the form"
+                                     " COMMAND=SECONDS".format(timeout))
+                pairs.append((name.strip(), seconds))
+            timeouts = pairs
+        # 0 is no limit, like None
+        return {name: int(seconds or 0) or None for name, seconds in timeouts}
+
+    def _command_limits(self, name):
+        """
+        :param name: program name of a command
+        :return: dictionary of the timeout and stall_timeout of the Command,
+                 None for no limit
+        """
+        timeout = self._timeouts.get(name, self.parameter['timeout'])
+        return {'timeout': timeout or None,
+                'stall_timeout': self.parameter['stall_timeout'] or None}
+
+    def _rst_command(self, argv, filepath, stdin=None, stderr=None):
+        """
+        Runs an RST command with the executor, writing its standard output
+        to filepath, see check_rst_command. The command is killed when it
+        goes over its time limits, see _command_limits.
+
+            :param argv: list of the command and its arguments
+            :param filepath: str path of the output file
+            :raise RSTTimeoutException: the command went over a time limit
+        """
+        command = Command(argv, stdin=stdin, stdout=filepath, stderr=stderr,
+                          cwd=self._current_path,
+                          **self._command_limits(os.path.basename(argv[0])))
+        check_rst_command(command, filepath, self.executor)
+
+    @staticmethod
+    def _expand(pattern):
+        """
+        Expands a file pattern like the shell did for the RST commands.
+
+            :param pattern: str glob pattern
+            :return: sorted list of the matching files, the pattern itself
+                     when nothing matches
+        """
+        return sorted(glob(pattern)) or [pattern]
+
+    @staticmethod
+    def _parse_integration_times(integration_time):
+        """
+        :param integration_time: integration time in seconds, or a list or
+                                 comma separated str of them
+        :return: list of the integration times, in the given order without
+                 duplicates
+        :raise ValueError: no integration time or one that is not positive
+        """
+        if isinstance(integration_time, str):
+            integration_time = integration_time.split(',')
+        elif not isinstance(integration_time, (list, tuple)):
+            integration_time = [integration_time]
+        integration_times = []
+        for value in integration_time:
+            value = int(value)
+            if value <= 0:
+                raise ValueError("Integration time {} is not positive"
+                                 "".format(value))
+            if value not in integration_times:
+                integration_times.append(value)
+        if not integration_times:
+            raise ValueError("No integration time was given")
+        return integration_times
+
+    @contextmanager
+    def _resolution(self, integration_time):
+        """
+        Runs the block (and the tasks added in it, which copy the context)
+        for one of the integration times: the grid and map files, the stages
+        of the manifest and the task names are those of the integration time.
+
+            :param integration_time: integration time in seconds
+        """
+        token = _resolution.set(integration_time)
+        try:
+            yield
+        finally:
+            _resolution.reset(token)
+
+    def _integration_time(self):
+        """
+        :return: integration time of the current context, the first
+                 integration time outside of _resolution
+        """
+        integration_time = _resolution.get()
+        if integration_time is None:
+            return self.integration_times[0]
+        return integration_time
+
+    def _resolution_ext(self):
+        """
+        :return: str added to the names of the grid and map files of the
+                 current integration time, empty with a single integration
+                 time so the names do not change
+        """
+        if len(self.integration_times) == 1:
+            return ''
+        return ".{}s".format(self._integration_time())
+
+    def _resolution_name(self, name):
+        """
+        :param name: stage or task name
+        :return: the name for the current integration time, names outside
+                 of _resolution (shared by the integration times) do not
+                 change
+        """
+        if len(self.integration_times) == 1 or _resolution.get() is None:
+            return name
+        return "{name} {time}s".format(name=name, time=_resolution.get())
+
+    @property
+    def _grid_combiner(self):
+        """
+        GridCombiner of the current integration time, None when the grid
+        files are not merged while they are written
+        """
+        return self._grid_combiners.get(self._integration_time())
+
+    def _split_channels(self, data_files, status_file):
+        """
+        Splits the fitacf files of a radar by channel, once for all the
+        integration times: the first caller splits them, the others wait
+        for it and get the same files.
+
+            :param data_files: sorted list of the fitacf files of a radar
+            :param status_file: name of the data reported in the radar
+                                status
+            :return: dictionary channel number: list of the files of the
+                     channel, empty when a file is not a valid dmap file
+        """
+        files_key = tuple(data_files)
+        with self._channel_lock:
+            lock = self._channel_locks.setdefault(files_key, threading.Lock())
+        with lock:
+            if files_key not in self._channel_files:
+                try:
+                    channel_files = demultiplex(list(data_files))
+                except DmapFormatError as err:
+                    logger.warning("{file}: {err}".format(file=status_file,
+                                                          err=err))
+                    self._add_radar_status('errors', status_file, str(err))
+                    channel_files = {}
+                self._channel_files[files_key] = channel_files
+            return self._channel_files[files_key]
+
+    def _reset_channel_files(self):
+        """
+        Forgets the channel split of earlier runs, the data files may have
+        changed since.
+        """
+        with self._channel_lock:
+            self._channel_files = {}
+            self._channel_locks = {}
 
     # TODO: implement parallel version
+    @with_run_context
     def generate_radar_grid_file(self, radar_abbrv, data_file):
         """
         Helper function for generate_grid_files to generate a grid file(s) for
         a single radar extension. This can be used to parallelize the grid
         generation process.
 
-            :param radar_abbrv: 3 letter acroynm of the radar
-            :param data_file: str fitted data file name with extension
-            :raise ValueError: if the radar abbrevation is not in the data file
-                               name which means it could be generating the wrong
+            :param radar_abbrv: radar name, 3 letter acroynm of the radar with
+                                the channel letter of its files (e.g. ksr.a)
+            :param data_file: str pattern or list of the fitacf files of the
+                              radar
+            :return: list of the grid files written
+            :raise ValueError: if a data file does not resolve to the radar
+                               which means it could be generating the wrong
                                grid file.
         """
+        radar = RadarKey.from_name(radar_abbrv)
+        if isinstance(data_file, str):
+            data_files = sorted(glob(data_file))
+            status_file = data_file
+        else:
+            data_files = sorted(data_file)
+            status_file = ', '.join(os.path.basename(filename)
+                                    for filename in data_files)
 
         # Sanity check
-        print(data_file)
-        if(radar_abbrv not in data_file):
-            logging.error('Mismatched radar abbreviation: {radar} and file name'
+        logger.debug(data_files)
+        mismatched = [filename for filename in data_files
+                      if self.radar_registry.resolve(filename) != radar]
+        if mismatched:
+            logger.error('Mismatched radar abbreviation: {radar} and file name'
                           ' {filename}'.format(radar=radar_abbrv,
-                                               filename=data_file))
+                                               filename=mismatched[0]))
             raise ValueError('Mismatched radar abbreviation: {radar} and file name'
                              ' {filename}'.format(radar=radar_abbrv,
-                                                  filename=data_file))
+                                                  filename=mismatched[0]))
+        if not data_files:
+            logger.warning("No data files of {radar} to grid"
+                           "".format(radar=radar_abbrv))
+            return []
 
         grid_options = ''
         # Standard naming convention for grid files
-        grid_filename = "{date}.{abbrv}.{hemisphere}."\
+        grid_filename = "{date}.{abbrv}.{hemisphere}{resolution}."\
                 "grid".format(date=self.parameter['date'],
                               abbrv=radar_abbrv,
-                              hemisphere=self.hem_ext)
+                              hemisphere=self.hem_ext,
+                              resolution=self._resolution_ext())
 
         grid_path = "{data_path}/{grid_file}"\
                     "".format(data_path=self.parameter['plot_path'],
                               grid_file=grid_filename)
 
-        result = 0
-        grid_options += '-c -tl 60 -i ' + \
-            str(self.parameter['integration_time'])
-
-        channelA = 0
-        channelB = 0
-        monochannel = 0
-        for filename in glob(data_file):
-            channelA += self._check_for_channel(filename, 1)
-            channelB += self._check_for_channel(filename, 2)
-            monochannel += self._check_for_channel(filename, 0)
-
-        if '.a.' in data_file:
-            grid_options = grid_options + " -cn_fix a"
-        elif '.b.' in data_file:
-            grid_options = grid_options + " -cn_fix a"
-        elif '.c.' in data_file:
-            grid_options = grid_options + " -cn_fix c"
-        elif '.d.' in data_file:
-            grid_options = grid_options + " -cn_fix d"
+        grid_options += '-c -tl 60 -i ' + str(self._integration_time())
+
+        # (grid file, make_grid options, data files) of the grid files of
+        # the radar
+        grid_jobs = []
+        if radar.channel:
+            # files of a single channel
+            grid_jobs.append((grid_path,
+                              grid_options + " -cn_fix " + radar.channel,
+                              data_files))
         elif self.parameter['channel'] == 0:
-                grid_path = "{plot_path}/{date}.{abbrv}.{hemisphere}."\
-                            "grid".format(date=self.parameter["date"],
-                                          plot_path=self.parameter['plot_path'],
-                                          abbrv=radar_abbrv,
-                                          hemisphere=self.hem_ext)
+                grid_path = "{plot_path}/{date}.{abbrv}.{hemisphere}"\
+                            "{resolution}.grid"\
+                            "".format(date=self.parameter["date"],
+                                      plot_path=self.parameter['plot_path'],
+                                      abbrv=radar_abbrv,
+                                      hemisphere=self.hem_ext,
+                                      resolution=self._resolution_ext())
+                grid_jobs.append((grid_path, grid_options, data_files))
         elif self.parameter['channel'] == 1:
-                grid_path = "{plot_path}/{date}.{abbrv}.a.{hemisphere}."\
-                            "grid".format(date=self.parameter["date"],
-                                          plot_path=self.parameter['plot_path'],
-                                          abbrv=radar_abbrv,
-                                          hemisphere=self.hem_ext)
-                grid_options = grid_options + " -cn A"
+                grid_path = "{plot_path}/{date}.{abbrv}.a.{hemisphere}"\
+                            "{resolution}.grid"\
+                            "".format(date=self.parameter["date"],
+                                      plot_path=self.parameter['plot_path'],
+                                      abbrv=radar_abbrv,
+                                      hemisphere=self.hem_ext,
+                                      resolution=self._resolution_ext())
+                grid_jobs.append((grid_path, grid_options + " -cn A",
+                                  data_files))
         elif self.parameter['channel'] == 2:
-                grid_path = "{plot_path}/{date}.{abbrv}.b.{hemisphere}."\
-                            "grid".format(date=self.parameter["date"],
-                                          plot_path=self.parameter['plot_path'],
-                                          abbrv=radar_abbrv,
-                                          hemisphere=self.hem_ext)
-                grid_options = grid_options + " -cn B"
+                grid_path = "{plot_path}/{date}.{abbrv}.b.{hemisphere}"\
+                            "{resolution}.grid"\
+                            "".format(date=self.parameter["date"],
+                                      plot_path=self.parameter['plot_path'],
+                                      abbrv=radar_abbrv,
+                                      hemisphere=self.hem_ext,
+                                      resolution=self._resolution_ext())
+                grid_jobs.append((grid_path, grid_options + " -cn B",
+                                  data_files))
         else:
-            if channelB > 0:
-                grid_path = "{plot_path}/{date}.{abbrv}.b.{hemisphere}."\
-                            "grid".format(date=self.parameter["date"],
-                                          plot_path=self.parameter['plot_path'],
-                                          abbrv=radar_abbrv,
-                                          hemisphere=self.hem_ext)
-                grid_optionsB = grid_options + " -cn B"
-                self.make_grid(data_file, grid_path, grid_optionsB)
-
-            if channelA > 0:
-              grid_path = "{plot_path}/{date}.{abbrv}.a.{hemisphere}."\
-                          "grid".format(date=self.parameter["date"],
-                                        plot_path=self.parameter['plot_path'],
-                                        abbrv=radar_abbrv,
-                                        hemisphere=self.hem_ext)
-              grid_optionsA = grid_options + " -cn A"
-              self.make_grid(data_file, grid_path, grid_optionsA)
-            elif monochannel > 0:
-                grid_path = "{plot_path}/{date}.{abbrv}.{hemisphere}."\
-                            "grid".format(date=self.parameter["date"],
-                                          plot_path=self.parameter['plot_path'],
-                                          abbrv=radar_abbrv,
-                                          hemisphere=self.hem_ext)
-                self.make_grid(data_file, grid_path, grid_options)
-            return 0
-
-        self.make_grid(data_file, grid_path, grid_options)
-        return result
-
-    # Maybe move this function to utils?
-    def _check_for_channel(self, data_file, channel_num):
-        """
-        A method to check for the channel number in a fitacf file
-        that may use mono and stero.
-        """
-        channel_command = "dmapdump {filename} "\
-                          "| grep -c '\"channel\" = {channel}'"\
-                          "".format(filename=data_file,
-                                    channel=channel_num)
-        try:
-            channel_count = check_output(channel_command, shell=True)
-        except CalledProcessError as e:
-            channel_count = e.output  # Gets the output of the command
-        return int(channel_count)
-
-    def make_grid(self, data_file, grid_file, grid_options=""):
-        make_grid_command = "make_grid {gridoptions} -tl 60 -xtd"\
-                            " -minrng 10"\
-                            " -vemax {max_velocity}"\
-                            " {datafile} > {gridpath}"\
-                            "".format(gridoptions=grid_options,
-                                      date=self.parameter['date'],
-                                      integration_time=self.parameter['integration_time'],
-                                      max_velocity=RstConst.VEMAX,
-                                      datafile=data_file,
-                                      gridpath=grid_file)
-
-        print(make_grid_command)
-        try:
-            check_rst_command(make_grid_command, grid_file)
+            # one read of the data files splits them by channel, make_grid
+            # then only reads the records of the channel it grids
+            channel_files = self._split_channels(data_files, status_file)
+
+            if channel_files.get(2):
+                grid_path = "{plot_path}/{date}.{abbrv}.b.{hemisphere}"\
+                            "{resolution}.grid"\
+                            "".format(date=self.parameter["date"],
+                                      plot_path=self.parameter['plot_path'],
+                                      abbrv=radar_abbrv,
+                                      hemisphere=self.hem_ext,
+                                      resolution=self._resolution_ext())
+                grid_jobs.append((grid_path, grid_options + " -cn B",
+                                  channel_files[2]))
+
+            if channel_files.get(1):
+                grid_path = "{plot_path}/{date}.{abbrv}.a.{hemisphere}"\
+                            "{resolution}.grid"\
+                            "".format(date=self.parameter["date"],
+                                      plot_path=self.parameter['plot_path'],
+                                      abbrv=radar_abbrv,
+                                      hemisphere=self.hem_ext,
+                                      resolution=self._resolution_ext())
+                grid_jobs.append((grid_path, grid_options + " -cn A",
+                                  channel_files[1]))
+            elif channel_files.get(0):
+                grid_path = "{plot_path}/{date}.{abbrv}.{hemisphere}"\
+                            "{resolution}.grid"\
+                            "".format(date=self.parameter["date"],
+                                      plot_path=self.parameter['plot_path'],
+                                      abbrv=radar_abbrv,
+                                      hemisphere=self.hem_ext,
+                                      resolution=self._resolution_ext())
+                grid_jobs.append((grid_path, grid_options, channel_files[0]))
+
+        # the grid files are declared before they are written so the
+        # combiner can merge them as they are written
+        self._declare_grid_files(radar_abbrv,
+                                 [grid_path for grid_path, options, inputs
+                                  in grid_jobs])
+        for grid_path, options, inputs in grid_jobs:
+            self.make_grid(inputs, grid_path, options, status_file=status_file)
+        return [grid_path for grid_path, options, inputs in grid_jobs
+                if os.path.exists(grid_path)]
+
+    def _declare_grid_files(self, radar_abbrv, grid_paths, complete=False):
+        """
+        Declares the grid files of a radar to the grid combiner when the
+        grid files are merged while they are written (see run).
 
-        except RSTException as err:
-            logging.warn(err)
-            self.radars_errors += data_file + '\n'
+            :param radar_abbrv: radar abbreviation of the grid task
+            :param grid_paths: list of the grid files of the radar
+            :param complete: the grid files are already written
+        """
+        if self._grid_combiner is None:
+            return
+        if not complete:
+            # left over by an earlier run, the combiner would read them
+            # before make_grid truncates them
+            for grid_path in grid_paths:
+                if os.path.exists(grid_path):
+                    os.remove(grid_path)
+        self._grid_combiner.declare(radar_abbrv, grid_paths, complete)
+
+    @with_run_context
+    def make_grid(self, data_file, grid_file, grid_options="",
+                  status_file=None):
+        """
+        Runs make_grid.
 
+            :param data_file: str pattern or list of the fitacf files
+            :param grid_file: path of the grid file
+            :param grid_options: make_grid options
+            :param status_file: name of the data reported in the radar
+                                status, default data_file
+        """
+        if status_file is None:
+            status_file = data_file
+        data_files = self._expand(data_file) \
+            if isinstance(data_file, str) else list(data_file)
+        make_grid_command = ['make_grid'] + grid_options.split() + \
+                            ['-tl', '60', '-xtd',
+                             '-minrng', '10',
+                             '-vemax', RstConst.VEMAX] + data_files
+
+        timed_out = False
+        try:
+            self._rst_command(make_grid_command, grid_file)
+            self._add_radar_status('used', status_file)
+
+        except RSTTimeoutException as err:
+            # the partial grid file of the killed make_grid is not combined,
+            # the python grid combiner drops what it merged of it
+            timed_out = True
+            logger.warning(err)
+            self._add_radar_status('errors', status_file, str(err))
+            if os.path.exists(grid_file):
+                os.remove(grid_file)
+        except RSTException as err:
+            logger.warning(err)
+            self._add_radar_status('errors', status_file, str(err))
         except RSTFileEmptyException as err:
-            self.radars_errors += data_file + '\n'
-            logging.warn(err)
+            self._add_radar_status('errors', status_file, str(err))
+            logger.warning(err)
             os.remove(grid_file)
+        finally:
+            if self._grid_combiner is not None:
+                self._grid_combiner.finish(grid_file, failed=timed_out)
 
     # TODO: might be a util method
+    @with_run_context
     def convert_fit_to_fitacf(self, file_path):
         """
         Converts fit data to fitacf with the standard naming convention used for
@@ -508,347 +1117,1053 @@ class ConvectionMaps():
                       "fitacf".format(date=self.parameter['date'],
                                       abbrv=radar_abbrv,
                                       plot_path=self.parameter['plot_path'])
-        fittofitacf_command = "fittofitacf {filepath} >"\
-                              " {fitacf_filename}"\
-                              "".format(filepath=file_path,
-                                        fitacf_filename=fitacf_path)
-        check_rst_command(fittofitacf_command, fitacf_path)
+        self._rst_command(['fittofitacf', file_path], fitacf_path)
 
         return (fitacf_path, radar_abbrv)
 
-    def generate_grid_files(self):
+    @with_run_context
+    def decompress_data_file(self, data_file, processes=None):
         """
-        Generates the grid files used in the map generation step.
+        Decompresses a fitted data file into the plot path (uncompressed files
+        are copied). When a cache path is set the decompressed file is hard
+        linked (or copied) from the cache instead, decompressing it into the
+        cache first if it is not there yet.
+
+            :param data_file: str path of the fitted data file
+            :param processes: number of processes of the block parallel
+                              decompression, None for num_proc
+            :return: str path of the decompressed data file in the plot path
+            :raise UnsupportedTypeException: file type or compression is not
+                                             supported
+            :raise FileDoesNotExistException: data file does not exist
+            :raise RSTFileEmptyException: decompressed data file is empty
+            :raise DmapFormatError: data file is corrupt, it is quarantined
         """
-        radar_abbrv = []
-        if self.parameter['hemisphere'] == 'south':
-            radar_abbrv = SouthRadar.RADAR_ABBRV
-        elif self.parameter['hemisphere'] == 'Canadian':
-            radar_abbrv = CanadianRadar.RADAR_ABBRV
-        else:
-            radar_abbrv = NorthRadar.RADAR_ABBRV
-
-        grid_file_counter = 0
-        ext = 'fitacf'
-        for abbrv in radar_abbrv:
-            file_pattern = "{data_path}/{date}*{abbrv}*.{ext}.bz2"\
-                    "".format(data_path=self.parameter['data_path'],
-                              date=self.parameter['date'],
-                              abbrv=abbrv,
-                              ext=ext)
-            for data_file in glob(file_pattern):
+        # More Sanity checks, because the method is public
+        # we have to make sure the user is providing correct file types
+        data_file_ext = data_file.split('.')[-1]
+        if data_file_ext not in RadarConst.COMPRESSION_TYPES and \
+           data_file_ext not in RadarConst.FILE_TYPE:
+            msg = "Error: {datafiletype} file type or compression extension"\
+                    " is not supported. Please use one for the following"\
+                    " supported types: {filetypes} {compressiontypes}"\
+                    "".format(datafiletype=data_file_ext,
+                              filetypes=RadarConst.FILE_TYPE,
+                              compressiontypes=RadarConst.COMPRESSION_TYPES)
+            logger.error(msg)
+            raise UnsupportedTypeException(msg)
+        if not os.path.isfile(data_file):
+            raise FileDoesNotExistException(data_file)
+        original_file = data_file
+        reason = self.quarantine.reason(original_file)
+        if reason:
+            self._add_radar_status('quarantined', original_file, reason)
+            raise DmapFormatError("{file} is quarantined: {reason}"
+                                  "".format(file=original_file, reason=reason))
+
+        # if the data file is not in data path then check in the
+        # in the current directory.
+        data_path = "{path}/{filename}"\
+                    "".format(path=self.parameter['plot_path'],
+                              filename=os.path.basename(data_file))
+
+        stage = None
+        cache_key = None
+        if data_file_ext in RadarConst.COMPRESSION_TYPES:
+            source_file = data_file
+            data_file = re.sub('.'+data_file_ext, '', data_path)
+            stage = 'decompress {}'.format(os.path.basename(source_file))
+            if self._completed_stage(stage, [source_file]):
+                return data_file
+
+            def decompress(destination):
+                self._decompress_file(source_file, data_file_ext, destination,
+                                      processes)
+
+            if self.file_cache:
+                cache_key = self.file_cache.key(*file_fingerprint(source_file))
+                self.file_cache.fetch(cache_key, data_file, decompress)
+            else:
+                if os.path.lexists(data_file):
+                    # may be linked to a cache entry by an earlier run, the
+                    # decompression truncates its destination in place
+                    os.remove(data_file)
                 try:
-                    # More Sanity checks, because the method is public
-                    # we have to make sure the user is providing correct file types
-                    data_file_ext = data_file.split('.')[-1]
-                    if data_file_ext not in RadarConst.COMPRESSION_TYPES and \
-                       data_file_ext not in RadarConst.FILE_TYPE:
-                        msg = "Error: {datafiletype} file type or compression extension"\
-                                " is not supported. Please use one for the following"\
-                                " supported types: {filetypes} {compresiontypes}"\
-                                "".format(datafiletype=data_file_ext,
-                                          filetypes=RadarConst.FILE_TYPE,
-                                          compressiontypes=RadarConst.COMPRESSION_TYPES)
-                        logging.error(msg)
-                        raise UnsupportedTypeException(msg)
-                    if not os.path.isfile(data_file):
-                        raise FileDoesNotExistException(data_file)
-
-                    # if the data file is not in data path then check in the
-                    # in the current directory.
-                    data_path = "{path}/{filename}"\
-                                "".format(path=self.parameter['plot_path'],
-                                          filename=os.path.basename(data_file))
-
-                    try:
-                        shutil.copy2(data_file, self.parameter['plot_path'])
-                        data_file = "{path}/{filename}"\
-                                "".format(path=self.parameter['plot_path'],
-                                          filename=os.path.basename(data_file))
-                    except shutil.Error as msg:
-                        logging.warn(msg)
-                        logging.warn("{datafile} was not found in the data_path:"
-                                     " {data_path} or plot_path: {plot_path},"
-                                     " this file will not be used"
-                                     "in the convection map process"
-                                     "".format(data_path=self.parameter['data_path'],
-                                               datafile=data_file,
-                                               plot_path=self.parameter['plot_path']))
-                        self.radars_missing += data_file + '\n'
-                        message = "File {datafile} was not found, please make sure to"\
-                                  " provide data path using -d option and that the"\
-                                  " file exist in the folder".format(datafile=data_file)
-                        raise OSError(message)  # TODO: better exception?
-                    
-                    if data_file_ext in RadarConst.COMPRESSION_TYPES:
-                        try:
-                            compression_command = "{command} {datapath}"\
-                                                  "".format(command=RadarConst.EXT[data_file_ext],
-                                                            datapath=data_path)
-                            call(compression_command, shell=True)
-                            data_file = re.sub('.'+data_file_ext,'', data_file)
-                        except KeyError as err:
-                            logging.warn(err)
-                            msg = "Error: The compression extension {compressionext} "\
-                                  "does not have a corresponding compression command"\
-                                  " associated. Please use one of the following"\
-                                  " implmented compressions types {compression}"\
-                                  "".format(compresionext=data_file_ext,
-                                            compression=RadarConst.EXT)
-                            raise KeyError(msg)  # TODO: make a better exception for this case 
-                    logging.info(data_file)
-                    if os.path.getsize(data_file) == 0:
-                        logging.warn(EmptyDataFileWarning(data_file))
-                        self.radars_errors += data_file + '\n'
-                        raise RSTFileEmptyException(data_file)
-                except Exception as err:
-                    logging.error(err)
-                    continue
-
-            print("Made it here")
+                    decompress(data_file)
+                except RSTTimeoutException as err:
+                    # a partial data file must not be gridded
+                    if os.path.exists(data_file):
+                        os.remove(data_file)
+                    self._add_radar_status('errors', source_file, str(err))
+                    raise
+
+        else:
             try:
-                filename = "{path}/{date}*{abbrv}.{ext}"\
-                           "".format(path=self.parameter['plot_path'],
-                                     date=self.parameter['date'],
-                                     abbrv=abbrv,
-                                     ext=ext)
-                result = self.generate_radar_grid_file(abbrv, filename)
-                if result == 0: 
-                    grid_file_counter+=1
-            except Exception as err:
-                print(err)
-                logging.error(err)
-                continue
+                shutil.copy2(data_file, self.parameter['plot_path'])
+                data_file = data_path
+            except shutil.Error as msg:
+                logger.warning(msg)
+                logger.warning("{datafile} was not found in the data_path:"
+                             " {data_path} or plot_path: {plot_path},"
+                             " this file will not be used"
+                             "in the convection map process"
+                             "".format(data_path=self.parameter['data_path'],
+                                       datafile=data_file,
+                                       plot_path=self.parameter['plot_path']))
+                self._add_radar_status('missing', data_file)
+                message = "File {datafile} was not found, please make sure to"\
+                          " provide data path using -d option and that the"\
+                          " file exist in the folder".format(datafile=data_file)
+                raise OSError(message)  # TODO: better exception?
+
+        logger.info(data_file)
+        if os.path.getsize(data_file) == 0:
+            logger.warning(EmptyDataFileWarning(data_file, 'grid'))
+            self._add_radar_status('errors', data_file)
+            raise RSTFileEmptyException(data_file)
+        # a corrupt file is caught from its record headers before it is
+        # split by channel and gridded
+        try:
+            validate_dmap(data_file)
+        except DmapFormatError as err:
+            self.quarantine.add(original_file, str(err))
+            self._add_radar_status('quarantined', original_file, str(err))
+            os.remove(data_file)
+            if cache_key:
+                # the next run must not take the corrupt file from the cache
+                self.file_cache.discard(cache_key)
+            raise
+        # replaced by a good file since it was quarantined
+        self.quarantine.release(original_file)
+        if stage:
+            self._record_stage(stage, [source_file], [data_file])
+        return data_file
+
+    def _decompress_file(self, compressed_file, compression_ext, destination,
+                         processes=None):
+        """
+        Decompresses a data file to destination. Large bz2 files are
+        decompressed block parallel over several processes, the rest with the
+        compression command.
+
+            :param compressed_file: str path of the compressed file
+            :param compression_ext: compression extension of the file
+            :param destination: str path of the decompressed file
+            :param processes: number of processes of the block parallel
+                              decompression, None for num_proc, 1 runs the
+                              compression command
+            :raise KeyError: no decompression command for the extension
+        """
+        if processes is None:
+            processes = self.parameter['num_proc']
+        if processes > 1 and self._parallel_decompression(compressed_file):
+            logger.info("Block parallel decompression of"
+                         " {}".format(compressed_file))
+            decompress_parallel(compressed_file, destination, processes)
+            return
 
-        # useful logging information for the user
-        logging.info(self.radars_used)
-        logging.info(self.radars_missing)
-        logging.info(self.radars_errors)
-
-        if grid_file_counter == 0:
-            logging.error(NoGridFilesException)
-            raise NoGridFilesException(radar_abbrv)
-
-        grd_filename = "{date}.{hemisphere}.grd".format(date=self.parameter['date'],
-                                                        hemisphere=self.hem_ext)
-        grd_path = "{plot_path}/{grd_file}"\
-                   "".format(plot_path=self.parameter['plot_path'],
-                             grd_file=grd_filename)
-
-        combine_grid_command = "combine_grid {options} {plot_path}/{date}."\
-                               "*.{hemisphere}.grid  > {grdpath}"\
-                               "".format(options=self.rst_options,
-                                         plot_path=self.parameter['plot_path'],
-                                         date=self.parameter['date'],
-                                         grdpath=grd_path,
-                                         hemisphere=self.hem_ext)
-
-        check_rst_command(combine_grid_command, grd_path)
+        try:
+            decompress_command = shlex.split(RadarConst.STDOUT_EXT[compression_ext]) + \
+                                 [compressed_file]
+        except KeyError as err:
+            logger.warning(err)
+            msg = "Error: The compression extension {compressionext} "\
+                  "does not have a corresponding compression command"\
+                  " associated. Please use one of the following"\
+                  " implmented compressions types {compression}"\
+                  "".format(compressionext=compression_ext,
+                            compression=RadarConst.STDOUT_EXT)
+            raise KeyError(msg)  # TODO: make a better exception for this case
+        self._rst_command(decompress_command, destination)
+
+    def _radar_abbreviations(self):
+        """
+        :return: list of the radar abbreviations used for the hemisphere
+        """
+        return self.radar_registry.abbreviations
 
-    def generate_map_files(self):
+    def _radar_files(self):
         """
-        Generates the various map files for the radar fit/fitacf files availible for
-        the given date and hemisphere. The 'date.map' is the only saved file,
-        the other map files are removed at the end of the convection process.
+        :return: OrderedDict RadarKey: list of the compressed fitacf files
+                 of the radar in the data path, every file under one radar
+        """
+        file_pattern = "{data_path}/{date}*.{ext}.bz2"\
+                       "".format(data_path=self.parameter['data_path'],
+                                 date=self.parameter['date'],
+                                 ext=RadarConst.FILE_TYPE[0])
+        # the data path listing is kept between runs of the process
+        return self.radar_registry.group(directory_index.glob(file_pattern))
+
+    def _decompressed_files(self, abbrv):
+        """
+        :param abbrv: radar name, e.g. ksr or ksr.a
+        :return: sorted list of the fitacf files of the radar in the plot
+                 path
+        """
+        file_pattern = "{path}/{date}*.{ext}"\
+                       "".format(path=self.parameter['plot_path'],
+                                 date=self.parameter['date'],
+                                 ext=RadarConst.FILE_TYPE[0])
+        radars = self.radar_registry.group(glob(file_pattern))
+        return radars.get(RadarKey.from_name(abbrv), [])
+
+    def _completed_stage(self, stage, inputs, options=''):
         """
-        map_grd_options = ""
+        Checks the run manifest for a stage that does not need to run again
+        when resuming.
+
+            :param stage: unique name of the stage
+            :param inputs: list of the input files of the stage
+            :param options: str of the options of the stage
+            :return: the manifest entry of the stage if it can be skipped,
+                     None otherwise
+        """
+        if not self.parameter['resume']:
+            return None
+        stage = self._resolution_name(stage)
+        entry = self.manifest.completed(stage, inputs, options)
+        if entry:
+            logger.info("Resuming: {} is up to date".format(stage))
+        return entry
+
+    def _record_stage(self, stage, inputs, outputs, options='', result=None):
+        """
+        Records a completed stage in the run manifest, see
+        RunManifest.record; the stages of an integration time are recorded
+        under its own name.
+        """
+        self.manifest.record(self._resolution_name(stage), inputs, outputs,
+                             options, result)
 
-        if self.parameter['hemisphere'] == "south":
-            map_grd_options = self.rst_options + " -sh"
+    def _profile_stage(self, stage):
+        """
+        :param stage: stage name
+        :return: context manager profiling the block when profiling is on
+        """
+        if self.profiler:
+            return self.profiler.stage(stage)
+        return nullcontext()
 
-        grd_path = "{plot_path}/{date}.{hemisphere}.grd"\
-                   "".format(plot_path=self.parameter['plot_path'],
-                             date=self.parameter['date'],
-                             hemisphere=self.hem_ext)
-        file_exists(grd_path)
-        empty_map_filename = "{date}.{hemisphere}.empty.map"\
-                             "".format(date=self.parameter['date'],
-                                       hemisphere=self.hem_ext)
-        empty_map_path = "{plot_path}/{empty_map}"\
-                         "".format(plot_path=self.parameter['plot_path'],
-                                   empty_map=empty_map_filename)
-
-        map_grd_command = "map_grd {options} -l 50 "\
-                          "{plot_path}/{date}.{hemisphere}.grd > "\
-                          "{plot_path}/{filename}"\
-                          "".format(options=map_grd_options,
-                                    plot_path=self.parameter['plot_path'],
-                                    date=self.parameter['date'],
-                                    filename=empty_map_filename,
-                                    hemisphere=self.hem_ext)
+    def _add_radar_status(self, status, filename, reason=None):
+        """
+        Records a data file as used, missing or raising errors, see
+        RadarStatus.add.
+        """
+        self.radar_status.add(status, filename, reason)
 
-        check_rst_command(map_grd_command, empty_map_path)
+    @property
+    def radars_used(self):
+        """
+        str list of the data files used in the convection map process
+        """
+        return self.radar_status.summary(RadarStatus.USED)
 
-        hmb_map_filename = "{date}.{hemisphere}.hmb.map"\
-                "".format(date=self.parameter['date'],
-                          hemisphere=self.hem_ext)
-        hmb_map_path = "{plot_path}/{hmb_map}"\
-                       "".format(plot_path=self.parameter['plot_path'],
-                                 hmb_map=hmb_map_filename)
+    @property
+    def radars_missing(self):
+        """
+        str list of the data files that were missing
+        """
+        return self.radar_status.summary(RadarStatus.MISSING)
 
-        map_addhmb_command = "map_addhmb {options} {plot_path}/{empty_map} >"\
-                             " {plot_path}/{hmb_map}"\
-                             "".format(options=self.rst_options,
-                                       plot_path=self.parameter['plot_path'],
-                                       empty_map=empty_map_filename,
-                                       hmb_map=hmb_map_filename)
+    @property
+    def radars_errors(self):
+        """
+        str list of the data files that raised errors
+        """
+        return self.radar_status.summary(RadarStatus.ERRORS)
 
-        check_rst_command(map_addhmb_command, hmb_map_path)
+    @property
+    def radars_quarantined(self):
+        """
+        str list of the data files quarantined as corrupt
+        """
+        return self.radar_status.summary(RadarStatus.QUARANTINED)
 
-        imf_filename = '{imf_path}/{date}_imf.txt'.format(imf_path=self.parameter['imf_path'],
-                                                          date=self.parameter['date'])
-        imf_map_filename = "{date}.{hemisphere}.imf.map"\
-                           "".format(date=self.parameter['date'],
-                                     hemisphere=self.hem_ext)
-        imf_map_path = "{map_path}/{imf_map}"\
-                       "".format(map_path=self.parameter['map_path'],
-                                 imf_map=imf_map_filename)
+    @with_run_context
+    def grid_radar(self, abbrv):
+        """
+        Generates the grid file(s) of a radar from its decompressed data
+        files in the plot path.
+
+            :param abbrv: radar name, e.g. ksr or ksr.a for the files of
+                          channel a
+            :return: True if the grid file(s) were generated
+        """
+        with log_context(radar=abbrv):
+            try:
+                return self._grid_radar(abbrv)
+            finally:
+                if self._grid_combiner is not None:
+                    # the merge must not wait for files that a failure
+                    # left incomplete or undeclared
+                    self._grid_combiner.close(abbrv)
+
+    def _grid_radar(self, abbrv):
+        try:
+            stage = 'grid {}'.format(abbrv)
+            inputs = self._decompressed_files(abbrv)
+            if not inputs:
+                logger.warning("No decompressed data files of {}"
+                               "".format(abbrv))
+                return False
+            options = "{integration_time} {channel}"\
+                      "".format(integration_time=self._integration_time(),
+                                channel=self.parameter['channel'])
+            entry = self._completed_stage(stage, inputs, options)
+            if entry:
+                self._declare_grid_files(abbrv,
+                                         [output[0] for output in entry['outputs']],
+                                         complete=True)
+                return True
+
+            outputs = self.generate_radar_grid_file(abbrv, inputs)
+            if not outputs:
+                return False
+            self._record_stage(stage, inputs, outputs, options)
+            return True
+        except Exception as err:
+            logger.error(err)
+            return False
 
+    def _grd_path(self):
+        """
+        :return: str path of the combined grid file
+        """
+        return "{plot_path}/{date}.{hemisphere}{resolution}.grd"\
+               "".format(plot_path=self.parameter['plot_path'],
+                         date=self.parameter['date'],
+                         hemisphere=self.hem_ext,
+                         resolution=self._resolution_ext())
 
-        if not os.path.exists(imf_filename):
-            omni = Omni(self.parameter['date'], self.parameter['map_path'])
+    def _map_filename(self, stage=None):
+        """
+        :param stage: intermediate map stage name (empty, hmb, imf, model),
+                      None for the final fitted map file
+        :return: str name of the map file
+        """
+        if stage:
+            return "{date}.{hemisphere}{resolution}.{stage}.map"\
+                   "".format(date=self.parameter['date'],
+                             hemisphere=self.hem_ext,
+                             resolution=self._resolution_ext(),
+                             stage=stage)
+        if self.parameter['hemisphere'] == 'south':
+            hemisphere = 's'
+        elif self.parameter['hemisphere'] == 'north':
+            hemisphere = 'n'
+        else:
+            hemisphere = 'canadian'
+        return "{date}.{hemisphere}{resolution}.map"\
+               "".format(date=self.parameter['date'],
+                         hemisphere=hemisphere,
+                         resolution=self._resolution_ext())
 
-            try:
-                update = omni.check_for_updates()
-                if update:
-                    old_omni_file = "{map_path}/{date}_omni_{currentdate}.txt"\
-                                    "".format(date=self.parameter['date'],
-                                              currentdate=self._current_date.strftime("%Y%m%d"))
-                    try:
-                        shutil.move(omni.omni_path, old_omni_file)
-                    except IOError as err:
-                        logging.exception(err)
-                        pass
-            except OmniFileNotFoundWarning as warning_msg:
-                logging.warn(warning_msg)
-                update = True
+    def _map_path(self, stage=None):
+        """
+        :param stage: see _map_filename
+        :return: str path of the map file in the plot path
+        """
+        return "{plot_path}/{map_file}"\
+               "".format(plot_path=self.parameter['plot_path'],
+                         map_file=self._map_filename(stage))
 
-            try:
-                if update:
-                    omni.get_omni_file()
+    @with_run_context
+    def generate_grid_files(self):
+        """
+        Generates the grid files used in the map generation step, the data
+        files are decompressed and split by channel once for all the
+        integration times.
+        """
+        with self._profile_stage('generate_grid_files'):
+            self._reset_channel_files()
+            radars = self._radar_files()
+            for radar, data_files in radars.items():
+                for data_file in data_files:
+                    self._decompress_task(data_file, radar.name)
+
+            for integration_time in self.integration_times:
+                with self._resolution(integration_time):
+                    grid_file_counter = 0
+                    for radar in radars:
+                        if self.grid_radar(radar.name):
+                            grid_file_counter += 1
+
+                    if grid_file_counter == 0:
+                        logger.error(NoGridFilesException)
+                        raise NoGridFilesException(self._radar_abbreviations())
+
+                    self.combine_grid_files()
+
+    @with_run_context
+    def combine_grid_files(self):
+        """
+        Combines the radar grid files into the hemisphere grd file.
+
+            :raise NoGridFilesException: no radar grid files were generated
+        """
+        # useful logging information for the user
+        logger.info(self.radars_used)
+        logger.info(self.radars_missing)
+        logger.info(self.radars_errors)
+        logger.info(self.radars_quarantined)
+
+        grid_pattern = "{plot_path}/{date}.*.{hemisphere}{resolution}.grid"\
+                       "".format(plot_path=self.parameter['plot_path'],
+                                 date=self.parameter['date'],
+                                 hemisphere=self.hem_ext,
+                                 resolution=self._resolution_ext())
+        if not glob(grid_pattern):
+            logger.error(NoGridFilesException)
+            raise NoGridFilesException(self._radar_abbreviations())
+
+        grd_path = self._grd_path()
+        inputs = sorted(glob(grid_pattern))
+        combiner = self.parameter['grid_combiner']
+        if not self._completed_stage('combine_grid', inputs, combiner):
+            if combiner == 'python':
+                merge_grid_files(inputs, grd_path)
+            else:
+                combine_grid_command = ['combine_grid'] + \
+                                       self.rst_options.split() + inputs
+                self._rst_command(combine_grid_command, grd_path)
+            self._record_stage('combine_grid', inputs, [grd_path], combiner)
+        self._save_product(grd_path, self.parameter['grid_path'], copy=False)
+
+    @with_run_context
+    def combine_grid_streams(self):
+        """
+        Combines the radar grid files while the radars are gridded, see
+        GridCombiner; the combine step of run with the python grid
+        combiner.
+
+            :raise NoGridFilesException: no radar grid files were declared
+        """
+        inputs = self._grid_combiner.wait_declared()
+        if not inputs:
+            logger.error(NoGridFilesException)
+            raise NoGridFilesException(self._radar_abbreviations())
+
+        grd_path = self._grd_path()
+        if self._completed_stage('combine_grid', inputs, 'python'):
+            self._save_product(grd_path, self.parameter['grid_path'],
+                               copy=False)
+            return
+        self._grid_combiner.merge(grd_path)
+
+        logger.info(self.radars_used)
+        logger.info(self.radars_missing)
+        logger.info(self.radars_errors)
+        logger.info(self.radars_quarantined)
+        inputs = [grid_path for grid_path in inputs
+                  if os.path.exists(grid_path)]
+        if not inputs:
+            logger.error(NoGridFilesException)
+            raise NoGridFilesException(self._radar_abbreviations())
+        self._record_stage('combine_grid', inputs, [grd_path], 'python')
+        self._save_product(grd_path, self.parameter['grid_path'], copy=False)
+
+    def _memoised_stage(self, stage, inputs, options, output, produce):
+        """
+        Runs a step of the map file chain. With a stage cache the output is
+        taken from the cache when the step ran before on inputs of the same
+        content with the same options, and cached otherwise; steps after a
+        changed option run again as their input changes.
+
+            :param stage: name of the step
+            :param inputs: list of the input files of the step
+            :param options: str of the options of the step
+            :param output: path of the output file
+            :param produce: callable taking the path of the file to write
+        """
+        if self.stage_cache is None:
+            if os.path.exists(output) and os.stat(output).st_nlink > 1:
+                # linked to an entry of a stage cache by an earlier run, the
+                # entry must not be overwritten in place
+                os.remove(output)
+            produce(output)
+            return
+
+        key = self.stage_cache.key(stage, options,
+                                   *[content_fingerprint(filename)
+                                     for filename in inputs])
+        if self.stage_cache.lookup(key):
+            logger.info("{stage}: same input and options as a cached run"
+                        "".format(stage=stage))
+        self.stage_cache.fetch(key, output, produce)
+
+    @with_run_context
+    def map_grd(self):
+        """
+        Generates the empty map file from the grd file (map_grd), with the
+        map_grd_options.
+        """
+        map_grd_options = self.parameter['map_grd_options']
+
+        if self.parameter['hemisphere'] == "south":
+            map_grd_options = self.rst_options + " -sh " + map_grd_options
 
-                omni.omnifile_to_IMFfile()
+        grd_path = self._grd_path()
+        file_exists(grd_path)
+        empty_map_path = self._map_path('empty')
+        if self._completed_stage('map_grd', [grd_path], map_grd_options):
+            return
+
+        def produce(filepath):
+            map_grd_command = ['map_grd'] + map_grd_options.split() + \
+                              [grd_path]
+            self._rst_command(map_grd_command, filepath)
+
+        self._memoised_stage('map_grd', [grd_path], map_grd_options,
+                             empty_map_path, produce)
+        self._record_stage('map_grd', [grd_path], [empty_map_path],
+                           map_grd_options)
+
+    @with_run_context
+    def map_addhmb(self):
+        """
+        Adds the Heppner-Maynard boundary to the empty map file (map_addhmb).
+        """
+        hmb_map_path = self._map_path('hmb')
+        inputs = [self._map_path('empty')]
+        if self._completed_stage('map_addhmb', inputs):
+            return
 
-                imf_filename = '{map_path}/{imf_file}'.format(map_path=self.parameter['map_path'],
-                                                              imf_file=omni.imf_filename)
+        def produce(filepath):
+            map_addhmb_command = ['map_addhmb'] + self.rst_options.split() + \
+                                 [self._map_path('empty')]
+            self._rst_command(map_addhmb_command, filepath)
 
+        self._memoised_stage('map_addhmb', inputs, '', hmb_map_path, produce)
+        self._record_stage('map_addhmb', inputs, [hmb_map_path])
 
-            except OmniException as err_msg:
-                logging.error(err_msg)
-                self._imf_option = ""
-                input_model_file = hmb_map_filename
+    @with_run_context
+    def get_imf_file(self):
+        """
+        Gets the IMF file of the date, from the imf path when it is there,
+        otherwise downloading the OMNI data and converting it.
 
-            except (OmniFileNotGeneratedWarning,
-                    OmniFileNotFoundWarning,
-                    OmniBadDataWarning) \
-                    as warning_msg:
-                logging.warn(warning_msg)
-                self._imf_option = ""
-                input_model_file = hmb_map_filename
+            :return: str path of the IMF file, None if there is no IMF data
+        """
+        imf_filename = '{imf_path}/{date}_imf.txt'.format(imf_path=self.parameter['imf_path'],
+                                                          date=self.parameter['date'])
+        if os.path.exists(imf_filename):
+            return imf_filename
 
+        entry = self._completed_stage('omni', [])
+        if entry:
+            return entry['result']
 
+        # several runs of the date share the map path, one of them fetches
+        # the OMNI data while the others wait for it
+        imf_cache = IMFCache(self.parameter['map_path'])
+        try:
+            imf_filename = imf_cache.imf_file(self.parameter['date'],
+                                              self._current_date)
+            self._record_stage('omni', [], [imf_filename], result=imf_filename)
+            return imf_filename
+
+        except (OmniException, LockTimeoutException) as err_msg:
+            logger.error(err_msg)
+
+        except (OmniFileNotGeneratedWarning,
+                OmniFileNotFoundWarning,
+                OmniBadDataWarning) \
+                as warning_msg:
+            logger.warning(warning_msg)
+        return None
+
+    @with_run_context
+    def map_addimf(self, imf_filename):
+        """
+        Adds the IMF data to the map file (map_addimf), with the
+        map_addimf_options. Without IMF data the model is added to the hmb
+        map file instead.
 
-        map_addimf_command = "map_addimf {options} -omni -d 00:10"\
-                             " -if {imf_file}"\
-                             " {plot_path}/{hmb_map} >"\
-                             " {plot_path}/{imf_map}"\
-                             "".format(options=self.rst_options,
-                                       map_path=self.parameter['map_path'],
-                                       plot_path=self.parameter['plot_path'],
-                                       imf_file=imf_filename,
-                                       hmb_map=hmb_map_filename,
-                                       imf_map=imf_map_filename)
+            :param imf_filename: str path of the IMF file, None if there is
+                                 no IMF data
+        """
+        if imf_filename is None:
+            self._imf_option = ""
+            return
 
-        check_rst_command(map_addimf_command, imf_map_path)
+        imf_map_path = self._map_path('imf')
         self._imf_option = " -imf"
-        input_model_file = imf_map_filename
+        inputs = [self._map_path('hmb'), imf_filename]
+        options = "{rst} {options}"\
+                  "".format(rst=self.rst_options,
+                            options=self.parameter['map_addimf_options']).strip()
+        if self._completed_stage('map_addimf', inputs, options):
+            return
+
+        def produce(filepath):
+            map_addimf_command = ['map_addimf'] + options.split() + \
+                                 ['-omni', '-if', imf_filename,
+                                  self._map_path('hmb')]
+            self._rst_command(map_addimf_command, filepath)
+
+        self._memoised_stage('map_addimf', inputs, options, imf_map_path,
+                             produce)
+        self._record_stage('map_addimf', inputs, [imf_map_path], options)
+
+    @with_run_context
+    def map_addmodel(self):
+        """
+        Adds the statistical model to the map file (map_addmodel), for a
+        fit of order fit_order with the map_addmodel_options.
+        """
+        map_model_path = self._map_path('model')
+        # the IMF map file, the hmb map file without IMF data
+        model_input = self._map_path('imf' if self._imf_option else 'hmb')
+        inputs = [model_input]
+        options = "{rst} -o {order} {options}"\
+                  "".format(rst=self.rst_options,
+                            order=self.parameter['fit_order'],
+                            options=self.parameter['map_addmodel_options']).strip()
+        if self._completed_stage('map_addmodel', inputs, options):
+            return
+
+        def produce(filepath):
+            map_addmodel_command = ['map_addmodel'] + options.split() + \
+                                   [model_input]
+            self._rst_command(map_addmodel_command, filepath)
+
+        self._memoised_stage('map_addmodel', inputs, options, map_model_path,
+                             produce)
+        self._record_stage('map_addmodel', inputs, [map_model_path], options)
+
+    @with_run_context
+    def map_fit(self):
+        """
+        Fits the spherical harmonic expansion (map_fit) and saves the map
+        file to the map path, see _save_product.
+        """
+        map_path = self._map_path()
+        inputs = [self._map_path('model')]
+        options = self.rst_options
+        if self._completed_stage('map_fit', inputs, options):
+            self._save_product(map_path, self.parameter['map_path'])
+            return
+
+        def produce(filepath):
+            map_fit_command = ['map_fit'] + options.split() + \
+                              [self._map_path('model')]
+            self._rst_command(map_fit_command, filepath)
+
+        self._memoised_stage('map_fit', inputs, options, map_path, produce)
+        self._record_stage('map_fit', inputs, [map_path], options)
+        self._save_product(map_path, self.parameter['map_path'])
+
+    @with_run_context
+    def export_map(self):
+        """
+        Exports the fit results of the map file to the columnar store in the
+        export path (see MapStore), when an export path is given. The series
+        of the map file is its name without the date, e.g. n or n.120s.
+        """
+        export_path = self.parameter['export_path']
+        if not export_path:
+            return
+        map_path = self._map_path()
+        if self._completed_stage('export', [map_path], export_path):
+            return
+        series = self._map_filename()[len(self.parameter['date']) + 1:
+                                      -len('.map')]
+        # numpy is only needed by the export
+        from DARNprocessing.utils.mapstore import MapStore
+        MapStore(export_path).export(map_path, series)
+        self._record_stage('export', [map_path], [], export_path)
+
+    def _save_product(self, source, directory, copy=True):
+        """
+        Saves a product (the map or grd file) to its directory. With the
+        compression parameter the file is compressed in the background (see
+        wait_for_products), otherwise it is copied.
 
+            :param source: path of the file in the plot path
+            :param directory: directory the file is saved to
+            :param copy: copy the file when products are not compressed
+        """
+        destination = "{directory}/{name}"\
+                      "".format(directory=directory,
+                                name=os.path.basename(source))
+        compression = self.parameter['compression']
+        if not compression:
+            if copy:
+                # a compressed copy of an earlier run would be out of date
+                for stale_file in compressed_variants(destination):
+                    os.remove(stale_file)
+                try:
+                    shutil.copy2(source, destination)
+                except shutil.Error:
+                    pass
+            return
+
+        compressed_path = "{destination}.{ext}".format(destination=destination,
+                                                       ext=compression)
+        stage = 'save {}'.format(os.path.basename(compressed_path))
+        options = "{compression} {level}"\
+                  "".format(compression=compression,
+                            level=self.parameter['compression_level'])
+        if self._completed_stage(stage, [source], options):
+            return
+        # readers prefer the uncompressed file of an earlier run
+        for stale_file in [destination] + compressed_variants(destination):
+            if stale_file != compressed_path and os.path.exists(stale_file):
+                os.remove(stale_file)
+
+        if self._compression_pool is None:
+            self._compression_pool = \
+                ThreadPoolExecutor(max_workers=self.parameter['compression_threads'])
+        context = contextvars.copy_context()
+        self._compressions.append(
+            self._compression_pool.submit(context.run, self._compress_product,
+                                          source, compressed_path, stage,
+                                          options))
+
+    def _compress_product(self, source, compressed_path, stage, options):
+        compress_file(source, compressed_path, self.parameter['compression'],
+                      self.parameter['compression_level'])
+        logger.info("Saved {}".format(compressed_path))
+        self._record_stage(stage, [source], [compressed_path], options)
+
+    def wait_for_products(self):
+        """
+        Waits for the products compressed in the background.
 
-        map_model_filename = "{date}.{hemisphere}.model.map"\
-                             "".format(date=self.parameter['date'],
-                                       hemisphere=self.hem_ext)
-        map_model_path = "{plot_path}/{map_model}"\
-                         "".format(plot_path=self.parameter['plot_path'],
-                                   map_model=map_model_filename)
+            :raise Exception: the error of the first compression that failed
+        """
+        compressions, self._compressions = self._compressions, []
+        errors = []
+        for compression in compressions:
+            try:
+                compression.result()
+            except Exception as err:
+                logger.error("Compression failed: {}".format(err))
+                errors.append(err)
+        if errors:
+            raise errors[0]
 
-        map_addmodel_command = "map_addmodel {options} -o 8 -d l "\
-                               "{plot_path}/{input_map} > {plot_path}/{model_map}"\
-                               "".format(options=self.rst_options,
-                                         plot_path=self.parameter['plot_path'],
-                                         input_map=input_model_file,
-                                         model_map=map_model_filename)
-        check_rst_command(map_addmodel_command, map_model_path)
+    def _product_input(self, product_path):
+        """
+        Path an RST command can read a saved product from: the saved file,
+        the file it was saved from in the plot path, or the saved file
+        decompressed into the plot path.
 
-        if self.parameter['hemisphere'] == 'south':
-            map_filename = "{date}.s.map".format(date=self.parameter['date'])
-        elif self.parameter['hemisphere'] == 'north':
-            map_filename = "{date}.n.map".format(date=self.parameter['date'])
-        else:
-            map_filename = "{date}.canadian.map".format(date=self.parameter['date'])
-
-        map_path = "{plot_path}/{map_file}"\
-                   "".format(plot_path=self.parameter['plot_path'],
-                             map_file=map_filename)
-
-        map_fit_command = "map_fit {options} {plot_path}/{model_map} >"\
-                          " {plot_path}/{map_file}"\
-                          "".format(options=self.rst_options,
-                                    plot_path=self.parameter['plot_path'],
-                                    model_map=map_model_filename,
-                                    map_file=map_filename)
-        check_rst_command(map_fit_command, map_path)
-        try:
-            shutil.copy2(map_path, self.parameter["map_path"])
-        except shutil.Error:
-            pass
+            :param product_path: path of the saved product, uncompressed name
+            :return: str path of an uncompressed file
+        """
+        if os.path.exists(product_path):
+            return product_path
+        plot_path = "{plot_path}/{name}"\
+                    "".format(plot_path=self.parameter['plot_path'],
+                              name=os.path.basename(product_path))
+        if os.path.exists(plot_path):
+            return plot_path
+        for compressed_path in compressed_variants(product_path):
+            decompress_file(compressed_path, plot_path)
+            return plot_path
+        return product_path
+
+    @with_run_context
+    def generate_map_files(self):
+        """
+        Generates the various map files for the radar fit/fitacf files availible for
+        the given date and hemisphere. The 'date.map' is the only saved file,
+        the other map files are removed at the end of the convection process.
+        With several integration times each has its own map files.
+        """
+        with self._profile_stage('generate_map_files'):
+            imf_filename = self.get_imf_file()
+            for integration_time in self.integration_times:
+                with self._resolution(integration_time):
+                    self.map_grd()
+                    self.map_addhmb()
+                    self.map_addimf(imf_filename)
+                    self.map_addmodel()
+                    self.map_fit()
+                    self.export_map()
+
+    def _frame_ext(self):
+        """
+        :return: extension of the frames map_plot writes, ps for the
+                 PostScript image extensions (see PlotConst), the raster
+                 frame extension otherwise
+        """
+        if self.parameter['image_ext'] in PlotConst.POSTSCRIPT_EXT:
+            return 'ps'
+        return PlotConst.RASTER_FRAME_EXT
 
-    def generate_RST_convection_maps(self):
+    def _frame_path(self):
         """
-        Generates the convection maps using the RST map_plot function.
+        :return: directory map_plot writes the frames of the current
+                 integration time to, the plot path with a single
+                 integration time and a directory of the integration time
+                 in it otherwise (the frames are named after their time)
+        """
+        if len(self.integration_times) == 1:
+            return self.parameter['plot_path']
+        frame_path = "{plot_path}/{time}s"\
+                     "".format(plot_path=self.parameter['plot_path'],
+                               time=self._integration_time())
+        if not os.path.isdir(frame_path):
+            os.makedirs(frame_path, exist_ok=True)
+        return frame_path
+
+    @with_run_context
+    def plot_convection_maps(self):
         """
+        Plots the convection maps of the map file using the RST map_plot
+        function, as PostScript frames for PostScript based image extensions
+        and as raster frames otherwise.
 
-        logging.info("Generating Convection Maps uring RST ")
+            :return: list of the frame files
+        """
+        logger.info("Generating Convection Maps uring RST ")
         # TODO: A better method of importing the key file and
         # what to do when it is not provided
         key_option = "-vkeyp -vkey rainbow.key"
-        map_path = "{map_path}/{date}.map"\
+        map_path = "{map_path}/{map_file}"\
                    "".format(map_path=self.parameter['map_path'],
-                             date=self.parameter['date'])
-
-        post_script_path = "{}/*.ps".format(self.parameter['plot_path'])
+                             map_file=self._map_filename())
+        # the saved map file may be compressed
+        map_path = self._product_input(map_path)
+
+        frame_ext = self._frame_ext()
+        frame_directory = self._frame_path()
+        frame_path = "{plot_path}/*.{ext}".format(plot_path=frame_directory,
+                                                  ext=frame_ext)
         file_exists(map_path)
-        map_plot_command = "map_plot {options} -ps -mag"\
-                           " -st {start_time} -et {end_time} -rotate -hmb -modn"\
-                           " -fit -grd -ctr {imf} -dn -extra -coast -vecp "\
-                           " -pot -time {key} -path {plot_path} {map_path}"\
-                           " 2>/dev/null"\
-                           "".format(options=self.rst_options,
-                                     start_time=self.parameter['start_time'],
-                                     end_time=self.parameter['end_time'],
-                                     imf=self._imf_option,
-                                     key=key_option,
-                                     plot_path=self.parameter['plot_path'],
-                                     map_path=map_path)
-        logging.info(map_plot_command)
-        check_rst_command(map_plot_command, post_script_path)
-
-        for ps_file in glob(post_script_path):
-            image_filename = ps_file.replace(".ps", "")
-            convert_command = "convert -density 200 {ps_filename} "\
-                              " {filename}.{ext}"\
-                              "".format(plot_path=self.parameter['plot_path'],
-                                        ps_filename=ps_file,
-                                        filename=image_filename,
-                                        ext=self.parameter['image_ext'])
-            return_value = call(convert_command.split())
-            if return_value != 0:
-                logging.warn(ConvertWarning(ps_file,
-                                            self.parameter['image_ext']))
+        options = "{start_time} {end_time}{imf} {frame_ext}"\
+                  "".format(start_time=self.parameter['start_time'],
+                            end_time=self.parameter['end_time'],
+                            imf=self._imf_option,
+                            frame_ext=frame_ext)
+        entry = self._completed_stage('map_plot', [map_path], options)
+        if entry:
+            return entry['result']
+
+        map_plot_command = Command(['map_plot'] + self.rst_options.split() +
+                                   ['-' + frame_ext, '-mag',
+                                    '-st', self.parameter['start_time'],
+                                    '-et', self.parameter['end_time'],
+                                    '-rotate', '-hmb', '-modn',
+                                    '-fit', '-grd', '-ctr'] +
+                                   self._imf_option.split() +
+                                   ['-dn', '-extra', '-coast', '-vecp',
+                                    '-pot', '-time'] + key_option.split() +
+                                   ['-path', frame_directory,
+                                    map_path],
+                                   stderr=DEVNULL, cwd=self._current_path,
+                                   **self._command_limits('map_plot'))
+        check_rst_command(map_plot_command, frame_path, self.executor)
+        frame_files = sorted(glob(frame_path))
+        self._record_stage('map_plot', [map_path], frame_files, options,
+                           result=frame_files)
+        return frame_files
+
+    @with_run_context
+    def convert_plot(self, frame_file):
+        """
+        Converts a frame to the image extension: raster frames are encoded
+        to png in process, other conversions use convert.
 
+            :param frame_file: str path of the PostScript or raster frame
+        """
+        image_filename, frame_ext = os.path.splitext(frame_file)
+        if frame_ext[1:] == self.parameter['image_ext']:
+            return
+        image_path = "{filename}.{ext}".format(filename=image_filename,
+                                               ext=self.parameter['image_ext'])
+        stage = 'convert {}'.format(os.path.basename(image_path))
+        if self._completed_stage(stage, [frame_file]):
+            return
+
+        if frame_ext[1:] == PlotConst.RASTER_FRAME_EXT and \
+           self.parameter['image_ext'] == 'png':
+            try:
+                pnm_to_png(frame_file, image_path)
+                return_value = 0
+            except (RasterFormatError, IOError) as err:
+                logger.warning(err)
+                return_value = 1
+        else:
+            convert_command = ['convert']
+            if frame_ext == '.ps':
+                convert_command += ['-density', PlotConst.DENSITY]
+            convert_command = Command(convert_command + [frame_file,
+                                                         image_path],
+                                      cwd=self._current_path,
+                                      **self._command_limits('convert'))
+            logger.info(str(convert_command))
+            try:
+                return_value = self.executor.run(convert_command)
+            except RSTTimeoutException as err:
+                logger.warning(err)
+                return_value = 1
+        if return_value != 0:
+            logger.warning(ConvertWarning(frame_file,
+                                          self.parameter['image_ext']))
+        else:
+            self._record_stage(stage, [frame_file], [image_path])
+
+    @with_run_context
+    def generate_RST_convection_maps(self):
+        """
+        Generates the convection maps using the RST map_plot function.
+        """
+        with self._profile_stage('generate_RST_convection_maps'):
+            for integration_time in self.integration_times:
+                with self._resolution(integration_time):
+                    for frame_file in self.plot_convection_maps():
+                        self.convert_plot(frame_file)
+
+    @with_run_context
+    def run(self):
+        """
+        Runs the whole convection map process (without cleanup) as a graph
+        of tasks: decompressing every data file, gridding every radar,
+        combining the grid files, fetching the OMNI data, the map file chain
+        and converting every plotted frame. Independent tasks run at the same
+        time with num_proc CPU slots and io_slots I/O slots, e.g. the OMNI
+        download runs while the radars are gridded. The critical path is
+        logged at the end. With profiling on every task is profiled.
+        With several integration times the data files are decompressed once
+        and the grid, map and plot tasks of the integration times run at the
+        same time, named after their integration time.
+
+            :return: the Scheduler that ran the tasks
+        """
+        wrapper = self.profiler.wrap if self.profiler else None
+        scheduler = Scheduler(self.parameter['num_proc'],
+                              self.parameter['io_slots'],
+                              wrapper)
+
+        self._reset_channel_files()
+        self._grid_combiners = {}
+        # radar name: decompress tasks of the data files of the radar, the
+        # registry puts every data file under exactly one radar
+        radar_dependencies = {}
+        for radar, data_files in self._radar_files().items():
+            radar_dependencies[radar.name] = []
+            for data_file in data_files:
+                # a block parallel decompression takes a CPU slot per
+                # process, the other tasks wait for them
+                slots = scheduler.slots[CPU] \
+                    if self._parallel_decompression(data_file) else 1
+                radar_dependencies[radar.name].append(
+                    scheduler.add_task('decompress {}'.format(os.path.basename(data_file)),
+                                       self._decompress_task,
+                                       (data_file, radar.name, slots),
+                                       slots=slots))
+        imf = scheduler.add_task('omni', self.get_imf_file, resource=IO)
+
+        # the grid and map steps of every integration time, they share the
+        # decompressed (and channel split) data files and the IMF file
+        for integration_time in self.integration_times:
+            with self._resolution(integration_time):
+                self._add_resolution_tasks(scheduler, radar_dependencies, imf)
+
+        try:
+            scheduler.run()
+        finally:
+            scheduler.report()
+            if self.profiler:
+                self.profiler.write()
+        return scheduler
+
+    def _add_resolution_tasks(self, scheduler, radar_dependencies, imf):
+        """
+        Adds the tasks of the current integration time to the task graph of
+        run: gridding every radar, combining the grid files, the map file
+        chain, plotting and exporting the fit results.
+
+            :param scheduler: Scheduler of run
+            :param radar_dependencies: dictionary radar name: list of the
+                                       decompress tasks of the radar
+            :param imf: task getting the IMF file
+        """
+        grid_tasks = []
+        for abbrv, dependencies in radar_dependencies.items():
+            grid_tasks.append(scheduler.add_task(self._resolution_name('grid {}'.format(abbrv)),
+                                                 self.grid_radar,
+                                                 (abbrv,),
+                                                 dependencies=dependencies))
+
+        if self.parameter['grid_combiner'] == 'python':
+            # the grid files are merged as they are written, the merge
+            # mostly waits for make_grid
+            self._grid_combiners[self._integration_time()] = \
+                GridCombiner([task.args[0] for task in grid_tasks])
+            combine = scheduler.add_task(self._resolution_name('combine_grid'),
+                                         self.combine_grid_streams,
+                                         resource=WAIT)
+        else:
+            combine = scheduler.add_task(self._resolution_name('combine_grid'),
+                                         self.combine_grid_files,
+                                         dependencies=grid_tasks)
+        map_grd = scheduler.add_task(self._resolution_name('map_grd'),
+                                     self.map_grd,
+                                     dependencies=[combine])
+        map_addhmb = scheduler.add_task(self._resolution_name('map_addhmb'),
+                                        self.map_addhmb,
+                                        dependencies=[map_grd])
+        map_addimf = scheduler.add_task(self._resolution_name('map_addimf'),
+                                        lambda: self.map_addimf(imf.result),
+                                        dependencies=[map_addhmb, imf])
+        map_addmodel = scheduler.add_task(self._resolution_name('map_addmodel'),
+                                          self.map_addmodel,
+                                          dependencies=[map_addimf])
+        map_fit = scheduler.add_task(self._resolution_name('map_fit'),
+                                     self.map_fit,
+                                     dependencies=[map_addmodel])
+
+        def plot():
+            for frame_file in self.plot_convection_maps():
+                name = 'convert {}'.format(os.path.basename(frame_file))
+                scheduler.add_task(self._resolution_name(name),
+                                   self.convert_plot, (frame_file,))
+
+        scheduler.add_task(self._resolution_name('map_plot'), plot,
+                           dependencies=[map_fit])
+        if self.parameter['export_path']:
+            scheduler.add_task(self._resolution_name('export'),
+                               self.export_map,
+                               dependencies=[map_fit])
+
+    def _parallel_decompression(self, data_file):
+        """
+        :param data_file: str path of a compressed data file
+        :return: True if the file is decompressed block parallel
+        """
+        return data_file.endswith('.bz2') and \
+            os.path.getsize(data_file) >= RadarConst.PARALLEL_BZ2_SIZE
+
+    def _decompress_task(self, data_file, abbrv, processes=None):
+        """
+        decompress_data_file as a task, errors are logged and the file is
+        not used.
+        """
+        with log_context(radar=abbrv):
+            try:
+                self.decompress_data_file(data_file, processes)
+            except Exception as err:
+                logger.error(err)
+
+    @with_run_context
     def cleanup(self):
         """
         Cleans up any meta or data that should not be stored in the plot path.
         """
+        if self.profiler:
+            # flush the profile of the steps run so far before the log file
+            # is copied
+            self.profiler.write()
+        # the products are compressed from the files removed below
+        try:
+            self.wait_for_products()
+        finally:
+            flush_logs()
+
         path = "{plot_path}/{date}".format(plot_path=self.parameter['plot_path'],
                                            date=self.parameter['date'])
 
@@ -870,6 +2185,34 @@ class ConvectionMaps():
         for f in glob(path + "*.grd"):
             os.remove(f)
 
+        # raster frames are large and only kept when asked for
+        if self.parameter['image_ext'] != PlotConst.RASTER_FRAME_EXT:
+            frame_paths = [self.parameter['plot_path']]
+            if len(self.integration_times) > 1:
+                frame_paths += ["{plot_path}/{time}s"
+                                "".format(plot_path=self.parameter['plot_path'],
+                                          time=integration_time)
+                                for integration_time in self.integration_times]
+            for frame_path in frame_paths:
+                for f in glob('{path}/{date}*.{ext}'.format(path=frame_path,
+                                                            date=self.parameter['date'],
+                                                            ext=PlotConst.RASTER_FRAME_EXT)):
+                    os.remove(f)
+
+        # the intermediate files the manifest refers to are gone
+        self.manifest.remove()
+
+    def close(self):
+        """
+        Flushes and closes the log file of the run. Logging of the instance
+        stops, call it when the instance is no longer used in a long running
+        process.
+        """
+        self.executor.shutdown()
+        if self._compression_pool is not None:
+            self._compression_pool.shutdown()
+        unregister_run(self.run_id)
+
 
 if __name__ == '__main__':
     import sys
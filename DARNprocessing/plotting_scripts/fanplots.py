@@ -0,0 +1,281 @@
+# Copyright 2018 SuperDARN Canada
+#
+# fanplots.py
+"""
+Fan plots of fitacf data: one frame per scan of a radar, every range gate
+cell with data coloured by its velocity, power or width.
+
+The cells of a scan are drawn as one matplotlib PolyCollection whose
+vertices come from the cached field-of-view corners (utils/fov.py) by array
+indexing, without a loop over the beams and gates. The frames are rendered
+by a pool of processes; the geometry is looked up once per configuration in
+the parent and sent with the scans.
+
+The map is an azimuthal equidistant projection centred on the pole of the
+radar's hemisphere, in geographic or AACGM magnetic coordinates.
+"""
+
+import os
+import logging
+
+from collections import namedtuple
+from multiprocessing import Pool
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.collections import PolyCollection
+
+from DARNprocessing.utils.dmap import read_records, fitacf_time
+from DARNprocessing.utils.fov import (hardware_filename,
+                                      read_hardware,
+                                      hardware_config,
+                                      fov_corners)
+from DARNprocessing.utils.convectionMapConstants import FanConst
+from DARNprocessing.utils.convectionMapExceptions import \
+    UnsupportedTypeException
+
+logger = logging.getLogger(__name__)
+
+Scan = namedtuple('Scan', ['time', 'stid', 'frang', 'rsep', 'gates',
+                           'beam', 'gate', 'value', 'ground_scatter'])
+
+
+def read_scans(fitacf_files, parameter='velocity'):
+    """
+    Groups the records of fitacf files into scans. A scan starts at a
+    record with the scan flag set, when a beam repeats or when the gate
+    layout changes.
+
+        :param fitacf_files: list of fitacf file paths in time order,
+                             compressed or not
+        :param parameter: one of FanConst.PARAMETERS
+        :return: generator of Scan, the beam, gate, value and ground_scatter
+                 numpy arrays holding one element per cell with data
+    """
+    name = FanConst.PARAMETERS[parameter]
+    records = []
+    beams = set()
+
+    def scan():
+        columns = [[], [], [], []]
+        for record in records:
+            gates = np.asarray(record.get('slist', ()), dtype=int)
+            if not gates.size or name not in record:
+                continue
+            columns[0].append(np.full(gates.size, record['bmnum'], dtype=int))
+            columns[1].append(gates)
+            columns[2].append(np.asarray(record[name], dtype=float))
+            columns[3].append(np.asarray(record.get('gflg', [0] * gates.size),
+                                         dtype=bool))
+        first = records[0]
+        return Scan(fitacf_time(first), first['stid'], first['frang'],
+                    first['rsep'], max(record['nrang'] for record in records),
+                    *[np.concatenate(column) if column else
+                      np.zeros(0, dtype=int if index < 2 else float)
+                      for index, column in enumerate(columns)])
+
+    for filename in fitacf_files:
+        for record in read_records(filename):
+            layout = (record['stid'], record['frang'], record['rsep'])
+            if records and (abs(record.get('scan', 0)) == 1 or
+                            record['bmnum'] in beams or
+                            layout != (records[0]['stid'],
+                                       records[0]['frang'],
+                                       records[0]['rsep'])):
+                yield scan()
+                records = []
+                beams = set()
+            records.append(record)
+            beams.add(record['bmnum'])
+    if records:
+        yield scan()
+
+
+def project(latitude, longitude, hemisphere=1):
+    """
+    :param latitude: numpy array of latitudes in degrees
+    :param longitude: numpy array of longitudes in degrees
+    :param hemisphere: 1 north, -1 south
+    :return: numpy array latitude.shape + (2,) of the x, y positions in
+             degrees of colatitude from the pole
+    """
+    colatitude = 90 - hemisphere * latitude
+    azimuth = np.radians(longitude)
+    # longitude 0 down for the north, the south seen through the earth
+    return np.stack([hemisphere * colatitude * np.sin(azimuth),
+                     -colatitude * np.cos(azimuth)], axis=-1)
+
+
+def cell_vertices(latitude, longitude, beam, gate, hemisphere=1):
+    """
+    Projected vertices of cells.
+
+        :param latitude: corner latitudes of fov_corners
+        :param longitude: corner longitudes of fov_corners
+        :param beam: numpy array of the beams of the cells
+        :param gate: numpy array of the gates of the cells
+        :param hemisphere: 1 north, -1 south
+        :return: numpy array (cells, 4, 2) of the projected vertices
+    """
+    beam_corners = np.stack([beam, beam + 1, beam + 1, beam], axis=-1)
+    gate_corners = np.stack([gate, gate, gate + 1, gate + 1], axis=-1)
+    return project(latitude[beam_corners, gate_corners],
+                   longitude[beam_corners, gate_corners], hemisphere)
+
+
+def fov_outline(latitude, longitude, hemisphere=1):
+    """
+    :return: numpy array (points, 2) of the projected edge of the field of
+             view, around the corners of fov_corners
+    """
+    edge = [(latitude[:, 0], longitude[:, 0]),
+            (latitude[-1, 1:], longitude[-1, 1:]),
+            (latitude[-2::-1, -1], longitude[-2::-1, -1]),
+            (latitude[0, -2::-1], longitude[0, -2::-1])]
+    latitudes, longitudes = zip(*edge)
+    return project(np.concatenate(latitudes), np.concatenate(longitudes),
+                   hemisphere)
+
+
+def render_scan(task):
+    """
+    Renders the frame of a scan, run by the pool.
+
+        :param task: (filename, Scan, latitude, longitude, options)
+        :return: filename
+    """
+    filename, scan, latitude, longitude, options = task
+    parameter = options['parameter']
+    hemisphere = 1 if np.nanmean(latitude) >= 0 else -1
+
+    valid = (scan.beam < latitude.shape[0] - 1) & \
+        (scan.gate < latitude.shape[1] - 1) & np.isfinite(scan.value)
+    if not options['ground_scatter']:
+        valid &= ~scan.ground_scatter
+
+    figure, axes = plt.subplots(figsize=options['figure_size'])
+    outline = fov_outline(latitude, longitude, hemisphere)
+    axes.fill(outline[:, 0], outline[:, 1], fill=False, edgecolor='black',
+              linewidth=0.5)
+
+    vertices = cell_vertices(latitude, longitude, scan.beam[valid],
+                             scan.gate[valid], hemisphere)
+    ionospheric = ~scan.ground_scatter[valid]
+    cells = PolyCollection(vertices[ionospheric],
+                           array=scan.value[valid][ionospheric],
+                           cmap=FanConst.COLOUR_MAPS[parameter],
+                           edgecolors='face')
+    cells.set_clim(*options['scale'])
+    axes.add_collection(cells)
+    if options['ground_scatter']:
+        axes.add_collection(PolyCollection(vertices[~ionospheric],
+                                           facecolors=FanConst.
+                                           GROUND_SCATTER_COLOUR,
+                                           edgecolors='face'))
+
+    for colatitude in range(10, 91, 10):
+        axes.add_patch(plt.Circle((0, 0), colatitude, fill=False,
+                                  linestyle=':', linewidth=0.5))
+    margin = 5
+    axes.set_xlim(outline[:, 0].min() - margin,
+                  outline[:, 0].max() + margin)
+    axes.set_ylim(outline[:, 1].min() - margin,
+                  outline[:, 1].max() + margin)
+    axes.set_aspect('equal')
+    axes.set_xticks([])
+    axes.set_yticks([])
+    figure.colorbar(cells, ax=axes,
+                    label="{parameter} ({units})"
+                    "".format(parameter=parameter.capitalize(),
+                              units=FanConst.UNITS[parameter]))
+    axes.set_title("{abbrv} {time:%Y-%m-%d %H:%M:%S} UT"
+                   "".format(abbrv=options['abbrv'], time=scan.time))
+    figure.savefig(filename)
+    plt.close(figure)
+    return filename
+
+
+def plot_fans(fitacf_files, plot_path, abbrv, parameter='velocity',
+              coords='geo', ground_scatter=True, start_time=None,
+              end_time=None, scale=None, image_ext='png', num_proc=1,
+              hdw_path=None, cache_path=None, figure_size=(8, 8)):
+    """
+    Renders a frame per scan of fitacf files.
+
+        :param fitacf_files: list of the fitacf files of one radar channel
+                             in time order
+        :param plot_path: directory of the frames
+        :param abbrv: 3-letter acronym of the radar
+        :param parameter: one of FanConst.PARAMETERS
+        :param coords: one of FanConst.COORDS
+        :param ground_scatter: draw the ground scatter cells in grey,
+                               otherwise leave them out
+        :param start_time: datetime of the first scan plotted, None for all
+        :param end_time: datetime after the last scan plotted, None for all
+        :param scale: (minimum, maximum) of the colour scale, default
+                      FanConst.SCALES
+        :param image_ext: image extension of the frames
+        :param num_proc: number of processes rendering the frames
+        :param hdw_path: directory of the hardware files, default
+                         $SD_HDWPATH
+        :param cache_path: directory of the persisted field of view, see
+                           fov_corners
+        :param figure_size: size of the frames in inches
+        :return: list of the frame paths in time order
+        :raise UnsupportedTypeException: unknown parameter or coordinates
+    """
+    if parameter not in FanConst.PARAMETERS:
+        raise UnsupportedTypeException("Fan plot parameter {parameter} is not"
+                                       " supported, available parameters:"
+                                       " {available}"
+                                       "".format(parameter=parameter,
+                                                 available=sorted(FanConst.
+                                                                  PARAMETERS)))
+    if coords not in FanConst.COORDS:
+        raise UnsupportedTypeException("Coordinates {coords} are not"
+                                       " supported, available coordinates:"
+                                       " {available}"
+                                       "".format(coords=coords,
+                                                 available=FanConst.COORDS))
+    configs = read_hardware(hardware_filename(abbrv, hdw_path))
+    options = {'abbrv': abbrv,
+               'parameter': parameter,
+               'ground_scatter': ground_scatter,
+               'scale': scale or FanConst.SCALES[parameter],
+               'figure_size': figure_size}
+    if not os.path.exists(plot_path):
+        os.makedirs(plot_path)
+
+    def tasks():
+        for scan in read_scans(fitacf_files, parameter):
+            if start_time is not None and scan.time < start_time:
+                continue
+            if end_time is not None and scan.time >= end_time:
+                break
+            config = hardware_config(configs, scan.time)
+            latitude, longitude = fov_corners(config, scan.frang, scan.rsep,
+                                              scan.gates, coords,
+                                              scan.time.year
+                                              if coords == 'mag' else None,
+                                              cache_path)
+            filename = os.path.join(plot_path,
+                                    FanConst.FRAME_NAME.format(
+                                        time=scan.time, abbrv=abbrv,
+                                        parameter=parameter, ext=image_ext))
+            yield filename, scan, latitude, longitude, options
+
+    if num_proc > 1:
+        pool = Pool(num_proc)
+        try:
+            frames = list(pool.imap(render_scan, tasks()))
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        frames = [render_scan(task) for task in tasks()]
+    logger.info("Rendered {count} {parameter} fan plots of {abbrv}"
+                "".format(count=len(frames), parameter=parameter,
+                          abbrv=abbrv))
+    return frames
@@ -0,0 +1,272 @@
+# Copyright 2018 SuperDARN Canada
+#
+# summaryplots.py
+"""
+Range-time intensity (RTI) summary plots of one beam of fitacf data.
+
+The records of the beam are streamed and their cells decimated to the pixel
+grid of the output, one column per horizontal pixel and one row per range
+gate, before anything is drawn: the cells falling in a pixel are combined
+(mean, min or max) as they are read, in chunks of records, so the memory is
+bounded by the image size and not by the length of the data. The grid is
+turned into a single RGBA image, ground scatter grey and empty pixels
+transparent, and drawn with one imshow call instead of a patch per cell.
+"""
+
+import os
+import logging
+
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from matplotlib.colors import Normalize, to_rgba
+
+from DARNprocessing.utils.dmap import (stream_records,
+                                       read_scalar,
+                                       parse_record,
+                                       fitacf_time)
+from DARNprocessing.utils.convectionMapConstants import FanConst, RtiConst
+from DARNprocessing.utils.convectionMapExceptions import \
+    UnsupportedTypeException
+
+logger = logging.getLogger(__name__)
+
+RtiGrid = namedtuple('RtiGrid', ['start_time', 'end_time', 'values',
+                                 'ground_scatter'])
+
+
+def beam_records(fitacf_files, beam, channel=None):
+    """
+    :param fitacf_files: list of fitacf file paths in time order, compressed
+                         or not
+    :param beam: beam number
+    :param channel: channel number of stereo files, None for every channel
+    :return: generator of the DmapRecords of the beam
+    """
+    for filename in fitacf_files:
+        for data in stream_records(filename):
+            # only the records of the beam are decoded
+            if read_scalar(data, 0, 'bmnum') != beam:
+                continue
+            if channel is not None and \
+                    read_scalar(data, 0, 'channel', 0) != channel:
+                continue
+            yield parse_record(data)[0]
+
+
+class _PixelGrid():
+    """
+    Accumulates cells into a (columns, gates) grid, growing the gates as
+    longer records arrive.
+    """
+
+    def __init__(self, columns, gates, decimation):
+        self.decimation = decimation
+        self.count = np.zeros((columns, gates), dtype=int)
+        self.ground_count = np.zeros((columns, gates), dtype=int)
+        if decimation == 'mean':
+            self.values = np.zeros((columns, gates))
+        elif decimation == 'min':
+            self.values = np.full((columns, gates), np.inf)
+        else:
+            self.values = np.full((columns, gates), -np.inf)
+
+    def _grow(self, gates):
+        extra = gates - self.count.shape[1]
+        if extra <= 0:
+            return
+        fill = {'mean': 0, 'min': np.inf, 'max': -np.inf}[self.decimation]
+        self.count = np.pad(self.count, ((0, 0), (0, extra)), 'constant')
+        self.ground_count = np.pad(self.ground_count, ((0, 0), (0, extra)),
+                                   'constant')
+        self.values = np.pad(self.values, ((0, 0), (0, extra)), 'constant',
+                             constant_values=fill)
+
+    def add(self, column, gate, value, ground_scatter):
+        """
+        Adds cells, numpy arrays of the same length.
+        """
+        if not gate.size:
+            return
+        self._grow(int(gate.max()) + 1)
+        index = (column, gate)
+        np.add.at(self.count, index, 1)
+        np.add.at(self.ground_count, index, ground_scatter.astype(int))
+        if self.decimation == 'mean':
+            np.add.at(self.values, index, value)
+        elif self.decimation == 'min':
+            np.minimum.at(self.values, index, value)
+        else:
+            np.maximum.at(self.values, index, value)
+
+    def result(self):
+        """
+        :return: (values with NaN for the empty pixels, ground scatter
+                 pixels)
+        """
+        empty = self.count == 0
+        if self.decimation == 'mean':
+            values = self.values / np.maximum(self.count, 1)
+        else:
+            values = self.values.copy()
+        values[empty] = np.nan
+        ground_scatter = self.ground_count > \
+            RtiConst.GROUND_SCATTER_FRACTION * self.count
+        return values, ground_scatter & ~empty
+
+
+def decimate(records, parameter, start_time, end_time, columns,
+             decimation='mean', ground_scatter=True):
+    """
+    Decimates the cells of records to a pixel grid.
+
+        :param records: iterable of the fitacf DmapRecords of one beam in
+                        time order
+        :param parameter: one of FanConst.PARAMETERS
+        :param start_time: datetime of the left edge of the grid
+        :param end_time: datetime of the right edge of the grid
+        :param columns: number of pixel columns
+        :param decimation: one of RtiConst.DECIMATIONS
+        :param ground_scatter: keep the ground scatter cells, otherwise they
+                               are left out
+        :return: RtiGrid, values and ground_scatter of shape
+                 (columns, gates)
+    """
+    name = FanConst.PARAMETERS[parameter]
+    seconds = (end_time - start_time).total_seconds()
+    grid = _PixelGrid(columns, 0, decimation)
+    chunk = []
+
+    def flush():
+        if chunk:
+            grid.add(*[np.concatenate(column) for column in zip(*chunk)])
+            del chunk[:]
+
+    for record in records:
+        time = fitacf_time(record)
+        if time < start_time:
+            continue
+        if time >= end_time:
+            break
+        gates = np.asarray(record.get('slist', ()), dtype=int)
+        if not gates.size or name not in record:
+            continue
+        values = np.asarray(record[name], dtype=float)
+        flags = np.asarray(record.get('gflg', [0] * gates.size), dtype=bool)
+        keep = np.isfinite(values)
+        if not ground_scatter:
+            keep &= ~flags
+        column = min(int((time - start_time).total_seconds() / seconds *
+                         columns), columns - 1)
+        chunk.append((np.full(int(keep.sum()), column, dtype=int),
+                      gates[keep], values[keep], flags[keep]))
+        if len(chunk) >= RtiConst.CHUNK_RECORDS:
+            flush()
+    flush()
+    values, ground = grid.result()
+    return RtiGrid(start_time, end_time, values, ground)
+
+
+def rti_image(grid, parameter, scale=None):
+    """
+    :param grid: RtiGrid
+    :param parameter: one of FanConst.PARAMETERS
+    :param scale: (minimum, maximum) of the colour scale, default
+                  FanConst.SCALES
+    :return: float numpy array (gates, columns, 4) RGBA image, rows in
+             increasing gate order
+    """
+    scale = scale or FanConst.SCALES[parameter]
+    colour_map = plt.get_cmap(FanConst.COLOUR_MAPS[parameter])
+    image = colour_map(Normalize(*scale)(np.nan_to_num(grid.values.T)))
+    image[grid.ground_scatter.T] = to_rgba(FanConst.GROUND_SCATTER_COLOUR)
+    image[np.isnan(grid.values.T)] = (0, 0, 0, 0)
+    return image
+
+
+def plot_rti(fitacf_files, filename, abbrv, beam, start_time,
+             duration=RtiConst.DURATION, parameter='velocity',
+             ground_scatter=True, decimation='mean', scale=None,
+             channel=None, figure_size=(12, 5), dpi=100):
+    """
+    Renders the RTI plot of a beam.
+
+        :param fitacf_files: list of the fitacf files of the radar in time
+                             order
+        :param filename: path of the image, its extension gives the format
+        :param abbrv: 3-letter acronym of the radar
+        :param beam: beam number
+        :param start_time: datetime of the start of the plot
+        :param duration: hours plotted
+        :param parameter: one of FanConst.PARAMETERS
+        :param ground_scatter: draw the ground scatter in grey, otherwise
+                               leave it out
+        :param decimation: one of RtiConst.DECIMATIONS
+        :param scale: (minimum, maximum) of the colour scale, default
+                      FanConst.SCALES
+        :param channel: channel number of stereo files, None for every
+                        channel
+        :param figure_size: size of the image in inches
+        :param dpi: dots per inch of the image; the grid has one column per
+                    pixel of the width of the plot axes
+        :return: filename
+        :raise UnsupportedTypeException: unknown parameter or decimation
+    """
+    if parameter not in FanConst.PARAMETERS:
+        raise UnsupportedTypeException("RTI parameter {parameter} is not"
+                                       " supported, available parameters:"
+                                       " {available}"
+                                       "".format(parameter=parameter,
+                                                 available=sorted(FanConst.
+                                                                  PARAMETERS)))
+    if decimation not in RtiConst.DECIMATIONS:
+        raise UnsupportedTypeException("Decimation {decimation} is not"
+                                       " supported, available decimations:"
+                                       " {available}"
+                                       "".format(decimation=decimation,
+                                                 available=RtiConst.
+                                                 DECIMATIONS))
+    scale = scale or FanConst.SCALES[parameter]
+    end_time = start_time + timedelta(hours=duration)
+
+    figure, axes = plt.subplots(figsize=figure_size, dpi=dpi)
+    axes.set_xlabel("Time (UT)")
+    axes.set_ylabel("Range gate")
+    axes.set_title("{abbrv} beam {beam} {time:%Y-%m-%d}"
+                   "".format(abbrv=abbrv, beam=beam, time=start_time))
+    # the image is already coloured, the colour bar only needs the scale
+    colour_bar = plt.cm.ScalarMappable(Normalize(*scale),
+                                       FanConst.COLOUR_MAPS[parameter])
+    colour_bar.set_array([])
+    figure.colorbar(colour_bar, ax=axes,
+                    label="{parameter} ({units})"
+                    "".format(parameter=parameter.capitalize(),
+                              units=FanConst.UNITS[parameter]))
+
+    # the colour bar took its share of the figure, the axes are what is
+    # left of its width in pixels
+    columns = max(int(axes.get_window_extent().width), 1)
+    grid = decimate(beam_records(fitacf_files, beam, channel), parameter,
+                    start_time, end_time, columns, decimation,
+                    ground_scatter)
+    gates = grid.values.shape[1]
+    axes.imshow(rti_image(grid, parameter, scale), aspect='auto',
+                origin='lower', interpolation='nearest',
+                extent=[mdates.date2num(start_time),
+                        mdates.date2num(end_time), 0, max(gates, 1)])
+    axes.xaxis_date()
+    axes.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    figure.savefig(filename, dpi=dpi)
+    plt.close(figure)
+    logger.info("Rendered the {parameter} RTI of {abbrv} beam {beam}"
+                " ({gates} gates)".format(parameter=parameter, abbrv=abbrv,
+                                          beam=beam, gates=gates))
+    return filename
@@ -0,0 +1,249 @@
+# Copyright 2018 SuperDARN Canada
+#
+# bzip2.py
+"""
+Block parallel bzip2 decompression.
+
+A bzip2 stream is a 4 byte header ('BZh' and the block size level) followed
+by independently compressed blocks, each starting with the 48 bit block magic
+0x314159265359 and its 32 bit CRC, and ends with the 48 bit end of stream
+magic 0x177245385090, the 32 bit combined CRC and padding to a byte. Blocks
+are not byte aligned, so the magics are searched for at every bit offset.
+Every block is then wrapped into a single block stream of its own and
+decompressed in a worker process. The combined CRC of each stream is checked
+against the block CRCs found, and any irregularity (a magic number appearing
+by chance inside compressed data, trailing data, ...) falls back to serial
+decompression, so the output is always identical to bzip2 -d.
+"""
+
+import bz2
+import mmap
+import shutil
+import logging
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+BLOCK_MAGIC = 0x314159265359
+EOS_MAGIC = 0x177245385090
+MAGIC_BITS = 48
+CRC_BITS = 32
+HEADER = b'BZh'
+
+# read size for the serial fall back
+CHUNK_SIZE = 1024**2
+
+
+class Bzip2FormatError(ValueError):
+    """
+    Raised when a file cannot be split into bzip2 blocks; callers fall back to
+    serial decompression.
+    """
+    pass
+
+
+def _find_magic(data, magic):
+    """
+    Finds every bit offset of a 48 bit magic number in data.
+
+        :param data: bytes like object (bytes or mmap)
+        :param magic: 48 bit magic number
+        :return: list of bit offsets
+    """
+    offsets = []
+    length = len(data)
+    for shift in range(8):
+        if shift == 0:
+            needle = magic.to_bytes(6, 'big')
+            position = data.find(needle)
+            while position != -1:
+                offsets.append(position * 8)
+                position = data.find(needle, position + 1)
+            continue
+        # the magic shifted right by shift bits spans 7 bytes, the middle 5
+        # bytes are fully determined and are used to search for candidates
+        shifted = magic << (8 - shift)
+        pattern = shifted.to_bytes(7, 'big')
+        needle = pattern[1:6]
+        first_mask = (1 << (8 - shift)) - 1
+        last_mask = (0xff << (8 - shift)) & 0xff
+        position = data.find(needle)
+        while position != -1:
+            start = position - 1
+            if start >= 0 and start + 7 <= length and \
+               data[start] & first_mask == pattern[0] and \
+               data[start + 6] & last_mask == pattern[6]:
+                offsets.append(start * 8 + shift)
+            position = data.find(needle, position + 1)
+    return offsets
+
+
+def _read_bits(data, bit_offset, nbits):
+    """
+    Reads nbits starting at bit_offset as an unsigned integer.
+    """
+    start = bit_offset // 8
+    end = (bit_offset + nbits + 7) // 8
+    value = int.from_bytes(data[start:end], 'big')
+    return (value >> (end * 8 - bit_offset - nbits)) & ((1 << nbits) - 1)
+
+
+def find_blocks(data):
+    """
+    Splits bzip2 data into its blocks.
+
+        :param data: bytes like object of the whole compressed file
+        :return: list of (start bit, number of bits, level, block crc) for
+                 every block in file order
+        :raise Bzip2FormatError: the data could not be split reliably
+    """
+    block_offsets = _find_magic(data, BLOCK_MAGIC)
+    eos_offsets = set(_find_magic(data, EOS_MAGIC))
+    markers = sorted(set(block_offsets) | eos_offsets)
+
+    blocks = []
+    byte_position = 0
+    marker_index = 0
+    while byte_position < len(data):
+        header = data[byte_position:byte_position + 4]
+        if len(header) < 4 or header[:3] != HEADER or \
+           not 0x31 <= header[3] <= 0x39:
+            raise Bzip2FormatError("No bzip2 stream header at byte"
+                                   " {}".format(byte_position))
+        level = header[3:4]
+        bit_position = (byte_position + 4) * 8
+        while marker_index < len(markers) and \
+                markers[marker_index] < bit_position:
+            marker_index += 1
+
+        combined_crc = 0
+        while True:
+            if marker_index >= len(markers) or \
+               markers[marker_index] != bit_position:
+                raise Bzip2FormatError("Expected a block or end of stream"
+                                       " marker at bit {}".format(bit_position))
+            marker = markers[marker_index]
+            if marker in eos_offsets:
+                stream_crc = _read_bits(data, marker + MAGIC_BITS, CRC_BITS)
+                if stream_crc != combined_crc:
+                    raise Bzip2FormatError("Combined CRC mismatch for the"
+                                           " stream ending at bit"
+                                           " {}".format(marker))
+                end = marker + MAGIC_BITS + CRC_BITS
+                byte_position = (end + 7) // 8
+                marker_index += 1
+                break
+            if marker_index + 1 >= len(markers):
+                raise Bzip2FormatError("Stream is truncated after bit"
+                                       " {}".format(marker))
+            next_marker = markers[marker_index + 1]
+            block_crc = _read_bits(data, marker + MAGIC_BITS, CRC_BITS)
+            combined_crc = (((combined_crc << 1) | (combined_crc >> 31))
+                            & 0xffffffff) ^ block_crc
+            blocks.append((marker, next_marker - marker, level, block_crc))
+            bit_position = next_marker
+            marker_index += 1
+    return blocks
+
+
+def _block_stream(chunk, bit_offset, nbits, level, crc):
+    """
+    Wraps a block into a stand alone single block bzip2 stream. The combined
+    CRC of a single block stream is the block CRC.
+    """
+    value = int.from_bytes(chunk, 'big')
+    block = (value >> (len(chunk) * 8 - bit_offset - nbits)) & \
+        ((1 << nbits) - 1)
+    stream = (((block << MAGIC_BITS) | EOS_MAGIC) << CRC_BITS) | crc
+    stream_bits = nbits + MAGIC_BITS + CRC_BITS
+    padding = -stream_bits % 8
+    stream <<= padding
+    return HEADER + level + stream.to_bytes((stream_bits + padding) // 8, 'big')
+
+
+def _decompress_block(args):
+    """
+    Worker: decompresses one block, args as produced by _block_tasks.
+    """
+    return bz2.decompress(_block_stream(*args))
+
+
+def _block_tasks(data, blocks):
+    for start, nbits, level, crc in blocks:
+        first = start // 8
+        last = (start + nbits + 7) // 8
+        yield (bytes(data[first:last]), start - first * 8, nbits, level, crc)
+
+
+def _context():
+    """
+    :return: multiprocessing context of the workers; the callers run threads
+             (scheduler, log listener) and a forked worker could inherit
+             one of their locks held, so the workers are not forked
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods
+                                       else 'spawn')
+
+
+def decompress_serial(source, destination):
+    """
+    Decompresses a bzip2 file (single or multi stream) in one process.
+
+        :param source: path of the bzip2 file
+        :param destination: path of the decompressed file
+    """
+    with bz2.open(source, 'rb') as compressed, \
+            open(destination, 'wb') as output:
+        shutil.copyfileobj(compressed, output, CHUNK_SIZE)
+
+
+def decompress_parallel(source, destination, processes=None):
+    """
+    Decompresses a bzip2 file with its blocks spread over several processes.
+    The output is written in block order and is identical to bzip2 -d. Files
+    that cannot be split into blocks reliably are decompressed serially.
+
+        :param source: path of the bzip2 file
+        :param destination: path of the decompressed file
+        :param processes: number of worker processes, None uses every core,
+                          1 decompresses serially
+    """
+    if processes is not None and processes <= 1:
+        decompress_serial(source, destination)
+        return
+
+    with open(source, 'rb') as compressed:
+        try:
+            data = mmap.mmap(compressed.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be memory mapped
+            data = b''
+        try:
+            try:
+                blocks = find_blocks(data)
+            except Bzip2FormatError as err:
+                logger.warning("{file}: {err}, decompressing"
+                               " serially".format(file=source, err=err))
+                blocks = None
+
+            if blocks is not None and len(blocks) > 1:
+                pool = _context().Pool(processes)
+                try:
+                    with open(destination, 'wb') as output:
+                        for block in pool.imap(_decompress_block,
+                                               _block_tasks(data, blocks)):
+                            output.write(block)
+                    return
+                except (OSError, ValueError, EOFError) as err:
+                    logger.warning("{file}: block decompression failed ({err}),"
+                                   " decompressing serially"
+                                   "".format(file=source, err=err))
+                finally:
+                    pool.terminate()
+                    pool.join()
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+    decompress_serial(source, destination)
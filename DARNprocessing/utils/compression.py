@@ -0,0 +1,130 @@
+# Copyright 2018 SuperDARN Canada
+#
+# compression.py
+"""
+Streaming compression of the saved products (map and grd files) and
+transparent reads of compressed files.
+
+Files are compressed and decompressed in CHUNK_SIZE pieces, never whole in
+memory. The bz2, gzip and zstandard libraries release the GIL while they
+compress, so products compressed on background threads do not hold up the
+rest of the run. Compressed files are recognised by their first bytes, so
+readers do not depend on the file extension.
+
+zstd needs the optional zstandard package.
+"""
+
+import os
+import bz2
+import gzip
+import shutil
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from DARNprocessing.utils.filelock import atomic_output
+from DARNprocessing.utils.convectionMapConstants import CompressionConst
+from DARNprocessing.utils.convectionMapExceptions import UnsupportedTypeException
+
+
+def available_compressions():
+    """
+    :return: list of the compressions that can be used here
+    """
+    return [compression for compression in CompressionConst.EXT
+            if compression != 'zst' or zstandard is not None]
+
+
+def check_compression(compression):
+    """
+    :raise UnsupportedTypeException: the compression cannot be used here
+    """
+    if compression not in available_compressions():
+        raise UnsupportedTypeException("Compression {compression} is not"
+                                       " supported, available compressions:"
+                                       " {available}"
+                                       "".format(compression=compression,
+                                                 available=available_compressions()))
+
+
+def detect_compression(filename):
+    """
+    :return: compression of the file from its first bytes, None if it is
+             not compressed
+    """
+    with open(filename, 'rb') as data_file:
+        start = data_file.read(4)
+    for compression, magic in CompressionConst.MAGIC.items():
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def _open(filename, compression, mode, level=None):
+    if compression == 'bz2':
+        return bz2.open(filename, mode, **({'compresslevel': level}
+                                           if level is not None else {}))
+    elif compression == 'gz':
+        return gzip.open(filename, mode, **({'compresslevel': level}
+                                            if level is not None else {}))
+    check_compression(compression)
+    if 'w' in mode:
+        compressor = zstandard.ZstdCompressor(**({'level': level}
+                                                 if level is not None else {}))
+        return zstandard.open(filename, mode, cctx=compressor)
+    return zstandard.open(filename, mode)
+
+
+def open_compressed(filename):
+    """
+    Opens a file for reading, decompressing it if it is compressed.
+
+        :param filename: path of the file
+        :return: binary file object
+        :raise UnsupportedTypeException: zstd file without zstandard
+    """
+    compression = detect_compression(filename)
+    if compression is None:
+        return open(filename, 'rb')
+    return _open(filename, compression, 'rb')
+
+
+def compress_file(source, destination, compression, level=None):
+    """
+    Compresses a file, the destination only appears once complete.
+
+        :param source: path of the file
+        :param destination: path of the compressed file
+        :param compression: one of CompressionConst.EXT
+        :param level: compression level, None for the default of the
+                      compression
+    """
+    check_compression(compression)
+    with atomic_output(destination) as tmp_path:
+        with open(source, 'rb') as source_file, \
+                _open(tmp_path, compression, 'wb', level) as compressed:
+            shutil.copyfileobj(source_file, compressed,
+                               CompressionConst.CHUNK_SIZE)
+
+
+def decompress_file(source, destination):
+    """
+    Decompresses a file (copies it when it is not compressed), the
+    destination only appears once complete.
+    """
+    with atomic_output(destination) as tmp_path:
+        with open_compressed(source) as source_file, \
+                open(tmp_path, 'wb') as decompressed:
+            shutil.copyfileobj(source_file, decompressed,
+                               CompressionConst.CHUNK_SIZE)
+
+
+def compressed_variants(path):
+    """
+    :return: list of the existing compressed files of path (path.bz2, ...)
+    """
+    return [path + '.' + compression
+            for compression in CompressionConst.EXT
+            if os.path.exists(path + '.' + compression)]
@@ -45,6 +45,11 @@ class OmniConst():
     # W=tan [0.5 * atan (V/428)] is parameter related to the assumed orientation of the phase front relative
     #   to the Earth-sun line.  It is Half-way between corotation geometry and convection geometry.
     DELAY = 600
+    # seconds the OMNI data availability date is reused before it is
+    # checked again on the website
+    AVAILABILITY_TTL = 3600
+    # seconds a run waits for another process fetching the same date
+    LOCK_TIMEOUT = 900
 
 
 class RadarConst():
@@ -60,6 +65,8 @@ class RadarConst():
 
         EXT: is a dictionary of the compression extension
                 with the compression command and options as the value.
+        PARALLEL_BZ2_SIZE: compressed size in bytes above which bz2 files
+                are decompressed block parallel in python instead of bzip2
 
         No support to fit files because of the complexity of file format changes and
         radar acronym changes.
@@ -69,6 +76,384 @@ class RadarConst():
     COMPRESSION_TYPES = ['gz', 'bz2']
     EXT = {'gz': 'gzip -df',
            'bz2': 'bzip2 -dfv'}
+    # decompress to standard output, used when filling the file cache
+    STDOUT_EXT = {'gz': 'gzip -dc',
+                  'bz2': 'bzip2 -dc'}
+    PARALLEL_BZ2_SIZE = 16 * 1024**2
+
+
+class ChannelConst():
+    """
+    Stereo channel constants
+        Constants:
+            NAMES: name of every fitacf channel number in the file names, 0
+                   is mono
+            SPLIT_EXT: extension of the files of one channel split from a
+                       combined fitacf file
+    """
+    NAMES = {0: 'mono', 1: 'a', 2: 'b', 3: 'c', 4: 'd'}
+    SPLIT_EXT = 'channel'
+
+
+class RegistryConst():
+    """
+    Radar registry constants
+        Constants:
+            FILENAME_PATTERN: regular expression of the data file names,
+                              date, then any fields (time, ...), the site
+                              acronym, the optional channel letter, the file
+                              type and the optional compression extension
+    """
+    FILENAME_PATTERN = r'^(?P<date>\d{8})\.(?:[^.]+\.)*?(?P<site>[a-z]{3})'\
+                       r'(?:\.(?P<channel>[a-d]))?\.(?P<type>fitacf|lmfit2)'\
+                       r'(?:\.(?P<compression>bz2|gz))?$'
+
+
+class ValidateConst():
+    """
+    Data file validation constants
+        Constants:
+            READ_SIZE: bytes read at a time when skipping through the records
+                       of a compressed file
+            QUARANTINE_EXT: extension of the quarantine file of a run, in the
+                            map path
+    """
+    READ_SIZE = 1024**2
+    QUARANTINE_EXT = 'quarantine.json'
+
+
+class CacheConst():
+    """
+    Decompressed data file cache constants
+        Constants:
+            SIZE: default byte budget of the cache in megabytes
+            STAGE_SIZE: default byte budget of the map stage cache in
+                        megabytes
+    """
+    SIZE = 10240
+    STAGE_SIZE = 2048
+
+
+class PlotConst():
+    """
+    Convection map plot constants
+        Constants:
+            POSTSCRIPT_EXT: image extensions made from PostScript frames
+                            (map_plot -ps), every other extension is made
+                            from raster frames (map_plot -ppm)
+            RASTER_FRAME_EXT: extension of the raster frames
+            DENSITY: dots per inch PostScript frames are converted at
+    """
+    POSTSCRIPT_EXT = ['ps', 'pdf', 'eps']
+    RASTER_FRAME_EXT = 'ppm'
+    DENSITY = 200
+
+
+class ExecutorConst():
+    """
+    Execution backend constants
+        Constants:
+            BATCH_SUBMIT: default submit command of the batch backend
+            BATCH_STATUS: default status command of the batch backend
+            POLL_INTERVAL: seconds between the status checks of a batch job
+            MAX_JOBS: maximum number of batch jobs queued at once
+            LOST_JOB: return value of a batch job that disappeared without
+                      recording its return value
+            TIMED_OUT: return value of a batch job killed by timeout(1)
+            WATCH_INTERVAL: seconds between the checks of a local command
+                            with a time limit
+            KILL_GRACE: seconds a command killed for a time limit has to
+                        exit after SIGTERM before it gets SIGKILL
+            TIMEOUT: default limit of the run time of a command in seconds,
+                     None for no limit
+            STALL_TIMEOUT: default limit in seconds of the time the output
+                           file of a command does not grow, None for no
+                           limit
+            STAGE_TIMEOUTS: default run time limits of the commands by
+                            program name, over TIMEOUT
+    """
+    BATCH_SUBMIT = 'sbatch --parsable'
+    BATCH_STATUS = 'squeue -h -j'
+    POLL_INTERVAL = 5
+    MAX_JOBS = 64
+    LOST_JOB = -1
+    TIMED_OUT = 124
+    WATCH_INTERVAL = 1.0
+    KILL_GRACE = 5
+    TIMEOUT = None
+    STALL_TIMEOUT = 1800
+    STAGE_TIMEOUTS = {'make_grid': 3600,
+                      'combine_grid': 3600,
+                      'map_plot': 7200}
+
+
+class DaemonConst():
+    """
+    Convection map daemon constants
+        Constants:
+            SOCKET: default path of the daemon socket, per user
+            SOCKET_ENV: environment variable overriding the socket path, an
+                        empty value disables the daemon
+            CONNECT_TIMEOUT: seconds to wait for the daemon to accept
+    """
+    SOCKET = '/tmp/DARNprocessing.{uid}.sock'
+    SOCKET_ENV = 'DARNPROCESSING_SOCKET'
+    CONNECT_TIMEOUT = 5
+
+
+class QueueConst():
+    """
+    Work queue constants
+        Constants:
+            LEASE_TIME: seconds a claimed task stays claimed without a
+                        heartbeat
+            HEARTBEAT_INTERVAL: seconds between the lease renewals of a
+                                worker
+            MAX_ATTEMPTS: times a task is tried before it is marked failed
+            POLL_INTERVAL: seconds between claims of an idle worker
+            DB_TIMEOUT: seconds to wait for the lock of the queue file
+            THROUGHPUT_WINDOW: seconds of finished tasks the throughput is
+                               measured over
+    """
+    LEASE_TIME = 600
+    HEARTBEAT_INTERVAL = 60
+    MAX_ATTEMPTS = 3
+    POLL_INTERVAL = 30
+    DB_TIMEOUT = 60
+    THROUGHPUT_WINDOW = 3600
+
+
+class HMBConst():
+    """
+    Heppner-Maynard boundary constants of the numpy estimate (hmb.py), the
+    defaults of map_addhmb
+        Constants:
+            VELOCITY: velocity in m/s above which a vector is flow
+            VECTOR_COUNT: number of vectors above VELOCITY a latitude step
+                          needs to be part of the convection zone
+            LATMIN: boundary latitude at midnight of records without enough
+                    vectors
+            LATMIN_LIMIT: lowest boundary latitude, the latitude limit of
+                          map_grd
+            LATITUDE_STEP: degrees between the boundaries tried
+            LATREF: latitude at midnight of the reference boundary
+            NOON_OFFSET: degrees the reference boundary is poleward of
+                         LATREF at noon
+            BOUNDARY_STEP: degrees of magnetic longitude between the
+                           boundary points written to the map file
+    """
+    VELOCITY = 100
+    VECTOR_COUNT = 3
+    LATMIN = 62
+    LATMIN_LIMIT = 50
+    LATITUDE_STEP = 1
+    LATREF = 59
+    NOON_OFFSET = 11
+    BOUNDARY_STEP = 5
+
+
+class MapChainConst():
+    """
+    Map file chain constants
+        Constants:
+            GRD_OPTIONS: default options of map_grd
+            IMF_OPTIONS: default options of map_addimf, with the OMNI IMF
+                         file
+            MODEL_OPTIONS: default options of map_addmodel besides the order
+                           of the fit
+    """
+    GRD_OPTIONS = '-l 50'
+    IMF_OPTIONS = '-d 00:10'
+    MODEL_OPTIONS = '-d l'
+
+
+class MapFitConst():
+    """
+    Spherical harmonic fit constants
+        Constants:
+            ORDER: default order of the fit (map_addmodel -o)
+            EARTH_RADIUS: earth radius in m
+            ALTITUDE: altitude of the convection in m
+            DIPOLE_FIELD: magnetic field of the dipole at the equator on the
+                          ground in T
+            TABLE_CACHE: number of Legendre tables (order, boundary and
+                         grid) kept in memory
+    """
+    ORDER = 8
+    EARTH_RADIUS = 6371.0e3
+    ALTITUDE = 300.0e3
+    DIPOLE_FIELD = 0.31e-4
+    TABLE_CACHE = 32
+
+
+class ExportConst():
+    """
+    Fit result export constants
+        Constants:
+            SCALARS: scalars of the map records exported, a float column
+                     each (NaN when a record does not have it)
+            COEFFICIENTS: array of the fit coefficients (N holds their
+                          degree and N+1 their order), exported as a
+                          (records, coefficients) column
+            COEFFICIENT_ERRORS: array of the errors of the coefficients,
+                                exported like them
+            INDEX: name of the time index of a store
+            CHUNK_EXT: extension of the chunk files
+            LOCK_TIMEOUT: seconds to wait for another process writing the
+                          index
+    """
+    SCALARS = ['pot.drop', 'pot.drop.err', 'pot.max', 'pot.min',
+               'latmin', 'fit.order', 'hemisphere', 'lon.shft',
+               'chi.sqr', 'rms.err',
+               'IMF.Bx', 'IMF.By', 'IMF.Bz']
+    COEFFICIENTS = 'N+2'
+    COEFFICIENT_ERRORS = 'N+3'
+    INDEX = 'index.json'
+    CHUNK_EXT = 'npz'
+    LOCK_TIMEOUT = 600
+
+
+class QueryConst():
+    """
+    Map archive query constants
+        Constants:
+            MAP_PATTERN: regular expression of the fitted map file names in
+                         the map path, the series is the hemisphere with the
+                         integration time when there are several
+            SERIES: default series of the queries
+            RECORD_CACHE: number of decoded map records kept in memory
+            GRID_CACHE: number of evaluations (record, grid) kept in memory
+            HOST: default address of the HTTP endpoint, local only
+            PORT: default port of the HTTP endpoint
+            MAX_POINTS: most evaluation points of an HTTP query
+            MAX_RECORDS: most records evaluated by a query, a day of
+                         one minute maps
+            FILE_INDEX: number of map files whose record times are kept in
+                        memory
+    """
+    MAP_PATTERN = r'^(?P<date>\d{8})\.(?P<series>(?:n|s|canadian)'\
+                  r'(?:\.\d+s)?)\.map(?:\.(?P<compression>bz2|gz|zst))?$'
+    SERIES = 'n'
+    RECORD_CACHE = 4096
+    GRID_CACHE = 4096
+    HOST = '127.0.0.1'
+    PORT = 8642
+    MAX_POINTS = 100000
+    MAX_RECORDS = 1440
+    FILE_INDEX = 1024
+
+
+class CombineConst():
+    """
+    Grid file combination constants
+        Constants:
+            COMBINERS: backends combining the radar grid files, rst runs
+                       combine_grid, python merges the files as they are
+                       written
+            FOLLOW_INTERVAL: seconds between the reads of a grid file being
+                             written
+            READ_SIZE: bytes of a grid file read at once, more when the
+                       next record is larger
+    """
+    COMBINERS = ['rst', 'python']
+    FOLLOW_INTERVAL = 0.5
+    READ_SIZE = 1 << 16
+
+
+class CompressionConst():
+    """
+    Compression constants of the saved map and grd files
+        Constants:
+            EXT: supported compressions, zst needs the zstandard package
+            MAGIC: first bytes of the files of each compression
+            THREADS: default number of background compression threads
+            CHUNK_SIZE: bytes compressed or decompressed at once
+    """
+    EXT = ['bz2', 'gz', 'zst']
+    MAGIC = {'bz2': b'BZh',
+             'gz': b'\x1f\x8b',
+             'zst': b'\x28\xb5\x2f\xfd'}
+    THREADS = 2
+    CHUNK_SIZE = 1024**2
+
+
+class FovConst():
+    """
+    Radar field-of-view geometry constants
+        Constants:
+            HDW_PATH_ENV: environment variable of the directory of the RST
+                          hardware files (hdw.dat.<abbrv>)
+            HDW_PREFIX: prefix of the hardware file names
+            EARTH_RADIUS: earth radius in km
+            VIRTUAL_HEIGHT: height of the scatter in km the far gates are
+                            projected at
+            E_REGION_HEIGHT: virtual height in km of the near gates, like
+                             RST's position code
+            E_REGION_LIMIT: heights in km up to this are E region heights,
+                            used at every range over NEAR_RANGE
+            NEAR_RANGE: slant range in km under which the virtual height
+                        falls linearly to 0 with the range
+            E_REGION_RANGE: slant range in km up to which the E region
+                            height is used
+            F_REGION_RANGE: slant range in km from which VIRTUAL_HEIGHT is
+                            used, the height is interpolated in between
+            HEIGHT_MODEL: name of the virtual height model in the names of
+                          the persisted geometry
+            CACHE_PATH: default directory of the persisted geometry, the
+                        user directory expanded
+    """
+    HDW_PATH_ENV = 'SD_HDWPATH'
+    HDW_PREFIX = 'hdw.dat.'
+    EARTH_RADIUS = 6371.0
+    VIRTUAL_HEIGHT = 300.0
+    E_REGION_HEIGHT = 115.0
+    E_REGION_LIMIT = 150.0
+    NEAR_RANGE = 150.0
+    E_REGION_RANGE = 600.0
+    F_REGION_RANGE = 800.0
+    HEIGHT_MODEL = 'rst'
+    CACHE_PATH = '~/.DARNprocessing/fov'
+
+
+class FanConst():
+    """
+    Fan plot constants
+        Constants:
+            PARAMETERS: fan plot parameter: fitacf array plotted
+            SCALES: default colour scale of every parameter
+            UNITS: units of every parameter
+            COLOUR_MAPS: matplotlib colour map of every parameter
+            GROUND_SCATTER_COLOUR: colour of the ground scatter cells
+            COORDS: 'geo' geographic, 'mag' AACGM (needs aacgmv2)
+            FRAME_NAME: name of a frame, formatted with the scan time, radar,
+                        parameter and image extension
+    """
+    PARAMETERS = {'velocity': 'v', 'power': 'p_l', 'width': 'w_l'}
+    SCALES = {'velocity': (-1000, 1000), 'power': (0, 30), 'width': (0, 500)}
+    UNITS = {'velocity': 'm/s', 'power': 'dB', 'width': 'm/s'}
+    COLOUR_MAPS = {'velocity': 'RdBu_r', 'power': 'viridis',
+                   'width': 'viridis'}
+    GROUND_SCATTER_COLOUR = 'grey'
+    COORDS = ['geo', 'mag']
+    FRAME_NAME = "{time:%Y%m%d.%H%M%S}.{abbrv}.{parameter}.{ext}"
+
+
+class RtiConst():
+    """
+    Range-time intensity (RTI) summary plot constants, the parameters,
+    scales and colour maps are those of FanConst
+        Constants:
+            DECIMATIONS: how the cells falling in one pixel column are
+                         combined
+            DURATION: default hours plotted
+            CHUNK_RECORDS: records accumulated into the pixel grid at once
+            GROUND_SCATTER_FRACTION: fraction of ground scatter cells that
+                                     makes a pixel ground scatter
+    """
+    DECIMATIONS = ['mean', 'min', 'max']
+    DURATION = 24
+    CHUNK_RECORDS = 1000
+    GROUND_SCATTER_FRACTION = 0.5
 
 
 """
@@ -96,6 +481,7 @@ class SouthRadar():
             SINGLE_TO_ABBRV: single abbrevations to 3-letter acronyms, used for
                             converting fit to fitacf files
             RADAR_ABBRV: South radar 3-letter acrnyms
+            STEREO_ABBRV: radars with several channels
         Stereo radar constants:
             CHANNEL_ONE_ABBRV: radars that have channel 'a' extension
                                <may not be needed anymore>
@@ -110,6 +496,7 @@ class SouthRadar():
                    'sye', 'sys', 'tig',
                    'unw', 'zho', 'mcm',
                    'sps']
+    STEREO_ABBRV = ['mcm', 'sps']
 
     # TODO: delete? may not be needed
     CHANNEL_ONE_ABBRV = ['mcm.a', 'sps.a']
@@ -155,7 +542,9 @@ class NorthRadar():
         Constants:
             SINGLE_TO_ABBRV: single abbrevations to 3-letter acronyms, used for
                             converting fit to fitacf files
-            RADAR_ABBRV: North Radar 3-letter acronyms
+            RADAR_ABBRV: North Radar 3-letter acronyms, the channel files
+                         of a radar (e.g. ksr.a) are found by RadarRegistry
+            STEREO_ABBRV: radars with several channels
 
         Stereo radar constants:
             CHANNEL_ONE_ABBRV: radars that have channel 'a' extension
@@ -175,11 +564,8 @@ class NorthRadar():
                    'inv', 'kap', 'ksr',
                    'lyr', 'pyk', 'pgr',
                    'rkn', 'sas', 'sch',
-                   'sto', 'wal', 'ksr',
-                   'kod', 'kod.a', 'kod.b', 'kod.c', 'kod.d', 
-                   'adw.a', 'adw.b', 'adw.c', 'adw.d',
-                   'ade.a', 'ade.b', 'ade.c', 'ade.d'
-                   'ksr.a', 'ksr.b', 'ksr.c', 'ksr.d']
+                   'sto', 'wal', 'kod']
+    STEREO_ABBRV = ['ade', 'adw', 'kod', 'ksr']
 
     CHANNEL_ONE_ABBRV = ['ksr.a',  'ade.a', 'adw.a']
     CHANNEL_TWO_ABBRV = ['ksr.b', 'ade.b', 'adw.b']
@@ -205,14 +591,16 @@ class CanadianRadar():
             SINGLE_TO_ABBRV: single abbrevations to 3-letter acronyms, used for
                             converting fit to fitacf files
             RADAR_ABBRV: Canadian Radar 3-letter acronyms
+            STEREO_ABBRV: radars with several channels
     """
     SINGLE_TO_ABBRV = {'t': 'sas',
                        'b': 'pgr'}
-    RADAR_ABBRV = {'cly',
+    RADAR_ABBRV = ['cly',
                    'inv',
                    'pgr',
                    'rkn',
-                   'sas'}
+                   'sas']
+    STEREO_ABBRV = []
 
 
 # TODO: these may not be used anymore as well
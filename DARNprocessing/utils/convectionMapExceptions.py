@@ -74,6 +74,22 @@ class RSTException(Exception):
         Exception.__init__(self, self.message)
 
 
+class RSTTimeoutException(RSTException):
+    """
+    Exception for when a RST function is killed for running too long or for
+    its output not growing any more
+    Parameters:
+        :param function_name: name of the RST function
+        :param reason: str of the limit the RST function went over
+    """
+    def __init__(self, function_name, reason):
+        RSTException.__init__(self, function_name, None)
+        self.reason = reason
+        self.message = "RST function {function} was killed: {reason}"\
+            "".format(function=function_name, reason=reason)
+        Exception.__init__(self, self.message)
+
+
 class RSTFileEmptyException(Exception):
     """
     Exception when a RST function returns an empty file
@@ -97,3 +113,32 @@ class NoGridFilesException(Exception):
         for radar in radar_list:
             self.message += " {},".format(radar)
         Exception.__init__(self, self.message)
+
+
+class LockTimeoutException(Exception):
+    """
+    Exception when a file lock could not be acquired in time
+    parameters:
+        :param lock_path: path of the lock file
+        :param timeout: seconds waited for the lock
+    """
+    def __init__(self, lock_path, timeout):
+        self.lock_path = lock_path
+        self.timeout = timeout
+        self.message = "Could not acquire the lock {lock} within {timeout}"\
+            " seconds".format(lock=lock_path, timeout=timeout)
+        Exception.__init__(self, self.message)
+
+
+class BatchJobException(Exception):
+    """
+    Exception when a job could not be submitted to the batch cluster
+    parameters:
+        :param script: path of the job script
+        :param message: reason the job could not be submitted
+    """
+    def __init__(self, script, message):
+        self.script = script
+        self.message = "Batch job {script}: {message}"\
+            "".format(script=script, message=message)
+        Exception.__init__(self, self.message)
@@ -68,7 +68,7 @@ class EmptyDataFileWarning(Warning):
         self.data_filename = data_file
         self.message = "Data file {filename} is Empty, will not be used in the"\
             " {processname} process".format(filename=self.data_filename,
-                                            processneame=process)
+                                            processname=process)
         Warning.__init__(self, self.message)
 
 
@@ -0,0 +1,233 @@
+# Copyright 2018 SuperDARN Canada
+#
+# daemon.py
+"""
+Resident convection map server. The daemon accepts jobs over a local Unix
+socket and runs them with ConvectionMaps in its own process, so repeated
+runs (cron jobs, web front-ends) do not pay the interpreter start and the
+package import, and the in memory caches stay warm between jobs: the data
+directory index and the OMNI data availability.
+
+Protocol: the client sends one JSON line and reads one JSON line back.
+
+    {"command": "run", "arguments": [<command line options>],
+     "steps": "run" | "maps", "cwd": <working directory of the client>}
+    {"command": "run", "parameters": {<ConvectionMaps parameters>}, ...}
+    {"command": "ping"}
+
+    reply: {"status": "ok", ...} or {"status": "error", "error": <message>}
+
+The RST commands run in the daemon's environment, start it with the RST
+environment set up.
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import socketserver
+
+from DARNprocessing.plotting_scripts.convectionmaps import ConvectionMaps
+from DARNprocessing.utils.convectionMapConstants import DaemonConst
+
+logger = logging.getLogger(__name__)
+
+
+def socket_path():
+    """
+    :return: str path of the daemon socket, DARNPROCESSING_SOCKET when set
+             (an empty value disables the daemon), None when disabled
+    """
+    path = os.environ.get(DaemonConst.SOCKET_ENV)
+    if path is None:
+        return DaemonConst.SOCKET.format(uid=os.getuid())
+    return path or None
+
+
+def _run_steps(convec_map, steps):
+    """
+    Runs the steps of a job, see ConvectionMapDaemon.
+    """
+    if steps == 'run':
+        convec_map.run()
+    elif steps == 'maps':
+        convec_map.generate_grid_files()
+        convec_map.generate_map_files()
+    else:
+        raise ValueError("Unknown steps {}".format(steps))
+    convec_map.cleanup()
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode())
+            response = self.server.handle_request_message(request)
+        except ValueError as err:
+            response = {'status': 'error',
+                        'error': "Bad request: {}".format(err)}
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class ConvectionMapDaemon(socketserver.ThreadingMixIn,
+                          socketserver.UnixStreamServer):
+    """
+    Unix socket server running convection map jobs.
+
+        :param path: path of the socket, see socket_path
+        :param jobs: number of jobs running at once, other jobs wait
+    """
+    daemon_threads = True
+
+    def __init__(self, path, jobs=1):
+        if os.path.exists(path):
+            if ping(path) is not None:
+                raise OSError("A daemon is already listening on {}"
+                              "".format(path))
+            # left over by a daemon that did not stop cleanly
+            os.remove(path)
+        socketserver.UnixStreamServer.__init__(self, path, _JobHandler)
+        os.chmod(path, 0o600)
+        self.path = path
+        self._job_slots = threading.BoundedSemaphore(max(1, jobs))
+        self._counter_lock = threading.Lock()
+        self.start_time = time.time()
+        self.jobs_run = 0
+        self.jobs_failed = 0
+
+    def handle_request_message(self, request):
+        """
+        :param request: dictionary of the request, see the module
+        :return: dictionary of the reply
+        """
+        command = request.get('command', 'run')
+        if command == 'ping':
+            return {'status': 'ok',
+                    'pid': os.getpid(),
+                    'uptime': time.time() - self.start_time,
+                    'jobs_run': self.jobs_run,
+                    'jobs_failed': self.jobs_failed}
+        elif command == 'run':
+            return self.run_job(request.get('arguments'),
+                                request.get('parameters'),
+                                request.get('steps', 'run'),
+                                request.get('cwd'))
+        return {'status': 'error',
+                'error': "Unknown command {}".format(command)}
+
+    def run_job(self, arguments=None, parameters=None, steps='run',
+                cwd=None):
+        """
+        Runs a convection map job.
+
+            :param arguments: list of command line options
+            :param parameters: dictionary of ConvectionMaps parameters, used
+                               when there are no arguments
+            :param steps: 'run' for the whole process (fitacf2convectionMap),
+                          'maps' for the grid and map files (fitdata2map)
+            :param cwd: working directory relative paths are resolved in
+            :return: dictionary of the reply
+        """
+        with self._job_slots:
+            try:
+                convec_map = ConvectionMaps(arguments, parameters,
+                                            working_path=cwd)
+            except SystemExit:
+                # argparse already reported the error on the daemon's
+                # standard error
+                return self._reply(False, "Invalid arguments {}, see --help"
+                                          "".format(arguments))
+            except Exception as err:
+                logger.exception("Job setup failed")
+                return self._reply(False, str(err))
+
+            try:
+                _run_steps(convec_map, steps)
+                return self._reply(True, logfile=convec_map.parameter['logfile'])
+            except Exception as err:
+                logger.exception("Job failed")
+                return self._reply(False, str(err),
+                                   logfile=convec_map.parameter['logfile'])
+            finally:
+                convec_map.close()
+
+    def _reply(self, success, error=None, **fields):
+        with self._counter_lock:
+            self.jobs_run += 1
+            if not success:
+                self.jobs_failed += 1
+        reply = {'status': 'ok' if success else 'error'}
+        if error is not None:
+            reply['error'] = error
+        reply.update(fields)
+        return reply
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def send_request(request, path=None, timeout=None):
+    """
+    Sends a request to the daemon.
+
+        :param request: dictionary of the request
+        :param path: socket path, socket_path() when None
+        :param timeout: seconds to wait for the reply, None to wait until
+                        the job finished
+        :return: dictionary of the reply, None when no daemon is running
+    """
+    path = path or socket_path()
+    if not path:
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(DaemonConst.CONNECT_TIMEOUT)
+        try:
+            client.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError, socket.timeout):
+            return None
+        client.settimeout(timeout)
+        client.sendall(json.dumps(request).encode() + b'\n')
+        reply = b''
+        while not reply.endswith(b'\n'):
+            data = client.recv(65536)
+            if not data:
+                break
+            reply += data
+    finally:
+        client.close()
+    if not reply:
+        return {'status': 'error', 'error': "The daemon closed the connection"}
+    return json.loads(reply.decode())
+
+
+def ping(path=None):
+    """
+    :return: dictionary of the daemon's status, None when no daemon is
+             running
+    """
+    return send_request({'command': 'ping'}, path, DaemonConst.CONNECT_TIMEOUT)
+
+
+def submit_job(arguments, steps='run', path=None):
+    """
+    Runs a job on the daemon when one is running, used by the command line
+    scripts to act as thin clients.
+
+        :param arguments: list of command line options
+        :param steps: see ConvectionMapDaemon.run_job
+        :param path: socket path, socket_path() when None
+        :return: dictionary of the reply, None when the job has to run
+                 locally (no daemon, or help was asked for)
+    """
+    if '-h' in arguments or '--help' in arguments:
+        return None
+    return send_request({'command': 'run',
+                         'arguments': list(arguments),
+                         'steps': steps,
+                         'cwd': os.getcwd()}, path)
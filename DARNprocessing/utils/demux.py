@@ -0,0 +1,105 @@
+# Copyright 2018 SuperDARN Canada
+#
+# demux.py
+"""
+Single read channel demultiplexer of fitacf files.
+
+Stereo radars write the records of their channels into one fitacf file,
+the channel scalar of every record says which (0 mono, 1 A, 2 B, ...).
+Instead of letting make_grid read and decode the whole file once per
+channel, the file is streamed once, a chunk at a time: only the record
+headers and the scalars up to the channel are decoded, and the bytes of
+every record are written to the file of its channel as they arrive. A file
+holding a single channel is not copied, it is its own channel file; the
+records read before a second channel appears are copied by reading the
+start of the file again, which is short as the channels of a stereo file
+alternate.
+"""
+
+import os
+import logging
+
+from itertools import islice
+from contextlib import ExitStack
+from collections import OrderedDict
+
+from DARNprocessing.utils.dmap import stream_records, read_scalar
+from DARNprocessing.utils.filelock import atomic_output
+from DARNprocessing.utils.convectionMapConstants import ChannelConst
+
+logger = logging.getLogger(__name__)
+
+
+def channel_filename(filename, channel):
+    """
+    :param filename: path of a combined fitacf file
+    :param channel: channel number
+    :return: path of the file of the channel split from it, e.g.
+             20160101.0000.00.ksr.a.channel.fitacf
+    """
+    root, ext = os.path.splitext(filename)
+    return "{root}.{name}.{split}{ext}"\
+           "".format(root=root, name=ChannelConst.NAMES.get(channel, channel),
+                     split=ChannelConst.SPLIT_EXT, ext=ext)
+
+
+def split_channels(filename):
+    """
+    Splits a fitacf file by channel in one streamed read.
+
+        :param filename: path of the fitacf file, compressed or not
+        :return: OrderedDict channel number: (path of the records of the
+                 channel, number of records) in the order the channels
+                 appear; the path is filename when it holds one channel
+        :raise DmapFormatError: the file is not a valid dmap file
+    """
+    counts = OrderedDict()
+    channel_files = {}
+    with ExitStack() as stack:
+
+        def open_channel(channel):
+            # the file is closed before atomic_output renames it
+            tmp_path = stack.enter_context(
+                atomic_output(channel_filename(filename, channel)))
+            channel_files[channel] = stack.enter_context(open(tmp_path, 'wb'))
+
+        for record in stream_records(filename):
+            channel = read_scalar(record, 0, 'channel', 0)
+            if channel not in counts and len(counts) == 1:
+                # a second channel, the file is split from its start
+                first, = counts
+                open_channel(first)
+                for previous in islice(stream_records(filename),
+                                       counts[first]):
+                    channel_files[first].write(previous)
+            if channel_files and channel not in channel_files:
+                open_channel(channel)
+            counts[channel] = counts.get(channel, 0) + 1
+            if channel_files:
+                channel_files[channel].write(record)
+
+    if len(counts) <= 1:
+        return OrderedDict((channel, (filename, count))
+                           for channel, count in counts.items())
+    channels = OrderedDict((channel, (channel_filename(filename, channel),
+                                      count))
+                           for channel, count in counts.items())
+    logger.debug("Split {filename} into channels {channels}"
+                 "".format(filename=filename, channels=list(channels)))
+    return channels
+
+
+def demultiplex(filenames):
+    """
+    Splits fitacf files by channel.
+
+        :param filenames: list of the fitacf files of a radar in time order
+        :return: dictionary channel number: list of the files of the
+                 channel in time order
+        :raise DmapFormatError: a file is not a valid dmap file
+    """
+    channel_files = {}
+    for filename in filenames:
+        for channel, (path, count) in split_channels(filename).items():
+            channel_files.setdefault(channel, []).append(path)
+    return channel_files
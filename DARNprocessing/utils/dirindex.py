@@ -0,0 +1,79 @@
+# Copyright 2018 SuperDARN Canada
+#
+# dirindex.py
+"""
+In memory index of directory listings. Data directories hold thousands of
+files and are globbed for every radar of every run; the listing of a
+directory is kept until the directory's modification time changes (a file
+was added, removed or renamed), so a long running process (e.g. the daemon)
+lists each data directory once.
+"""
+
+import os
+import glob
+import time
+import fnmatch
+import threading
+
+# a listing taken in the same time step as the last change of a coarse
+# modification time (1 s on some file systems) may miss a later change in
+# that step, it is only trusted once it is older than this many nanoseconds
+STABLE_NS = 2 * 10**9
+
+
+class DirectoryIndex():
+    """
+    Cache of directory listings validated by the directory's modification
+    time.
+    """
+
+    def __init__(self):
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def listdir(self, path):
+        """
+        :param path: directory path
+        :return: list of the names in the directory
+        :raise OSError: the directory cannot be read
+        """
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._listings.get(path)
+        if entry and entry[0] == mtime and entry[1] - mtime >= STABLE_NS:
+            return entry[2]
+
+        listed_at = time.time_ns()
+        names = sorted(os.listdir(path))
+        with self._lock:
+            self._listings[path] = (mtime, listed_at, names)
+        return names
+
+    def glob(self, pattern):
+        """
+        glob.glob of a pattern whose wildcards are in the file name only,
+        other patterns fall back to glob.glob.
+
+            :param pattern: str path pattern
+            :return: list of the matching paths
+        """
+        directory, name_pattern = os.path.split(pattern)
+        if glob.has_magic(directory):
+            return glob.glob(pattern)
+        try:
+            names = self.listdir(directory or os.curdir)
+        except OSError:
+            return []
+        if not name_pattern.startswith('.'):
+            # like glob, wildcards do not match hidden files
+            names = [name for name in names if not name.startswith('.')]
+        return [os.path.join(directory, name)
+                for name in fnmatch.filter(names, name_pattern)]
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+
+
+# shared by every ConvectionMaps instance of the process
+directory_index = DirectoryIndex()
@@ -0,0 +1,430 @@
+# Copyright 2018 SuperDARN Canada
+#
+# dmap.py
+"""
+Reader and writer of the RST DataMap (dmap) format of fitacf, grid and map
+files, in pure python.
+
+A file is a sequence of records, every value little endian:
+
+    int32 code (0x00010001), int32 size of the record in bytes (header
+    included), int32 number of scalars
+    scalars: null terminated name, int8 type, value (strings null
+             terminated)
+    int32 number of arrays
+    arrays: null terminated name, int8 type, int32 number of dimensions,
+            int32 range of every dimension, values
+
+Array ranges are stored fastest varying first, the reverse of the C order
+shape used by DmapRecord.shape.
+"""
+
+import sys
+import array
+import struct
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from DARNprocessing.utils.compression import open_compressed
+
+DMAP_CODE = 0x00010001
+
+CHAR = 1
+SHORT = 2
+INT = 3
+FLOAT = 4
+DOUBLE = 8
+STRING = 9
+LONG = 10
+UCHAR = 16
+USHORT = 17
+UINT = 18
+ULONG = 19
+
+# dmap type: struct format
+FORMATS = {CHAR: 'b', SHORT: 'h', INT: 'i', FLOAT: 'f', DOUBLE: 'd',
+           LONG: 'q', UCHAR: 'B', USHORT: 'H', UINT: 'I', ULONG: 'Q'}
+# array module type codes of the same sizes
+ARRAY_CODES = {CHAR: 'b', SHORT: 'h', INT: 'i', FLOAT: 'f', DOUBLE: 'd',
+               LONG: 'q', UCHAR: 'B', USHORT: 'H', UINT: 'I', ULONG: 'Q'}
+SIZES = {data_type: struct.calcsize('<' + data_format)
+         for data_type, data_format in FORMATS.items()}
+
+_HEADER = struct.Struct('<iii')
+HEADER_SIZE = _HEADER.size
+_INT = struct.Struct('<i')
+
+
+class DmapFormatError(ValueError):
+    """
+    Raised when a file is not a valid dmap file.
+    """
+    pass
+
+
+class DmapRecord():
+    """
+    A dmap record: ordered scalars (name: (type, value)) and arrays (name:
+    (type, ranges, values)). Numeric array values are array.array, string
+    arrays lists of str.
+    """
+
+    def __init__(self):
+        self.scalars = OrderedDict()
+        self.arrays = OrderedDict()
+
+    def __contains__(self, name):
+        return name in self.scalars or name in self.arrays
+
+    def __getitem__(self, name):
+        """
+        :return: value of a scalar or the flat values of an array
+        :raise KeyError: no such field
+        """
+        if name in self.scalars:
+            return self.scalars[name][1]
+        return self.arrays[name][2]
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return default
+
+    def shape(self, name):
+        """
+        :return: C order shape of an array
+        """
+        return tuple(reversed(self.arrays[name][1]))
+
+    def set_scalar(self, name, value, data_type=None):
+        """
+        Sets a scalar, keeping its type when it exists.
+
+            :param data_type: dmap type, by default the existing type or
+                              STRING, INT or DOUBLE from the value
+        """
+        if data_type is None:
+            if name in self.scalars:
+                data_type = self.scalars[name][0]
+            elif isinstance(value, str):
+                data_type = STRING
+            elif isinstance(value, int):
+                data_type = INT
+            else:
+                data_type = DOUBLE
+        self.scalars[name] = (data_type, value)
+
+    def set_array(self, name, values, data_type=None, shape=None):
+        """
+        Sets an array, keeping its type when it exists.
+
+            :param values: flat sequence of the values (C order)
+            :param data_type: dmap type, by default the existing type or
+                              FLOAT
+            :param shape: C order shape, default one dimension
+        """
+        if data_type is None:
+            data_type = self.arrays[name][0] if name in self.arrays else FLOAT
+        if data_type == STRING:
+            values = [str(value) for value in values]
+        else:
+            values = array.array(ARRAY_CODES[data_type], values)
+        ranges = tuple(reversed(shape)) if shape else (len(values),)
+        self.arrays[name] = (data_type, ranges, values)
+
+    def remove(self, name):
+        self.scalars.pop(name, None)
+        self.arrays.pop(name, None)
+
+
+def record_time(record, prefix='start'):
+    """
+    :param record: DmapRecord of a grid or map file
+    :param prefix: 'start' or 'end'
+    :return: datetime of the record's start.* (or end.*) scalars
+    """
+    return datetime(record[prefix + '.year'], record[prefix + '.month'],
+                    record[prefix + '.day'], record[prefix + '.hour'],
+                    record[prefix + '.minute']) + \
+        timedelta(seconds=record[prefix + '.second'])
+
+
+def fitacf_time(record):
+    """
+    :param record: DmapRecord of a fitacf file
+    :return: datetime of the record's time.* scalars
+    """
+    return datetime(record['time.yr'], record['time.mo'], record['time.dy'],
+                    record['time.hr'], record['time.mt'],
+                    record['time.sc']) + \
+        timedelta(microseconds=record.get('time.us', 0))
+
+
+def _read_string(data, position, end):
+    terminator = data.find(b'\x00', position, end)
+    if terminator < 0:
+        raise DmapFormatError("Unterminated string at byte {}".format(position))
+    return data[position:terminator].decode('latin-1'), terminator + 1
+
+
+def _read_value(data, position, end, data_type):
+    if data_type == STRING:
+        return _read_string(data, position, end)
+    try:
+        size = SIZES[data_type]
+    except KeyError:
+        raise DmapFormatError("Unknown data type {type} at byte {position}"
+                              "".format(type=data_type, position=position))
+    if position + size > end:
+        raise DmapFormatError("Truncated value at byte {}".format(position))
+    value, = struct.unpack_from('<' + FORMATS[data_type], data, position)
+    return value, position + size
+
+
+def parse_record(data, position=0):
+    """
+    Parses the record starting at position.
+
+        :param data: bytes of the file
+        :return: (DmapRecord, position of the next record)
+        :raise DmapFormatError: the record is not valid
+    """
+    if position + _HEADER.size > len(data):
+        raise DmapFormatError("Truncated record header at byte {}"
+                              "".format(position))
+    code, size, scalar_count = _HEADER.unpack_from(data, position)
+    if code != DMAP_CODE:
+        raise DmapFormatError("Bad record code {code:#x} at byte {position}"
+                              "".format(code=code, position=position))
+    end = position + size
+    if size < _HEADER.size + _INT.size or end > len(data):
+        raise DmapFormatError("Bad record size {size} at byte {position}"
+                              "".format(size=size, position=position))
+
+    record = DmapRecord()
+    cursor = position + _HEADER.size
+    for i in range(scalar_count):
+        name, cursor = _read_string(data, cursor, end)
+        if cursor >= end:
+            raise DmapFormatError("Truncated scalar {}".format(name))
+        data_type = data[cursor]
+        value, cursor = _read_value(data, cursor + 1, end, data_type)
+        record.scalars[name] = (data_type, value)
+
+    if cursor + _INT.size > end:
+        raise DmapFormatError("Truncated record at byte {}".format(cursor))
+    array_count, = _INT.unpack_from(data, cursor)
+    cursor += _INT.size
+    for i in range(array_count):
+        name, cursor = _read_string(data, cursor, end)
+        if cursor + 1 + _INT.size > end:
+            raise DmapFormatError("Truncated array {}".format(name))
+        data_type = data[cursor]
+        dimensions, = _INT.unpack_from(data, cursor + 1)
+        cursor += 1 + _INT.size
+        if dimensions < 0 or cursor + dimensions * _INT.size > end:
+            raise DmapFormatError("Bad dimensions of array {}".format(name))
+        ranges = struct.unpack_from('<{}i'.format(dimensions), data, cursor)
+        cursor += dimensions * _INT.size
+        count = 1
+        for dimension_range in ranges:
+            if dimension_range < 0:
+                raise DmapFormatError("Bad range of array {}".format(name))
+            count *= dimension_range
+
+        if data_type == STRING:
+            values = []
+            for j in range(count):
+                value, cursor = _read_string(data, cursor, end)
+                values.append(value)
+        else:
+            if data_type not in ARRAY_CODES:
+                raise DmapFormatError("Unknown data type {type} of array"
+                                      " {name}".format(type=data_type,
+                                                       name=name))
+            byte_count = count * SIZES[data_type]
+            if cursor + byte_count > end:
+                raise DmapFormatError("Truncated array {}".format(name))
+            values = array.array(ARRAY_CODES[data_type])
+            values.frombytes(data[cursor:cursor + byte_count])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            cursor += byte_count
+        record.arrays[name] = (data_type, ranges, values)
+
+    if cursor != end:
+        raise DmapFormatError("Record at byte {position} has {extra} bytes"
+                              " after its arrays"
+                              "".format(position=position, extra=end - cursor))
+    return record, end
+
+
+def parse_header(data, position=0, offset=0):
+    """
+    Reads the header of the record at position, without the rest of the
+    record.
+
+        :param data: bytes holding the header
+        :param position: start of the record
+        :param offset: position of data in the file, for the error messages
+        :return: size of the record in bytes (header included)
+        :raise DmapFormatError: the header is truncated or not valid
+    """
+    if position + _HEADER.size > len(data):
+        raise DmapFormatError("Truncated record header at byte {}"
+                              "".format(offset + position))
+    code, size, scalar_count = _HEADER.unpack_from(data, position)
+    if code != DMAP_CODE:
+        raise DmapFormatError("Bad record code {code:#x} at byte {position}"
+                              "".format(code=code,
+                                        position=offset + position))
+    if size < _HEADER.size + _INT.size or scalar_count < 0:
+        raise DmapFormatError("Bad record size {size} at byte {position}"
+                              "".format(size=size,
+                                        position=offset + position))
+    return size
+
+
+def record_spans(data):
+    """
+    Finds the records of a file from their headers only.
+
+        :param data: bytes of the file
+        :return: generator of the (start, end) byte positions of the records
+        :raise DmapFormatError: a header is not valid
+    """
+    position = 0
+    while position < len(data):
+        size = parse_header(data, position)
+        if position + size > len(data):
+            raise DmapFormatError("Record at byte {position} of {size} bytes"
+                                  " is truncated"
+                                  "".format(position=position, size=size))
+        yield position, position + size
+        position += size
+
+
+def read_scalar(data, position, name, default=None):
+    """
+    Reads one scalar of the record at position without decoding the rest
+    of the record.
+
+        :param data: bytes of the file
+        :param position: start of the record
+        :param name: name of the scalar
+        :return: value of the scalar, default if the record does not have it
+        :raise DmapFormatError: the scalars are not valid
+    """
+    code, size, scalar_count = _HEADER.unpack_from(data, position)
+    end = position + size
+    cursor = position + _HEADER.size
+    for i in range(scalar_count):
+        scalar_name, cursor = _read_string(data, cursor, end)
+        if cursor >= end:
+            raise DmapFormatError("Truncated scalar {}".format(scalar_name))
+        value, cursor = _read_value(data, cursor + 1, end, data[cursor])
+        if scalar_name == name:
+            return value
+    return default
+
+
+def stream_records(filename, chunk_size=1024**2):
+    """
+    Reads a dmap file, compressed or not, a chunk at a time and splits it
+    into records from their headers, without decoding them.
+
+        :param filename: path of the file
+        :param chunk_size: bytes read at a time, more when a record is larger
+        :return: generator of the bytes of every record
+        :raise DmapFormatError: a header is not valid or the file is
+                                truncated
+    """
+    with open_compressed(filename) as dmap_file:
+        buffer = b''
+        offset = 0
+        while True:
+            size = None
+            if len(buffer) >= _HEADER.size:
+                size = parse_header(buffer, offset=offset)
+                if len(buffer) >= size:
+                    yield buffer[:size]
+                    buffer = buffer[size:]
+                    offset += size
+                    continue
+            data = dmap_file.read(max(chunk_size, (size or 0) - len(buffer)))
+            if not data:
+                break
+            buffer += data
+    if buffer:
+        if size is None:
+            parse_header(buffer, offset=offset)
+        raise DmapFormatError("Record at byte {position} of {size} bytes"
+                              " is truncated"
+                              "".format(position=offset, size=size))
+
+
+def read_records(filename):
+    """
+    Reads the records of a dmap file, compressed or not, a chunk of the file
+    at a time.
+
+        :param filename: path of the file
+        :return: generator of DmapRecord
+        :raise DmapFormatError: the file is not valid
+    """
+    for data in stream_records(filename):
+        yield parse_record(data)[0]
+
+
+def read_dmap(filename):
+    """
+    :return: list of the DmapRecords of a dmap file
+    """
+    return list(read_records(filename))
+
+
+def _encode_value(data_type, value):
+    if data_type == STRING:
+        return value.encode('latin-1') + b'\x00'
+    return struct.pack('<' + FORMATS[data_type], value)
+
+
+def encode_record(record):
+    """
+    :param record: DmapRecord
+    :return: bytes of the record
+    """
+    parts = []
+    for name, (data_type, value) in record.scalars.items():
+        parts.append(name.encode('latin-1') + b'\x00' +
+                     struct.pack('<b', data_type) +
+                     _encode_value(data_type, value))
+    parts.append(_INT.pack(len(record.arrays)))
+    for name, (data_type, ranges, values) in record.arrays.items():
+        parts.append(name.encode('latin-1') + b'\x00' +
+                     struct.pack('<bi', data_type, len(ranges)) +
+                     struct.pack('<{}i'.format(len(ranges)), *ranges))
+        if data_type == STRING:
+            parts.append(b''.join(value.encode('latin-1') + b'\x00'
+                                  for value in values))
+        else:
+            values = array.array(ARRAY_CODES[data_type], values)
+            if sys.byteorder == 'big':
+                values.byteswap()
+            parts.append(values.tobytes())
+    body = b''.join(parts)
+    return _HEADER.pack(DMAP_CODE, _HEADER.size + len(body),
+                        len(record.scalars)) + body
+
+
+def write_dmap(filename, records):
+    """
+    Writes records to a dmap file.
+
+        :param filename: path of the file
+        :param records: iterable of DmapRecord
+    """
+    with open(filename, 'wb') as dmap_file:
+        for record in records:
+            dmap_file.write(encode_record(record))
@@ -0,0 +1,484 @@
+# Copyright 2018 SuperDARN Canada
+#
+# executor.py
+"""
+Execution backends for the RST commands. A command is an argv list with
+explicit standard input, output and error redirections, so no shell is
+forked to run it and it can be run anywhere the files are visible:
+
+    SerialExecutor: one command at a time on the local machine
+    PoolExecutor: up to a number of commands at once on the local machine
+    BatchExecutor: every command as a job of a batch cluster (e.g. slurm),
+                   written to a job script, submitted and polled until it
+                   finished
+
+Every backend has the same interface, submit returns a
+concurrent.futures.Future of the return value of the command and run waits
+for it.
+
+A command can have a limit of its run time and of the time its output file
+does not grow (a hung program). A local command with a limit runs in its own
+process group, which is killed as a whole when it goes over the limit, and
+fails with RSTTimeoutException.
+"""
+
+import os
+import time
+import shlex
+import signal
+import logging
+import itertools
+import threading
+import subprocess
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from DARNprocessing.utils.convectionMapConstants import ExecutorConst
+from DARNprocessing.utils.convectionMapExceptions import (BatchJobException,
+                                                          RSTTimeoutException)
+
+logger = logging.getLogger(__name__)
+
+# redirection to the null device, e.g. for the chatty standard error of
+# map_plot
+DEVNULL = os.devnull
+
+# local commands running in a process group of their own, see kill_sessions
+_sessions = set()
+_sessions_lock = threading.Lock()
+
+
+class Command():
+    """
+    A command to execute.
+
+        :param argv: list of the program and its arguments
+        :param stdin: path of the file read as standard input, None for no
+                      input
+        :param stdout: path of the file standard output is written to, None
+                       to inherit it
+        :param stderr: path of the file standard error is written to, None
+                       to inherit it
+        :param cwd: working directory, None for the current one
+        :param timeout: seconds the command can run, None for no limit
+        :param stall_timeout: seconds the standard output file can stay the
+                              same size, None for no limit
+    """
+
+    def __init__(self, argv, stdin=None, stdout=None, stderr=None, cwd=None,
+                 timeout=None, stall_timeout=None):
+        self.argv = [str(arg) for arg in argv]
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.cwd = cwd
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+
+    @property
+    def name(self):
+        """
+        Program name, used in errors and job names
+        """
+        return os.path.basename(self.argv[0])
+
+    def shell_line(self):
+        """
+        :return: str of the equivalent shell command line, used for the logs
+                 and the job scripts
+        """
+        line = " ".join(shlex.quote(arg) for arg in self.argv)
+        if self.stdin:
+            line += " < {}".format(shlex.quote(self.stdin))
+        if self.stdout:
+            line += " > {}".format(shlex.quote(self.stdout))
+        if self.stderr:
+            line += " 2> {}".format(shlex.quote(self.stderr))
+        return line
+
+    def __str__(self):
+        return self.shell_line()
+
+    def run_local(self):
+        """
+        Runs the command on the local machine.
+
+            :return: return value of the command
+            :raise RSTTimeoutException: the command went over its timeout or
+                                        stall_timeout and was killed
+        """
+        files = []
+        try:
+            stdin = subprocess.DEVNULL
+            if self.stdin:
+                stdin = open(self.stdin, 'rb')
+                files.append(stdin)
+            stdout = None
+            if self.stdout:
+                stdout = open(self.stdout, 'wb')
+                files.append(stdout)
+            stderr = None
+            if self.stderr:
+                stderr = open(self.stderr, 'wb')
+                files.append(stderr)
+            limited = self.timeout is not None or \
+                (self.stall_timeout is not None and self.stdout is not None)
+            try:
+                if not limited:
+                    return subprocess.call(self.argv, stdin=stdin,
+                                           stdout=stdout, stderr=stderr,
+                                           cwd=self.cwd)
+                # its own process group, so the children it starts are
+                # killed with it
+                process = subprocess.Popen(self.argv, stdin=stdin,
+                                           stdout=stdout, stderr=stderr,
+                                           cwd=self.cwd,
+                                           start_new_session=True)
+            except OSError as err:
+                # program not found or not executable, like the shell's 127
+                logger.error("{command}: {error}".format(command=self.name,
+                                                         error=err))
+                return 127
+            with _sessions_lock:
+                _sessions.add(process)
+            try:
+                return wait_for_process(process, self.name, self.timeout,
+                                        self.stall_timeout, self.stdout)
+            finally:
+                with _sessions_lock:
+                    _sessions.discard(process)
+        finally:
+            for f in files:
+                f.close()
+
+
+def kill_sessions():
+    """
+    Kills (SIGKILL) the process groups of the running local commands that
+    have a process group of their own, e.g. when the process running them
+    is stopped. They are outside of the process group of the process.
+    """
+    with _sessions_lock:
+        processes = list(_sessions)
+    for process in processes:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def kill_process_group(process, grace=ExecutorConst.KILL_GRACE):
+    """
+    Kills the process group of a process started in a new session: SIGTERM,
+    then SIGKILL when the process has not exited after grace seconds.
+
+        :param process: subprocess.Popen
+        :param grace: seconds to wait for the process after SIGTERM
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    # children ignoring SIGTERM may outlive the process
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def wait_for_process(process, name, timeout=None, stall_timeout=None,
+                     output=None, interval=ExecutorConst.WATCH_INTERVAL):
+    """
+    Waits for a process started in a new session, killing its process group
+    when it runs longer than timeout or its output file does not grow for
+    stall_timeout seconds.
+
+        :param process: subprocess.Popen
+        :param name: program name, used in the errors
+        :param timeout: seconds the process can run, None for no limit
+        :param stall_timeout: seconds output can stay the same size, None
+                              for no limit
+        :param output: path of the output file of the process, None for no
+                       stall detection
+        :param interval: seconds between the checks
+        :return: return value of the process
+        :raise RSTTimeoutException: the process was killed
+    """
+    start = time.monotonic()
+    last_size = None
+    last_growth = start
+    try:
+        while True:
+            try:
+                return process.wait(timeout=interval)
+            except subprocess.TimeoutExpired:
+                pass
+            now = time.monotonic()
+            if timeout is not None and now - start >= timeout:
+                reason = "ran for more than {} s".format(timeout)
+                break
+            if stall_timeout is not None and output is not None:
+                try:
+                    size = os.path.getsize(output)
+                except OSError:
+                    size = None
+                if size != last_size:
+                    last_size = size
+                    last_growth = now
+                elif now - last_growth >= stall_timeout:
+                    reason = "{output} did not grow for {stall} s"\
+                             "".format(output=output, stall=stall_timeout)
+                    break
+    except BaseException:
+        # e.g. KeyboardInterrupt, the process would outlive the run
+        kill_process_group(process)
+        raise
+    logger.error("Killing {name} (process group {pid}): {reason}"
+                 "".format(name=name, pid=process.pid, reason=reason))
+    kill_process_group(process)
+    raise RSTTimeoutException(name, reason)
+
+
+class Executor():
+    """
+    Base class of the execution backends.
+    """
+
+    def submit(self, command):
+        """
+        Starts a command.
+
+            :param command: Command
+            :return: concurrent.futures.Future of the return value
+        """
+        raise NotImplementedError
+
+    def run(self, command):
+        """
+        Runs a command and waits for it.
+
+            :param command: Command
+            :return: return value of the command
+        """
+        return self.submit(command).result()
+
+    def shutdown(self, wait=True):
+        """
+        Releases the resources of the backend.
+        """
+        pass
+
+
+class SerialExecutor(Executor):
+    """
+    Runs the commands on the local machine one at a time, in the thread
+    submitting them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def submit(self, command):
+        future = Future()
+        with self._lock:
+            try:
+                future.set_result(command.run_local())
+            except Exception as err:
+                future.set_exception(err)
+        return future
+
+
+class _ThreadedExecutor(Executor):
+    """
+    Backend running at most max_workers commands at once, each from its own
+    thread waiting for it.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max(1, max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def submit(self, command):
+        return self._pool.submit(self._execute, command)
+
+    def _execute(self, command):
+        raise NotImplementedError
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+class PoolExecutor(_ThreadedExecutor):
+    """
+    Runs up to processes commands at once on the local machine.
+
+        :param processes: maximum number of commands running at once
+    """
+
+    def __init__(self, processes=1):
+        _ThreadedExecutor.__init__(self, processes)
+
+    def _execute(self, command):
+        return command.run_local()
+
+
+class BatchExecutor(_ThreadedExecutor):
+    """
+    Runs every command as a batch job. The command is written to a job
+    script in job_path which records the return value of the command in a
+    {script}.rc file, the script is given to the submit command and the job
+    is finished when the return value file exists. job_path and the files of
+    the commands have to be on a file system shared with the cluster nodes.
+
+    When a status command is given, a job it no longer reports (no output or
+    a non-zero return value) without a return value file was lost, e.g.
+    killed by the scheduler, and fails with ExecutorConst.LOST_JOB.
+
+    Any program following the same protocol can stand in for the cluster,
+    e.g. for testing.
+
+        :param job_path: directory of the job scripts
+        :param submit_command: argv list of the submit command, the script
+                               path is appended; the last word of its
+                               output (up to a ';') is taken as the job id
+        :param status_command: argv list of the status command, the job id
+                               is appended, None to only wait for the
+                               return value file
+        :param poll_interval: seconds between status checks
+        :param max_jobs: maximum number of jobs queued at once
+    """
+
+    def __init__(self, job_path, submit_command=None, status_command=None,
+                 poll_interval=ExecutorConst.POLL_INTERVAL,
+                 max_jobs=ExecutorConst.MAX_JOBS):
+        _ThreadedExecutor.__init__(self, max_jobs)
+        self.job_path = job_path
+        if submit_command is None:
+            submit_command = shlex.split(ExecutorConst.BATCH_SUBMIT)
+        self.submit_command = list(submit_command)
+        self.status_command = list(status_command) if status_command else None
+        self.poll_interval = poll_interval
+        self._counter = itertools.count()
+        if not os.path.isdir(job_path):
+            os.makedirs(job_path)
+
+    def write_job_script(self, command):
+        """
+        Writes the job script of a command.
+
+            :param command: Command
+            :return: str path of the job script
+        """
+        script_path = os.path.join(self.job_path, "{name}.{pid}.{count}.sh"
+                                   "".format(name=command.name,
+                                             pid=os.getpid(),
+                                             count=next(self._counter)))
+        rc_path = script_path + '.rc'
+        cwd = command.cwd or os.getcwd()
+        with open(script_path, 'w') as script:
+            script.write("#!/bin/sh\n")
+            script.write("cd {}\n".format(shlex.quote(cwd)))
+            line = command.shell_line()
+            if command.timeout is not None:
+                # the stall limit is left to the cluster
+                line = "timeout -k {grace} {timeout} {line}"\
+                       "".format(grace=ExecutorConst.KILL_GRACE,
+                                 timeout=command.timeout, line=line)
+            if command.stdin:
+                script.write("{}\n".format(line))
+            else:
+                script.write("{} < /dev/null\n".format(line))
+            # written then renamed so a partial file is never read
+            script.write("echo $? > {rc}.tmp && mv {rc}.tmp {rc}\n"
+                         "".format(rc=shlex.quote(rc_path)))
+        os.chmod(script_path, 0o755)
+        return script_path
+
+    def _submit_job(self, script_path):
+        """
+        :return: str job id
+        :raise BatchJobException: the submit command failed
+        """
+        submit = subprocess.run(self.submit_command + [script_path],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                stdin=subprocess.DEVNULL)
+        output = submit.stdout.decode(errors='replace').split()
+        if submit.returncode != 0 or not output:
+            raise BatchJobException(script_path,
+                                    "submit command {command} failed with"
+                                    " {returnvalue}: {error}"
+                                    "".format(command=self.submit_command[0],
+                                              returnvalue=submit.returncode,
+                                              error=submit.stderr.decode(errors='replace').strip()))
+        # sbatch --parsable prints "jobid[;cluster]"
+        return output[-1].split(';')[0]
+
+    def _job_listed(self, job_id):
+        """
+        :return: False if the status command no longer reports the job
+        """
+        status = subprocess.run(self.status_command + [job_id],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                stdin=subprocess.DEVNULL)
+        return status.returncode == 0 and status.stdout.strip() != b''
+
+    def _read_return_value(self, rc_path):
+        with open(rc_path) as rc_file:
+            return int(rc_file.read().strip() or ExecutorConst.LOST_JOB)
+
+    def _execute(self, command):
+        script_path = self.write_job_script(command)
+        rc_path = script_path + '.rc'
+        job_id = self._submit_job(script_path)
+        logger.debug("Submitted {script} as job {job}"
+                     "".format(script=script_path, job=job_id))
+
+        while not os.path.exists(rc_path):
+            time.sleep(self.poll_interval)
+            if self.status_command and not self._job_listed(job_id):
+                # the return value can be written between the two checks
+                if os.path.exists(rc_path):
+                    break
+                logger.error("Job {job} ({script}) finished without a return"
+                             " value".format(job=job_id, script=script_path))
+                return ExecutorConst.LOST_JOB
+
+        return_value = self._read_return_value(rc_path)
+        for filename in (script_path, rc_path):
+            os.remove(filename)
+        if command.timeout is not None and \
+           return_value == ExecutorConst.TIMED_OUT:
+            raise RSTTimeoutException(command.name,
+                                      "job {job} ran for more than {timeout} s"
+                                      "".format(job=job_id,
+                                                timeout=command.timeout))
+        return return_value
+
+
+EXECUTORS = {'serial': SerialExecutor,
+             'local': PoolExecutor,
+             'batch': BatchExecutor}
+
+
+def make_executor(name, **kwargs):
+    """
+    Creates an execution backend by name.
+
+        :param name: 'serial', 'local' or 'batch'
+        :param kwargs: parameters of the backend class
+        :return: Executor
+        :raise ValueError: unknown backend
+    """
+    try:
+        executor_class = EXECUTORS[name]
+    except KeyError:
+        raise ValueError("Unknown executor {name}, use one of: {names}"
+                         "".format(name=name, names=", ".join(EXECUTORS)))
+    return executor_class(**kwargs)
@@ -0,0 +1,215 @@
+# Copyright 2018 SuperDARN Canada
+#
+# filecache.py
+"""
+A directory of cached files that can be shared by several processes. Entries
+are keyed by a hash, written atomically and evicted least recently used
+first when the cache grows over its byte budget.
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+
+from DARNprocessing.utils.filelock import FileLock, atomic_output
+
+logger = logging.getLogger(__name__)
+
+
+def file_fingerprint(filename):
+    """
+    Fingerprint of a file from its absolute path, size and modification time.
+    Cheap to compute and changes whenever the file is replaced or rewritten.
+
+        :param filename: path of the file
+        :return: tuple (absolute path, size in bytes, mtime in nanoseconds)
+    """
+    stat = os.stat(filename)
+    return (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+
+
+def content_fingerprint(filename, block_size=1024**2):
+    """
+    Fingerprint of a file from its content. Unlike file_fingerprint it does
+    not change when a file is rewritten with the same content, e.g. by a step
+    run again with the same input and options.
+
+        :param filename: path of the file
+        :param block_size: bytes read at a time
+        :return: str hex digest of the content
+    """
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as content_file:
+        for block in iter(lambda: content_file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileCache():
+    """
+    Cache of files stored in cache_path.
+
+    Entries are produced by a callable writing to a temporary file that is
+    renamed into place, so concurrent readers never see partial entries.
+    A lock per entry makes sure only one process produces a given entry
+    while the others wait for it. Every hit refreshes the entry's
+    modification time which is used for the least recently used eviction.
+
+        :param cache_path: directory of the cache, created if needed
+        :param max_bytes: byte budget of the cache, None for no limit
+    """
+    LOCK_EXT = '.lock'
+    EVICT_LOCK = '.evict.lock'
+
+    def __init__(self, cache_path, max_bytes=None):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(self.cache_path)
+        except OSError:
+            if not os.path.isdir(self.cache_path):
+                raise
+
+    @staticmethod
+    def key(*parts):
+        """
+        Builds a cache key from any number of hashable parts.
+
+            :return: str hex digest of the parts
+        """
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def entry_path(self, key):
+        """
+        :param key: cache key
+        :return: str path of the entry for the key
+        """
+        return os.path.join(self.cache_path, key)
+
+    def lookup(self, key):
+        """
+        Looks for an entry and marks it as recently used.
+
+            :param key: cache key
+            :return: path of the entry, None if it is not cached
+        """
+        entry = self.entry_path(key)
+        if not os.path.isfile(entry):
+            return None
+        try:
+            os.utime(entry, None)
+        except OSError:
+            # entry owned by another user, it is still usable
+            pass
+        return entry
+
+    def store(self, key, producer):
+        """
+        Returns the entry for key, producing it when it is not cached.
+
+            :param key: cache key
+            :param producer: callable taking the path of the file to write
+            :return: path of the entry
+        """
+        entry = self.lookup(key)
+        if entry:
+            return entry
+
+        with FileLock(self.entry_path(key) + self.LOCK_EXT):
+            # another process may have produced it while we waited
+            entry = self.lookup(key)
+            if entry:
+                return entry
+            entry = self.entry_path(key)
+            with atomic_output(entry) as tmp_path:
+                producer(tmp_path)
+            logger.info("Cached {}".format(entry))
+
+        # the entry just produced is the most recently used one, even when
+        # it is over the budget by itself
+        self.evict(keep=entry)
+        return entry
+
+    def fetch(self, key, destination, producer):
+        """
+        Places the entry for key at destination, hard linking it when
+        possible and copying it otherwise (e.g. across file systems).
+
+            :param key: cache key
+            :param destination: path the file is needed at
+            :param producer: callable taking the path of the file to write,
+                             used when the entry is not cached
+            :return: destination
+        """
+        while True:
+            entry = self.store(key, producer)
+            # eviction waits until the entry is placed, another process may
+            # have evicted it since it was stored, it is produced again then
+            with FileLock(os.path.join(self.cache_path, self.EVICT_LOCK)):
+                if self.lookup(key) is None:
+                    logger.debug("{} was evicted before it was placed"
+                                 "".format(entry))
+                    continue
+                if os.path.lexists(destination):
+                    os.remove(destination)
+                try:
+                    os.link(entry, destination)
+                except OSError:
+                    shutil.copy2(entry, destination)
+                return destination
+
+    def discard(self, key):
+        """
+        Removes the entry for key, e.g. when it turned out to be bad. The
+        files it is linked to are kept.
+
+            :param key: cache key
+        """
+        with FileLock(os.path.join(self.cache_path, self.EVICT_LOCK)):
+            entry = self.entry_path(key)
+            if os.path.exists(entry):
+                os.remove(entry)
+                logger.info("Discarded {} from the cache".format(entry))
+
+    def entries(self):
+        """
+        :return: list of (mtime, size, path) of the cached entries
+        """
+        entries = []
+        for filename in os.listdir(self.cache_path):
+            if filename.startswith('.') or filename.endswith(self.LOCK_EXT):
+                continue
+            path = os.path.join(self.cache_path, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries until the cache fits in its
+        byte budget.
+
+            :param keep: path of an entry that is not removed
+        """
+        if self.max_bytes is None:
+            return
+
+        with FileLock(os.path.join(self.cache_path, self.EVICT_LOCK)):
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    logger.info("Evicted {} from the cache".format(path))
+                except OSError:
+                    pass
+                total -= size
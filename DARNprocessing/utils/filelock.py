@@ -0,0 +1,121 @@
+# Copyright 2018 SuperDARN Canada
+#
+# filelock.py
+"""
+Inter-process file locking and atomic file writing, used by the caches that
+are shared between several convection map processes.
+"""
+
+import os
+import time
+import fcntl
+import binascii
+
+from contextlib import contextmanager
+
+from DARNprocessing.utils.convectionMapExceptions import LockTimeoutException
+
+
+class FileLock():
+    """
+    Advisory lock on a lock file (fcntl.flock) that can be shared between
+    processes on the same machine or a shared file system that supports
+    flock.
+
+        :param lock_path: path of the lock file, created if it does not exist
+        :param timeout: seconds to wait for the lock, None waits forever
+        :param poll_interval: seconds between attempts when a timeout is set
+    """
+
+    def __init__(self, lock_path, timeout=None, poll_interval=0.1):
+        self.lock_path = lock_path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    def acquire(self):
+        """
+        Acquires the lock, blocking until it is free.
+
+            :raise LockTimeoutException: the lock was not obtained within
+                                         the timeout
+        """
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o664)
+        if self.timeout is None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            deadline = time.time() + self.timeout
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except (IOError, OSError):
+                    if time.time() >= deadline:
+                        os.close(fd)
+                        raise LockTimeoutException(self.lock_path,
+                                                   self.timeout)
+                    time.sleep(self.poll_interval)
+        self._fd = fd
+
+    def release(self):
+        """
+        Releases the lock if it is held.
+        """
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def _create_temporary(directory, suffix):
+    """
+    Creates a new empty file in directory with the permissions of a file
+    created by open: the mode is given to os.open, so the umask of the
+    process applies without being changed (os.umask is process wide and not
+    thread safe).
+
+        :param directory: directory of the file
+        :param suffix: end of the file name
+        :return: path of the file
+    """
+    while True:
+        tmp_path = os.path.join(directory, '.tmp.{}{}'
+                                           ''.format(binascii.hexlify(
+                                               os.urandom(6)).decode(),
+                                               suffix))
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         0o666)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return tmp_path
+
+
+@contextmanager
+def atomic_output(destination):
+    """
+    Yields a temporary file path in the same directory as destination. When
+    the block finishes without an error the temporary file is renamed over
+    destination, so readers only ever see a complete file. On an error the
+    temporary file is removed.
+
+        :param destination: final path of the file
+    """
+    directory = os.path.dirname(os.path.abspath(destination))
+    tmp_path = _create_temporary(directory,
+                                 '.' + os.path.basename(destination))
+    try:
+        yield tmp_path
+        os.replace(tmp_path, destination)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,287 @@
+# Copyright 2018 SuperDARN Canada
+#
+# fov.py
+"""
+Field-of-view geometry of the radars: the latitude and longitude of the
+corners of every beam and range gate cell, geographic or magnetic.
+
+The site of a radar (location, boresight, beam separation, number of beams)
+comes from its RST hardware file, hdw.dat.<abbrv> in $SD_HDWPATH; a file
+holds one line per hardware configuration. Both layouts are read:
+
+    RST 4.2 and newer (21 columns): stid, YYYYMMDD, HH:MM:SS the line is
+    valid from, latitude, longitude, altitude (m), boresight, boresight
+    shift, beam separation, ... , maximum range gates, maximum beams
+    older RST (19 columns): stid, year, second of the year the line is valid
+    until, latitude, longitude, altitude (m), boresight, beam separation,
+    ... , maximum range gates, maximum beams
+
+The edges of a cell are half a beam separation either side of the beam
+direction and the gate edges are frang + gate * rsep km of slant range; the
+slant range is projected to the ground under a virtual height and the
+corners placed along the great circle of the beam direction. Like RST's
+position code the virtual height depends on the range: the near gates see
+E region scatter (and the height falls to 0 at the radar), the far gates the
+given (F region) height.
+
+The corners depend only on the configuration, the gate layout (frang, rsep,
+number of gates) and, for magnetic coordinates, the year of the AACGM
+coefficients. They are computed once per key, kept in memory and persisted
+as .npz files, so rendering a day of scans, or another day of the same
+radar, never recomputes them.
+"""
+
+import os
+import logging
+import functools
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    import aacgmv2
+except ImportError:
+    aacgmv2 = None
+
+from DARNprocessing.utils.filelock import atomic_output
+from DARNprocessing.utils.convectionMapConstants import FovConst
+from DARNprocessing.utils.convectionMapExceptions import (
+    FileDoesNotExistException,
+    UnsupportedTypeException)
+
+logger = logging.getLogger(__name__)
+
+HardwareConfig = namedtuple('HardwareConfig',
+                            ['stid', 'valid_from', 'latitude', 'longitude',
+                             'altitude', 'boresight', 'beam_separation',
+                             'max_gates', 'max_beams'])
+
+
+def hardware_filename(abbrv, hdw_path=None):
+    """
+    :param abbrv: 3-letter acronym of the radar
+    :param hdw_path: directory of the hardware files, default $SD_HDWPATH
+    :return: path of the hardware file of the radar
+    :raise FileDoesNotExistException: no such file
+    """
+    if hdw_path is None:
+        hdw_path = os.environ.get(FovConst.HDW_PATH_ENV, '')
+    filename = os.path.join(hdw_path, FovConst.HDW_PREFIX + abbrv)
+    if not os.path.isfile(filename):
+        raise FileDoesNotExistException(filename)
+    return filename
+
+
+def read_hardware(filename):
+    """
+    Reads the configurations of a hardware file.
+
+        :param filename: path of the hdw.dat file
+        :return: list of HardwareConfig in time order
+        :raise ValueError: a line is in neither layout
+    """
+    configs = []
+    valid_until = []
+    with open(filename) as hardware_file:
+        for line_number, line in enumerate(hardware_file, 1):
+            columns = line.split('#')[0].split()
+            if not columns:
+                continue
+            if len(columns) == 21:
+                valid_from = datetime.strptime(columns[1] + columns[2],
+                                               "%Y%m%d%H:%M:%S")
+                boresight = float(columns[6]) + float(columns[7])
+                beam_separation = float(columns[8])
+            elif len(columns) == 19:
+                valid_from = datetime.min
+                valid_until.append(datetime(int(columns[1]), 1, 1) +
+                                   timedelta(seconds=int(columns[2])))
+                boresight = float(columns[6])
+                beam_separation = float(columns[7])
+            else:
+                raise ValueError("{file}:{line}: {count} columns, expected 19"
+                                 " or 21".format(file=filename,
+                                                 line=line_number,
+                                                 count=len(columns)))
+            configs.append(HardwareConfig(int(columns[0]), valid_from,
+                                          float(columns[3]),
+                                          float(columns[4]),
+                                          float(columns[5]),
+                                          boresight, beam_separation,
+                                          int(columns[-2]),
+                                          int(columns[-1])))
+    if valid_until:
+        # the older layout gives the end of every configuration, it starts
+        # where the previous one ends
+        ends = sorted(zip(valid_until, configs), key=lambda end: end[0])
+        starts = [datetime.min] + [end for end, config in ends[:-1]]
+        configs = [config._replace(valid_from=start)
+                   for (end, config), start in zip(ends, starts)]
+    return sorted(configs, key=lambda config: config.valid_from)
+
+
+def hardware_config(configs, time):
+    """
+    :param configs: list of HardwareConfig in time order
+    :param time: datetime
+    :return: the HardwareConfig valid at time
+    :raise ValueError: none is valid at time
+    """
+    valid = [config for config in configs if config.valid_from <= time]
+    if not valid:
+        raise ValueError("No hardware configuration is valid at {}"
+                         "".format(time))
+    return valid[-1]
+
+
+def virtual_height(slant_range, height=FovConst.VIRTUAL_HEIGHT):
+    """
+    Virtual height of the scatter of RST's position code.
+
+        :param slant_range: numpy array of slant ranges in km
+        :param height: height of the far ranges in km, used over the near
+                       ranges when it is an E region height
+        :return: numpy array of the virtual heights in km
+    """
+    slant_range = np.asarray(slant_range, dtype=float)
+    if height <= FovConst.E_REGION_LIMIT:
+        far_height = np.full(slant_range.shape, float(height))
+    else:
+        far_height = np.interp(slant_range,
+                               [FovConst.E_REGION_RANGE,
+                                FovConst.F_REGION_RANGE],
+                               [FovConst.E_REGION_HEIGHT, height])
+    # falls linearly to the radar, the scatter stays below the range
+    near_height = slant_range / FovConst.NEAR_RANGE * FovConst.E_REGION_HEIGHT
+    return np.where(slant_range < FovConst.NEAR_RANGE, near_height,
+                    far_height)
+
+
+def gate_corners(config, frang, rsep, gates,
+                 height=FovConst.VIRTUAL_HEIGHT):
+    """
+    Geographic corners of the cells.
+
+        :param config: HardwareConfig of the radar
+        :param frang: slant range to the first gate in km
+        :param rsep: gate length in km
+        :param gates: number of range gates
+        :param height: virtual height of the far gates in km, see
+                       virtual_height
+        :return: (latitude, longitude) numpy arrays in degrees of shape
+                 (beams + 1, gates + 1); cell (beam, gate) has the corners
+                 [beam:beam + 2, gate:gate + 2]
+    """
+    beam_edges = np.arange(config.max_beams + 1) - config.max_beams / 2.0
+    azimuth = np.radians(config.boresight +
+                         beam_edges * config.beam_separation)[:, np.newaxis]
+    slant_range = frang + rsep * np.arange(gates + 1, dtype=float)
+
+    site_radius = FovConst.EARTH_RADIUS + config.altitude / 1000.0
+    scatter_radius = FovConst.EARTH_RADIUS + virtual_height(slant_range,
+                                                             height)
+    # earth centred angle between the site and the scatter
+    cosine = (site_radius**2 + scatter_radius**2 - slant_range**2) / \
+        (2 * site_radius * scatter_radius)
+    angle = np.arccos(np.clip(cosine, -1, 1))[np.newaxis, :]
+
+    latitude = np.radians(config.latitude)
+    longitude = np.radians(config.longitude)
+    corner_latitude = np.arcsin(np.sin(latitude) * np.cos(angle) +
+                                np.cos(latitude) * np.sin(angle) *
+                                np.cos(azimuth))
+    corner_longitude = longitude + \
+        np.arctan2(np.sin(azimuth) * np.sin(angle) * np.cos(latitude),
+                   np.cos(angle) - np.sin(latitude) * np.sin(corner_latitude))
+    return (np.degrees(corner_latitude),
+            (np.degrees(corner_longitude) + 180) % 360 - 180)
+
+
+def magnetic_corners(latitude, longitude, year,
+                     height=FovConst.VIRTUAL_HEIGHT):
+    """
+    :param latitude: geographic latitudes of gate_corners
+    :param longitude: geographic longitudes of gate_corners
+    :param year: year of the AACGM coefficients
+    :return: (magnetic latitude, magnetic longitude) numpy arrays of the
+             same shape, NaN where AACGM is not defined
+    :raise UnsupportedTypeException: aacgmv2 is not installed
+    """
+    if aacgmv2 is None:
+        raise UnsupportedTypeException("Magnetic coordinates need the aacgmv2"
+                                       " package, available coordinates:"
+                                       " geo")
+    mlat, mlon, radius = aacgmv2.convert_latlon_arr(latitude.ravel(),
+                                                    longitude.ravel(), height,
+                                                    datetime(year, 1, 1),
+                                                    method_code='G2A')
+    return (np.asarray(mlat, dtype=float).reshape(latitude.shape),
+            np.asarray(mlon, dtype=float).reshape(latitude.shape))
+
+
+def _cache_filename(cache_path, config, frang, rsep, gates, coords, year):
+    name = "{stid}.{valid:%Y%m%d%H%M%S}.{frang}.{rsep}.{gates}.{beams}."\
+           "{height:g}{model}.{coords}".format(stid=config.stid,
+                                        valid=max(config.valid_from,
+                                                  datetime(1900, 1, 1)),
+                                        frang=frang, rsep=rsep, gates=gates,
+                                        beams=config.max_beams,
+                                        height=FovConst.VIRTUAL_HEIGHT,
+                                        model=FovConst.HEIGHT_MODEL,
+                                        coords=coords)
+    if coords == 'mag':
+        name += ".{}".format(year)
+    return os.path.join(cache_path, name + '.npz')
+
+
+@functools.lru_cache(maxsize=None)
+def fov_corners(config, frang, rsep, gates, coords='geo', year=None,
+                cache_path=None):
+    """
+    Corners of the cells of a configuration, from memory, from the
+    persisted geometry or computed and persisted.
+
+        :param config: HardwareConfig of the radar
+        :param frang: slant range to the first gate in km
+        :param rsep: gate length in km
+        :param gates: number of range gates
+        :param coords: one of FanConst.COORDS
+        :param year: year of the AACGM coefficients, for 'mag'
+        :param cache_path: directory of the persisted geometry, default
+                           FovConst.CACHE_PATH, '' to not persist it
+        :return: read only (latitude, longitude) numpy arrays of
+                 gate_corners
+    """
+    if cache_path is None:
+        cache_path = os.path.expanduser(FovConst.CACHE_PATH)
+    filename = None
+    if cache_path:
+        filename = _cache_filename(cache_path, config, frang, rsep, gates,
+                                   coords, year)
+        if os.path.exists(filename):
+            with np.load(filename) as corners:
+                latitude, longitude = corners['latitude'], corners['longitude']
+            latitude.setflags(write=False)
+            longitude.setflags(write=False)
+            return latitude, longitude
+
+    latitude, longitude = gate_corners(config, frang, rsep, gates)
+    if coords == 'mag':
+        latitude, longitude = magnetic_corners(latitude, longitude, year)
+    elif coords != 'geo':
+        raise UnsupportedTypeException("Coordinates {} are not supported,"
+                                       " use geo or mag".format(coords))
+
+    if filename is not None:
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path)
+        with atomic_output(filename) as tmp_path:
+            # a file object, np.savez would add .npz to the temporary name
+            with open(tmp_path, 'wb') as cache_file:
+                np.savez(cache_file, latitude=latitude, longitude=longitude)
+        logger.debug("Saved the field of view {}".format(filename))
+    latitude.setflags(write=False)
+    longitude.setflags(write=False)
+    return latitude, longitude
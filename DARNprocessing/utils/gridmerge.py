@@ -0,0 +1,335 @@
+# Copyright 2018 SuperDARN Canada
+#
+# gridmerge.py
+"""
+Streaming combination of radar grid files, the python alternative of
+combine_grid.
+
+The records of every radar grid file are in time order, so combining them
+is a k-way merge: a heap holds the next record of every file and the records
+of the same integration period (same start time) are merged into one record,
+the station and vector arrays of the radars concatenated. Only one record
+per file is in memory, whatever the length of the day, and the files are
+read in bounded chunks.
+
+The grid files can also be merged while make_grid is still writing them: a
+GridStream follows its file like tail -f until it is told the file is
+complete. A GridCombiner knows the radars (producers) to expect; each
+producer declares the grid files it will write before writing them, and the
+merge starts once every producer declared its files, so it runs alongside
+the gridding of the last radars instead of after the slowest one. A file
+whose writer failed part way (e.g. make_grid timed out) must not be in the
+combined file: its stream fails, the partial combined file is dropped and
+the other files are merged again from their start.
+"""
+
+import os
+import heapq
+import struct
+import logging
+import threading
+
+from itertools import groupby
+
+from DARNprocessing.utils.dmap import (DmapRecord,
+                                       DmapFormatError,
+                                       parse_record,
+                                       encode_record,
+                                       record_time)
+from DARNprocessing.utils.filelock import atomic_output
+from DARNprocessing.utils.compression import open_compressed
+from DARNprocessing.utils.convectionMapConstants import CombineConst
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<iii')
+
+
+class StreamFailed(Exception):
+    """
+    The writer of a followed grid file failed, its records are not to be
+    combined.
+    """
+
+
+def merge_records(records):
+    """
+    Merges the grid records of several radars for the same period.
+
+        :param records: list of DmapRecords with the same start time
+        :return: DmapRecord with the scalars of the first record, the end
+                 time of the latest record and the arrays of the records
+                 concatenated
+    """
+    merged = DmapRecord()
+    merged.scalars.update(records[0].scalars)
+    latest = max(records, key=lambda record: record_time(record, 'end'))
+    for name, value in latest.scalars.items():
+        if name.startswith('end.'):
+            merged.scalars[name] = value
+
+    names = []
+    for record in records:
+        names.extend(name for name in record.arrays if name not in names)
+    for name in names:
+        # RST leaves out the vector arrays of a radar without vectors, a
+        # missing array adds no values
+        present = [record.arrays[name] for record in records
+                   if name in record.arrays]
+        data_type, ranges, _ = present[0]
+        values = []
+        length = 0
+        for other_type, other_ranges, other_values in present:
+            if other_type != data_type or \
+                    tuple(other_ranges[:-1]) != tuple(ranges[:-1]):
+                raise DmapFormatError("Array {} differs between the grid"
+                                      " records".format(name))
+            values.extend(other_values)
+            length += other_ranges[-1] if other_ranges else 0
+        merged.arrays[name] = (data_type, tuple(ranges[:-1]) + (length,),
+                               values)
+    return merged
+
+
+def merge_streams(streams):
+    """
+    k-way merge of grid record streams.
+
+        :param streams: iterables of DmapRecords in time order
+        :return: generator of the merged DmapRecords in time order
+    """
+    merged = heapq.merge(*streams, key=record_time)
+    for start_time, records in groupby(merged, key=record_time):
+        records = list(records)
+        yield records[0] if len(records) == 1 else merge_records(records)
+
+
+class GridStream():
+    """
+    Iterator of the records of a grid file, following the file while it is
+    written.
+
+        :param path: path of the grid file
+        :param complete: the file is already complete, otherwise finish has
+                         to be called once the writer closed it
+        :param interval: seconds between the reads of a growing file
+    """
+
+    def __init__(self, path, complete=True,
+                 interval=CombineConst.FOLLOW_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._complete = threading.Event()
+        if complete:
+            self._complete.set()
+        self.failed = False
+        self._file = None
+        self._buffer = b''
+        self._position = 0
+
+    def finish(self, failed=False):
+        """
+        Marks the file complete, called when its writer finished.
+
+            :param failed: the writer failed part way, the iteration raises
+                           StreamFailed instead of ending
+        """
+        # set before the completion, the iteration checks it once complete
+        self.failed = self.failed or failed
+        self._complete.set()
+
+    def restart(self):
+        """
+        :return: new GridStream of the file, from its start
+        """
+        return GridStream(self.path, self._complete.is_set(), self.interval)
+
+    def _read(self):
+        """
+        :return: True if data was read
+        """
+        if self._file is None:
+            if not os.path.exists(self.path):
+                return False
+            # a file being written is never compressed, saved grid files
+            # may be
+            if self._complete.is_set():
+                self._file = open_compressed(self.path)
+            else:
+                self._file = open(self.path, 'rb')
+        # enough for the next record, the parsed records are dropped from
+        # the buffer
+        size = CombineConst.READ_SIZE
+        available = len(self._buffer) - self._position
+        if available >= _HEADER.size:
+            record_size = _HEADER.unpack_from(self._buffer,
+                                              self._position)[1]
+            size = max(size, record_size - available)
+        data = self._file.read(size)
+        if data:
+            self._buffer = self._buffer[self._position:] + data
+            self._position = 0
+        return bool(data)
+
+    def _next_record(self):
+        if len(self._buffer) - self._position < _HEADER.size:
+            return None
+        code, size, scalar_count = _HEADER.unpack_from(self._buffer,
+                                                       self._position)
+        if len(self._buffer) - self._position < size:
+            # not written yet, or the rest of a truncated file
+            return None
+        record, self._position = parse_record(self._buffer, self._position)
+        return record
+
+    def __iter__(self):
+        try:
+            while True:
+                record = self._next_record()
+                if record is not None:
+                    yield record
+                    continue
+                # the flag is read before the data, so the data of a file
+                # completed meanwhile is read once more
+                complete = self._complete.is_set()
+                if complete and self.failed:
+                    raise StreamFailed(self.path)
+                if self._read():
+                    continue
+                if complete:
+                    break
+                self._complete.wait(self.interval)
+            remaining = len(self._buffer) - self._position
+            if remaining:
+                # e.g. make_grid failed while writing
+                logger.warning("Ignoring {size} bytes of an incomplete record"
+                               " at the end of {path}"
+                               "".format(size=remaining, path=self.path))
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def write_records(records, output_path):
+    """
+    Writes records to a dmap file, replacing it once all are written.
+
+        :return: number of records written
+    """
+    count = 0
+    with atomic_output(output_path) as tmp_path:
+        with open(tmp_path, 'wb') as output:
+            for record in records:
+                output.write(encode_record(record))
+                count += 1
+    return count
+
+
+def merge_grid_files(grid_files, output_path):
+    """
+    Combines complete radar grid files, the python combine_grid.
+
+        :param grid_files: list of the paths of the radar grid files
+        :param output_path: path of the combined grid file
+        :return: number of records written
+    """
+    return write_records(merge_streams([GridStream(path)
+                                        for path in grid_files]),
+                         output_path)
+
+
+class GridCombiner():
+    """
+    Merges the grid files of several producers (radars) while they are
+    written.
+
+        :param producers: names of the producers to expect
+    """
+
+    def __init__(self, producers):
+        self._pending = set(producers)
+        self._streams = {}
+        self._producer_paths = {}
+        self._condition = threading.Condition()
+
+    def declare(self, producer, paths, complete=False):
+        """
+        Declares the grid files of a producer, once per producer; later
+        calls are ignored.
+
+            :param producer: name of the producer
+            :param paths: list of the paths it writes, empty if it writes
+                          nothing; the files must not exist yet unless
+                          complete is True
+            :param complete: the files are already written
+        """
+        with self._condition:
+            if producer not in self._pending:
+                return
+            for path in paths:
+                self._streams[path] = GridStream(path, complete)
+            self._producer_paths[producer] = list(paths)
+            self._pending.discard(producer)
+            self._condition.notify_all()
+
+    def finish(self, path, failed=False):
+        """
+        Marks a declared file complete.
+
+            :param path: path of the file
+            :param failed: its writer failed part way, the file is left out
+                           of the merge
+        """
+        with self._condition:
+            # under the lock, merge may replace the stream
+            stream = self._streams.get(path)
+            if stream is not None:
+                stream.finish(failed)
+
+    def close(self, producer):
+        """
+        Marks every file of a producer complete, e.g. when it failed. A
+        producer that did not declare its files is declared without files.
+        """
+        self.declare(producer, [])
+        with self._condition:
+            paths = self._producer_paths.get(producer, [])
+        for path in paths:
+            self.finish(path)
+
+    def wait_declared(self, timeout=None):
+        """
+        Waits for every producer to declare its files.
+
+            :return: sorted list of the declared paths, None on timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: not self._pending,
+                                            timeout):
+                return None
+            return sorted(self._streams)
+
+    def merge(self, output_path):
+        """
+        Merges the declared files as they are written.
+
+            :param output_path: path of the combined grid file
+            :return: number of records written
+        """
+        paths = self.wait_declared()
+        while True:
+            with self._condition:
+                streams = [self._streams[path] for path in paths
+                           if not self._streams[path].failed]
+            try:
+                return write_records(merge_streams(streams), output_path)
+            except StreamFailed as err:
+                logger.warning("The writer of {} failed, merging the grid"
+                               " files again without it".format(err))
+            with self._condition:
+                # the records read so far are already in the dropped
+                # output, the other files are read again from their start
+                for stream in streams:
+                    if not stream.failed:
+                        self._streams[stream.path] = stream.restart()
@@ -0,0 +1,179 @@
+# Copyright 2018 SuperDARN Canada
+#
+# hmb.py
+"""
+Heppner-Maynard boundary (HMB) estimation in numpy, an experimental
+alternative to map_addhmb. ConvectionMaps.map_addhmb always runs map_addhmb.
+
+Like map_addhmb in its default mode, the boundary of a record is the lowest
+latitude with enough gridded vectors above a velocity threshold. The
+boundary follows the shape of a reference boundary, LATREF at midnight and
+NOON_OFFSET degrees poleward at noon, scaled in colatitude so its midnight
+latitude is the record's latmin. Every vector is mapped to the midnight
+latitude of the boundary passing through it, and the vectors of all the
+records of the file are counted per latitude step in one histogram, so the
+whole file is a single vectorised pass instead of a loop over the records.
+
+The magnetic local time of a vector is its magnetic longitude rotated by the
+record's mlt.av (the MLT of magnetic longitude 0 written by map_grd); records
+without it are treated as having a circular boundary.
+
+The estimate follows the map_addhmb algorithm but has not been checked
+against map_addhmb output of real data yet, so it is not offered by the
+convection map chain; compare_with_rst reports the records where the two
+differ.
+"""
+
+import logging
+
+import numpy as np
+
+from DARNprocessing.utils.dmap import read_dmap, write_dmap, FLOAT
+from DARNprocessing.utils.filelock import atomic_output
+from DARNprocessing.utils.convectionMapConstants import HMBConst
+
+logger = logging.getLogger(__name__)
+
+
+def boundary_shape(mlt):
+    """
+    :param mlt: magnetic local times in hours
+    :return: colatitude of the reference boundary at mlt relative to its
+             colatitude at midnight
+    """
+    latitude = HMBConst.LATREF + HMBConst.NOON_OFFSET * \
+        (1 - np.cos(np.pi * np.asarray(mlt, dtype=float) / 12)) / 2
+    return (90 - latitude) / (90 - HMBConst.LATREF)
+
+
+def _concatenate(records, name):
+    """
+    :return: the arrays name of the records as one float array
+    """
+    arrays = [np.asarray(record.get(name, ()), dtype=float)
+              for record in records]
+    if not arrays:
+        return np.zeros(0)
+    return np.concatenate(arrays)
+
+
+def hmb_latitudes(records, velocity=HMBConst.VELOCITY,
+                  vector_count=HMBConst.VECTOR_COUNT,
+                  latmin=HMBConst.LATMIN,
+                  latmin_limit=HMBConst.LATMIN_LIMIT,
+                  step=HMBConst.LATITUDE_STEP):
+    """
+    Computes the boundary latitude of every record.
+
+        :param records: list of the DmapRecords of a grid or map file
+        :param velocity: m/s a vector has to be above
+        :param vector_count: number of vectors above velocity a latitude
+                             step needs
+        :param latmin: latitude of records without enough vectors
+        :param latmin_limit: lowest latitude tried
+        :param step: degrees between the latitudes tried
+        :return: numpy array of the boundary latitudes at midnight (positive
+                 in both hemispheres)
+    """
+    record_count = len(records)
+    vector_counts = [len(record.get('vector.mlat', ())) for record in records]
+    record_index = np.repeat(np.arange(record_count), vector_counts)
+
+    colatitude = 90 - np.abs(_concatenate(records, 'vector.mlat'))
+    mlon = _concatenate(records, 'vector.mlon')
+    speed = np.abs(_concatenate(records, 'vector.vel.median'))
+
+    mlt_av = np.array([record.get('mlt.av', np.nan) for record in records],
+                      dtype=float)
+    mlt = (mlt_av[record_index] + mlon / 15) % 24
+    shape = np.where(np.isnan(mlt), 1.0, boundary_shape(np.nan_to_num(mlt)))
+    midnight_latitude = 90 - colatitude / shape
+
+    step_count = int(np.ceil((90 - latmin_limit) / step))
+    steps = np.floor((midnight_latitude - latmin_limit) / step).astype(int)
+    used = (speed >= velocity) & (steps >= 0) & (steps < step_count)
+    histogram = np.bincount(record_index[used] * step_count + steps[used],
+                            minlength=record_count * step_count)
+    enough = histogram.reshape(record_count, step_count) >= vector_count
+
+    # lowest step with enough vectors, argmax finds the first True
+    return np.where(enough.any(axis=1),
+                    latmin_limit + enough.argmax(axis=1) * step,
+                    float(latmin))
+
+
+def boundary_points(latmin, mlt_av, hemisphere=1):
+    """
+    :param latmin: boundary latitude at midnight
+    :param mlt_av: MLT of magnetic longitude 0, None for a circle
+    :param hemisphere: 1 north, -1 south
+    :return: (boundary.mlat, boundary.mlon) numpy arrays every
+             BOUNDARY_STEP degrees of magnetic longitude
+    """
+    mlon = np.arange(0, 360, HMBConst.BOUNDARY_STEP, dtype=float)
+    if mlt_av is None:
+        shape = np.ones_like(mlon)
+    else:
+        shape = boundary_shape((mlt_av + mlon / 15) % 24)
+    mlat = 90 - (90 - latmin) * shape
+    return np.copysign(mlat, hemisphere), mlon
+
+
+def add_hmb(map_filename, hmb_map_filename, **options):
+    """
+    Writes a copy of a map file with the boundary of every record, the
+    numpy version of map_addhmb.
+
+        :param map_filename: path of the map file (map_grd output)
+        :param hmb_map_filename: path of the map file written
+        :param options: keyword arguments of hmb_latitudes
+        :return: numpy array of the boundary latitudes
+    """
+    records = read_dmap(map_filename)
+    latitudes = hmb_latitudes(records, **options)
+    for record, latmin in zip(records, latitudes):
+        hemisphere = 1 if record.get('hemisphere', 1) >= 0 else -1
+        mlat, mlon = boundary_points(latmin, record.get('mlt.av'), hemisphere)
+        record.set_scalar('latmin', float(latmin * hemisphere),
+                          data_type=None if 'latmin' in record else FLOAT)
+        record.set_array('boundary.mlat', mlat.tolist(), FLOAT)
+        record.set_array('boundary.mlon', mlon.tolist(), FLOAT)
+
+    with atomic_output(hmb_map_filename) as tmp_path:
+        write_dmap(tmp_path, records)
+    logger.info("Added the boundary to {count} records of {filename}"
+                "".format(count=len(records), filename=map_filename))
+    return latitudes
+
+
+def compare_with_rst(map_filename, rst_hmb_filename, **options):
+    """
+    Validates the numpy estimate against map_addhmb output of the same map
+    file.
+
+        :param map_filename: path of the map file given to map_addhmb
+        :param rst_hmb_filename: path of the map_addhmb output
+        :param options: keyword arguments of hmb_latitudes
+        :return: list of (record start time 'HH:MM:SS', map_addhmb latmin,
+                 numpy latmin) of the records whose latitudes differ
+        :raise ValueError: the files do not have the same number of records
+    """
+    records = read_dmap(map_filename)
+    rst_records = read_dmap(rst_hmb_filename)
+    if len(records) != len(rst_records):
+        raise ValueError("{map_file} has {count} records, {rst_file} has"
+                         " {rst_count}".format(map_file=map_filename,
+                                               count=len(records),
+                                               rst_file=rst_hmb_filename,
+                                               rst_count=len(rst_records)))
+    latitudes = hmb_latitudes(records, **options)
+    differences = []
+    for record, latmin in zip(rst_records, latitudes):
+        rst_latmin = abs(record['latmin'])
+        if abs(rst_latmin - latmin) > 1e-3:
+            time = "{:02d}:{:02d}:{:02d}"\
+                   "".format(record.get('start.hour', 0),
+                             record.get('start.minute', 0),
+                             int(record.get('start.second', 0)))
+            differences.append((time, rst_latmin, float(latmin)))
+    return differences
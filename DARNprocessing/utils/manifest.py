@@ -0,0 +1,164 @@
+# Copyright 2018 SuperDARN Canada
+#
+# manifest.py
+"""
+Run manifest recording the completed stages of a convection map run, so a
+failed run can be resumed without redoing the stages that are still valid.
+"""
+
+import os
+import json
+import logging
+import threading
+
+from DARNprocessing.utils.filecache import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def _fingerprints(filenames):
+    """
+    :return: list of [path, size, mtime] of the files, None if one of them
+             does not exist
+    """
+    fingerprints = []
+    for filename in filenames:
+        try:
+            fingerprints.append(list(file_fingerprint(filename)))
+        except OSError:
+            return None
+    return fingerprints
+
+
+class RunManifest():
+    """
+    Journal of the completed stages, one JSON line appended per recorded or
+    invalidated stage, so recording a stage does not rewrite the stages
+    before it. Every stage entry holds the fingerprints (path, size and
+    modification time) of its input and output files, the options it ran
+    with and its result. A stage is still valid when its inputs and options
+    did not change and its outputs are still there, unmodified.
+
+        :param manifest_path: path of the manifest file
+        :param load: read the existing manifest (when resuming), otherwise
+                     start a new one
+    """
+
+    def __init__(self, manifest_path, load=True):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self.stages = {}
+        # a new manifest replaces the file of the previous run on the first
+        # write
+        self._truncate = not load
+        if load and os.path.isfile(manifest_path):
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path) as manifest_file:
+                lines = manifest_file.read().split('\n')
+        except IOError as err:
+            logger.warning("Ignoring unreadable manifest {file}: {err}"
+                           "".format(file=self.manifest_path, err=err))
+            return
+        for number, line in enumerate(lines, 1):
+            if not line:
+                continue
+            try:
+                change = json.loads(line)
+                stage = change['stage']
+                entry = change.get('entry')
+            except (ValueError, KeyError, TypeError) as err:
+                # e.g. the last line of a run that was killed while writing
+                logger.warning("Ignoring line {number} of the manifest"
+                               " {file}: {err}"
+                               "".format(number=number,
+                                         file=self.manifest_path, err=err))
+                continue
+            if entry is None:
+                self.stages.pop(stage, None)
+            else:
+                self.stages[stage] = entry
+
+    def completed(self, stage, inputs, options=''):
+        """
+        Checks if a stage can be skipped.
+
+            :param stage: unique name of the stage
+            :param inputs: list of the input file paths of the stage
+            :param options: str of the options the stage runs with
+            :return: the stage entry (dictionary with 'outputs' and 'result')
+                     if it is still valid, None otherwise
+        """
+        with self._lock:
+            entry = self.stages.get(stage)
+        if entry is None or entry['options'] != options:
+            return None
+        if entry['inputs'] != _fingerprints(inputs):
+            return None
+        outputs = [output[0] for output in entry['outputs']]
+        if entry['outputs'] != _fingerprints(outputs):
+            return None
+        return entry
+
+    def record(self, stage, inputs, outputs, options='', result=None):
+        """
+        Records a completed stage and saves it to the manifest. A stage with
+        a missing input or output file is not recorded, it runs again when
+        the run is resumed.
+
+            :param stage: unique name of the stage
+            :param inputs: list of the input file paths
+            :param outputs: list of the output file paths
+            :param options: str of the options the stage ran with
+            :param result: JSON serialisable result of the stage
+            :return: True if the stage was recorded
+        """
+        input_fingerprints = _fingerprints(inputs)
+        output_fingerprints = _fingerprints(outputs)
+        if input_fingerprints is None or output_fingerprints is None:
+            logger.warning("Not recording {stage} in the manifest, one of"
+                           " its files is missing: {files}"
+                           "".format(stage=stage,
+                                     files=", ".join(list(inputs) +
+                                                     list(outputs))))
+            self.invalidate(stage)
+            return False
+        entry = {'inputs': input_fingerprints,
+                 'outputs': output_fingerprints,
+                 'options': options,
+                 'result': result}
+        with self._lock:
+            self.stages[stage] = entry
+            self._append(stage, entry)
+        return True
+
+    def invalidate(self, stage):
+        """
+        Forgets a stage so it runs again.
+        """
+        with self._lock:
+            if self.stages.pop(stage, None) is not None:
+                self._append(stage, None)
+
+    def _append(self, stage, entry):
+        """
+        Appends a change of a stage to the manifest file, entry None when it
+        was invalidated.
+        """
+        line = json.dumps({'stage': stage, 'entry': entry},
+                          sort_keys=True) + '\n'
+        with open(self.manifest_path, 'w' if self._truncate else 'a') \
+                as manifest_file:
+            manifest_file.write(line)
+        self._truncate = False
+
+    def remove(self):
+        """
+        Removes the manifest file.
+        """
+        with self._lock:
+            self.stages = {}
+            if os.path.exists(self.manifest_path):
+                os.remove(self.manifest_path)
@@ -0,0 +1,440 @@
+# Copyright 2018 SuperDARN Canada
+#
+# mapquery.py
+"""
+Queries of the fitted convection over the archive of map files in a map
+path: the potential and the E x B velocity at magnetic latitudes/longitudes
+for the records of a time range, and a local HTTP endpoint serving them.
+
+The records are located through a time index of two levels. The date in the
+map file names ({date}.{series}.map, optionally compressed) selects the files
+of a time range, then the start and end times of the records of a file, read
+from their scalars without decoding the arrays, select the records. The
+record times of a file are kept until the file changes.
+
+The records of a query are evaluated in one batch (see
+potential.evaluate_records). Decoded records and the evaluations of a record
+on a grid are kept in LRU caches, so repeated queries (e.g. a web page
+refreshing the same grid) neither read the map files nor evaluate again.
+
+HTTP protocol, GET with the query in the URL or POST with a JSON body:
+
+    /query?series=n&start=2016-01-01T00:00&end=2016-01-01T06:00
+           &mlat=70,75,80&mlon=0,0,0
+    reply: {"status": "ok", "start.time": [...], "end.time": [...],
+            "potential": [[...]], "velocity.north": [[...]],
+            "velocity.east": [[...]]} (times in seconds since 1970, one row
+            per record, null for the records without a fit)
+    /ping  reply: {"status": "ok", <cache statistics>}
+    errors: {"status": "error", "error": <message>}
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import socketserver
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from DARNprocessing.utils.dmap import (DmapFormatError,
+                                       parse_record,
+                                       read_scalar,
+                                       record_spans)
+from DARNprocessing.utils.potential import evaluate_records
+from DARNprocessing.utils.dirindex import directory_index
+from DARNprocessing.utils.filecache import file_fingerprint
+from DARNprocessing.utils.compression import open_compressed
+from DARNprocessing.utils.mapstore import epoch_seconds
+from DARNprocessing.utils.convectionMapConstants import QueryConst
+
+logger = logging.getLogger(__name__)
+
+_MAP_FILENAME = re.compile(QueryConst.MAP_PATTERN)
+
+_TIME_SCALARS = ['year', 'month', 'day', 'hour', 'minute', 'second']
+
+# formats of the times of the HTTP queries
+_TIME_FORMATS = ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y%m%d%H%M',
+                 '%Y-%m-%d', '%Y%m%d']
+
+
+class LRUCache():
+    """
+    Thread safe dictionary keeping the most recently used entries.
+
+        :param size: most entries kept
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        :return: dictionary of the number of entries, hits and misses
+        """
+        return {'entries': len(self), 'hits': self.hits,
+                'misses': self.misses}
+
+
+def parse_time(text):
+    """
+    :param text: time as YYYY-MM-DDTHH:MM[:SS], YYYYMMDDHHMM, YYYY-MM-DD,
+                 YYYYMMDD or seconds since 1970
+    :return: float seconds since 1970
+    :raise ValueError: not a time
+    """
+    for time_format in _TIME_FORMATS:
+        try:
+            return epoch_seconds(datetime.strptime(text, time_format))
+        except ValueError:
+            continue
+    return float(text)
+
+
+def _scalar_time(data, position, prefix):
+    """
+    :return: seconds since 1970 of the start.* (or end.*) scalars of the
+             record at position, read without decoding the record
+    :raise DmapFormatError: the record has no such time
+    """
+    values = [read_scalar(data, position, "{prefix}.{name}"
+                                          "".format(prefix=prefix, name=name))
+              for name in _TIME_SCALARS]
+    if None in values:
+        raise DmapFormatError("Map record at byte {} has no {} time"
+                              "".format(position, prefix))
+    time = datetime(*[int(value) for value in values[:5]]) + \
+        timedelta(seconds=values[5])
+    return epoch_seconds(time)
+
+
+class MapQuery():
+    """
+    Evaluates the fitted solutions of the map files of a map path.
+
+        :param map_path: directory of the map files
+        :param record_cache: number of decoded records kept in memory
+        :param grid_cache: number of evaluations of a record on a grid kept
+                           in memory
+        :param max_records: most records evaluated by a query
+        :param file_index: number of map files whose record times are kept
+                           in memory
+    """
+
+    def __init__(self, map_path, record_cache=QueryConst.RECORD_CACHE,
+                 grid_cache=QueryConst.GRID_CACHE,
+                 max_records=QueryConst.MAX_RECORDS,
+                 file_index=QueryConst.FILE_INDEX):
+        self.map_path = os.path.abspath(map_path)
+        self.records = LRUCache(record_cache)
+        self.grids = LRUCache(grid_cache)
+        self.max_records = max_records
+        # map file path: (fingerprint, record spans, start times, end times)
+        self._file_index = LRUCache(file_index)
+
+    def files(self, series, start=None, end=None):
+        """
+        :param series: series of the map files, e.g. n, s or n.120s
+        :param start: datetime or seconds, None from the first file
+        :param end: datetime or seconds, None to the last file
+        :return: list of the map files of the series with records in the
+                 time range by their date, in time order; an uncompressed
+                 file is preferred to its compressed copies
+        """
+        first = None if start is None else \
+            self._day(epoch_seconds(start) - 86400)
+        last = None if end is None else self._day(epoch_seconds(end))
+        files = {}
+        for name in directory_index.listdir(self.map_path):
+            match = _MAP_FILENAME.match(name)
+            if match is None or match.group('series') != series:
+                continue
+            date = match.group('date')
+            # the map file of the day before can hold records after its
+            # midnight
+            if (first and date < first) or (last and date > last):
+                continue
+            if date not in files or match.group('compression') is None:
+                files[date] = os.path.join(self.map_path, name)
+        return [files[date] for date in sorted(files)]
+
+    @staticmethod
+    def _day(seconds):
+        return (datetime(1970, 1, 1) +
+                timedelta(seconds=seconds)).strftime('%Y%m%d')
+
+    def _read(self, map_file):
+        with open_compressed(map_file) as data_file:
+            return data_file.read()
+
+    def _index(self, map_file):
+        """
+        :return: (fingerprint, record spans, start times, end times) of the
+                 records of a map file, read again when the file changed
+        """
+        fingerprint = file_fingerprint(map_file)
+        entry = self._file_index.get(map_file)
+        if entry is not None and entry[0] == fingerprint:
+            return entry
+        data = self._read(map_file)
+        spans = list(record_spans(data))
+        entry = (fingerprint, spans,
+                 np.array([_scalar_time(data, span[0], 'start')
+                           for span in spans]),
+                 np.array([_scalar_time(data, span[0], 'end')
+                           for span in spans]))
+        self._file_index.put(map_file, entry)
+        return entry
+
+    def locate(self, series, start=None, end=None):
+        """
+        Finds the records of a series starting in a time range.
+
+            :param series: series of the map files, e.g. n
+            :param start: datetime or seconds, None from the first record
+            :param end: datetime or seconds, None to the last record
+            :return: list of (record key, start time, end time) in time
+                     order, the key is (fingerprint of the map file, index
+                     of the record)
+        """
+        first = -np.inf if start is None else epoch_seconds(start)
+        last = np.inf if end is None else epoch_seconds(end)
+        located = []
+        for map_file in self.files(series, start, end):
+            fingerprint, spans, start_times, end_times = self._index(map_file)
+            selected = np.nonzero((start_times >= first) &
+                                  (start_times <= last))[0]
+            located.extend(((fingerprint, int(index)),
+                            float(start_times[index]),
+                            float(end_times[index]))
+                           for index in selected)
+        return located
+
+    def decoded_records(self, keys):
+        """
+        :param keys: list of record keys, see locate
+        :return: list of the DmapRecords, from the cache or read once per
+                 map file
+        """
+        records = [self.records.get(key) for key in keys]
+        missing = OrderedDict()
+        for position, (key, record) in enumerate(zip(keys, records)):
+            if record is None:
+                missing.setdefault(key[0], []).append(position)
+        for fingerprint, positions in missing.items():
+            map_file = fingerprint[0]
+            entry = self._index(map_file)
+            if entry[0] != fingerprint:
+                raise DmapFormatError("{} changed during the query"
+                                      "".format(map_file))
+            data = self._read(map_file)
+            for position in positions:
+                key = keys[position]
+                record, end = parse_record(data, entry[1][key[1]][0])
+                self.records.put(key, record)
+                records[position] = record
+        return records
+
+    def evaluate(self, series, start, end, mlat, mlon):
+        """
+        Evaluates the potential and velocity of the records of a time range
+        on magnetic latitudes and longitudes.
+
+            :param series: series of the map files, e.g. n or n.120s
+            :param start: datetime or seconds, None from the first record
+            :param end: datetime or seconds, None to the last record
+            :param mlat: magnetic latitudes in degrees
+            :param mlon: magnetic longitudes in degrees, same shape as mlat
+            :return: OrderedDict of the numpy arrays start.time and end.time
+                     (records,) in seconds since 1970, potential (V),
+                     velocity.north and velocity.east (m/s) of shape
+                     (records,) + mlat.shape, NaN for the records without a
+                     fit
+            :raise ValueError: more than max_records records in the time
+                               range
+        """
+        mlat, mlon = np.broadcast_arrays(np.asarray(mlat, dtype=float),
+                                         np.asarray(mlon, dtype=float))
+        grid = hashlib.sha1(np.ascontiguousarray(mlat).tobytes() +
+                            np.ascontiguousarray(mlon).tobytes() +
+                            str(mlat.shape).encode()).hexdigest()
+        located = self.locate(series, start, end)
+        if len(located) > self.max_records:
+            raise ValueError("{} records from {} to {}, more than {}; narrow "
+                             "the time range".format(len(located), start, end,
+                                                     self.max_records))
+
+        evaluations = [self.grids.get((key, grid))
+                       for key, start_time, end_time in located]
+        missing = [index for index, evaluation in enumerate(evaluations)
+                   if evaluation is None]
+        if missing:
+            records = self.decoded_records([located[index][0]
+                                            for index in missing])
+            # one batch for all the records not evaluated on this grid
+            results = evaluate_records(records, mlat, mlon)
+            for position, index in enumerate(missing):
+                evaluation = tuple(result[position].copy()
+                                   for result in results)
+                self.grids.put((located[index][0], grid), evaluation)
+                evaluations[index] = evaluation
+
+        columns = OrderedDict()
+        columns['start.time'] = np.array([start_time for key, start_time,
+                                          end_time in located])
+        columns['end.time'] = np.array([end_time for key, start_time,
+                                        end_time in located])
+        for position, name in enumerate(['potential', 'velocity.north',
+                                         'velocity.east']):
+            columns[name] = np.array([evaluation[position]
+                                      for evaluation in evaluations]) \
+                if evaluations else np.zeros((0,) + mlat.shape)
+        return columns
+
+    def stats(self):
+        """
+        :return: dictionary of the cache statistics
+        """
+        return {'files_indexed': len(self._file_index),
+                'records': self.records.stats(),
+                'grids': self.grids.stats()}
+
+
+def _json_values(array):
+    """
+    :return: nested lists of a numpy array, None for NaN
+    """
+    return np.where(np.isnan(array), None, array.astype(object)).tolist()
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[-1]
+                 for name, values in parse_qs(url.query).items()}
+        if 'mlat' in query:
+            query['mlat'] = query['mlat'].split(',')
+        if 'mlon' in query:
+            query['mlon'] = query['mlon'].split(',')
+        self._handle(url.path, query)
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            query = json.loads(self.rfile.read(length).decode() or '{}')
+        except ValueError as err:
+            self._reply(400, {'status': 'error',
+                              'error': "Bad request: {}".format(err)})
+            return
+        self._handle(urlparse(self.path).path, query)
+
+    def _handle(self, path, query):
+        if path == '/ping':
+            self._reply(200, dict(status='ok', **self.server.query.stats()))
+        elif path == '/query':
+            try:
+                reply = self.server.handle_query(query)
+            except (ValueError, KeyError, TypeError) as err:
+                self._reply(400, {'status': 'error',
+                                  'error': "Bad query: {}".format(err)})
+                return
+            except Exception as err:
+                logger.exception("Query failed")
+                self._reply(500, {'status': 'error', 'error': str(err)})
+                return
+            self._reply(200, reply)
+        else:
+            self._reply(404, {'status': 'error',
+                              'error': "Unknown path {}".format(path)})
+
+    def _reply(self, code, reply):
+        body = json.dumps(reply).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, log_format, *args):
+        logger.debug(log_format % args)
+
+
+class MapQueryServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    Local HTTP endpoint of a MapQuery, see the module for the protocol.
+
+        :param map_path: directory of the map files
+        :param host: address to listen on, local by default
+        :param port: port to listen on, 0 for any free port
+        :param record_cache: see MapQuery
+        :param grid_cache: see MapQuery
+        :param max_records: see MapQuery
+    """
+    daemon_threads = True
+
+    def __init__(self, map_path, host=QueryConst.HOST, port=QueryConst.PORT,
+                 record_cache=QueryConst.RECORD_CACHE,
+                 grid_cache=QueryConst.GRID_CACHE,
+                 max_records=QueryConst.MAX_RECORDS):
+        HTTPServer.__init__(self, (host, port), _QueryHandler)
+        self.query = MapQuery(map_path, record_cache, grid_cache,
+                              max_records)
+
+    def handle_query(self, query):
+        """
+        :param query: dictionary of the query: series (default n), start,
+                      end (optional times, see parse_time), mlat and mlon
+                      (lists of degrees)
+        :return: dictionary of the reply
+        :raise ValueError: bad query
+        """
+        start = query.get('start')
+        end = query.get('end')
+        if start is not None:
+            start = parse_time(str(start))
+        if end is not None:
+            end = parse_time(str(end))
+        mlat = np.asarray(query['mlat'], dtype=float)
+        mlon = np.asarray(query['mlon'], dtype=float)
+        if mlat.shape != mlon.shape:
+            raise ValueError("mlat and mlon have different shapes")
+        if mlat.size > QueryConst.MAX_POINTS:
+            raise ValueError("More than {} points".format(QueryConst.MAX_POINTS))
+        columns = self.query.evaluate(query.get('series', QueryConst.SERIES),
+                                      start, end, mlat, mlon)
+        reply = OrderedDict(status='ok')
+        for name, values in columns.items():
+            reply[name] = _json_values(values)
+        return reply
@@ -0,0 +1,247 @@
+# Copyright 2018 SuperDARN Canada
+#
+# mapstore.py
+"""
+Columnar store of the fit results of map files, for reading long time series
+(cross polar cap potential, HMB latitude, coefficients, ...) without the RST
+tools or decoding the map files again.
+
+A store is a directory of chunks partitioned by series (hemisphere and
+integration time, e.g. n or n.120s) and day:
+
+    <store>/index.json                     time index of the chunks
+    <store>/<series>/<YYYY>/<YYYYMMDD>.npz one chunk per map file
+
+A chunk holds one column per variable and one row per map record: the
+start.time and end.time of the records (seconds since 1970-01-01 UTC),
+vector.count, the scalars of ExportConst.SCALARS, and the coefficients N+2
+and their errors N+3, each a (records, coefficients) array padded with NaN.
+A chunk without a column (exported by an older version) reads it as NaN. The
+columns are compressed
+members of the chunk, a read decompresses only the variables it asks for,
+and the index gives the time range of every chunk so a read of a time range
+only opens the chunks it overlaps. Exporting a map file again replaces its
+chunk.
+"""
+
+import os
+import json
+import logging
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from DARNprocessing.utils.dmap import read_records, record_time
+from DARNprocessing.utils.filelock import FileLock, atomic_output
+from DARNprocessing.utils.convectionMapConstants import ExportConst
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+
+# columns of every chunk besides the scalars and coefficients
+TIME_COLUMNS = ['start.time', 'end.time', 'vector.count']
+# (records, coefficients) columns
+ARRAY_COLUMNS = [ExportConst.COEFFICIENTS, ExportConst.COEFFICIENT_ERRORS]
+
+
+def epoch_seconds(time):
+    """
+    :param time: datetime (UTC) or seconds since 1970-01-01
+    :return: float seconds since 1970-01-01
+    """
+    if isinstance(time, datetime):
+        return (time - _EPOCH).total_seconds()
+    return float(time)
+
+
+def _pad(rows):
+    """
+    :param rows: list of 1-d sequences of different lengths
+    :return: float numpy array (rows, longest) padded with NaN
+    """
+    width = max([len(row) for row in rows] or [0])
+    table = np.full((len(rows), width), np.nan)
+    for index, row in enumerate(rows):
+        table[index, :len(row)] = row
+    return table
+
+
+def map_columns(records):
+    """
+    :param records: DmapRecords of a fitted map file
+    :return: OrderedDict variable: numpy array of one row per record
+    """
+    columns = OrderedDict()
+    columns['start.time'] = np.array([epoch_seconds(record_time(record))
+                                      for record in records], dtype=float)
+    columns['end.time'] = np.array([epoch_seconds(record_time(record, 'end'))
+                                    for record in records], dtype=float)
+    columns['vector.count'] = np.array([len(record.get('vector.mlat', ()))
+                                        for record in records],
+                                       dtype=np.int64)
+    for name in ExportConst.SCALARS:
+        columns[name] = np.array([record.get(name, np.nan)
+                                  for record in records], dtype=float)
+    for name in ARRAY_COLUMNS:
+        columns[name] = _pad([record.get(name, ()) for record in records])
+    return columns
+
+
+class MapStore():
+    """
+    Chunked columnar store of map fit results.
+
+        :param path: directory of the store, created if it does not exist
+        :param lock_timeout: seconds to wait for another process updating
+                             the index, None waits forever
+    """
+
+    def __init__(self, path, lock_timeout=ExportConst.LOCK_TIMEOUT):
+        self.path = path
+        self.lock_timeout = lock_timeout
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, ExportConst.INDEX)
+
+    def _load_index(self):
+        """
+        :return: dictionary chunk name: index entry
+        """
+        if not os.path.isfile(self.index_path):
+            return {}
+        with open(self.index_path) as index_file:
+            return json.load(index_file)['chunks']
+
+    def _chunk_name(self, series, start_time):
+        """
+        :param start_time: seconds of the first record of the chunk
+        :return: path of the chunk relative to the store
+        """
+        day = _EPOCH + timedelta(seconds=float(start_time))
+        return "{series}/{year}/{date}.{ext}"\
+               "".format(series=series, year=day.strftime('%Y'),
+                         date=day.strftime('%Y%m%d'),
+                         ext=ExportConst.CHUNK_EXT)
+
+    def export(self, map_file, series):
+        """
+        Exports the fit results of a map file as a chunk of the store,
+        replacing the chunk of an earlier export of the same day.
+
+            :param map_file: path of the fitted map file, compressed or not
+            :param series: str name of the series of the map file, e.g. n or
+                           n.120s
+            :return: number of records exported
+            :raise DmapFormatError: the map file is not valid
+        """
+        records = list(read_records(map_file))
+        if not records:
+            logger.warning("{} has no records to export".format(map_file))
+            return 0
+        columns = map_columns(records)
+        name = self._chunk_name(series, columns['start.time'][0])
+        chunk_path = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        with atomic_output(chunk_path) as tmp_path:
+            with open(tmp_path, 'wb') as chunk_file:
+                np.savez_compressed(chunk_file, **columns)
+
+        entry = {'series': series,
+                 'start': float(columns['start.time'][0]),
+                 'end': float(np.max(columns['end.time'])),
+                 'records': len(records),
+                 'variables': list(columns),
+                 'source': os.path.basename(map_file)}
+        with FileLock(self.index_path + '.lock', self.lock_timeout):
+            chunks = self._load_index()
+            chunks[name] = entry
+            with atomic_output(self.index_path) as tmp_path:
+                with open(tmp_path, 'w') as index_file:
+                    json.dump({'chunks': chunks}, index_file, indent=1,
+                              sort_keys=True)
+        logger.info("Exported {count} records of {map_file} to {chunk}"
+                    "".format(count=len(records), map_file=map_file,
+                              chunk=chunk_path))
+        return len(records)
+
+    def series(self):
+        """
+        :return: sorted list of the series in the store
+        """
+        return sorted(set(entry['series']
+                          for entry in self._load_index().values()))
+
+    def variables(self):
+        """
+        :return: list of the variables of the chunks
+        """
+        return TIME_COLUMNS + ExportConst.SCALARS + ARRAY_COLUMNS
+
+    def chunks(self, series, start=None, end=None):
+        """
+        :param series: name of the series
+        :param start: datetime or seconds, None from the first record
+        :param end: datetime or seconds, None to the last record
+        :return: list of the (chunk name, index entry) of the chunks of the
+                 series overlapping the time range, in time order
+        """
+        start = -np.inf if start is None else epoch_seconds(start)
+        end = np.inf if end is None else epoch_seconds(end)
+        return sorted(((name, entry)
+                       for name, entry in self._load_index().items()
+                       if entry['series'] == series and
+                       entry['start'] <= end and entry['end'] >= start),
+                      key=lambda chunk: chunk[1]['start'])
+
+    def read(self, series, start=None, end=None, variables=None):
+        """
+        Reads variables of the records of a series starting in a time
+        range, only from the chunks overlapping it.
+
+            :param series: name of the series, e.g. n or n.120s
+            :param start: datetime or seconds, None from the first record
+            :param end: datetime or seconds, None to the last record
+            :param variables: list of the variables, default all of them
+            :return: OrderedDict variable: numpy array of one row per
+                     record in time order, always with start.time
+            :raise KeyError: not a variable of the store
+        """
+        names = list(variables or self.variables())
+        for name in names:
+            if name not in self.variables():
+                raise KeyError("{} is not a variable of the map store"
+                               "".format(name))
+        if 'start.time' not in names:
+            names.insert(0, 'start.time')
+        first = -np.inf if start is None else epoch_seconds(start)
+        last = np.inf if end is None else epoch_seconds(end)
+
+        parts = OrderedDict((name, []) for name in names)
+        for name, entry in self.chunks(series, start, end):
+            with np.load(os.path.join(self.path, name)) as chunk:
+                # the members are decompressed when they are read
+                times = chunk['start.time']
+                selected = (times >= first) & (times <= last)
+                for variable in names:
+                    if variable not in chunk.files:
+                        # a column added after the chunk was exported
+                        parts[variable].append(np.full((selected.sum(), 0),
+                                                       np.nan))
+                        continue
+                    parts[variable].append(chunk[variable][selected])
+
+        columns = OrderedDict()
+        for variable, arrays in parts.items():
+            if variable in ARRAY_COLUMNS:
+                columns[variable] = _pad([row for array in arrays
+                                          for row in array])
+            elif arrays:
+                columns[variable] = np.concatenate(arrays)
+            else:
+                columns[variable] = np.zeros(0)
+        return columns
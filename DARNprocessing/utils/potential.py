@@ -0,0 +1,260 @@
+# Copyright 2018 SuperDARN Canada
+#
+# potential.py
+"""
+Evaluation of the fitted convection solution of map files: the
+electrostatic potential and the E x B drift velocity on arbitrary magnetic
+latitude/longitude arrays, for one record or many records at once.
+
+map_fit expands the potential in spherical harmonics up to the fit order,
+with the colatitude stretched like RST so the boundary latitude (latmin)
+maps to theta' = pi, the opposite pole of the expansion:
+
+    Phi(theta, phi) = sum over l <= order, m <= l of
+                      P_l^m(cos theta') (A_lm cos(m phi) + B_lm sin(m phi))
+    theta' = theta pi / theta_max, theta_max = 90 - |latmin| degrees
+
+The coefficients are the N+2 array of the map record (N holds the degree l
+of every coefficient, N+1 its order m, negative for the sine coefficients,
+and N+3 its error), A_lm at index l^2 (m = 0) or l^2 + 2m - 1 and B_lm at
+the next index, like RST and pydarn. The potential is zero equatorward of
+the boundary.
+
+The Legendre tables of a grid depend only on the fit order, latmin and the
+grid, they are memoised, so records sharing a boundary (and repeated queries
+of the same grid) are evaluated with a single matrix product.
+"""
+
+import functools
+
+import numpy as np
+
+from DARNprocessing.utils.convectionMapConstants import MapFitConst
+
+
+def legendre_index(degree, order):
+    """
+    :return: index of the cosine coefficient of P_degree^order in the
+             coefficients, the sine coefficient is the next one
+    """
+    if order == 0:
+        return degree**2
+    return degree**2 + 2 * order - 1
+
+
+def coefficient_count(order):
+    """
+    :return: number of coefficients of a fit of this order
+    """
+    return (order + 1)**2
+
+
+def fit_order(coefficient_number):
+    """
+    :return: order of a fit with this number of coefficients
+    :raise ValueError: not the number of coefficients of a fit
+    """
+    order = int(round(np.sqrt(coefficient_number))) - 1
+    if order < 0 or coefficient_count(order) != coefficient_number:
+        raise ValueError("{} is not the number of coefficients of a fit"
+                         "".format(coefficient_number))
+    return order
+
+
+def legendre(order, x):
+    """
+    Associated Legendre functions (with the Condon-Shortley phase, like
+    RST) and their derivatives with respect to the angle.
+
+        :param order: maximum degree
+        :param x: numpy array of cos(theta')
+        :return: (P, dP) numpy arrays of shape (order + 2, order + 2) +
+                 x.shape indexed [degree, order], P_l^m = 0 for m > l
+    """
+    x = np.asarray(x, dtype=float)
+    sine = np.sqrt(np.clip(1 - x**2, 0, None))
+    table = np.zeros((order + 2, order + 2) + x.shape)
+    diagonal = np.ones_like(x)
+    for m in range(order + 1):
+        if m > 0:
+            diagonal = -(2 * m - 1) * sine * diagonal
+        table[m, m] = diagonal
+        if m < order:
+            table[m + 1, m] = x * (2 * m + 1) * diagonal
+        for degree in range(m + 2, order + 1):
+            table[degree, m] = (x * (2 * degree - 1) * table[degree - 1, m] -
+                                (degree + m - 1) * table[degree - 2, m]) / \
+                               (degree - m)
+
+    derivative = np.zeros_like(table)
+    for degree in range(order + 1):
+        derivative[degree, 0] = table[degree, 1]
+        for m in range(1, degree + 1):
+            derivative[degree, m] = (table[degree, m + 1] -
+                                     (degree + m) * (degree - m + 1) *
+                                     table[degree, m - 1]) / 2
+    return table, derivative
+
+
+@functools.lru_cache(maxsize=MapFitConst.TABLE_CACHE)
+def _basis(order, theta_max, colatitude_bytes, longitude_bytes):
+    """
+    Values of the spherical harmonics of every coefficient on a grid and
+    their derivatives, memoised per (order, boundary, grid).
+
+        :param theta_max: colatitude of the boundary in radians
+        :param colatitude_bytes: bytes of the float64 colatitudes in radians
+        :param longitude_bytes: bytes of the float64 longitudes in radians
+        :return: read only (value, d/dtheta, d/dphi) numpy arrays of shape
+                 (coefficients, points)
+    """
+    colatitude = np.frombuffer(colatitude_bytes)
+    longitude = np.frombuffer(longitude_bytes)
+    inside = colatitude <= theta_max
+    stretch = np.pi / theta_max
+    table, derivative = legendre(order, np.cos(np.where(inside,
+                                                        colatitude * stretch,
+                                                        np.pi)))
+
+    shape = (coefficient_count(order), colatitude.size)
+    value = np.zeros(shape)
+    d_theta = np.zeros(shape)
+    d_phi = np.zeros(shape)
+    for degree in range(order + 1):
+        index = legendre_index(degree, 0)
+        value[index] = table[degree, 0]
+        d_theta[index] = derivative[degree, 0] * stretch
+        for m in range(1, degree + 1):
+            index = legendre_index(degree, m)
+            cosine = np.cos(m * longitude)
+            sine = np.sin(m * longitude)
+            value[index] = table[degree, m] * cosine
+            value[index + 1] = table[degree, m] * sine
+            d_theta[index] = derivative[degree, m] * stretch * cosine
+            d_theta[index + 1] = derivative[degree, m] * stretch * sine
+            d_phi[index] = -m * table[degree, m] * sine
+            d_phi[index + 1] = m * table[degree, m] * cosine
+
+    for array in (value, d_theta, d_phi):
+        array[:, ~inside] = 0
+        array.setflags(write=False)
+    return value, d_theta, d_phi
+
+
+def evaluate(coefficients, latmin, mlat, mlon, order=None, hemisphere=None,
+             lon_shift=0.0):
+    """
+    Evaluates a fitted solution.
+
+        :param coefficients: coefficients (N+2 of a map record), or an
+                             array (records, coefficients) of records
+                             sharing latmin, order and hemisphere
+        :param latmin: boundary latitude of the fit in degrees
+        :param mlat: magnetic latitudes in degrees, any shape
+        :param mlon: magnetic longitudes in degrees, same shape as mlat
+        :param order: fit order, default from the number of coefficients;
+                      a lower order truncates the expansion
+        :param hemisphere: 1 north, -1 south, default from the sign of
+                           latmin
+        :param lon_shift: lon.shft of the map record in degrees
+        :return: (potential in V, northward and eastward velocities in m/s)
+                 numpy arrays of shape coefficients.shape[:-1] + mlat.shape
+        :raise ValueError: too few coefficients for the order
+    """
+    coefficients = np.asarray(coefficients, dtype=float)
+    if order is None:
+        order = fit_order(coefficients.shape[-1])
+    count = coefficient_count(order)
+    if coefficients.shape[-1] < count:
+        raise ValueError("Fit order {order} needs {count} coefficients, got"
+                         " {number}".format(order=order, count=count,
+                                            number=coefficients.shape[-1]))
+    coefficients = coefficients[..., :count]
+    if hemisphere is None:
+        hemisphere = 1 if latmin >= 0 else -1
+
+    mlat, mlon = np.broadcast_arrays(np.asarray(mlat, dtype=float),
+                                     np.asarray(mlon, dtype=float))
+    colatitude = np.radians(90 - np.abs(mlat.ravel()))
+    longitude = np.radians(mlon.ravel() - lon_shift)
+    theta_max = float(np.radians(90 - abs(latmin)))
+    value, d_theta, d_phi = _basis(order, theta_max,
+                                   np.ascontiguousarray(colatitude).tobytes(),
+                                   np.ascontiguousarray(longitude).tobytes())
+
+    radius = MapFitConst.EARTH_RADIUS + MapFitConst.ALTITUDE
+    sine = np.maximum(np.sin(colatitude), 1e-9)
+    field = MapFitConst.DIPOLE_FIELD * \
+        (MapFitConst.EARTH_RADIUS / radius)**3 * \
+        np.sqrt(1 + 3 * np.cos(colatitude)**2)
+
+    # E = -grad(Phi), theta increasing away from the hemisphere's pole
+    electric_theta = -np.dot(coefficients, d_theta) / radius
+    electric_phi = -np.dot(coefficients, d_phi) / (radius * sine)
+    # v = E x B / B^2 with B downward in the north and upward in the south
+    velocity_east = electric_theta / field
+    velocity_north = hemisphere * electric_phi / field
+
+    shape = coefficients.shape[:-1] + mlat.shape
+    return (np.dot(coefficients, value).reshape(shape),
+            velocity_north.reshape(shape),
+            velocity_east.reshape(shape))
+
+
+def record_solution(record):
+    """
+    :param record: DmapRecord of a fitted map file
+    :return: dictionary of the evaluate arguments of the record
+             (coefficients, latmin, order, hemisphere, lon_shift), None
+             when the record has no fit
+    :raise ValueError: the fit has a latitude shift, which is not supported
+    """
+    if 'N+2' not in record or not len(record['N+2']):
+        return None
+    if record.get('lat.shft', 0):
+        raise ValueError("Fits with a latitude shift are not supported")
+    latmin = record['latmin']
+    hemisphere = record.get('hemisphere', 1 if latmin >= 0 else -1)
+    return {'coefficients': np.asarray(record['N+2'], dtype=float),
+            'latmin': float(latmin),
+            'order': record.get('fit.order'),
+            'hemisphere': 1 if hemisphere >= 0 else -1,
+            'lon_shift': float(record.get('lon.shft', 0))}
+
+
+def evaluate_records(records, mlat, mlon):
+    """
+    Evaluates the solutions of many map records on the same grid. Records
+    sharing the boundary, order and hemisphere are evaluated together.
+
+        :param records: list of DmapRecords of a fitted map file
+        :param mlat: magnetic latitudes in degrees
+        :param mlon: magnetic longitudes in degrees
+        :return: (potential, northward velocity, eastward velocity) numpy
+                 arrays of shape (records,) + mlat.shape, NaN for the records
+                 without a fit
+    """
+    mlat, mlon = np.broadcast_arrays(np.asarray(mlat, dtype=float),
+                                     np.asarray(mlon, dtype=float))
+    results = [np.full((len(records),) + mlat.shape, np.nan)
+               for i in range(3)]
+    groups = {}
+    for index, record in enumerate(records):
+        solution = record_solution(record)
+        if solution is None:
+            continue
+        order = solution['order']
+        if order is None:
+            order = fit_order(solution['coefficients'].size)
+        key = (order, solution['latmin'], solution['hemisphere'],
+               solution['lon_shift'], solution['coefficients'].size)
+        groups.setdefault(key, []).append((index, solution['coefficients']))
+
+    for (order, latmin, hemisphere, lon_shift, size), members in groups.items():
+        indices = [index for index, coefficients in members]
+        evaluated = evaluate(np.stack([coefficients
+                                       for index, coefficients in members]),
+                             latmin, mlat, mlon, order, hemisphere, lon_shift)
+        for result, values in zip(results, evaluated):
+            result[indices] = values
+    return tuple(results)
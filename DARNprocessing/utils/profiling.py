@@ -0,0 +1,193 @@
+# Copyright 2018 SuperDARN Canada
+#
+# profiling.py
+"""
+Profiling of the python orchestration of the convection map process. Python
+time is measured with cProfile (one profile per thread, merged at the end)
+and the CPU time of the RST child processes with
+resource.getrusage(RUSAGE_CHILDREN) around every stage.
+"""
+
+import io
+import os
+import time
+import pstats
+import cProfile
+import logging
+import resource
+import threading
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_name(function):
+    """
+    Flame graph frame name of a pstats function key (file, line, name).
+    """
+    filename, line, name = function
+    if filename == '~':
+        # built in functions
+        return name.replace(';', ':')
+    return "{name} ({file}:{line})".format(name=name,
+                                           file=os.path.basename(filename),
+                                           line=line).replace(';', ':')
+
+
+def collapsed_stacks(stats, max_depth=64):
+    """
+    Converts pstats statistics into collapsed stacks ("frame;frame;frame
+    microseconds" lines) for flame graph tools. cProfile only keeps caller
+    and callee pairs, so the time of a function is split between its callers
+    in proportion to the time spent in it from each caller.
+
+        :param stats: pstats.Stats
+        :param max_depth: deepest stack written
+        :return: list of the collapsed stack lines
+    """
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+
+    totals = {}
+
+    def walk(function, stack, fraction):
+        total_time, cumulative_time = stats.stats[function][2:4]
+        stack = stack + [_frame_name(function)]
+        key = ";".join(stack)
+        totals[key] = totals.get(key, 0.0) + total_time * fraction
+        if len(stack) >= max_depth or cumulative_time <= 0:
+            return
+        for callee, edge_time in callees.get(function, []):
+            callee_cumulative = stats.stats[callee][3]
+            # recursion is already accounted for in the cumulative times
+            if _frame_name(callee) in stack or callee_cumulative <= 0:
+                continue
+            share = fraction * edge_time / callee_cumulative
+            if share * callee_cumulative >= 1e-6:
+                walk(callee, stack, share)
+
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        if not any(caller in stats.stats for caller in callers):
+            walk(function, [], 1.0)
+
+    return ["{stack} {usec}".format(stack=stack, usec=int(seconds * 1e6))
+            for stack, seconds in sorted(totals.items())
+            if int(seconds * 1e6) > 0]
+
+
+class Profiler():
+    """
+    Collects cProfile statistics and the CPU time of child processes per
+    stage.
+
+    Output files:
+        {output_prefix}.prof: pstats dump, e.g. for snakeviz
+        {output_prefix}.collapsed: collapsed stacks for flamegraph.pl or
+                                   speedscope; child process CPU time per
+                                   stage is added as
+                                   "stage <name>;[child processes]" frames
+
+        :param output_prefix: path prefix of the output files
+        :param top: number of functions in the hotspot summary in the log
+    """
+
+    def __init__(self, output_prefix, top=20):
+        self.output_prefix = output_prefix
+        self.top = top
+        self.profiles = []
+        self.stages = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profiles a block: enables cProfile on the current thread (unless it
+        already is) and records the wall time and the CPU time of the child
+        processes reaped during the block. Child time of stages that overlap
+        in time (concurrent tasks) can be attributed to either stage.
+
+            :param name: stage name
+        """
+        profile = None
+        if not getattr(self._local, 'active', False):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                self._local.active = True
+            except ValueError:
+                # another profiler is active (python >= 3.12 only allows one
+                # at a time), the block is only timed
+                profile = None
+
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            wall_time = time.time() - start_time
+            children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+            if profile is not None:
+                profile.disable()
+                self._local.active = False
+            with self._lock:
+                if profile is not None:
+                    self.profiles.append(profile)
+                self.stages.append((name, wall_time,
+                                    children_end.ru_utime - children.ru_utime,
+                                    children_end.ru_stime - children.ru_stime))
+
+    def wrap(self, name, function):
+        """
+        :return: function running under stage(name), used for the tasks of
+                 the scheduler which run on worker threads
+        """
+        def profiled(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+        return profiled
+
+    def write(self):
+        """
+        Writes the output files and logs the hotspot and stage summaries.
+        """
+        with self._lock:
+            profiles = list(self.profiles)
+            stages = list(self.stages)
+        if not profiles and not stages:
+            return
+
+        lines = []
+        if profiles:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(self.output_prefix + '.prof')
+            lines = collapsed_stacks(stats)
+
+            summary = io.StringIO()
+            stats.stream = summary
+            stats.sort_stats('tottime').print_stats(self.top)
+            logger.info("Python hotspots:\n" + summary.getvalue())
+
+        stage_summary = ["Stage wall time and child process CPU time:"]
+        for name, wall_time, user_time, system_time in stages:
+            stage_summary.append("    {name}: {wall:.3f} s wall, {user:.3f} s"
+                                 " user, {system:.3f} s system"
+                                 "".format(name=name, wall=wall_time,
+                                           user=user_time,
+                                           system=system_time))
+            child_usec = int((user_time + system_time) * 1e6)
+            if child_usec > 0:
+                lines.append("stage {name};[child processes] {usec}"
+                             "".format(name=name.replace(';', ':'),
+                                       usec=child_usec))
+        logger.info("\n".join(stage_summary))
+
+        with open(self.output_prefix + '.collapsed', 'w') as collapsed_file:
+            collapsed_file.write("\n".join(lines) + "\n")
+        logger.info("Profile written to {prefix}.prof and"
+                    " {prefix}.collapsed".format(prefix=self.output_prefix))
@@ -0,0 +1,122 @@
+# Copyright 2018 SuperDARN Canada
+#
+# radars.py
+"""
+Registry of the radars of a hemisphere, resolving every data file name to
+exactly one (site, channel) key.
+
+Data files are named {date}.{time fields}.{site}[.{channel}].{type}[.{ext}],
+e.g. 20160101.0000.00.ksr.a.fitacf.bz2 is channel a of King Salmon. Matching
+the files with glob patterns of the abbreviations makes ksr match the files
+of ksr.a too; the registry parses the names instead, so every file belongs to
+one radar key and is decompressed and gridded once.
+"""
+
+import os
+import re
+import logging
+
+from collections import namedtuple, OrderedDict
+
+from DARNprocessing.utils.convectionMapConstants import (NorthRadar,
+                                                         SouthRadar,
+                                                         CanadianRadar,
+                                                         RegistryConst)
+
+logger = logging.getLogger(__name__)
+
+# metadata of a radar site
+Site = namedtuple('Site', ['abbrv', 'hemisphere', 'stereo'])
+
+
+class RadarKey(namedtuple('RadarKey', ['site', 'channel'])):
+    """
+    Radar of a data file, site acronym and channel letter ('' for the files
+    without a channel letter).
+    """
+    __slots__ = ()
+
+    @property
+    def name(self):
+        """
+        str name of the radar in the file names, e.g. ksr or ksr.a
+        """
+        if self.channel:
+            return "{site}.{channel}".format(site=self.site,
+                                             channel=self.channel)
+        return self.site
+
+    @classmethod
+    def from_name(cls, name):
+        """
+        :param name: str name of a radar, e.g. ksr or ksr.a
+        :return: RadarKey
+        """
+        site, _, channel = name.partition('.')
+        return cls(site, channel)
+
+
+_FILENAME = re.compile(RegistryConst.FILENAME_PATTERN)
+
+_HEMISPHERES = {'north': NorthRadar,
+                'south': SouthRadar,
+                'Canadian': CanadianRadar}
+
+
+class RadarRegistry():
+    """
+    Radar sites of a hemisphere.
+
+        :param hemisphere: 'north', 'south' or 'Canadian'
+    """
+
+    def __init__(self, hemisphere):
+        radars = _HEMISPHERES.get(hemisphere, NorthRadar)
+        self.hemisphere = hemisphere
+        self.sites = OrderedDict()
+        for abbrv in radars.RADAR_ABBRV:
+            # the lists are hand written, the first entry of a site wins
+            if abbrv not in self.sites:
+                self.sites[abbrv] = Site(abbrv, hemisphere,
+                                         abbrv in radars.STEREO_ABBRV)
+
+    @property
+    def abbreviations(self):
+        """
+        list of the site acronyms
+        """
+        return list(self.sites)
+
+    def resolve(self, filename):
+        """
+        :param filename: path of a data file
+        :return: RadarKey of the file, None if it is not a data file of a
+                 site of the registry
+        """
+        match = _FILENAME.match(os.path.basename(filename))
+        if match is None or match.group('site') not in self.sites:
+            return None
+        return RadarKey(match.group('site'), match.group('channel') or '')
+
+    def group(self, filenames):
+        """
+        Groups data files by radar, every file once.
+
+            :param filenames: iterable of the data file paths, duplicates
+                              are dropped
+            :return: OrderedDict RadarKey: sorted list of the files of the
+                     radar, in the order of the sites then channels
+        """
+        radars = {}
+        for filename in set(filenames):
+            key = self.resolve(filename)
+            if key is None:
+                logger.debug("{} is not a data file of a known radar"
+                             "".format(filename))
+                continue
+            radars.setdefault(key, []).append(filename)
+        order = {abbrv: index for index, abbrv in enumerate(self.sites)}
+        return OrderedDict((key, sorted(radars[key]))
+                           for key in sorted(radars,
+                                             key=lambda key: (order[key.site],
+                                                              key.channel)))
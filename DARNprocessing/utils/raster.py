@@ -0,0 +1,158 @@
+# Copyright 2018 SuperDARN Canada
+#
+# raster.py
+"""
+Raster image encoding for the frames RST writes as netpbm images (map_plot
+-ppm), so PNG frames are written straight from the pixel buffer instead of
+rasterising PostScript.
+
+Netpbm binary images are a text header ('P6' for RGB or 'P5' for greyscale,
+width, height and the maximum value, separated by white space and optional
+'#' comments) followed by a single white space character and the rows of
+pixels, one byte per sample (two big endian bytes when the maximum value is
+above 255).
+
+PNG files are the 8 byte signature followed by chunks (length, type, data
+and the CRC of type and data): IHDR with the size and pixel format, IDAT
+with the zlib compressed rows, each prefixed by its filter type, and IEND.
+"""
+
+import zlib
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# netpbm magic: (PNG colour type, samples per pixel)
+PNM_TYPES = {b'P5': (0, 1),
+             b'P6': (2, 3)}
+
+
+class RasterFormatError(ValueError):
+    """
+    Raised when an image is not in a supported format.
+    """
+    pass
+
+
+def _header_tokens(data, count):
+    """
+    Reads the white space separated tokens of a netpbm header.
+
+        :param data: bytes of the image
+        :param count: number of tokens to read
+        :return: (list of the tokens, offset of the pixel data)
+    """
+    tokens = []
+    position = 0
+    while len(tokens) < count:
+        while position < len(data) and data[position:position + 1].isspace():
+            position += 1
+        if data[position:position + 1] == b'#':
+            position = data.find(b'\n', position)
+            if position < 0:
+                break
+            continue
+        end = position
+        while end < len(data) and not data[end:end + 1].isspace():
+            end += 1
+        if end == position:
+            break
+        tokens.append(data[position:end])
+        position = end
+    if len(tokens) < count:
+        raise RasterFormatError("Truncated netpbm header")
+    # a single white space character separates the header from the pixels
+    return tokens, position + 1
+
+
+def read_pnm(filename):
+    """
+    Reads a binary netpbm (PPM or PGM) image.
+
+        :param filename: path of the image
+        :return: (width, height, PNG colour type, bit depth, pixel bytes)
+        :raise RasterFormatError: not a binary PPM/PGM image
+    """
+    with open(filename, 'rb') as image:
+        data = image.read()
+
+    magic = data[:2]
+    if magic not in PNM_TYPES:
+        raise RasterFormatError("{} is not a binary PPM or PGM image"
+                                "".format(filename))
+    tokens, offset = _header_tokens(data[2:], 3)
+    offset += 2
+    try:
+        width, height, maximum = (int(token) for token in tokens)
+    except ValueError:
+        raise RasterFormatError("Bad netpbm header in {}".format(filename))
+    if maximum == 255:
+        bit_depth = 8
+    elif maximum == 65535:
+        bit_depth = 16
+    else:
+        raise RasterFormatError("Unsupported maximum value {maximum} in"
+                                " {filename}".format(maximum=maximum,
+                                                     filename=filename))
+
+    colour_type, samples = PNM_TYPES[magic]
+    size = width * height * samples * bit_depth // 8
+    pixels = data[offset:offset + size]
+    if len(pixels) != size:
+        raise RasterFormatError("Truncated pixel data in {}".format(filename))
+    return width, height, colour_type, bit_depth, pixels
+
+
+def _chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + \
+        struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+
+def encode_png(width, height, pixels, colour_type=2, bit_depth=8,
+               compression=6):
+    """
+    Encodes raw pixels as a PNG image.
+
+        :param width: image width in pixels
+        :param height: image height in pixels
+        :param pixels: bytes of the rows of pixels, top to bottom, samples
+                       big endian when bit_depth is 16
+        :param colour_type: 0 for greyscale, 2 for RGB
+        :param bit_depth: 8 or 16 bits per sample
+        :param compression: zlib compression level
+        :return: bytes of the PNG file
+    """
+    samples = {0: 1, 2: 3}[colour_type]
+    row_size = width * samples * bit_depth // 8
+    if len(pixels) != row_size * height:
+        raise RasterFormatError("Expected {expected} bytes of pixels, got"
+                                " {size}".format(expected=row_size * height,
+                                                 size=len(pixels)))
+    # every row starts with filter type 0 (none): the frames are mostly flat
+    # colour areas which zlib compresses well without filtering
+    compressor = zlib.compressobj(compression)
+    compressed = []
+    for row in range(height):
+        compressed.append(compressor.compress(b'\x00'))
+        compressed.append(compressor.compress(pixels[row * row_size:
+                                                     (row + 1) * row_size]))
+    compressed.append(compressor.flush())
+
+    header = struct.pack('>IIBBBBB', width, height, bit_depth, colour_type,
+                         0, 0, 0)
+    return PNG_SIGNATURE + _chunk(b'IHDR', header) + \
+        _chunk(b'IDAT', b''.join(compressed)) + _chunk(b'IEND', b'')
+
+
+def pnm_to_png(pnm_filename, png_filename, compression=6):
+    """
+    Converts a binary PPM/PGM image (e.g. a map_plot -ppm frame) to PNG.
+
+        :param pnm_filename: path of the netpbm image
+        :param png_filename: path of the PNG image written
+        :param compression: zlib compression level
+    """
+    width, height, colour_type, bit_depth, pixels = read_pnm(pnm_filename)
+    png = encode_png(width, height, pixels, colour_type, bit_depth,
+                     compression)
+    with open(png_filename, 'wb') as image:
+        image.write(png)
@@ -0,0 +1,273 @@
+# Copyright 2018 SuperDARN Canada
+#
+# runlog.py
+"""
+Logging for concurrent convection map runs.
+
+Every logger of the package sends its records through one queue to a single
+listener thread that writes them, so tasks running on threads or forked
+worker processes never block on, or interleave within, the log files. Each
+record carries the context of the run it belongs to (run id, date,
+hemisphere, radar and stage) taken from a context variable, and the listener
+routes it to the log file of its run. Several ConvectionMaps instances in one
+process therefore each get their own log file.
+"""
+
+import os
+import atexit
+import logging
+import itertools
+import threading
+import functools
+import contextvars
+import multiprocessing
+
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+PACKAGE_LOGGER = 'DARNprocessing'
+CONTEXT_FIELDS = ('run', 'date', 'hemisphere', 'radar', 'stage')
+FORMAT = "%(levelname)s %(asctime)-15s [%(date)s %(hemisphere)s %(radar)s"\
+         " %(stage)s]: %(message)s"
+
+_context = contextvars.ContextVar('DARNprocessing_log_context', default={})
+_run_counter = itertools.count()
+_lock = threading.Lock()
+_queue = None
+_listener = None
+_router = None
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Adds fields (see CONTEXT_FIELDS) to the context of the records logged in
+    the block, on the current thread or task only.
+    """
+    token = _context.set(dict(_context.get(), **fields))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def with_run_context(method):
+    """
+    Decorator for methods of objects with a _log_fields dictionary; runs the
+    method in the logging context of the object's run with the method name
+    as the stage.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with log_context(stage=method.__name__, **self._log_fields):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def new_run_id():
+    """
+    :return: str run id unique in the process
+    """
+    return "{pid}.{count}".format(pid=os.getpid(), count=next(_run_counter))
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copies the logging context onto the record before it is queued.
+    """
+    def filter(self, record):
+        context = _context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field, '-'))
+        return True
+
+
+class RunLogRouter(logging.Handler):
+    """
+    Handler used by the listener, writing every record to the log file of
+    its run. Records without a registered run are dropped here; they still
+    propagate to the root logger in the thread that logged them.
+    """
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self._handlers = {}
+        self._flush_events = {}
+        self._flush_counter = itertools.count()
+
+    def add_run(self, run_id, logfile):
+        handler = logging.FileHandler(logfile)
+        handler.setFormatter(logging.Formatter(FORMAT))
+        with _lock:
+            self._handlers[run_id] = handler
+
+    def remove_run(self, run_id):
+        with _lock:
+            handler = self._handlers.pop(run_id, None)
+        if handler:
+            handler.close()
+
+    def new_flush(self):
+        token = next(self._flush_counter)
+        event = threading.Event()
+        with _lock:
+            self._flush_events[token] = event
+        return token, event
+
+    def emit(self, record):
+        flush_token = getattr(record, 'flush_token', None)
+        if flush_token is not None:
+            with _lock:
+                event = self._flush_events.pop(flush_token, None)
+                handlers = list(self._handlers.values())
+            for handler in handlers:
+                handler.flush()
+            if event:
+                event.set()
+            return
+        with _lock:
+            handler = self._handlers.get(getattr(record, 'run', None))
+        if handler:
+            handler.handle(record)
+
+
+def start_logging():
+    """
+    Starts the listener (once per process) and attaches the queue handler to
+    the package logger.
+
+        :return: the queue records are sent through, see configure_worker
+    """
+    global _queue, _listener, _router
+    with _lock:
+        if _listener is not None:
+            return _queue
+        _queue = multiprocessing.Queue()
+        _router = RunLogRouter()
+        _listener = QueueListener(_queue, _router)
+        _listener.start()
+        atexit.register(stop_logging)
+
+    handler = QueueHandler(_queue)
+    handler.addFilter(ContextFilter())
+    logger = logging.getLogger(PACKAGE_LOGGER)
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    return _queue
+
+
+def stop_logging():
+    """
+    Writes the queued records and stops the listener, run at exit.
+    """
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for run_id in list(_router._handlers):
+            _router.remove_run(run_id)
+
+
+def configure_worker(queue):
+    """
+    Sends the package's records of a worker process to the parent's
+    listener, e.g. as a multiprocessing.Pool initializer. Forked workers
+    already inherit the handler and do not need it.
+
+        :param queue: queue returned by start_logging in the parent
+    """
+    logger = logging.getLogger(PACKAGE_LOGGER)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = QueueHandler(queue)
+    handler.addFilter(ContextFilter())
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+
+
+def register_run(run_id, logfile):
+    """
+    Writes the records of a run to logfile (appending).
+    """
+    start_logging()
+    _router.add_run(run_id, logfile)
+
+
+def unregister_run(run_id):
+    """
+    Flushes and closes the log file of a run.
+    """
+    if _router is not None:
+        flush_logs()
+        _router.remove_run(run_id)
+
+
+def flush_logs(timeout=10):
+    """
+    Waits until every record queued so far is written to its log file.
+    """
+    if _router is None:
+        return
+    token, event = _router.new_flush()
+    record = logging.makeLogRecord({'flush_token': token, 'msg': ''})
+    _queue.put(record)
+    event.wait(timeout)
+
+
+class RadarStatus():
+    """
+    Status of the data files of a run (used, missing, errors, quarantined
+    as corrupt), collected as structured data from concurrent tasks and
+    logged once at the end instead of growing log strings on every file.
+    """
+    USED = 'used'
+    MISSING = 'missing'
+    ERRORS = 'errors'
+    QUARANTINED = 'quarantined'
+
+    TITLES = {USED: "Radar files uses in the Convection Map process:",
+              MISSING: "Radar files missing"
+                       " (not used in the Convection Map process):",
+              ERRORS: "Radars files that raised errors:",
+              QUARANTINED: "Radar files quarantined as corrupt"
+                           " (not used in the Convection Map process):"}
+
+    def __init__(self):
+        self._records = []
+        self._lock = threading.Lock()
+
+    def add(self, status, filename, reason=None):
+        """
+        :param status: USED, MISSING, ERRORS or QUARANTINED
+        :param filename: data file name
+        :param reason: optional str of why the file was not used
+        """
+        context = _context.get()
+        with self._lock:
+            self._records.append({'status': status,
+                                  'file': filename,
+                                  'radar': context.get('radar'),
+                                  'stage': context.get('stage'),
+                                  'reason': reason})
+
+    def records(self, status=None):
+        """
+        :param status: only return records of this status, None for all
+        :return: list of the status dictionaries
+        """
+        with self._lock:
+            return [dict(record) for record in self._records
+                    if status is None or record['status'] == status]
+
+    def summary(self, status):
+        """
+        :return: str listing the files of a status, one per line
+        """
+        lines = [self.TITLES[status]]
+        for record in self.records(status):
+            line = record['file']
+            if record['reason']:
+                line += " ({})".format(record['reason'])
+            lines.append(line)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,279 @@
+# Copyright 2018 SuperDARN Canada
+#
+# scheduler.py
+"""
+Dependency aware task scheduler. Tasks form a directed acyclic graph and a
+task is started as soon as all of its dependencies have finished and a slot
+of its resource type is free. CPU bound tasks (RST processing) and I/O bound
+tasks (downloads, copies) have separate slot limits so that, for example, the
+OMNI download overlaps the gridding. Tasks are started in the order they
+were added; a ready task waiting for more slots than are free holds back the
+tasks added after it on the same resource, so a task taking several slots
+is not starved by a stream of single slot tasks.
+"""
+
+import time
+import logging
+import threading
+import contextvars
+
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CPU = 'cpu'
+IO = 'io'
+# tasks that mostly wait on other tasks, they do not take a slot
+WAIT = 'wait'
+
+
+class Task():
+    """
+    A unit of work in the scheduler.
+
+        :param name: unique name of the task, used in the logs and the report
+        :param function: callable to run
+        :param args: positional arguments of function
+        :param kwargs: keyword arguments of function
+        :param dependencies: tasks that have to finish first
+        :param resource: CPU, IO or WAIT
+        :param slots: number of slots of its resource the task takes, e.g.
+                      the worker processes it starts
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+
+    def __init__(self, name, function, args=(), kwargs=None,
+                 dependencies=(), resource=CPU, slots=1):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.dependencies = list(dependencies)
+        self.resource = resource
+        self.slots = slots
+        self.state = self.PENDING
+        self.result = None
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+        # tasks run in the context (e.g. logging context) they were added in
+        self.context = contextvars.copy_context()
+
+    @property
+    def duration(self):
+        """
+        Run time in seconds, 0 if the task did not run.
+        """
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+    def __repr__(self):
+        return "Task({name}, {state})".format(name=self.name, state=self.state)
+
+
+class Scheduler():
+    """
+    Runs a graph of tasks concurrently on threads. Tasks typically spawn RST
+    commands so threads are enough to keep several cores busy.
+
+    Tasks can be added while the scheduler is running, e.g. a plotting task
+    adding one conversion task per frame it produced. When a task fails the
+    tasks depending on it are skipped, every other branch still runs and the
+    first error is raised once nothing is left to run.
+
+        :param cpu_slots: number of CPU bound tasks running at once
+        :param io_slots: number of I/O bound tasks running at once
+        :param wrapper: optional callable taking a task name and function and
+                        returning the function to run instead, e.g. to
+                        profile every task
+    """
+
+    def __init__(self, cpu_slots=1, io_slots=1, wrapper=None):
+        self.slots = {CPU: max(1, cpu_slots),
+                      IO: max(1, io_slots)}
+        self.tasks = []
+        self._names = set()
+        self._condition = threading.Condition()
+        self._running = {CPU: 0, IO: 0, WAIT: 0}
+        self.wrapper = wrapper
+        self.start_time = None
+        self.end_time = None
+
+    def add_task(self, name, function, args=(), kwargs=None,
+                 dependencies=(), resource=CPU, slots=1):
+        """
+        Adds a task, see Task for the parameters. Safe to call from a running
+        task. A task never takes more than the slots of its resource.
+
+            :return: the Task, used as a dependency of other tasks
+            :raise ValueError: the name is already used or the resource is
+                               unknown
+        """
+        if resource not in self._running:
+            raise ValueError("Unknown resource {}".format(resource))
+        if self.wrapper is not None:
+            function = self.wrapper(name, function)
+        slots = max(1, min(slots, self.slots.get(resource, 1)))
+        task = Task(name, function, args, kwargs, dependencies, resource,
+                    slots)
+        with self._condition:
+            if name in self._names:
+                raise ValueError("Task {} already exists".format(name))
+            for dependency in task.dependencies:
+                if dependency not in self.tasks:
+                    raise ValueError("Dependency {dependency} of {task} was"
+                                     " not added to the scheduler"
+                                     "".format(dependency=dependency.name,
+                                               task=name))
+            self._names.add(name)
+            self.tasks.append(task)
+            self._condition.notify_all()
+        return task
+
+    def _ready(self, task):
+        """
+        :return: True if all dependencies finished, None if one of them
+                 failed or was skipped, False otherwise
+        """
+        for dependency in task.dependencies:
+            if dependency.state in (Task.FAILED, Task.SKIPPED):
+                return None
+            if dependency.state != Task.DONE:
+                return False
+        return True
+
+    def _execute(self, task):
+        task.start_time = time.time()
+        try:
+            task.result = task.context.run(task.function, *task.args,
+                                           **task.kwargs)
+            state = Task.DONE
+        except Exception as err:
+            logger.exception("Task {} failed".format(task.name))
+            task.error = err
+            state = Task.FAILED
+        task.end_time = time.time()
+        with self._condition:
+            task.state = state
+            self._running[task.resource] -= task.slots
+            self._condition.notify_all()
+
+    def run(self):
+        """
+        Runs the tasks until every task finished, failed or was skipped.
+
+            :raise Exception: the error of the first task that failed
+        """
+        self.start_time = time.time()
+        executors = {resource: ThreadPoolExecutor(max_workers=slots)
+                     for resource, slots in self.slots.items()}
+        waiting = ThreadPoolExecutor(max_workers=None)
+        try:
+            with self._condition:
+                while True:
+                    pending = [task for task in self.tasks
+                               if task.state == Task.PENDING]
+                    running = sum(self._running.values())
+                    if not pending and running == 0:
+                        break
+
+                    started = False
+                    # resources whose free slots are held for a ready task
+                    # added earlier
+                    reserved = set()
+                    for task in pending:
+                        ready = self._ready(task)
+                        if ready is None:
+                            task.state = Task.SKIPPED
+                            logger.warning("Skipping {} because a dependency"
+                                           " failed".format(task.name))
+                            started = True
+                        elif not ready or task.resource in reserved:
+                            continue
+                        elif task.resource != WAIT and \
+                                self._running[task.resource] + task.slots > \
+                                self.slots[task.resource]:
+                            reserved.add(task.resource)
+                        else:
+                            task.state = Task.RUNNING
+                            self._running[task.resource] += task.slots
+                            executor = executors.get(task.resource, waiting)
+                            executor.submit(self._execute, task)
+                            started = True
+
+                    if not started:
+                        if running == 0:
+                            raise ValueError("Tasks {} can never run, check for"
+                                             " dependency cycles"
+                                             "".format([t.name for t in pending]))
+                        self._condition.wait()
+        finally:
+            for executor in list(executors.values()) + [waiting]:
+                executor.shutdown(wait=True)
+            self.end_time = time.time()
+
+        for task in self.tasks:
+            if task.state == Task.FAILED:
+                raise task.error
+
+    def critical_path(self):
+        """
+        The chain of dependent tasks with the longest total run time, the
+        lower bound of the wall time however many slots are available.
+
+            :return: list of tasks from the first to the last of the chain
+        """
+        longest = {}
+        previous = {}
+        # tasks are always added after their dependencies
+        for task in self.tasks:
+            best = None
+            for dependency in task.dependencies:
+                if best is None or longest[dependency] > longest[best]:
+                    best = dependency
+            longest[task] = task.duration + (longest[best] if best else 0.0)
+            previous[task] = best
+
+        if not longest:
+            return []
+        task = max(longest, key=lambda t: longest[t])
+        path = []
+        while task is not None:
+            path.append(task)
+            task = previous[task]
+        return path[::-1]
+
+    def report(self):
+        """
+        Logs the wall time, the time spent per resource and the critical
+        path of the last run.
+
+            :return: str of the report
+        """
+        wall_time = (self.end_time or time.time()) - (self.start_time or 0)
+        lines = ["Scheduler ran {count} tasks in {wall:.2f} s"
+                 "".format(count=len(self.tasks), wall=wall_time)]
+        for resource in (CPU, IO, WAIT):
+            busy = sum(task.duration for task in self.tasks
+                       if task.resource == resource)
+            lines.append("    {resource} task time: {busy:.2f} s"
+                         "".format(resource=resource, busy=busy))
+        failed = [task.name for task in self.tasks
+                  if task.state in (Task.FAILED, Task.SKIPPED)]
+        if failed:
+            lines.append("    failed or skipped: {}".format(", ".join(failed)))
+
+        path = self.critical_path()
+        lines.append("Critical path ({:.2f} s):".format(sum(task.duration
+                                                            for task in path)))
+        for task in path:
+            lines.append("    {name}: {duration:.2f} s"
+                         "".format(name=task.name, duration=task.duration))
+        report = "\n".join(lines)
+        logger.info(report)
+        return report
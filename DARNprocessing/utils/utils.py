@@ -8,14 +8,18 @@
 import os
 import logging
 import argparse
-from subprocess import call
+from subprocess import call, Popen
 from glob import glob
 
 from DARNprocessing.utils.convectionMapExceptions import (RSTException,
                                                           RSTFileEmptyException,
                                                           PathDoesNotExistException)
+from DARNprocessing.utils.executor import wait_for_process
 
-def flag_options(program_name,program_desc,option_names,option_settings):
+logger = logging.getLogger(__name__)
+
+def flag_options(program_name,program_desc,option_names,option_settings,
+                 arguments=None):
     """
     Parameter options is a utility to add options to runnable scripts
 
@@ -27,6 +31,7 @@ def flag_options(program_name,program_desc,option_names,option_settings):
                             *Note: for required options do not use a hyphen,
                                    for flag options use a single hyphen for
                                    singlular letters and two hyphens for words
+        :param arguments: list of the arguments to parse, None for sys.argv
         :return options_object: passes back an options object the method can
                                 invoke to obtain the values from sys.argv
 
@@ -41,7 +46,7 @@ def flag_options(program_name,program_desc,option_names,option_settings):
             parser.add_argument(*option_name,**option_setting)
 
 
-    parameter = parser.parse_args()
+    parameter = parser.parse_args(arguments)
     return vars(parameter)
 
 def path_exists(path):
@@ -69,26 +74,46 @@ def file_exists(filename):
     return True
 
 
-def check_rst_command(rst_command, filepath):
+def check_rst_command(rst_command, filepath, executor=None, timeout=None):
     """
     Runs RST command and checks if they returned succeful and
     the file was properly produced.
 
-        :param rst_command: the string of the rst command to be
-                            called in a terminal
+        :param rst_command: Command (see utils.executor), or the string of
+                            the rst command to be called in a terminal
         :param filename: the file name that is produced by the command
+        :param executor: Executor running the Command, None to run it in the
+                         calling thread
+        :param timeout: seconds the string of a command can run, None for no
+                        limit; a Command carries its own limits
         :raise RSTExceptopm: raises an error when rst returns a
                              non-zero return value
+        :raise RSTTimeoutException: the command went over its time limit
+                                    and was killed with its children
         :raise RSTFileEmptyException: raise an error when the output
                                       file is empty
     """
-    if logging:
-        logging.info(rst_command)
+    logger.info(str(rst_command))
 
-    return_value = call(rst_command, shell=True)
-    if return_value != 0:
+    if isinstance(rst_command, str):
         # first word of the rst_command should be the rst command name
-        raise RSTException(rst_command.split()[0], return_value)
+        command_name = rst_command.split()[0]
+        if timeout is None:
+            return_value = call(rst_command, shell=True)
+        else:
+            # the shell and the commands of its pipes in their own process
+            # group, killed together
+            process = Popen(rst_command, shell=True, start_new_session=True)
+            return_value = wait_for_process(process, command_name, timeout)
+    else:
+        if executor is None:
+            return_value = rst_command.run_local()
+        else:
+            return_value = executor.run(rst_command)
+        command_name = rst_command.name
+
+    if return_value != 0:
+        raise RSTException(command_name, return_value)
 
     for filename in glob(filepath):
         if os.path.getsize(filename) <= 0:
@@ -0,0 +1,150 @@
+# Copyright 2018 SuperDARN Canada
+#
+# validate.py
+"""
+Structural validator of dmap files and the quarantine of the data files that
+fail it.
+
+The validator only walks the record headers: it reads the code and size of
+every record and skips over the rest without decoding it, seeking in
+uncompressed files. In one pass it finds truncated files, bad record codes
+or sizes and files without records, which would otherwise only show up when
+make_grid fails or writes an empty grid file.
+"""
+
+import os
+import json
+import logging
+import threading
+
+from DARNprocessing.utils.dmap import (DmapFormatError,
+                                       HEADER_SIZE,
+                                       parse_header)
+from DARNprocessing.utils.filecache import file_fingerprint
+from DARNprocessing.utils.filelock import atomic_output
+from DARNprocessing.utils.compression import (detect_compression,
+                                              open_compressed)
+from DARNprocessing.utils.convectionMapConstants import ValidateConst
+
+logger = logging.getLogger(__name__)
+
+
+def _skip(dmap_file, count, file_size):
+    """
+    Skips count bytes of a file.
+
+        :param file_size: size of a seekable file, None to read through
+        :return: True if the file had count bytes left
+    """
+    if file_size is not None:
+        return dmap_file.seek(count, os.SEEK_CUR) <= file_size
+    while count > 0:
+        block = dmap_file.read(min(count, ValidateConst.READ_SIZE))
+        if not block:
+            return False
+        count -= len(block)
+    return True
+
+
+def validate_dmap(filename):
+    """
+    Checks the structure of a dmap file, compressed or not, from its record
+    headers.
+
+        :param filename: path of the file
+        :return: number of records
+        :raise DmapFormatError: the file is truncated, has a bad record
+                                header or has no records
+    """
+    # uncompressed files are skipped through by seeking
+    file_size = None
+    if detect_compression(filename) is None:
+        file_size = os.path.getsize(filename)
+    with open_compressed(filename) as dmap_file:
+        position = 0
+        count = 0
+        while True:
+            header = dmap_file.read(HEADER_SIZE)
+            if not header:
+                break
+            size = parse_header(header)
+            if not _skip(dmap_file, size - HEADER_SIZE, file_size):
+                raise DmapFormatError("Record at byte {position} of {size}"
+                                      " bytes is truncated"
+                                      "".format(position=position, size=size))
+            position += size
+            count += 1
+    if count == 0:
+        raise DmapFormatError("No records")
+    return count
+
+
+class Quarantine():
+    """
+    JSON file of the data files that failed validation, with the reasons.
+    A quarantined file is skipped until it changes (size or modification
+    time), e.g. when it is downloaded again.
+
+        :param quarantine_path: path of the quarantine file
+    """
+
+    def __init__(self, quarantine_path):
+        self.quarantine_path = quarantine_path
+        self._lock = threading.Lock()
+        self.files = {}
+        if os.path.isfile(quarantine_path):
+            try:
+                with open(quarantine_path) as quarantine_file:
+                    self.files = json.load(quarantine_file)['files']
+            except (ValueError, KeyError, IOError) as err:
+                logger.warning("Ignoring unreadable quarantine {file}: {err}"
+                               "".format(file=quarantine_path, err=err))
+
+    def reason(self, filename):
+        """
+        :param filename: path of a data file
+        :return: str reason the file is quarantined, None if it is not (or
+                 it changed since)
+        """
+        path = os.path.abspath(filename)
+        with self._lock:
+            entry = self.files.get(path)
+        if entry is None:
+            return None
+        try:
+            if entry['fingerprint'] != list(file_fingerprint(path)):
+                return None
+        except OSError:
+            return None
+        return entry['reason']
+
+    def add(self, filename, reason):
+        """
+        Quarantines a data file and saves the quarantine.
+
+            :param filename: path of the data file
+            :param reason: str of why it failed
+        """
+        path = os.path.abspath(filename)
+        entry = {'fingerprint': list(file_fingerprint(path)),
+                 'reason': reason}
+        logger.warning("Quarantined {file}: {reason}"
+                       "".format(file=filename, reason=reason))
+        with self._lock:
+            self.files[path] = entry
+            self._save()
+
+    def release(self, filename):
+        """
+        Takes a data file out of the quarantine, e.g. once it passed.
+        """
+        path = os.path.abspath(filename)
+        with self._lock:
+            if self.files.pop(path, None) is not None:
+                self._save()
+
+    def _save(self):
+        with atomic_output(self.quarantine_path) as tmp_path:
+            with open(tmp_path, 'w') as quarantine_file:
+                json.dump({'files': self.files}, quarantine_file,
+                          indent=1, sort_keys=True)
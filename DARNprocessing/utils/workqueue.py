@@ -0,0 +1,462 @@
+# Copyright 2018 SuperDARN Canada
+#
+# workqueue.py
+"""
+Work queue distributing convection map runs (date, hemisphere, parameters)
+over several nodes. The queue is a SQLite file on a shared file system: a
+coordinator enqueues the tasks, workers on any node claim them with a lease
+they renew (heartbeat) while the task runs. A worker that crashes stops
+renewing its lease and once the lease expired the task is claimed again by
+another worker. Every task runs in a process of its own (forked, in its own
+process group), which the worker kills with the commands it started when it
+loses the lease of the task, so two workers never run the same task at
+once.
+
+The lease times compare the clocks of the nodes, keep them synchronised
+(NTP) and the lease time well above the clock differences.
+"""
+
+import os
+import json
+import time
+import signal
+import socket
+import sqlite3
+import logging
+import threading
+import multiprocessing
+
+from contextlib import contextmanager
+
+from DARNprocessing.utils.executor import kill_sessions
+from DARNprocessing.utils.convectionMapConstants import (ExecutorConst,
+                                                         QueueConst)
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATES = (PENDING, RUNNING, DONE, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    hemisphere TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    heartbeat REAL,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    UNIQUE (date, hemisphere, parameters)
+)
+"""
+
+
+def default_worker_id():
+    """
+    :return: str worker id unique on the cluster, host name and process id
+    """
+    return "{host}:{pid}".format(host=socket.gethostname(), pid=os.getpid())
+
+
+class WorkQueue():
+    """
+    SQLite work queue with leases.
+
+        :param db_path: path of the queue file, created if it does not exist
+        :param lease_time: seconds a claim is valid without a heartbeat
+        :param max_attempts: number of times a task is tried before it is
+                             marked failed
+    """
+
+    def __init__(self, db_path, lease_time=QueueConst.LEASE_TIME,
+                 max_attempts=QueueConst.MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        # the connection is shared with the heartbeat thread
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path,
+                                           timeout=QueueConst.DB_TIMEOUT,
+                                           isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._transaction() as cursor:
+            cursor.execute(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Runs a block in a write transaction, taking the database lock up
+        front so two workers never claim the same task.
+        """
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def enqueue(self, date, hemisphere, parameters=None):
+        """
+        Adds a task, a task already in the queue is not added again.
+
+            :param date: str YYYYMMDD
+            :param hemisphere: north, south or Canadian
+            :param parameters: dictionary of ConvectionMaps parameters
+            :return: True if the task was added
+        """
+        parameters = json.dumps(parameters or {}, sort_keys=True)
+        with self._transaction() as cursor:
+            cursor.execute("INSERT OR IGNORE INTO tasks (date, hemisphere,"
+                           " parameters, state) VALUES (?, ?, ?, ?)",
+                           (date, hemisphere, parameters, PENDING))
+            return cursor.rowcount == 1
+
+    def claim(self, worker):
+        """
+        Claims the next pending task or a task whose lease expired.
+
+            :param worker: str worker id
+            :return: task dictionary (id, date, hemisphere, parameters,
+                     attempts), None if there is nothing to do
+        """
+        now = time.time()
+        with self._transaction() as cursor:
+            # tasks of crashed workers that ran out of attempts
+            cursor.execute("UPDATE tasks SET state = ?, error = ?,"
+                           " finished = ? WHERE state = ? AND"
+                           " lease_expires < ? AND attempts >= ?",
+                           (FAILED, "lease expired", now, RUNNING, now,
+                            self.max_attempts))
+            row = cursor.execute("SELECT * FROM tasks WHERE state = ? OR"
+                                 " (state = ? AND lease_expires < ?)"
+                                 " ORDER BY id LIMIT 1",
+                                 (PENDING, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            if row['state'] == RUNNING:
+                logger.warning("Lease of task {id} held by {worker} expired,"
+                               " claiming it again".format(id=row['id'],
+                                                           worker=row['worker']))
+            cursor.execute("UPDATE tasks SET state = ?, worker = ?,"
+                           " attempts = attempts + 1, lease_expires = ?,"
+                           " heartbeat = ?, started = ?, error = NULL"
+                           " WHERE id = ?",
+                           (RUNNING, worker, now + self.lease_time, now, now,
+                            row['id']))
+        return {'id': row['id'],
+                'date': row['date'],
+                'hemisphere': row['hemisphere'],
+                'parameters': json.loads(row['parameters']),
+                'attempts': row['attempts'] + 1}
+
+    def heartbeat(self, task_id, worker):
+        """
+        Renews the lease of a claimed task.
+
+            :return: False if the worker lost the lease (it expired and
+                     another worker claimed the task)
+        """
+        now = time.time()
+        with self._transaction() as cursor:
+            cursor.execute("UPDATE tasks SET lease_expires = ?, heartbeat = ?"
+                           " WHERE id = ? AND worker = ? AND state = ?",
+                           (now + self.lease_time, now, task_id, worker,
+                            RUNNING))
+            return cursor.rowcount == 1
+
+    def complete(self, task_id, worker):
+        """
+        Marks a claimed task done.
+
+            :return: False if the worker lost the lease
+        """
+        with self._transaction() as cursor:
+            cursor.execute("UPDATE tasks SET state = ?, finished = ?,"
+                           " lease_expires = NULL WHERE id = ? AND"
+                           " worker = ? AND state = ?",
+                           (DONE, time.time(), task_id, worker, RUNNING))
+            return cursor.rowcount == 1
+
+    def fail(self, task_id, worker, error):
+        """
+        Gives up a claimed task after an error, it is tried again until it
+        failed max_attempts times.
+
+            :param error: str error of the run
+            :return: False if the worker lost the lease
+        """
+        with self._transaction() as cursor:
+            cursor.execute("UPDATE tasks SET state = CASE WHEN attempts < ?"
+                           " THEN ? ELSE ? END, error = ?, finished = ?,"
+                           " lease_expires = NULL WHERE id = ? AND"
+                           " worker = ? AND state = ?",
+                           (self.max_attempts, PENDING, FAILED, str(error),
+                            time.time(), task_id, worker, RUNNING))
+            return cursor.rowcount == 1
+
+    def release(self, task_id, worker):
+        """
+        Puts a claimed task back without counting the attempt, e.g. when a
+        worker is stopped.
+
+            :return: False if the worker lost the lease
+        """
+        with self._transaction() as cursor:
+            cursor.execute("UPDATE tasks SET state = ?, worker = NULL,"
+                           " attempts = attempts - 1, lease_expires = NULL"
+                           " WHERE id = ? AND worker = ? AND state = ?",
+                           (PENDING, task_id, worker, RUNNING))
+            return cursor.rowcount == 1
+
+    def retry_failed(self):
+        """
+        Puts the failed tasks back in the queue with new attempts.
+
+            :return: number of tasks put back
+        """
+        with self._transaction() as cursor:
+            cursor.execute("UPDATE tasks SET state = ?, attempts = 0,"
+                           " worker = NULL WHERE state = ?", (PENDING, FAILED))
+            return cursor.rowcount
+
+    def status(self, window=QueueConst.THROUGHPUT_WINDOW):
+        """
+        Progress of the queue.
+
+            :param window: seconds of recently finished tasks the throughput
+                           is measured over
+            :return: dictionary of the task count per state, the running
+                     tasks per worker, the throughput (tasks per hour), the
+                     mean run time of the done tasks, the estimated seconds
+                     left and the errors of the failed tasks
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.cursor()
+            counts = dict.fromkeys(STATES, 0)
+            for state, count in cursor.execute("SELECT state, COUNT(*) FROM"
+                                               " tasks GROUP BY state"):
+                counts[state] = count
+            workers = {}
+            for row in cursor.execute("SELECT worker, date, hemisphere,"
+                                      " heartbeat, lease_expires FROM tasks"
+                                      " WHERE state = ?", (RUNNING,)):
+                workers.setdefault(row['worker'], []).append(
+                    {'date': row['date'],
+                     'hemisphere': row['hemisphere'],
+                     'heartbeat_age': now - row['heartbeat'],
+                     'expired': row['lease_expires'] < now})
+            recent = cursor.execute("SELECT COUNT(*) FROM tasks WHERE"
+                                    " state = ? AND finished >= ?",
+                                    (DONE, now - window)).fetchone()[0]
+            mean_time = cursor.execute("SELECT AVG(finished - started) FROM"
+                                       " tasks WHERE state = ?",
+                                       (DONE,)).fetchone()[0]
+            errors = [(row['date'], row['hemisphere'], row['error'])
+                      for row in cursor.execute("SELECT date, hemisphere,"
+                                                " error FROM tasks WHERE"
+                                                " state = ? ORDER BY id",
+                                                (FAILED,))]
+
+        throughput = recent * 3600.0 / window
+        remaining = counts[PENDING] + counts[RUNNING]
+        eta = None
+        if throughput > 0:
+            eta = remaining * 3600.0 / throughput
+        return {'counts': counts,
+                'workers': workers,
+                'throughput': throughput,
+                'mean_time': mean_time,
+                'eta': eta,
+                'errors': errors}
+
+
+class _Heartbeat(threading.Thread):
+    """
+    Renews the lease of a task until stopped.
+    """
+
+    def __init__(self, queue, task_id, worker, interval):
+        threading.Thread.__init__(self, daemon=True)
+        self.queue = queue
+        self.task_id = task_id
+        self.worker = worker
+        self.interval = interval
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.task_id, self.worker):
+                    self.lost = True
+                    logger.warning("Lost the lease of task {}, another worker"
+                                   " may run it, stopping it"
+                                   "".format(self.task_id))
+                    return
+            except sqlite3.Error as err:
+                # e.g. the shared file system is busy, the lease is long
+                # enough to try again
+                logger.warning("Heartbeat of task {id} failed: {error}"
+                               "".format(id=self.task_id, error=err))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _terminate_task(signum, frame):
+    """
+    SIGTERM handler of a task process: the commands in a process group of
+    their own are killed with it.
+    """
+    kill_sessions()
+    os._exit(1)
+
+
+def _run_task_process(run_task, task, connection):
+    """
+    Runs a task in the task process and sends its error (None when it
+    succeeded) to the worker.
+    """
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, _terminate_task)
+    error = None
+    try:
+        run_task(task)
+    except Exception as err:
+        logger.exception("Task {} failed".format(task['id']))
+        error = str(err)
+    connection.send(error)
+    connection.close()
+
+
+def _kill_task_process(process, grace=ExecutorConst.KILL_GRACE):
+    """
+    Kills the process group of a task process: SIGTERM, then SIGKILL when it
+    has not exited after grace seconds.
+    """
+    for signum in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, signum)
+        except ProcessLookupError:
+            break
+        process.join(grace)
+        if process.exitcode is not None:
+            break
+
+
+def _run_task(run_task, task, heartbeat):
+    """
+    Runs a task in a process of its own while the heartbeat renews its
+    lease, the process is killed when the lease is lost.
+
+        :return: str error of the task, None if it succeeded
+    """
+    # forked before the heartbeat thread starts
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_task_process,
+                              args=(run_task, task, sender))
+    process.start()
+    sender.close()
+    try:
+        # also set by the task process, whichever runs first
+        os.setpgid(process.pid, process.pid)
+    except OSError:
+        pass
+    heartbeat.start()
+    try:
+        while process.exitcode is None:
+            process.join(heartbeat.interval)
+            if heartbeat.lost:
+                _kill_task_process(process)
+    except BaseException:
+        # the worker is stopped
+        _kill_task_process(process)
+        raise
+    finally:
+        heartbeat.stop()
+    try:
+        return receiver.recv()
+    except EOFError:
+        return "Task process exited with {}".format(process.exitcode)
+    finally:
+        receiver.close()
+
+
+def run_worker(queue, run_task, worker=None,
+               heartbeat_interval=QueueConst.HEARTBEAT_INTERVAL,
+               poll_interval=QueueConst.POLL_INTERVAL,
+               idle_exit=None, max_tasks=None):
+    """
+    Claims and runs tasks until the queue is empty (or forever). Every task
+    runs in a forked process, killed when the worker loses its lease.
+
+        :param queue: WorkQueue
+        :param run_task: callable given the task dictionary (see
+                         WorkQueue.claim), raising an exception when the
+                         task failed
+        :param worker: str worker id, default_worker_id() when None
+        :param heartbeat_interval: seconds between lease renewals
+        :param poll_interval: seconds between claims when the queue is empty
+        :param idle_exit: seconds without a task after which the worker
+                          stops, None to stop as soon as the queue is empty,
+                          a negative value to never stop
+        :param max_tasks: stop after this many tasks, None for no limit
+        :return: number of tasks run
+    """
+    worker = worker or default_worker_id()
+    count = 0
+    idle_since = time.time()
+    while max_tasks is None or count < max_tasks:
+        task = queue.claim(worker)
+        if task is None:
+            idle_time = time.time() - idle_since
+            if idle_exit is None or 0 <= idle_exit <= idle_time:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        logger.info("Worker {worker} running task {id}: {date} {hemisphere}"
+                    " (attempt {attempt})".format(worker=worker,
+                                                  id=task['id'],
+                                                  date=task['date'],
+                                                  hemisphere=task['hemisphere'],
+                                                  attempt=task['attempts']))
+        heartbeat = _Heartbeat(queue, task['id'], worker, heartbeat_interval)
+        try:
+            error = _run_task(run_task, task, heartbeat)
+        except (KeyboardInterrupt, SystemExit):
+            # the worker is stopped, the task goes back to the queue
+            queue.release(task['id'], worker)
+            raise
+        if heartbeat.lost:
+            logger.warning("Stopped task {} after its lease was lost"
+                           "".format(task['id']))
+        elif error is not None:
+            logger.error("Task {id} failed: {error}"
+                         "".format(id=task['id'], error=error))
+            queue.fail(task['id'], worker, error)
+        elif not queue.complete(task['id'], worker):
+            logger.warning("Task {} finished after its lease was lost"
+                           "".format(task['id']))
+        count += 1
+        idle_since = time.time()
+    return count
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+# Copyright 2018 SuperDARN Canada
+#
+# convectionMapDaemon.py
+#
+# Resident convection map server: while it runs, fitacf2convectionMap.py,
+# fitdata2convectionPlots.py and fitdata2map.py send their jobs to it over a
+# Unix socket instead of running them in a new process.
+
+import sys
+import signal
+import argparse
+
+from DARNprocessing.utils.daemon import ConvectionMapDaemon, socket_path, ping
+
+parser = argparse.ArgumentParser(prog='convectionMapDaemon',
+                                 description='Runs convection map jobs sent by'
+                                 ' the command line scripts, keeping caches'
+                                 ' warm between jobs')
+parser.add_argument('--socket', default=socket_path(),
+                    help='Path of the Unix socket. Default: {}'
+                    ''.format(socket_path()))
+parser.add_argument('-j', '--jobs', type=int, default=1,
+                    help='Number of jobs running at once. Default: 1')
+parser.add_argument('--status', action='store_true',
+                    help='Print the status of the running daemon and exit')
+arguments = parser.parse_args()
+
+if arguments.status:
+    status = ping(arguments.socket)
+    if status is None:
+        sys.exit("No daemon is listening on {}".format(arguments.socket))
+    print("Daemon {pid}: up {uptime:.0f} s, {jobs_run} jobs run,"
+          " {jobs_failed} failed".format(**status))
+    sys.exit(0)
+
+server = ConvectionMapDaemon(arguments.socket, arguments.jobs)
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+try:
+    server.serve_forever()
+except (KeyboardInterrupt, SystemExit):
+    pass
+finally:
+    server.server_close()
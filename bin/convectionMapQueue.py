@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+# Copyright 2018 SuperDARN Canada
+#
+# convectionMapQueue.py
+#
+# Distributes convection map runs over several nodes through a work queue
+# file on a shared file system:
+#
+#   coordinator: convectionMapQueue.py enqueue queue.db 20160101 20161231
+#                    -H north south -P '{"data_path": "/data/fitcon/{year}/{month}"}'
+#   every node:  convectionMapQueue.py worker queue.db
+#   progress:    convectionMapQueue.py status queue.db
+
+import sys
+import json
+import signal
+import argparse
+
+from datetime import datetime, timedelta
+
+from DARNprocessing import ConvectionMaps
+from DARNprocessing.utils.convectionMapConstants import QueueConst
+from DARNprocessing.utils.workqueue import (WorkQueue,
+                                            run_worker,
+                                            default_worker_id)
+
+
+def dates(start_date, end_date):
+    day = datetime.strptime(start_date, "%Y%m%d")
+    end = datetime.strptime(end_date, "%Y%m%d")
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def enqueue(arguments):
+    queue = WorkQueue(arguments.queue)
+    parameters = json.loads(arguments.parameters)
+    added = 0
+    for day in dates(arguments.start_date, arguments.end_date):
+        for hemisphere in arguments.hemisphere:
+            if queue.enqueue(day.strftime("%Y%m%d"), hemisphere, parameters):
+                added += 1
+    if arguments.retry_failed:
+        added += queue.retry_failed()
+    print("{} tasks added".format(added))
+
+
+def run_task(task):
+    """
+    Runs a queued convection map task, path parameters can contain {year},
+    {month} and {day} of the task date.
+    """
+    day = datetime.strptime(task['date'], "%Y%m%d")
+    parameters = {}
+    for key, value in task['parameters'].items():
+        if isinstance(value, str):
+            value = value.format(year=day.strftime("%Y"),
+                                 month=day.strftime("%m"),
+                                 day=day.strftime("%d"))
+        parameters[key] = value
+    parameters.update({'date': task['date'],
+                       'hemisphere': task['hemisphere'],
+                       # a task claimed again after a crash carries on where
+                       # the crashed worker stopped
+                       'resume': task['attempts'] > 1})
+    convec_map = ConvectionMaps(None, parameters)
+    try:
+        convec_map.run()
+        convec_map.cleanup()
+    finally:
+        convec_map.close()
+
+
+def worker(arguments):
+    # stopping a worker puts its task back in the queue
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    queue = WorkQueue(arguments.queue, lease_time=arguments.lease_time)
+    count = run_worker(queue, run_task, arguments.worker_id,
+                       heartbeat_interval=arguments.lease_time / 10.0,
+                       idle_exit=arguments.idle_exit,
+                       max_tasks=arguments.max_tasks)
+    print("{worker} ran {count} tasks".format(worker=arguments.worker_id,
+                                              count=count))
+
+
+def status(arguments):
+    report = WorkQueue(arguments.queue).status()
+    counts = report['counts']
+    total = sum(counts.values())
+    print("{done}/{total} done, {running} running, {pending} pending,"
+          " {failed} failed".format(total=total, **counts))
+    print("Throughput: {:.1f} tasks/hour".format(report['throughput']))
+    if report['mean_time'] is not None:
+        print("Mean run time: {:.0f} s".format(report['mean_time']))
+    if report['eta'] is not None:
+        print("Estimated time left: {:.1f} hours".format(report['eta'] / 3600.0))
+    for worker_id, tasks in sorted(report['workers'].items()):
+        for task in tasks:
+            print("    {worker}: {date} {hemisphere}, heartbeat {age:.0f} s ago"
+                  "{expired}".format(worker=worker_id, date=task['date'],
+                                     hemisphere=task['hemisphere'],
+                                     age=task['heartbeat_age'],
+                                     expired=" (lease expired)"
+                                     if task['expired'] else ""))
+    for date, hemisphere, error in report['errors']:
+        print("Failed {date} {hemisphere}: {error}".format(date=date,
+                                                           hemisphere=hemisphere,
+                                                           error=error))
+
+
+parser = argparse.ArgumentParser(prog='convectionMapQueue',
+                                 description='Distributes convection map runs'
+                                 ' over several nodes through a work queue on'
+                                 ' a shared file system')
+commands = parser.add_subparsers(dest='command')
+commands.required = True
+
+enqueue_parser = commands.add_parser('enqueue', help='Add a range of dates')
+enqueue_parser.add_argument('queue', metavar='QUEUE', help='Queue file')
+enqueue_parser.add_argument('start_date', metavar='YYYYMMDD')
+enqueue_parser.add_argument('end_date', metavar='YYYYMMDD')
+enqueue_parser.add_argument('-H', '--hemisphere', nargs='+',
+                            choices=['north', 'south', 'Canadian'],
+                            default=['north'],
+                            help='Hemispheres of every date. Default: north')
+enqueue_parser.add_argument('-P', '--parameters', default='{}',
+                            help='JSON dictionary of ConvectionMaps parameters,'
+                            ' string values can use {year}, {month} and {day}'
+                            ' of the date.')
+enqueue_parser.add_argument('--retry-failed', action='store_true',
+                            help='Put the failed tasks back in the queue')
+enqueue_parser.set_defaults(function=enqueue)
+
+worker_parser = commands.add_parser('worker', help='Run queued tasks')
+worker_parser.add_argument('queue', metavar='QUEUE', help='Queue file')
+worker_parser.add_argument('--worker-id', default=default_worker_id(),
+                           help='Default: <host>:<pid>')
+worker_parser.add_argument('--lease-time', type=float,
+                           default=QueueConst.LEASE_TIME,
+                           help='Seconds before the task of a silent worker'
+                           ' is claimed by another one.'
+                           ' Default: {}'.format(QueueConst.LEASE_TIME))
+worker_parser.add_argument('--idle-exit', type=float, default=None,
+                           metavar='SECONDS',
+                           help='Wait for new tasks this long before exiting,'
+                           ' negative to never exit. Default: exit when the'
+                           ' queue is empty')
+worker_parser.add_argument('--max-tasks', type=int, default=None)
+worker_parser.set_defaults(function=worker)
+
+status_parser = commands.add_parser('status', help='Show the progress')
+status_parser.add_argument('queue', metavar='QUEUE', help='Queue file')
+status_parser.set_defaults(function=status)
+
+arguments = parser.parse_args()
+arguments.function(arguments)
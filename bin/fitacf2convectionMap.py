@@ -9,10 +9,16 @@
 
 import sys
 from DARNprocessing import ConvectionMaps
+from DARNprocessing.utils.daemon import submit_job
+
+# a running convectionMapDaemon.py runs the job with its warm caches
+reply = submit_job(sys.argv[1:], 'run')
+if reply is not None:
+    if reply['status'] != 'ok':
+        sys.exit("Convection map job failed: {}".format(reply['error']))
+    sys.exit(0)
 
 convec_map = ConvectionMaps(sys.argv[1:])
-convec_map.generate_grid_files()
-convec_map.generate_map_files()
-convec_map.generate_RST_convection_maps()
+convec_map.run()
 convec_map.cleanup()
 
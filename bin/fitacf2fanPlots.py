@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# Copyright 2018 SuperDARN Canada
+#
+# fitacf2fanPlots.py
+#
+# Fan plots of the scans of fitacf files, one frame per scan.
+
+import sys
+import argparse
+
+from datetime import datetime
+
+from DARNprocessing.plotting_scripts.fanplots import plot_fans
+from DARNprocessing.utils.convectionMapConstants import FanConst, FovConst
+
+
+def time_of_day(value):
+    return datetime.strptime(value, "%Y%m%d.%H:%M")
+
+
+parser = argparse.ArgumentParser(prog='fitacf2fanPlots',
+                                 description='Renders a fan plot of every'
+                                 ' scan of fitacf files of one radar')
+parser.add_argument('radar', help='3-letter acronym of the radar')
+parser.add_argument('fitacf_files', nargs='+',
+                    help='fitacf files in time order, compressed or not')
+parser.add_argument('-p', '--plot-path', default='.',
+                    help='Directory of the frames. Default: current directory')
+parser.add_argument('--parameter', default='velocity',
+                    choices=sorted(FanConst.PARAMETERS),
+                    help='Parameter plotted. Default: velocity')
+parser.add_argument('--coords', default='geo', choices=FanConst.COORDS,
+                    help='geo or mag (AACGM, needs aacgmv2). Default: geo')
+parser.add_argument('--no-ground-scatter', action='store_true',
+                    help='Leave the ground scatter out')
+parser.add_argument('--start-time', type=time_of_day,
+                    help='First scan plotted, YYYYMMDD.HH:MM')
+parser.add_argument('--end-time', type=time_of_day,
+                    help='End of the scans plotted, YYYYMMDD.HH:MM')
+parser.add_argument('--image-extension', default='png',
+                    help='Image extension of the frames. Default: png')
+parser.add_argument('-n', '--num-proc', type=int, default=1,
+                    help='Number of processes rendering frames. Default: 1')
+parser.add_argument('--hdw-path',
+                    help='Directory of the hdw.dat files. Default:'
+                    ' $SD_HDWPATH')
+parser.add_argument('--fov-cache-path',
+                    help='Directory of the persisted field of view. Default:'
+                    ' {}'.format(FovConst.CACHE_PATH))
+arguments = parser.parse_args()
+
+frames = plot_fans(arguments.fitacf_files, arguments.plot_path,
+                   arguments.radar, parameter=arguments.parameter,
+                   coords=arguments.coords,
+                   ground_scatter=not arguments.no_ground_scatter,
+                   start_time=arguments.start_time,
+                   end_time=arguments.end_time,
+                   image_ext=arguments.image_extension,
+                   num_proc=arguments.num_proc,
+                   hdw_path=arguments.hdw_path,
+                   cache_path=arguments.fov_cache_path)
+print("{} frames written to {}".format(len(frames), arguments.plot_path))
+sys.exit(0)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+# Copyright 2018 SuperDARN Canada
+#
+# fitacf2rtiPlot.py
+#
+# Range-time intensity plot of one beam of fitacf files.
+
+import sys
+import argparse
+
+from datetime import datetime
+
+from DARNprocessing.plotting_scripts.summaryplots import plot_rti
+from DARNprocessing.utils.convectionMapConstants import FanConst, RtiConst
+
+
+def time_of_day(value):
+    return datetime.strptime(value, "%Y%m%d.%H:%M")
+
+
+parser = argparse.ArgumentParser(prog='fitacf2rtiPlot',
+                                 description='Renders the range-time'
+                                 ' intensity plot of a beam of fitacf files')
+parser.add_argument('radar', help='3-letter acronym of the radar')
+parser.add_argument('beam', type=int, help='Beam number')
+parser.add_argument('start_time', type=time_of_day,
+                    help='Start of the plot, YYYYMMDD.HH:MM')
+parser.add_argument('fitacf_files', nargs='+',
+                    help='fitacf files in time order, compressed or not')
+parser.add_argument('-o', '--output', default='rti.png',
+                    help='Image path, its extension gives the format.'
+                    ' Default: rti.png')
+parser.add_argument('-d', '--duration', type=float,
+                    default=RtiConst.DURATION,
+                    help='Hours plotted. Default: {}'
+                    ''.format(RtiConst.DURATION))
+parser.add_argument('--parameter', default='velocity',
+                    choices=sorted(FanConst.PARAMETERS),
+                    help='Parameter plotted. Default: velocity')
+parser.add_argument('--decimation', default='mean',
+                    choices=RtiConst.DECIMATIONS,
+                    help='How the cells of a pixel are combined.'
+                    ' Default: mean')
+parser.add_argument('--no-ground-scatter', action='store_true',
+                    help='Leave the ground scatter out')
+parser.add_argument('--channel', type=int,
+                    help='Channel of stereo files. Default: every channel')
+arguments = parser.parse_args()
+
+plot_rti(arguments.fitacf_files, arguments.output, arguments.radar,
+         arguments.beam, arguments.start_time, duration=arguments.duration,
+         parameter=arguments.parameter,
+         ground_scatter=not arguments.no_ground_scatter,
+         decimation=arguments.decimation, channel=arguments.channel)
+print("RTI plot written to {}".format(arguments.output))
+sys.exit(0)
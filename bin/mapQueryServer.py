@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+# Copyright 2018 SuperDARN Canada
+#
+# mapQueryServer.py
+#
+# Local HTTP endpoint evaluating the fitted potential and velocity of the map
+# files of a map path, see DARNprocessing.utils.mapquery for the protocol.
+
+import sys
+import signal
+import argparse
+
+from DARNprocessing.utils.mapquery import MapQueryServer
+from DARNprocessing.utils.convectionMapConstants import QueryConst
+
+parser = argparse.ArgumentParser(prog='mapQueryServer',
+                                 description='Serves the potential and'
+                                 ' velocity of the fitted map files over'
+                                 ' HTTP, e.g. GET /query?series=n'
+                                 '&start=2016-01-01T00:00&end=2016-01-01T06:00'
+                                 '&mlat=70,75&mlon=0,90')
+parser.add_argument('map_path',
+                    help='Directory of the map files')
+parser.add_argument('--host', default=QueryConst.HOST,
+                    help='Address to listen on. Default: {}'
+                    ''.format(QueryConst.HOST))
+parser.add_argument('--port', type=int, default=QueryConst.PORT,
+                    help='Port to listen on. Default: {}'
+                    ''.format(QueryConst.PORT))
+parser.add_argument('--record-cache', type=int,
+                    default=QueryConst.RECORD_CACHE,
+                    help='Number of decoded map records kept in memory.'
+                    ' Default: {}'.format(QueryConst.RECORD_CACHE))
+parser.add_argument('--grid-cache', type=int,
+                    default=QueryConst.GRID_CACHE,
+                    help='Number of evaluations of a record on a grid kept'
+                    ' in memory. Default: {}'.format(QueryConst.GRID_CACHE))
+parser.add_argument('--max-records', type=int,
+                    default=QueryConst.MAX_RECORDS,
+                    help='Most records evaluated by a query.'
+                    ' Default: {}'.format(QueryConst.MAX_RECORDS))
+arguments = parser.parse_args()
+
+server = MapQueryServer(arguments.map_path, arguments.host, arguments.port,
+                        arguments.record_cache, arguments.grid_cache,
+                        arguments.max_records)
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+try:
+    server.serve_forever()
+except (KeyboardInterrupt, SystemExit):
+    pass
+finally:
+    server.server_close()
@@ -6,7 +6,11 @@ setup(
     license="GNU",
     packages=find_packages(exclude=['docs', 'test']),
     author="SuperDARN Canada",
-    scripts=['./bin/fitdata2convectionPlots.py','./bin/fitdata2map.py','./bin/omniDataAvailability']
+    extras_require={'numpy': ['numpy'],
+                    'plots': ['numpy', 'matplotlib'],
+                    'aacgm': ['aacgmv2'],
+                    'zstd': ['zstandard']},
+    scripts=['./bin/fitdata2convectionPlots.py','./bin/fitdata2map.py','./bin/omniDataAvailability','./bin/convectionMapQueue.py','./bin/convectionMapDaemon.py','./bin/fitacf2fanPlots.py','./bin/fitacf2rtiPlot.py','./bin/mapQueryServer.py']
 )
 
 
@@ -3,6 +3,7 @@ from glob import glob
 import unittest
 import os
 import shutil
+import tempfile
 
 """
 Unit test suite for testing the ConvectionMaps class
@@ -249,6 +250,39 @@ class TestNorthData(unittest.TestCase):
         self.assertNotEqual(len(glob(self.plot_path+'20170301.*.pdf')),0)
 
 
+class TestIntegrationTimes(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.convec_map = ConvectionMaps(None, {'date': "20170301",
+                                                'integration_time': [60, 120, 60],
+                                                'data_path': self.path,
+                                                'plot_path': self.path,
+                                                'map_path': self.path,
+                                                'grid_path': self.path,
+                                                'logpath': self.path})
+
+    def tearDown(self):
+        self.convec_map.close()
+        shutil.rmtree(self.path)
+
+    def test_integration_times(self):
+        self.assertEqual(self.convec_map.integration_times, [60, 120])
+        self.assertEqual(ConvectionMaps._parse_integration_times('120'), [120])
+        self.assertRaises(ValueError, ConvectionMaps._parse_integration_times, [])
+
+    def test_file_names_per_integration_time(self):
+        with self.convec_map._resolution(120):
+            self.assertEqual(self.convec_map._map_path(),
+                             self.path + '/20170301.n.120s.map')
+            self.assertEqual(self.convec_map._grd_path(),
+                             self.path + '/20170301.n.120s.grd')
+            self.assertEqual(self.convec_map._resolution_name('map_fit'),
+                             'map_fit 120s')
+        # steps shared by the integration times keep their names
+        self.assertEqual(self.convec_map._resolution_name('omni'), 'omni')
+
+
 if __name__ == '__main__':
     unittest.main()
 
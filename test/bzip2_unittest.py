@@ -0,0 +1,78 @@
+import os
+import bz2
+import random
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+from DARNprocessing.utils.bzip2 import decompress_parallel, find_blocks
+
+"""
+Unit test suite for the block parallel bzip2 decompression
+"""
+
+
+class TestParallelBzip2(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        random_generator = random.Random(2018)
+        # level 1 uses 100k blocks, so this gives several blocks
+        self.data = bytes(random_generator.choice(b'0123456789 .\n')
+                          for _ in range(450000))
+        self.tmp_path = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp_path, 'output.fitacf')
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_path)
+
+    def write(self, name, content):
+        filename = os.path.join(self.tmp_path, name)
+        with open(filename, 'wb') as f:
+            f.write(content)
+        return filename
+
+    def read_output(self):
+        with open(self.output, 'rb') as f:
+            return f.read()
+
+    def test_finds_blocks(self):
+        compressed = bz2.compress(self.data, 1)
+        self.assertGreater(len(find_blocks(compressed)), 1)
+
+    def test_multi_block(self):
+        filename = self.write('single.bz2', bz2.compress(self.data, 1))
+        decompress_parallel(filename, self.output, 2)
+        self.assertEqual(self.read_output(), self.data)
+
+    def test_multi_stream(self):
+        filename = self.write('multi.bz2', bz2.compress(self.data, 1) +
+                              bz2.compress(self.data[:1000], 9))
+        decompress_parallel(filename, self.output, 2)
+        self.assertEqual(self.read_output(), self.data + self.data[:1000])
+
+    def test_one_process_is_serial(self):
+        filename = self.write('serial.bz2', bz2.compress(self.data, 1))
+        with mock.patch('DARNprocessing.utils.bzip2.find_blocks') as blocks:
+            decompress_parallel(filename, self.output, 1)
+        blocks.assert_not_called()
+        self.assertEqual(self.read_output(), self.data)
+
+    def test_empty_file(self):
+        filename = self.write('empty.bz2', bz2.compress(b''))
+        decompress_parallel(filename, self.output, 2)
+        self.assertEqual(self.read_output(), b'')
+
+    def test_corrupt_file_raises(self):
+        compressed = bytearray(bz2.compress(self.data, 1))
+        compressed[len(compressed) // 2] ^= 0xff
+        filename = self.write('corrupt.bz2', bytes(compressed))
+        with self.assertRaises((OSError, ValueError)):
+            decompress_parallel(filename, self.output, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
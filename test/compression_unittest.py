@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime
+
+from DARNprocessing.utils.compression import (available_compressions,
+                                              check_compression,
+                                              compress_file,
+                                              decompress_file,
+                                              detect_compression,
+                                              compressed_variants)
+from DARNprocessing.utils.convectionMapExceptions import UnsupportedTypeException
+from DARNprocessing.utils.dmap import read_dmap, write_dmap
+
+from test.records import map_record
+
+"""
+Unit test suite for the compression of the saved products
+"""
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.map_file = os.path.join(self.tmp_path, '20170301.n.map')
+        write_dmap(self.map_file,
+                   [map_record(datetime(2017, 3, 1, 3))] * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_round_trip(self):
+        with open(self.map_file, 'rb') as map_file:
+            data = map_file.read()
+        for compression in available_compressions():
+            compressed = '{}.{}'.format(self.map_file, compression)
+            compress_file(self.map_file, compressed, compression, level=1)
+            self.assertEqual(detect_compression(compressed), compression)
+            self.assertLess(os.path.getsize(compressed), len(data))
+
+            decompressed = os.path.join(self.tmp_path, 'decompressed')
+            decompress_file(compressed, decompressed)
+            with open(decompressed, 'rb') as map_file:
+                self.assertEqual(map_file.read(), data)
+        self.assertEqual(len(compressed_variants(self.map_file)),
+                         len(available_compressions()))
+
+    def test_transparent_dmap_reads(self):
+        compressed = self.map_file + '.gz'
+        compress_file(self.map_file, compressed, 'gz')
+        records = read_dmap(compressed)
+        self.assertEqual(len(records), 100)
+        self.assertEqual(records[0]['start.hour'], 3)
+        self.assertIsNone(detect_compression(self.map_file))
+
+    def test_unknown_compression(self):
+        with self.assertRaises(UnsupportedTypeException):
+            check_compression('xz')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+import threading
+
+from DARNprocessing.utils.daemon import (ConvectionMapDaemon,
+                                         ping,
+                                         send_request,
+                                         submit_job)
+
+"""
+Unit test suite for the convection map daemon
+"""
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.socket = os.path.join(self.tmp_path, 'daemon.sock')
+        self.server = ConvectionMapDaemon(self.socket)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_path)
+
+    def test_ping(self):
+        self.assertEqual(ping(self.socket)['pid'], os.getpid())
+        self.assertIsNone(ping(os.path.join(self.tmp_path, 'none.sock')))
+
+    def test_second_daemon(self):
+        with self.assertRaises(OSError):
+            ConvectionMapDaemon(self.socket)
+
+    def test_failed_job(self):
+        # no data for the date, the error comes back to the client
+        data_path = os.path.join(self.tmp_path, 'data')
+        os.mkdir(data_path)
+        # IMF data is there, nothing is downloaded
+        open(os.path.join(data_path, '20170301_imf.txt'), 'w').close()
+        reply = send_request({'command': 'run',
+                              'parameters': {'date': '20170301',
+                                             'data_path': 'data',
+                                             'plot_path': 'plot',
+                                             'map_path': 'map',
+                                             'imf_path': 'data',
+                                             'logpath': '.'},
+                              'cwd': self.tmp_path}, self.socket)
+        self.assertEqual(reply['status'], 'error')
+        self.assertIn('No grid files', reply['error'])
+        # relative paths are in the client's working directory
+        self.assertTrue(os.path.isdir(os.path.join(self.tmp_path, 'plot')))
+        self.assertEqual(ping(self.socket)['jobs_failed'], 1)
+
+    def test_invalid_arguments(self):
+        reply = submit_job(['--no-such-option'], path=self.socket)
+        self.assertEqual(reply['status'], 'error')
+        self.assertIsNone(submit_job(['--help'], path=self.socket))
+
+
+if __name__ == '__main__':
+    unittest.main()
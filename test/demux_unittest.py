@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from DARNprocessing.utils.dmap import (DmapFormatError,
+                                       read_dmap,
+                                       write_dmap,
+                                       read_scalar,
+                                       record_spans,
+                                       encode_record)
+from DARNprocessing.utils.demux import (channel_filename,
+                                        split_channels,
+                                        demultiplex)
+
+from test.records import fitacf_record
+
+"""
+Unit test suite for the fitacf channel demultiplexer
+"""
+
+
+class TestDemux(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def write(self, name, records):
+        # records: (beam, channel) of every record
+        filename = os.path.join(self.tmp_path, name)
+        write_dmap(filename, [fitacf_record(beam=beam, channel=channel)
+                              for beam, channel in records])
+        return filename
+
+    def test_read_scalar(self):
+        data = b''.join(encode_record(fitacf_record(beam=3, channel=channel))
+                        for channel in (1, 2))
+        spans = list(record_spans(data))
+        self.assertEqual(len(spans), 2)
+        self.assertEqual([read_scalar(data, start, 'channel')
+                          for start, end in spans], [1, 2])
+        self.assertEqual(read_scalar(data, 0, 'missing', 0), 0)
+
+    def test_split_stereo_file(self):
+        filename = self.write('20160101.0000.00.ksr.fitacf',
+                              [(0, 1), (0, 2), (1, 1), (1, 2)])
+        channels = split_channels(filename)
+        self.assertEqual(list(channels), [1, 2])
+        path, count = channels[1]
+        self.assertEqual(path, os.path.join(self.tmp_path,
+                                            '20160101.0000.00.ksr.a.channel'
+                                            '.fitacf'))
+        self.assertEqual(count, 2)
+        self.assertEqual([record['bmnum'] for record in read_dmap(path)],
+                         [0, 1])
+        self.assertEqual([record['channel']
+                          for record in read_dmap(channels[2][0])], [2, 2])
+
+    def test_split_a_file_whose_second_channel_starts_late(self):
+        filename = self.write('20160101.0000.00.ksr.fitacf',
+                              [(0, 1), (1, 1), (2, 1), (0, 2), (3, 1)])
+        channels = split_channels(filename)
+        self.assertEqual([count for path, count in channels.values()], [4, 1])
+        self.assertEqual([record['bmnum']
+                          for record in read_dmap(channels[1][0])],
+                         [0, 1, 2, 3])
+
+    def test_truncated_file_leaves_no_channel_files(self):
+        filename = self.write('20160101.0000.00.ksr.fitacf',
+                              [(0, 1), (0, 2)])
+        with open(filename, 'rb+') as fitacf_file:
+            fitacf_file.truncate(os.path.getsize(filename) - 4)
+        with self.assertRaises(DmapFormatError):
+            split_channels(filename)
+        self.assertEqual(os.listdir(self.tmp_path),
+                         ['20160101.0000.00.ksr.fitacf'])
+
+    def test_single_channel_file_is_not_copied(self):
+        filename = self.write('20160101.0000.00.sas.fitacf',
+                              [(0, 0), (1, 0)])
+        self.assertEqual(split_channels(filename), {0: (filename, 2)})
+        self.assertEqual(os.listdir(self.tmp_path),
+                         ['20160101.0000.00.sas.fitacf'])
+
+    def test_demultiplex_keeps_time_order(self):
+        first = self.write('20160101.0000.00.ksr.fitacf',
+                           [(0, 1), (0, 2)])
+        second = self.write('20160101.0200.00.ksr.fitacf',
+                            [(1, 1)])
+        channel_files = demultiplex([first, second])
+        self.assertEqual(channel_files[1], [channel_filename(first, 1), second])
+        self.assertEqual(channel_files[2], [channel_filename(first, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
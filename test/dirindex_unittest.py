@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from DARNprocessing.utils import dirindex
+from DARNprocessing.utils.dirindex import DirectoryIndex
+
+"""
+Unit test suite for the directory listing index
+"""
+
+
+class TestDirectoryIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        for name in ('20170301.0000.00.sas.fitacf.bz2',
+                     '20170301.0200.00.inv.fitacf.bz2',
+                     '.20170301.sas.fitacf.bz2'):
+            self.touch(name)
+        self.index = DirectoryIndex()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def touch(self, name):
+        open(os.path.join(self.tmp_path, name), 'w').close()
+
+    def test_glob(self):
+        pattern = os.path.join(self.tmp_path, '20170301*sas*.fitacf.bz2')
+        self.assertEqual(self.index.glob(pattern),
+                         [os.path.join(self.tmp_path,
+                                       '20170301.0000.00.sas.fitacf.bz2')])
+
+    def test_new_file_is_seen(self):
+        pattern = os.path.join(self.tmp_path, '*.fitacf.bz2')
+        self.assertEqual(len(self.index.glob(pattern)), 2)
+        self.touch('20170301.0400.00.sas.fitacf.bz2')
+        os.utime(self.tmp_path, ns=(0, os.stat(self.tmp_path).st_mtime_ns + 1))
+        self.assertEqual(len(self.index.glob(pattern)), 3)
+
+    def test_stable_listing_is_reused(self):
+        stable_ns = dirindex.STABLE_NS
+        dirindex.STABLE_NS = 0
+        try:
+            pattern = os.path.join(self.tmp_path, '*.fitacf.bz2')
+            self.index.glob(pattern)
+            mtime = os.stat(self.tmp_path).st_mtime_ns
+            self.touch('20170301.0400.00.sas.fitacf.bz2')
+            # same modification time: the cached listing is used
+            os.utime(self.tmp_path, ns=(mtime, mtime))
+            self.assertEqual(len(self.index.glob(pattern)), 2)
+        finally:
+            dirindex.STABLE_NS = stable_ns
+
+
+if __name__ == '__main__':
+    unittest.main()
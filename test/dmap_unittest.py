@@ -0,0 +1,93 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from datetime import datetime
+
+from DARNprocessing.utils.dmap import (DmapRecord,
+                                       DmapFormatError,
+                                       read_dmap,
+                                       write_dmap,
+                                       encode_record,
+                                       stream_records,
+                                       SHORT,
+                                       STRING)
+
+from test.records import map_record
+
+"""
+Unit test suite for the dmap reader and writer
+"""
+
+
+def format_record(hour):
+    # a map record with a string array and a two dimensional array, which
+    # RST only writes in other file types
+    record = map_record(datetime(2016, 1, 1, hour, 0, 30, 500000),
+                        vectors=[60.5, 61.5, 70.0])
+    record.set_array('names', ['sas', 'pgr'], STRING)
+    record.set_array('grid', range(6), SHORT, shape=(2, 3))
+    return record
+
+
+class TestDmap(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_path, 'test.map')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_round_trip(self):
+        write_dmap(self.filename, [format_record(0), format_record(1)])
+        records = read_dmap(self.filename)
+        self.assertEqual(len(records), 2)
+        record = records[1]
+        self.assertEqual(record['start.hour'], 1)
+        self.assertEqual(record['start.second'], 30.5)
+        self.assertEqual(record['source'], 'map_grd')
+        self.assertEqual(list(record['vector.mlat']), [60.5, 61.5, 70.0])
+        self.assertEqual(list(record['vector.stid']), [5, 5, 5])
+        self.assertEqual(record['names'], ['sas', 'pgr'])
+        self.assertEqual(record.shape('grid'), (2, 3))
+        self.assertEqual(record.arrays['grid'][1], (3, 2))
+        # the types are kept, so a record is written back unchanged
+        self.assertEqual(encode_record(record),
+                         encode_record(format_record(1)))
+
+    def test_record_layout(self):
+        record = DmapRecord()
+        record.set_scalar('a', 1, SHORT)
+        data = encode_record(record)
+        self.assertEqual(data, struct.pack('<iii', 0x00010001, 21, 1) +
+                         b'a\x00' + struct.pack('<bhi', SHORT, 1, 0))
+
+    def test_corrupt_files(self):
+        data = encode_record(format_record(0))
+        for corrupt in (data[:-1],
+                        b'\x00' + data[1:],
+                        data[:4] + struct.pack('<i', 10**6) + data[8:]):
+            with open(self.filename, 'wb') as f:
+                f.write(corrupt)
+            with self.assertRaises(DmapFormatError):
+                read_dmap(self.filename)
+
+    def test_stream_records(self):
+        records = [format_record(hour) for hour in range(3)]
+        write_dmap(self.filename, records)
+        # chunks smaller than a record
+        self.assertEqual(list(stream_records(self.filename, chunk_size=7)),
+                         [encode_record(record) for record in records])
+        with open(self.filename, 'ab') as f:
+            f.write(encode_record(records[0])[:-1])
+        with self.assertRaisesRegex(DmapFormatError,
+                                    'at byte {}'.format(3 * len(
+                                        encode_record(records[0])))):
+            list(stream_records(self.filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from DARNprocessing.utils.executor import (Command,
+                                           SerialExecutor,
+                                           PoolExecutor,
+                                           BatchExecutor,
+                                           kill_sessions,
+                                           make_executor)
+from DARNprocessing.utils.convectionMapConstants import ExecutorConst
+from DARNprocessing.utils.convectionMapExceptions import RSTTimeoutException
+
+"""
+Unit test suite for the RST command execution backends
+"""
+
+# stand-in for a batch cluster: jobs run in the background and are listed
+# while their process is alive
+SUBMIT = "#!/bin/sh\nsh \"$1\" > /dev/null 2>&1 &\necho \"Submitted batch job $!\"\n"
+STATUS = "#!/bin/sh\nkill -0 \"$1\" 2>/dev/null && echo \"$1\"\n"
+
+
+def alive(pid):
+    """
+    :return: True if the process runs, a killed orphan may be left a zombie
+    """
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat:
+            return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except IOError:
+        return False
+
+
+class TestExecutors(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.input_file = self.path('input.txt')
+        with open(self.input_file, 'w') as f:
+            f.write("b\na\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def path(self, name):
+        return os.path.join(self.tmp_path, name)
+
+    def script(self, name, content):
+        filename = self.path(name)
+        with open(filename, 'w') as f:
+            f.write(content)
+        os.chmod(filename, 0o755)
+        return filename
+
+    def read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def check_redirection(self, executor):
+        output = self.path('sorted.txt')
+        command = Command(['sort'], stdin=self.input_file, stdout=output)
+        self.assertEqual(executor.run(command), 0)
+        self.assertEqual(self.read(output), "a\nb\n")
+
+        error = self.path('error.txt')
+        command = Command(['sh', '-c', 'echo oops >&2; exit 3'], stderr=error)
+        self.assertEqual(executor.run(command), 3)
+        self.assertEqual(self.read(error), "oops\n")
+
+    def test_serial(self):
+        self.check_redirection(SerialExecutor())
+
+    def test_pool(self):
+        executor = PoolExecutor(4)
+        self.check_redirection(executor)
+        start_time = time.time()
+        futures = [executor.submit(Command(['sleep', '0.3']))
+                   for i in range(4)]
+        self.assertEqual([future.result() for future in futures], [0] * 4)
+        self.assertLess(time.time() - start_time, 1.0)
+        executor.shutdown()
+
+    def test_missing_program(self):
+        self.assertEqual(SerialExecutor().run(Command(['no-such-rst-program'])),
+                         127)
+
+    def test_shell_line(self):
+        command = Command(['map_grd', '-l', 50, 'a b.grd'],
+                          stdout='a b.map', stderr='/dev/null')
+        self.assertEqual(str(command),
+                         "map_grd -l 50 'a b.grd' > 'a b.map' 2> /dev/null")
+
+    def test_batch(self):
+        executor = BatchExecutor(self.path('jobs'),
+                                 [self.script('submit', SUBMIT)],
+                                 [self.script('status', STATUS)],
+                                 poll_interval=0.05)
+        self.check_redirection(executor)
+        # the job scripts are removed once the jobs finished
+        self.assertEqual(os.listdir(self.path('jobs')), [])
+        executor.shutdown()
+
+    def test_lost_batch_job(self):
+        # the "cluster" kills the job before the return value is written
+        submit = self.script('submit', "#!/bin/sh\necho 123\n")
+        status = self.script('status', "#!/bin/sh\nexit 1\n")
+        executor = BatchExecutor(self.path('jobs'), [submit], [status],
+                                 poll_interval=0.05)
+        self.assertEqual(executor.run(Command(['true'])),
+                         ExecutorConst.LOST_JOB)
+        executor.shutdown()
+
+    @unittest.skipUnless(os.path.isdir('/proc'), "needs /proc")
+    def test_timeout_kills_process_group(self):
+        pid_file = self.path('child.pid')
+        # the background child would outlive a kill of the shell alone
+        command = Command(['sh', '-c', 'sleep 30 & echo $! > {}; wait'
+                           ''.format(pid_file)], timeout=0.5)
+        start_time = time.time()
+        with self.assertRaises(RSTTimeoutException):
+            SerialExecutor().run(command)
+        self.assertLess(time.time() - start_time, 5.0)
+        child = int(self.read(pid_file))
+        time.sleep(0.1)
+        self.assertFalse(alive(child))
+
+    @unittest.skipUnless(os.path.isdir('/proc'), "needs /proc")
+    def test_kill_sessions(self):
+        pid_file = self.path('child.pid')
+        command = Command(['sh', '-c', 'sleep 30 & echo $! > {}; wait'
+                           ''.format(pid_file)], timeout=60)
+        executor = PoolExecutor(1)
+        future = executor.submit(command)
+        while not os.path.exists(pid_file) or not self.read(pid_file):
+            time.sleep(0.05)
+        kill_sessions()
+        # killed by SIGKILL
+        self.assertEqual(future.result(timeout=5), -9)
+        executor.shutdown()
+        time.sleep(0.1)
+        self.assertFalse(alive(int(self.read(pid_file))))
+
+    def test_stalled_output_is_killed(self):
+        output = self.path('grid.txt')
+        command = Command(['sh', '-c', 'echo record; sleep 30'],
+                          stdout=output, stall_timeout=1)
+        with self.assertRaises(RSTTimeoutException) as context:
+            SerialExecutor().run(command)
+        self.assertIn('did not grow', str(context.exception))
+        # a command writing steadily is not a stall
+        command = Command(['sh', '-c', 'for i in 1 2 3; do echo $i;'
+                           ' sleep 0.6; done'], stdout=output,
+                          stall_timeout=1)
+        self.assertEqual(SerialExecutor().run(command), 0)
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            make_executor('grid-engine')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from DARNprocessing.utils.filecache import (FileCache,
+                                            file_fingerprint,
+                                            content_fingerprint)
+
+"""
+Unit test suite for the shared file cache
+"""
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp_path, 'cache')
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def producer(self, content):
+        def produce(filename):
+            self.calls.append(filename)
+            with open(filename, 'wb') as f:
+                f.write(content)
+        return produce
+
+    def test_fetch_produces_once(self):
+        cache = FileCache(self.cache_path)
+        key = cache.key('20170301.rkn.fitacf.bz2', 10, 1)
+        for name in ['first.fitacf', 'second.fitacf']:
+            destination = os.path.join(self.tmp_path, name)
+            cache.fetch(key, destination, self.producer(b'data'))
+            with open(destination, 'rb') as f:
+                self.assertEqual(f.read(), b'data')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_failed_producer_leaves_no_entry(self):
+        cache = FileCache(self.cache_path)
+
+        def fail(filename):
+            raise RuntimeError("decompression failed")
+
+        with self.assertRaises(RuntimeError):
+            cache.store('key', fail)
+        self.assertEqual(cache.entries(), [])
+
+    def test_lru_eviction(self):
+        cache = FileCache(self.cache_path, max_bytes=20)
+        for key in ['a', 'b', 'c']:
+            entry = cache.store(key, self.producer(b'0123456789'))
+            os.utime(entry, (len(self.calls), len(self.calls)))
+            # touching 'a' makes 'b' the least recently used entry
+            if key == 'b':
+                os.utime(cache.entry_path('a'), (10, 10))
+        self.assertIsNotNone(cache.lookup('a'))
+        self.assertIsNone(cache.lookup('b'))
+        self.assertIsNotNone(cache.lookup('c'))
+
+    def test_fetch_an_entry_over_the_budget(self):
+        cache = FileCache(self.cache_path, max_bytes=5)
+        destination = os.path.join(self.tmp_path, 'large.fitacf')
+        cache.fetch('key', destination, self.producer(b'0123456789'))
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+
+    def test_fetch_an_entry_evicted_meanwhile(self):
+        cache = FileCache(self.cache_path)
+        destination = os.path.join(self.tmp_path, 'data.fitacf')
+        store = cache.store
+
+        def evicted_store(key, producer):
+            # another process evicts the entry after it was stored
+            entry = store(key, producer)
+            if len(self.calls) == 1:
+                os.remove(entry)
+            return entry
+
+        cache.store = evicted_store
+        cache.fetch('key', destination, self.producer(b'data'))
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_discard_keeps_the_linked_files(self):
+        cache = FileCache(self.cache_path)
+        destination = os.path.join(self.tmp_path, 'data.fitacf')
+        cache.fetch('key', destination, self.producer(b'data'))
+        cache.discard('key')
+        cache.discard('key')
+        self.assertIsNone(cache.lookup('key'))
+        self.assertTrue(os.path.exists(destination))
+        cache.fetch('key', destination, self.producer(b'data'))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_entries_get_the_default_permissions(self):
+        umask = os.umask(0o022)
+        try:
+            entry = FileCache(self.cache_path).store('key',
+                                                     self.producer(b'data'))
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(entry).st_mode & 0o777, 0o644)
+
+    def test_fingerprint_changes_with_content(self):
+        filename = os.path.join(self.tmp_path, 'data.fitacf.bz2')
+        with open(filename, 'wb') as f:
+            f.write(b'abc')
+        first = file_fingerprint(filename)
+        with open(filename, 'wb') as f:
+            f.write(b'abcd')
+        self.assertNotEqual(first, file_fingerprint(filename))
+
+    def test_content_fingerprint_ignores_rewrites(self):
+        filename = os.path.join(self.tmp_path, '20170301.n.empty.map')
+        with open(filename, 'wb') as f:
+            f.write(b'map')
+        first = content_fingerprint(filename, block_size=2)
+        os.utime(filename, (0, 0))
+        self.assertEqual(first, content_fingerprint(filename))
+        with open(filename, 'wb') as f:
+            f.write(b'maps')
+        self.assertNotEqual(first, content_fingerprint(filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
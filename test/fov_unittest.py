@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+Unit test suite for the radar field-of-view geometry
+"""
+
+NEW_LAYOUT = """# station date time lat lon alt boresight shift beam sep ...
+5 19930901 00:00:00 52.160 -106.530 489.0 23.1 0.0 3.24 1.0 1 0.0 0.0 0.0 -100.0 0.0 0.0 0.0 0 75 16
+5 20150101 00:00:00 52.160 -106.530 489.0 23.1 0.0 3.24 1.0 1 0.0 0.0 0.0 -100.0 0.0 0.0 0.0 0 110 16
+"""
+
+OLD_LAYOUT = """5 2999 0 52.160 -106.530 489.0 23.1 3.24 1.0 20 0.0 0.0 0.0 -100.0 0.0 0.0 0 110 16
+5 2014 31535999 52.160 -106.530 489.0 23.1 3.24 1.0 20 0.0 0.0 0.0 -100.0 0.0 0.0 0 75 16
+"""
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestFov(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def write_hardware(self, text):
+        filename = os.path.join(self.tmp_path, 'hdw.dat.sas')
+        with open(filename, 'w') as hardware_file:
+            hardware_file.write(text)
+        return filename
+
+    def test_read_both_layouts(self):
+        from DARNprocessing.utils.fov import read_hardware, hardware_config
+        for text in (NEW_LAYOUT, OLD_LAYOUT):
+            configs = read_hardware(self.write_hardware(text))
+            self.assertEqual(len(configs), 2)
+            self.assertEqual(hardware_config(configs,
+                                             datetime(2010, 1, 1)).max_gates,
+                             75)
+            config = hardware_config(configs, datetime(2016, 1, 1))
+            self.assertEqual(config.max_gates, 110)
+            self.assertEqual(config.max_beams, 16)
+            self.assertAlmostEqual(config.beam_separation, 3.24)
+
+    def test_corners_along_the_boresight(self):
+        from DARNprocessing.utils.fov import read_hardware, gate_corners
+        config = read_hardware(self.write_hardware(NEW_LAYOUT))[-1]
+        config = config._replace(boresight=0.0, latitude=50.0)
+        latitude, longitude = gate_corners(config, 180, 45, 75)
+        self.assertEqual(latitude.shape, (17, 76))
+        # the middle beam edge points north: the longitude does not change
+        # and the latitude grows with the range
+        self.assertTrue(np.allclose(longitude[8], config.longitude))
+        self.assertTrue(np.all(np.diff(latitude[8]) > 0))
+        self.assertTrue(np.allclose(latitude[0], latitude[16]))
+
+    def test_virtual_height(self):
+        from DARNprocessing.utils.fov import virtual_height
+        np.testing.assert_allclose(virtual_height([0, 75, 180, 600, 700,
+                                                   800, 2000]),
+                                   [0, 57.5, 115, 115, 207.5, 300, 300])
+        np.testing.assert_allclose(virtual_height([75, 1000], 110),
+                                   [57.5, 110])
+
+    def test_corners_persisted(self):
+        from DARNprocessing.utils.fov import read_hardware, fov_corners
+        config = read_hardware(self.write_hardware(NEW_LAYOUT))[-1]
+        cache_path = os.path.join(self.tmp_path, 'fov')
+        latitude, longitude = fov_corners(config, 180, 45, 75,
+                                          cache_path=cache_path)
+        files = os.listdir(cache_path)
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('.geo.npz'))
+        fov_corners.cache_clear()
+        cached_latitude, cached_longitude = fov_corners(config, 180, 45, 75,
+                                                        cache_path=cache_path)
+        self.assertTrue(np.array_equal(latitude, cached_latitude))
+        self.assertTrue(np.array_equal(longitude, cached_longitude))
+
+
+if __name__ == '__main__':
+    unittest.main()
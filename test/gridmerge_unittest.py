@@ -0,0 +1,147 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from unittest import mock
+
+from datetime import datetime
+
+from DARNprocessing.utils.dmap import read_dmap, write_dmap, encode_record
+from DARNprocessing.utils.gridmerge import (GridCombiner,
+                                            GridStream,
+                                            merge_grid_files)
+from DARNprocessing.utils.convectionMapConstants import CombineConst
+
+from test.records import grid_record
+
+"""
+Unit test suite for the streaming grid file combiner
+"""
+
+
+def at(minute):
+    return datetime(2017, 3, 1, 0, minute)
+
+
+class TestGridMerge(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp_path, 'combined.grd')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def grid_file(self, name, records):
+        path = os.path.join(self.tmp_path, name)
+        write_dmap(path, records)
+        return path
+
+    def test_merge(self):
+        sas = self.grid_file('sas.grid', [grid_record(at(0), 5, [60.5]),
+                                          grid_record(at(2), 5, [61.5, 62.5])])
+        pgr = self.grid_file('pgr.grid', [grid_record(at(2), 64, [70.5]),
+                                          grid_record(at(4), 64, [71.5])])
+        self.assertEqual(merge_grid_files([sas, pgr], self.output), 3)
+        records = read_dmap(self.output)
+        self.assertEqual([record['start.minute'] for record in records],
+                         [0, 2, 4])
+        self.assertEqual(list(records[1]['stid']), [5, 64])
+        self.assertEqual(list(records[1]['vector.mlat']), [61.5, 62.5, 70.5])
+        self.assertEqual(records[1].arrays['vector.mlat'][1], (3,))
+
+    def test_merge_a_radar_without_vectors(self):
+        sas = self.grid_file('sas.grid', [grid_record(at(0), 5)])
+        pgr = self.grid_file('pgr.grid', [grid_record(at(0), 64, [70.5])])
+        kod = self.grid_file('kod.grid', [grid_record(at(0), 7)])
+        self.assertEqual(merge_grid_files([sas, pgr, kod], self.output), 1)
+        record, = read_dmap(self.output)
+        self.assertEqual(list(record['stid']), [5, 64, 7])
+        self.assertEqual(list(record['vector.mlat']), [70.5])
+        self.assertEqual(record.arrays['vector.mlat'][1], (1,))
+
+    def test_read_in_chunks(self):
+        records = [grid_record(at(minute), 5, [60.5] * 100)
+                   for minute in range(0, 20, 2)]
+        path = self.grid_file('sas.grid', records)
+        with mock.patch.object(CombineConst, 'READ_SIZE', 64):
+            stream = GridStream(path)
+            minutes = []
+            for record in stream:
+                minutes.append(record['start.minute'])
+                self.assertLess(len(stream._buffer),
+                                2 * len(encode_record(records[0])))
+        self.assertEqual(minutes, list(range(0, 20, 2)))
+
+    def test_follow_a_file_being_written(self):
+        path = os.path.join(self.tmp_path, 'sas.grid')
+        stream = GridStream(path, complete=False, interval=0.01)
+        data = b''.join(encode_record(grid_record(at(minute), 5, [60.5]))
+                        for minute in range(0, 10, 2))
+
+        def writer():
+            with open(path, 'wb') as grid:
+                for start in range(0, len(data), 50):
+                    grid.write(data[start:start + 50])
+                    grid.flush()
+                    time.sleep(0.005)
+            stream.finish()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        minutes = [record['start.minute'] for record in stream]
+        thread.join()
+        self.assertEqual(minutes, [0, 2, 4, 6, 8])
+
+    def test_combiner_waits_for_producers(self):
+        sas = self.grid_file('sas.grid', [grid_record(at(0), 5, [60.5])])
+        pgr = os.path.join(self.tmp_path, 'pgr.grid')
+        combiner = GridCombiner(['sas', 'pgr', 'kod'])
+        combiner.declare('sas', [sas], complete=True)
+        self.assertIsNone(combiner.wait_declared(timeout=0.01))
+
+        result = []
+        merge = threading.Thread(target=lambda: result.append(
+            combiner.merge(self.output)))
+        merge.start()
+        combiner.declare('pgr', [pgr])
+        # kod failed before declaring its files
+        combiner.close('kod')
+        write_dmap(pgr, [grid_record(at(0), 64, [70.5])])
+        combiner.finish(pgr)
+        merge.join()
+        self.assertEqual(result, [1])
+        record, = read_dmap(self.output)
+        # in the order of the file names, like combine_grid of sorted files
+        self.assertEqual(list(record['stid']), [64, 5])
+
+    def test_combiner_drops_a_failed_producer(self):
+        sas = self.grid_file('sas.grid', [grid_record(at(minute), 5, [60.5])
+                                          for minute in (0, 2, 4)])
+        pgr = os.path.join(self.tmp_path, 'pgr.grid')
+        combiner = GridCombiner(['sas', 'pgr'])
+        combiner.declare('sas', [sas], complete=True)
+        combiner.declare('pgr', [pgr])
+
+        result = []
+        merge = threading.Thread(target=lambda: result.append(
+            combiner.merge(self.output)))
+        with self.assertLogs('DARNprocessing.utils.gridmerge', 'WARNING'):
+            merge.start()
+            write_dmap(pgr, [grid_record(at(0), 64, [70.5])])
+            # the merge reads the first records of pgr before it times out
+            time.sleep(0.2)
+            os.remove(pgr)
+            combiner.finish(pgr, failed=True)
+            merge.join()
+        self.assertEqual(result, [3])
+        records = read_dmap(self.output)
+        self.assertEqual([list(record['stid']) for record in records],
+                         [[5], [5], [5]])
+
+
+if __name__ == '__main__':
+    unittest.main()
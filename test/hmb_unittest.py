@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from DARNprocessing.utils.dmap import read_dmap, write_dmap
+
+from test.records import map_record
+
+"""
+Unit test suite for the numpy Heppner-Maynard boundary estimate
+"""
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestHMB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_lowest_latitude_with_enough_vectors(self):
+        from DARNprocessing.utils.hmb import hmb_latitudes
+        records = [
+            # a single fast vector at 55 is not enough, three at 58 are
+            map_record(vectors=[55.5, 58.2, 58.5, 58.9, 70],
+                       velocities=[500, 300, -300, 200, 800], mlt_av=0),
+            # slow vectors do not count
+            map_record(vectors=[55.5, 55.6, 55.7, 65.1, 65.2, 65.3],
+                       velocities=[50, 50, 50, 400, 400, 400], mlt_av=0),
+            # no vectors
+            map_record(),
+            # at noon the boundary is poleward of its midnight latitude
+            map_record(vectors=[70.5, 70.5, 70.5],
+                       velocities=[200, 200, 200], mlt_av=12)]
+        latitudes = hmb_latitudes(records)
+        self.assertEqual(list(latitudes[:3]), [58, 65, 62])
+        self.assertLess(latitudes[3], 70)
+
+    def test_add_hmb(self):
+        from DARNprocessing.utils.hmb import add_hmb
+        map_file = os.path.join(self.tmp_path, 'empty.map')
+        hmb_file = os.path.join(self.tmp_path, 'hmb.map')
+        write_dmap(map_file, [map_record(vectors=[60.5] * 3,
+                                         velocities=[200] * 3, mlt_av=0)])
+        add_hmb(map_file, hmb_file)
+        record, = read_dmap(hmb_file)
+        self.assertEqual(record['latmin'], 60)
+        self.assertEqual(record['boundary.mlat'][0], 60)
+        self.assertEqual(len(record['boundary.mlon']), 72)
+
+
+if __name__ == '__main__':
+    unittest.main()
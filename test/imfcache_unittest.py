@@ -0,0 +1,81 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from datetime import datetime, timedelta
+from unittest import mock
+
+from DARNprocessing.IMF_scripts.omni import Omni
+from DARNprocessing.IMF_scripts.imfcache import IMFCache
+
+"""
+Unit test suite for the single-flight IMF cache
+"""
+
+OMNI_DATA = "2017 60 0 0 5.0 1.0 2.0 3.0\n2017 60 0 1 5.0 1.0 2.0 -3.0\n"
+
+
+class TestIMFCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.downloads = []
+
+        def download(omni):
+            self.downloads.append(omni.date)
+            time.sleep(0.2)
+            with open(omni.omni_path, 'w') as omni_file:
+                omni_file.write(OMNI_DATA)
+
+        self.patches = [mock.patch.object(Omni, 'get_omni_file', download),
+                        mock.patch.object(Omni, 'get_data_avialability',
+                                          return_value=datetime(2017, 3, 2))]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.tmp_path)
+
+    def test_single_download(self):
+        results = []
+
+        def fetch():
+            results.append(IMFCache(self.tmp_path).imf_file('20170301'))
+
+        threads = [threading.Thread(target=fetch) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        imf_path = os.path.join(self.tmp_path, '20170301_imf.txt')
+        self.assertEqual(self.downloads, ['20170301'])
+        self.assertEqual(results, [imf_path] * 4)
+        with open(imf_path) as imf_file:
+            self.assertEqual(imf_file.readline(),
+                             "2017 03 01 0 0 00 1.0 2.0 3.0\n")
+
+    def test_outdated_file_archived(self):
+        omni_path = os.path.join(self.tmp_path, '20170301_omni.txt')
+        with open(omni_path, 'w') as omni_file:
+            omni_file.write(OMNI_DATA)
+        # downloaded before the data was last updated
+        old_time = time.mktime((datetime(2017, 3, 1) -
+                                timedelta(days=1)).timetuple())
+        os.utime(omni_path, (old_time, old_time))
+
+        IMFCache(self.tmp_path).imf_file('20170301', datetime(2017, 3, 5))
+        self.assertEqual(self.downloads, ['20170301'])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_path,
+                                                    '20170301_omni_20170305'
+                                                    '.txt')))
+        self.assertTrue(os.path.exists(omni_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
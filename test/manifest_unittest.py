@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from DARNprocessing.utils.manifest import RunManifest
+
+"""
+Unit test suite for the run manifest used to resume convection map runs
+"""
+
+
+class TestRunManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.manifest_path = os.path.join(self.tmp_path, 'manifest.json')
+        self.grd = self.write('20170301.n.grd', 'grd')
+        self.empty_map = self.write('20170301.n.empty.map', 'map')
+        manifest = RunManifest(self.manifest_path, load=False)
+        manifest.record('map_grd', [self.grd], [self.empty_map], '-l 50')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def write(self, name, content):
+        filename = os.path.join(self.tmp_path, name)
+        with open(filename, 'w') as f:
+            f.write(content)
+        return filename
+
+    def test_completed_stage_is_reloaded(self):
+        manifest = RunManifest(self.manifest_path)
+        self.assertIsNotNone(manifest.completed('map_grd', [self.grd], '-l 50'))
+
+    def test_new_manifest_ignores_previous_run(self):
+        manifest = RunManifest(self.manifest_path, load=False)
+        self.assertIsNone(manifest.completed('map_grd', [self.grd], '-l 50'))
+
+    def test_changed_options(self):
+        manifest = RunManifest(self.manifest_path)
+        self.assertIsNone(manifest.completed('map_grd', [self.grd], '-l 60'))
+
+    def test_changed_input(self):
+        self.write('20170301.n.grd', 'new grd')
+        manifest = RunManifest(self.manifest_path)
+        self.assertIsNone(manifest.completed('map_grd', [self.grd], '-l 50'))
+
+    def test_missing_output(self):
+        os.remove(self.empty_map)
+        manifest = RunManifest(self.manifest_path)
+        self.assertIsNone(manifest.completed('map_grd', [self.grd], '-l 50'))
+
+    def test_result_is_kept(self):
+        manifest = RunManifest(self.manifest_path)
+        manifest.record('map_plot', [self.empty_map], [], result=['a.ps'])
+        entry = RunManifest(self.manifest_path).completed('map_plot',
+                                                          [self.empty_map])
+        self.assertEqual(entry['result'], ['a.ps'])
+
+    def test_stage_with_a_missing_output_is_not_recorded(self):
+        manifest = RunManifest(self.manifest_path)
+        missing = os.path.join(self.tmp_path, '20170301.n.hmb.map')
+        self.assertFalse(manifest.record('map_addhmb', [self.empty_map],
+                                         [missing]))
+        self.assertIsNone(RunManifest(self.manifest_path).completed(
+            'map_addhmb', [self.empty_map]))
+        # recorded again after its output went missing
+        os.remove(self.empty_map)
+        self.assertFalse(manifest.record('map_grd', [self.grd],
+                                         [self.empty_map], '-l 50'))
+        self.assertNotIn('map_grd', RunManifest(self.manifest_path).stages)
+
+    def test_stages_are_appended(self):
+        manifest = RunManifest(self.manifest_path)
+        manifest.record('map_addhmb', [self.empty_map], [self.grd])
+        manifest.invalidate('map_grd')
+        with open(self.manifest_path) as manifest_file:
+            self.assertEqual(len(manifest_file.readlines()), 3)
+        # a line cut short by a killed run is ignored
+        with open(self.manifest_path, 'a') as manifest_file:
+            manifest_file.write('{"stage": "map_addim')
+        self.assertEqual(list(RunManifest(self.manifest_path).stages),
+                         ['map_addhmb'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import bz2
+import json
+import shutil
+import tempfile
+import unittest
+import threading
+
+from datetime import datetime
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from DARNprocessing.utils.dmap import encode_record
+
+from test.records import map_record
+
+"""
+Unit test suite for the queries of the map archive
+"""
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestMapQuery(unittest.TestCase):
+
+    def setUp(self):
+        from DARNprocessing.utils.mapquery import MapQuery
+        self.tmp_path = tempfile.mkdtemp()
+        self.records = {}
+        for name, day in (('20160101.n.map', 1),
+                          ('20160102.n.map.bz2', 2),
+                          ('20160101.s.map', 1)):
+            records = [map_record(datetime(2016, 1, day, hour),
+                                  [0, 0, 0, 1000.0 * (hour + day)])
+                       for hour in range(3)]
+            self.records[name] = records
+            data = b''.join(encode_record(record) for record in records)
+            opener = bz2.open if name.endswith('.bz2') else open
+            with opener(os.path.join(self.tmp_path, name), 'wb') as map_file:
+                map_file.write(data)
+        self.query = MapQuery(self.tmp_path)
+        self.mlat = np.array([70.0, 75.0])
+        self.mlon = np.array([90.0, 45.0])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_locate(self):
+        self.assertEqual([os.path.basename(map_file)
+                          for map_file in self.query.files('n')],
+                         ['20160101.n.map', '20160102.n.map.bz2'])
+        located = self.query.locate('n', datetime(2016, 1, 1, 1),
+                                    datetime(2016, 1, 2, 0))
+        self.assertEqual([key[1] for key, start, end in located], [1, 2, 0])
+        self.assertEqual(located[0][1],
+                         (datetime(2016, 1, 1, 1) -
+                          datetime(1970, 1, 1)).total_seconds())
+
+    def test_evaluate_batches_and_caches(self):
+        from DARNprocessing.utils.potential import evaluate_records
+        columns = self.query.evaluate('n', None, None, self.mlat, self.mlon)
+        records = self.records['20160101.n.map'] + \
+            self.records['20160102.n.map.bz2']
+        expected = evaluate_records(records, self.mlat, self.mlon)
+        self.assertEqual(columns['potential'].shape, (6, 2))
+        for name, values in zip(['potential', 'velocity.north',
+                                 'velocity.east'], expected):
+            np.testing.assert_allclose(columns[name], values)
+
+        # the same grid again is answered from the cache
+        self.query.evaluate('n', datetime(2016, 1, 2), None, self.mlat,
+                            self.mlon)
+        self.assertEqual(self.query.grids.stats()['hits'], 3)
+        self.assertEqual(self.query.records.stats()['entries'], 6)
+        # another grid only decodes the records again from the cache
+        self.query.evaluate('n', datetime(2016, 1, 2), None, [80.0], [0.0])
+        self.assertEqual(self.query.records.stats()['hits'], 3)
+
+    def test_max_records(self):
+        from DARNprocessing.utils.mapquery import MapQuery
+        query = MapQuery(self.tmp_path, max_records=5)
+        with self.assertRaises(ValueError):
+            query.evaluate('n', None, None, self.mlat, self.mlon)
+        self.assertEqual(len(query.grids), 0)
+        columns = query.evaluate('n', datetime(2016, 1, 2), None, self.mlat,
+                                 self.mlon)
+        self.assertEqual(columns['potential'].shape, (3, 2))
+
+    def test_file_index_bounded(self):
+        from DARNprocessing.utils.mapquery import MapQuery
+        query = MapQuery(self.tmp_path, file_index=1)
+        query.locate('n')
+        self.assertEqual(query.stats()['files_indexed'], 1)
+        located = query.locate('n', datetime(2016, 1, 1), datetime(2016, 1, 1))
+        self.assertEqual([key[1] for key, start, end in located], [0])
+
+    def test_http(self):
+        from DARNprocessing.utils.mapquery import MapQueryServer
+        server = MapQueryServer(self.tmp_path, port=0, max_records=5)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = "http://127.0.0.1:{}".format(server.server_address[1])
+            with urlopen(url + "/query?series=s&start=20160101&end="
+                         "2016-01-01T01:00&mlat=70,50&mlon=90,90") as reply:
+                reply = json.loads(reply.read().decode())
+            self.assertEqual(reply['status'], 'ok')
+            self.assertEqual(len(reply['potential']), 2)
+            # equatorward of the boundary
+            self.assertEqual(reply['potential'][0][1], 0)
+            with urlopen(url + "/ping") as reply:
+                self.assertEqual(json.loads(reply.read().decode())
+                                 ['files_indexed'], 1)
+            # the whole archive is more than max_records
+            with self.assertRaises(HTTPError) as context:
+                urlopen(url + "/query?series=n&mlat=70&mlon=0")
+            self.assertEqual(context.exception.code, 400)
+            context.exception.close()
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
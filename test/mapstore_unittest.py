@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from DARNprocessing.utils.dmap import write_dmap
+
+from test.records import map_record
+
+"""
+Unit test suite for the columnar export of map fit results
+"""
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestMapStore(unittest.TestCase):
+
+    def setUp(self):
+        from DARNprocessing.utils.mapstore import MapStore
+        self.tmp_path = tempfile.mkdtemp()
+        self.store = MapStore(os.path.join(self.tmp_path, 'store'))
+        for day, order_coefficients in ((1, [1.0, 2.0, 3.0, 4.0]),
+                                        (2, [1.0] * 9)):
+            records = [map_record(datetime(2016, 1, day, hour),
+                                  order_coefficients, vectors=[70.0, 71.0],
+                                  potential_drop=1000.0 * hour)
+                       for hour in range(3)]
+            map_file = os.path.join(self.tmp_path,
+                                    '2016010{}.n.map'.format(day))
+            write_dmap(map_file, records)
+            self.assertEqual(self.store.export(map_file, 'n'), 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_read_all(self):
+        columns = self.store.read('n')
+        self.assertEqual(self.store.series(), ['n'])
+        np.testing.assert_array_equal(columns['pot.drop'],
+                                      [0, 1000, 2000] * 2)
+        np.testing.assert_array_equal(columns['vector.count'], [2] * 6)
+        self.assertEqual(columns['N+2'].shape, (6, 9))
+        np.testing.assert_array_equal(columns['N+2'][0, :4],
+                                      [1.0, 2.0, 3.0, 4.0])
+        self.assertTrue(np.isnan(columns['N+2'][0, 4]))
+        np.testing.assert_array_equal(columns['N+3'][5], [1.0] * 9)
+        np.testing.assert_array_equal(columns['pot.max'],
+                                      [0, 500, 1000] * 2)
+        self.assertEqual(columns['end.time'][0] - columns['start.time'][0],
+                         120)
+
+    def test_time_range_reads_needed_chunks(self):
+        chunks = self.store.chunks('n', datetime(2016, 1, 2, 1),
+                                   datetime(2016, 1, 2, 5))
+        self.assertEqual([name for name, entry in chunks],
+                         ['n/2016/20160102.npz'])
+        # the chunk of the first day is not opened
+        os.remove(os.path.join(self.store.path, 'n/2016/20160101.npz'))
+        columns = self.store.read('n', datetime(2016, 1, 2, 1),
+                                  datetime(2016, 1, 2, 5),
+                                  variables=['latmin'])
+        self.assertEqual(list(columns), ['start.time', 'latmin'])
+        np.testing.assert_array_equal(columns['latmin'], [60.0, 60.0])
+        with self.assertRaises(KeyError):
+            self.store.read('n', variables=['vector.mlat'])
+
+    def test_export_again_replaces_chunk(self):
+        map_file = os.path.join(self.tmp_path, '20160101.n.map')
+        record = map_record(datetime(2016, 1, 1), [1.0], potential_drop=5.0)
+        # a map file without the scalar, e.g. of an older RST
+        record.remove('pot.max')
+        write_dmap(map_file, [record])
+        self.store.export(map_file, 'n')
+        columns = self.store.read('n', end=datetime(2016, 1, 1, 23))
+        self.assertEqual(len(columns['pot.drop']), 1)
+        self.assertTrue(np.isnan(columns['pot.max']).all())
+        self.assertEqual(self.store.read('s')['pot.drop'].size, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
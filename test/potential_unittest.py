@@ -0,0 +1,86 @@
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from test.records import map_record
+
+"""
+Unit test suite for the spherical harmonic potential evaluator
+"""
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestPotential(unittest.TestCase):
+
+    def test_indices(self):
+        from DARNprocessing.utils.potential import (legendre_index,
+                                                    coefficient_count,
+                                                    fit_order)
+        self.assertEqual([legendre_index(2, m) for m in range(3)], [4, 5, 7])
+        self.assertEqual(coefficient_count(8), 81)
+        self.assertEqual(fit_order(81), 8)
+        with self.assertRaises(ValueError):
+            fit_order(80)
+
+    def test_legendre(self):
+        from DARNprocessing.utils.potential import legendre
+        x = np.linspace(-1, 1, 7)
+        sine = np.sqrt(1 - x**2)
+        table, derivative = legendre(2, x)
+        np.testing.assert_allclose(table[2, 0], (3 * x**2 - 1) / 2)
+        np.testing.assert_allclose(table[2, 1], -3 * x * sine)
+        np.testing.assert_allclose(table[2, 2], 3 * sine**2)
+        np.testing.assert_allclose(derivative[2, 1], 3 - 6 * x**2)
+
+    def test_single_harmonic(self):
+        from DARNprocessing.utils.potential import evaluate
+        # only B_11: Phi = P_1^1(cos theta') sin(phi) = -sin(theta') sin(phi)
+        coefficients = [0, 0, 0, 1000.0]
+        mlat = np.array([75.0, 70.0, 50.0])
+        mlon = np.array([90.0, 45.0, 90.0])
+        potential, north, east = evaluate(coefficients, 60.0, mlat, mlon)
+        # theta' = theta pi / theta_max, theta_max = 30 degrees
+        theta_prime = np.radians(90 - mlat) * 180 / (90 - 60.0)
+        expected = -1000 * np.sin(theta_prime) * np.sin(np.radians(mlon))
+        expected[2] = 0
+        np.testing.assert_allclose(potential, expected, atol=1e-9)
+        self.assertEqual((north[2], east[2]), (0, 0))
+        self.assertNotEqual(east[0], 0)
+
+    def test_pydarn_reference(self):
+        from DARNprocessing.utils.potential import evaluate_records
+        record = map_record(coefficients=[1000.0, -2000.0, 3000.0, 500.0,
+                                          1500.0, -700.0, 800.0, 250.0,
+                                          -400.0], latmin=62.5)
+        mlat = np.array([63.0, 70.0, 77.5, 85.0, 89.0, 55.0])
+        mlon = np.array([0.0, 45.0, 130.0, 200.0, 310.0, 90.0])
+        potential = evaluate_records([record], mlat, mlon)[0][0]
+        # pydarn 3.1 Maps.calculate_potentials of the same coefficients
+        # (in V, before its conversion to kV)
+        np.testing.assert_allclose(potential,
+                                   [4200.89209639, 73.83001876,
+                                    2121.65542772, 1194.69355848,
+                                    682.38473654, 0], atol=1e-6)
+
+    def test_records_match_single_evaluation(self):
+        from DARNprocessing.utils.potential import evaluate, evaluate_records
+        records = [map_record(coefficients=[0, 10.0, 20.0, 30.0]),
+                   map_record(coefficients=[5.0, 0, -20.0, 1.0],
+                              latmin=65.0),
+                   # a map_grd record, not fitted
+                   map_record()]
+        mlat, mlon = np.meshgrid(np.arange(60, 90, 5.0),
+                                 np.arange(0, 360, 30.0))
+        potential, north, east = evaluate_records(records, mlat, mlon)
+        self.assertEqual(potential.shape, (3,) + mlat.shape)
+        expected = evaluate([5.0, 0, -20.0, 1.0], 65.0, mlat, mlon)
+        for result, values in zip((potential, north, east), expected):
+            np.testing.assert_allclose(result[1], values)
+        self.assertTrue(np.isnan(potential[2]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from DARNprocessing.utils.profiling import Profiler
+
+"""
+Unit test suite for the orchestration profiler
+"""
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmp_path, '20170301.n.profile')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_output_files(self):
+        profiler = Profiler(self.prefix)
+        profiler.wrap('grid sas', busy)(100000)
+        with profiler.stage('make_grid'):
+            subprocess.call(['sh', '-c', 'i=0; while [ $i -lt 20000 ]; do'
+                             ' i=$((i+1)); done'])
+        profiler.write()
+
+        self.assertTrue(os.path.isfile(self.prefix + '.prof'))
+        with open(self.prefix + '.collapsed') as collapsed_file:
+            lines = collapsed_file.read().splitlines()
+        self.assertTrue(any('busy (profiling_unittest.py' in line
+                            for line in lines))
+        self.assertTrue(any(line.startswith('stage make_grid;[child processes]')
+                            for line in lines))
+        for line in lines:
+            stack, usec = line.rsplit(' ', 1)
+            self.assertGreater(int(usec), 0)
+
+    def test_nested_stages(self):
+        profiler = Profiler(self.prefix)
+        with profiler.stage('generate_map_files'):
+            with profiler.stage('map_grd'):
+                busy(1000)
+        self.assertEqual([stage[0] for stage in profiler.stages],
+                         ['map_grd', 'generate_map_files'])
+        self.assertEqual(len(profiler.profiles), 1)
+
+    def test_profile_options(self):
+        from DARNprocessing import ConvectionMaps
+        paths = ['-p', self.tmp_path, '-m', self.tmp_path, '-g', self.tmp_path]
+        # --profile is a flag, it does not take the date as its prefix
+        convec_map = ConvectionMaps(['--profile', '20170301'] + paths,
+                                    working_path=self.tmp_path)
+        convec_map.close()
+        self.assertEqual(convec_map.parameter['date'], '20170301')
+        self.assertEqual(convec_map.profiler.output_prefix, self.prefix)
+
+        prefix = os.path.join(self.tmp_path, 'run')
+        convec_map = ConvectionMaps(['20170301', '--profile-prefix', prefix] +
+                                    paths, working_path=self.tmp_path)
+        convec_map.close()
+        self.assertEqual(convec_map.profiler.output_prefix, prefix)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from DARNprocessing.utils.radars import RadarRegistry, RadarKey
+from DARNprocessing.utils.convectionMapConstants import NorthRadar
+
+"""
+Unit test suite for the radar registry
+"""
+
+
+class TestRadarRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = RadarRegistry('north')
+
+    def test_resolve(self):
+        self.assertEqual(self.registry.resolve('/data/20160101.0000.00.ksr.'
+                                               'a.fitacf.bz2'),
+                         RadarKey('ksr', 'a'))
+        self.assertEqual(self.registry.resolve('20160101.0000.00.ksr.fitacf'),
+                         RadarKey('ksr', ''))
+        self.assertEqual(self.registry.resolve('20160101.ksr.fitacf.bz2'),
+                         RadarKey('ksr', ''))
+        # files split by channel, unknown sites and other file types
+        for filename in ('20160101.0000.00.ksr.a.channel.fitacf',
+                         '20160101.0000.00.xyz.fitacf',
+                         '20160101.0000.00.ksr.fit'):
+            self.assertIsNone(self.registry.resolve(filename))
+        self.assertEqual(RadarKey.from_name('ksr.a').name, 'ksr.a')
+        self.assertEqual(RadarKey.from_name('ksr'), RadarKey('ksr', ''))
+
+    def test_group_once(self):
+        files = ['20160101.0200.00.ksr.a.fitacf.bz2',
+                 '20160101.0000.00.ksr.a.fitacf.bz2',
+                 '20160101.0000.00.ksr.fitacf.bz2',
+                 '20160101.0000.00.sas.fitacf.bz2',
+                 '20160101.0000.00.sas.fitacf.bz2',
+                 '20160101.0000.00.ade.d.fitacf.bz2']
+        radars = self.registry.group(files)
+        self.assertEqual([radar.name for radar in radars],
+                         ['ade.d', 'ksr', 'ksr.a', 'sas'])
+        self.assertEqual(radars[RadarKey('ksr', 'a')],
+                         ['20160101.0000.00.ksr.a.fitacf.bz2',
+                          '20160101.0200.00.ksr.a.fitacf.bz2'])
+        self.assertEqual(sum(len(group) for group in radars.values()), 5)
+
+    def test_sites(self):
+        abbreviations = self.registry.abbreviations
+        self.assertEqual(len(abbreviations), len(set(abbreviations)))
+        self.assertEqual(set(abbreviations), set(NorthRadar.RADAR_ABBRV))
+        self.assertTrue(self.registry.sites['ksr'].stereo)
+        self.assertFalse(self.registry.sites['sas'].stereo)
+        self.assertEqual(self.registry.sites['sas'].hemisphere, 'north')
+        self.assertIn('mcm', RadarRegistry('south').abbreviations)
+
+
+if __name__ == '__main__':
+    unittest.main()
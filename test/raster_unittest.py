@@ -0,0 +1,78 @@
+import os
+import zlib
+import struct
+import shutil
+import tempfile
+import unittest
+
+from DARNprocessing.utils.raster import (pnm_to_png,
+                                         read_pnm,
+                                         RasterFormatError,
+                                         PNG_SIGNATURE)
+
+"""
+Unit test suite for the in-process PNG encoding of raster frames
+"""
+
+
+def read_png(filename):
+    """
+    Minimal PNG reader checking the chunk CRCs.
+
+        :return: (IHDR fields, unfiltered rows as bytes)
+    """
+    with open(filename, 'rb') as png:
+        data = png.read()
+    assert data[:8] == PNG_SIGNATURE
+    position = 8
+    chunks = {}
+    while position < len(data):
+        length, = struct.unpack('>I', data[position:position + 4])
+        chunk_type = data[position + 4:position + 8]
+        chunk = data[position + 8:position + 8 + length]
+        crc, = struct.unpack('>I', data[position + 8 + length:
+                                        position + 12 + length])
+        assert crc == zlib.crc32(chunk_type + chunk) & 0xffffffff
+        chunks[chunk_type] = chunks.get(chunk_type, b'') + chunk
+        position += 12 + length
+    header = struct.unpack('>IIBBBBB', chunks[b'IHDR'])
+    return header, zlib.decompress(chunks[b'IDAT'])
+
+
+class TestRaster(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def write(self, name, data):
+        filename = os.path.join(self.tmp_path, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def test_ppm_to_png(self):
+        pixels = bytes(range(2 * 3 * 3))
+        ppm = self.write('frame.ppm', b'P6\n# map_plot\n3 2\n255\n' + pixels)
+        png = os.path.join(self.tmp_path, 'frame.png')
+        pnm_to_png(ppm, png)
+        header, rows = read_png(png)
+        self.assertEqual(header, (3, 2, 8, 2, 0, 0, 0))
+        self.assertEqual(rows, b'\x00' + pixels[:9] + b'\x00' + pixels[9:])
+
+    def test_16_bit_pgm(self):
+        pixels = struct.pack('>4H', 0, 1000, 40000, 65535)
+        pgm = self.write('frame.pgm', b'P5 2 2 65535\n' + pixels)
+        self.assertEqual(read_pnm(pgm), (2, 2, 0, 16, pixels))
+
+    def test_unsupported_images(self):
+        with self.assertRaises(RasterFormatError):
+            read_pnm(self.write('ascii.ppm', b'P3\n1 1\n255\n0 0 0\n'))
+        with self.assertRaises(RasterFormatError):
+            read_pnm(self.write('short.ppm', b'P6\n2 2\n255\n\x00\x00'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,249 @@
+"""
+DmapRecords with the layouts RST writes, shared by the unit test suites:
+fitacf records (fitacf), grid records (make_grid, combine_grid) and map
+records (map_grd, map_addhmb, map_fit). The names, types and order of the
+fields are those of RST; the values are plain defaults the tests override.
+"""
+
+from datetime import datetime, timedelta
+
+from DARNprocessing.utils.dmap import (DmapRecord,
+                                       CHAR,
+                                       SHORT,
+                                       INT,
+                                       FLOAT,
+                                       DOUBLE,
+                                       STRING)
+
+# pulse table of the 8 pulse sequence
+PULSES = [0, 14, 22, 24, 27, 31, 42, 43]
+
+
+def coefficient_layout(order):
+    """
+    :param order: order of the spherical harmonic fit
+    :return: (degrees, orders) of the coefficients of map_fit (N and N+1 of
+             a map record): l^2 for m = 0, l^2 + 2m - 1 for the cosine and
+             the next index, with a negative order, for the sine terms
+    """
+    degrees, orders = [], []
+    for degree in range(order + 1):
+        degrees.append(degree)
+        orders.append(0)
+        for m in range(1, degree + 1):
+            degrees.extend([degree, degree])
+            orders.extend([m, -m])
+    return degrees, orders
+
+
+def fitacf_record(time=datetime(2016, 1, 1), beam=7, channel=0, gates=(),
+                  velocities=None, ground_scatter=None):
+    """
+    :param time: datetime of the record
+    :param beam: beam number
+    :param channel: channel, 0 mono, 1 A, 2 B of a stereo radar
+    :param gates: range gates with a fit (slist), the range arrays are left
+                  out without any like fitacf does
+    :param velocities: velocity of every gate, default 100 m/s
+    :param ground_scatter: ground scatter flag of every gate, default 0
+    :return: DmapRecord of a fitacf file
+    """
+    record = DmapRecord()
+    record.set_scalar('radar.revision.major', 1, CHAR)
+    record.set_scalar('radar.revision.minor', 18, CHAR)
+    record.set_scalar('origin.code', 0, CHAR)
+    record.set_scalar('origin.time', time.strftime('%a %b %d %H:%M:%S %Y'),
+                      STRING)
+    record.set_scalar('origin.command', 'make_fit -fitacf-version 2.5',
+                      STRING)
+    record.set_scalar('cp', 153, SHORT)
+    record.set_scalar('stid', 5, SHORT)
+    for name, value in zip(['time.yr', 'time.mo', 'time.dy', 'time.hr',
+                            'time.mt', 'time.sc'],
+                           [time.year, time.month, time.day, time.hour,
+                            time.minute, time.second]):
+        record.set_scalar(name, value, SHORT)
+    record.set_scalar('time.us', time.microsecond, INT)
+    for name in ('txpow', 'nave', 'atten', 'lagfr', 'smsep', 'ercod',
+                 'stat.agc', 'stat.lopwr'):
+        record.set_scalar(name, 0, SHORT)
+    record.set_scalar('noise.search', 0.0, FLOAT)
+    record.set_scalar('noise.mean', 0.0, FLOAT)
+    record.set_scalar('channel', channel, SHORT)
+    record.set_scalar('bmnum', beam, SHORT)
+    record.set_scalar('bmazm', 0.0, FLOAT)
+    record.set_scalar('scan', 0, SHORT)
+    record.set_scalar('offset', 0, SHORT)
+    record.set_scalar('rxrise', 100, SHORT)
+    record.set_scalar('intt.sc', 3, SHORT)
+    record.set_scalar('intt.us', 0, INT)
+    record.set_scalar('txpl', 300, SHORT)
+    record.set_scalar('mpinc', 1500, SHORT)
+    record.set_scalar('mppul', len(PULSES), SHORT)
+    record.set_scalar('mplgs', 23, SHORT)
+    record.set_scalar('nrang', 75, SHORT)
+    record.set_scalar('frang', 180, SHORT)
+    record.set_scalar('rsep', 45, SHORT)
+    record.set_scalar('xcf', 0, SHORT)
+    record.set_scalar('tfreq', 10500, SHORT)
+    record.set_scalar('mxpwr', 0, INT)
+    record.set_scalar('lvmax', 20000, INT)
+    record.set_scalar('fitacf.revision.major', 2, INT)
+    record.set_scalar('fitacf.revision.minor', 5, INT)
+    record.set_scalar('combf', 'test', STRING)
+    for name in ('noise.sky', 'noise.lag0', 'noise.vel'):
+        record.set_scalar(name, 0.0, FLOAT)
+
+    record.set_array('ptab', PULSES, SHORT)
+    # pulse pairs of the lags
+    lags = [(first, second) for first in range(len(PULSES))
+            for second in range(first, len(PULSES))][:24]
+    record.set_array('ltab', [pulse for lag in lags for pulse in lag], SHORT,
+                     shape=(len(lags), 2))
+    record.set_array('pwr0', [0.0] * 75, FLOAT)
+    if len(gates):
+        count = len(gates)
+        record.set_array('slist', gates, SHORT)
+        record.set_array('nlag', [23] * count, SHORT)
+        record.set_array('qflg', [1] * count, CHAR)
+        record.set_array('gflg', [0] * count if ground_scatter is None
+                         else ground_scatter, CHAR)
+        for name in ('p_l', 'p_l_e', 'p_s', 'p_s_e'):
+            record.set_array(name, [10.0] * count, FLOAT)
+        record.set_array('v', [100.0] * count if velocities is None
+                         else velocities, FLOAT)
+        for name in ('v_e', 'w_l', 'w_l_e', 'w_s', 'w_s_e', 'sd_l', 'sd_s',
+                     'sd_phi'):
+            record.set_array(name, [10.0] * count, FLOAT)
+    return record
+
+
+def _set_times(record, time, duration):
+    for prefix, prefix_time in (('start', time),
+                                ('end', time + timedelta(seconds=duration))):
+        record.set_scalar(prefix + '.year', prefix_time.year, SHORT)
+        record.set_scalar(prefix + '.month', prefix_time.month, SHORT)
+        record.set_scalar(prefix + '.day', prefix_time.day, SHORT)
+        record.set_scalar(prefix + '.hour', prefix_time.hour, SHORT)
+        record.set_scalar(prefix + '.minute', prefix_time.minute, SHORT)
+        record.set_scalar(prefix + '.second', prefix_time.second +
+                          prefix_time.microsecond / 1e6, DOUBLE)
+
+
+def _set_grid_arrays(record, stid, vectors, velocities, mlons):
+    # one station, combine_grid concatenates the arrays of the stations
+    record.set_array('stid', [stid], SHORT)
+    record.set_array('channel', [0], SHORT)
+    record.set_array('nvec', [len(vectors)], SHORT)
+    record.set_array('freq', [10500.0], FLOAT)
+    record.set_array('major.revision', [2], SHORT)
+    record.set_array('minor.revision', [0], SHORT)
+    record.set_array('program.id', [1], SHORT)
+    record.set_array('noise.mean', [0.0], FLOAT)
+    record.set_array('noise.sd', [0.0], FLOAT)
+    record.set_array('gsct', [1], SHORT)
+    for name, value in (('v.min', 35.0), ('v.max', 2000.0), ('p.min', 3.0),
+                        ('p.max', 50.0), ('w.min', 10.0), ('w.max', 1000.0),
+                        ('ve.min', 0.0), ('ve.max', 200.0)):
+        record.set_array(name, [value], FLOAT)
+    # the vector arrays are left out of a record without vectors
+    if len(vectors):
+        count = len(vectors)
+        record.set_array('vector.mlat', vectors, FLOAT)
+        record.set_array('vector.mlon', [0.0] * count if mlons is None
+                         else mlons, FLOAT)
+        record.set_array('vector.kvect', [0.0] * count, FLOAT)
+        record.set_array('vector.stid', [stid] * count, SHORT)
+        record.set_array('vector.channel', [0] * count, SHORT)
+        record.set_array('vector.index', list(range(count)), INT)
+        record.set_array('vector.vel.median', [100.0] * count
+                         if velocities is None else velocities, FLOAT)
+        record.set_array('vector.vel.sd', [10.0] * count, FLOAT)
+
+
+def grid_record(time=datetime(2017, 3, 1), stid=5, vectors=(),
+                velocities=None, mlons=None, duration=120):
+    """
+    :param time: datetime of the start of the record
+    :param stid: station id of the radar
+    :param vectors: magnetic latitudes of the vectors of the radar
+    :param velocities: median velocity of every vector, default 100 m/s
+    :param mlons: magnetic longitude of every vector, default 0
+    :param duration: seconds of the record
+    :return: DmapRecord of a grid file of one radar
+    """
+    record = DmapRecord()
+    _set_times(record, time, duration)
+    _set_grid_arrays(record, stid, vectors, velocities, mlons)
+    return record
+
+
+def map_record(time=datetime(2016, 1, 1), coefficients=None, vectors=(),
+               velocities=None, mlons=None, latmin=60.0, hemisphere=1,
+               mlt_av=0.0, potential_drop=0.0, duration=120, stid=5):
+    """
+    :param time: datetime of the start of the record
+    :param coefficients: fit coefficients (N+2), (order + 1)^2 of them in
+                         the layout of coefficient_layout; None for a
+                         record that was not fitted (map_grd)
+    :param vectors: magnetic latitudes of the gridded vectors
+    :param velocities: median velocity of every vector, default 100 m/s
+    :param mlons: magnetic longitude of every vector, default 0
+    :param latmin: latitude of the Heppner-Maynard boundary at midnight
+    :param hemisphere: 1 north, -1 south
+    :param mlt_av: magnetic local time of magnetic longitude 0
+    :param potential_drop: cross polar cap potential in V
+    :param duration: seconds of the record
+    :param stid: station id of the radar of the vectors
+    :return: DmapRecord of a map file
+    :raise ValueError: the number of coefficients is not a square
+    """
+    order = 0
+    if coefficients is not None:
+        order = int(round(len(coefficients) ** 0.5)) - 1
+        if (order + 1) ** 2 != len(coefficients):
+            raise ValueError("{} coefficients are not a fit of an order"
+                             "".format(len(coefficients)))
+
+    record = DmapRecord()
+    _set_times(record, time, duration)
+    record.set_scalar('map.major.revision', 2, SHORT)
+    record.set_scalar('map.minor.revision', 0, SHORT)
+    record.set_scalar('source', 'map_fit' if coefficients is not None
+                      else 'map_grd', STRING)
+    record.set_scalar('doping.level', 1, SHORT)
+    record.set_scalar('model.wt', 1, SHORT)
+    record.set_scalar('error.wt', 1, SHORT)
+    record.set_scalar('IMF.flag', 0, SHORT)
+    record.set_scalar('IMF.delay', 0, SHORT)
+    for name in ('IMF.Bx', 'IMF.By', 'IMF.Bz'):
+        record.set_scalar(name, 0.0, DOUBLE)
+    record.set_scalar('model.angle', 'Null', STRING)
+    record.set_scalar('model.level', 'Null', STRING)
+    record.set_scalar('model.tilt', 'Null', STRING)
+    record.set_scalar('model.name', 'Null', STRING)
+    record.set_scalar('hemisphere', hemisphere, SHORT)
+    record.set_scalar('fit.order', order, SHORT)
+    record.set_scalar('latmin', latmin, FLOAT)
+    for name in ('chi.sqr', 'chi.sqr.dat', 'rms.err'):
+        record.set_scalar(name, 0.0, DOUBLE)
+    record.set_scalar('lon.shft', 0.0, FLOAT)
+    record.set_scalar('lat.shft', 0.0, FLOAT)
+    record.set_scalar('mlt.start', mlt_av, DOUBLE)
+    record.set_scalar('mlt.end', mlt_av, DOUBLE)
+    record.set_scalar('mlt.av', mlt_av, DOUBLE)
+    record.set_scalar('pot.drop', potential_drop, DOUBLE)
+    record.set_scalar('pot.drop.err', 0.0, DOUBLE)
+    record.set_scalar('pot.max', potential_drop / 2, DOUBLE)
+    record.set_scalar('pot.max.err', 0.0, DOUBLE)
+    record.set_scalar('pot.min', -potential_drop / 2, DOUBLE)
+    record.set_scalar('pot.min.err', 0.0, DOUBLE)
+
+    _set_grid_arrays(record, stid, vectors, velocities, mlons)
+    if coefficients is not None:
+        degrees, orders = coefficient_layout(order)
+        record.set_array('N', degrees, DOUBLE)
+        record.set_array('N+1', orders, DOUBLE)
+        record.set_array('N+2', coefficients, DOUBLE)
+        record.set_array('N+3', [1.0] * len(coefficients), DOUBLE)
+    return record
@@ -0,0 +1,71 @@
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+import threading
+
+from DARNprocessing.utils import runlog
+
+"""
+Unit test suite for the queue based run logging
+"""
+
+logger = logging.getLogger('DARNprocessing.test')
+
+
+class TestRunLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def read_log(self, logfile):
+        with open(logfile) as log:
+            return log.read().splitlines()
+
+    def test_runs_get_their_own_log_file(self):
+        logfiles = {}
+        for run_id, date in (('a', '20170301'), ('b', '20170302')):
+            logfiles[run_id] = os.path.join(self.tmp_path, run_id + '.log')
+            runlog.register_run(run_id, logfiles[run_id])
+
+        def task(run_id, date, radar):
+            with runlog.log_context(run=run_id, date=date, radar=radar,
+                                    stage='make_grid'):
+                for i in range(50):
+                    logger.info("line {}".format(i))
+
+        threads = [threading.Thread(target=task, args=args)
+                   for args in (('a', '20170301', 'sas'),
+                                ('b', '20170302', 'inv'))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        runlog.unregister_run('a')
+        runlog.unregister_run('b')
+
+        lines = self.read_log(logfiles['a'])
+        self.assertEqual(len(lines), 50)
+        self.assertTrue(all('[20170301 - sas make_grid]' in line
+                            for line in lines))
+        lines = self.read_log(logfiles['b'])
+        self.assertEqual(len(lines), 50)
+        self.assertTrue(all('[20170302 - inv make_grid]' in line
+                            for line in lines))
+
+    def test_radar_status(self):
+        status = runlog.RadarStatus()
+        with runlog.log_context(radar='sas'):
+            status.add(status.USED, '20170301.sas.fitacf')
+        status.add(status.ERRORS, '20170301.inv.fitacf', 'empty grid file')
+        self.assertEqual(status.records(status.USED)[0]['radar'], 'sas')
+        self.assertEqual(status.summary(status.ERRORS).splitlines()[1],
+                         '20170301.inv.fitacf (empty grid file)')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import time
+import threading
+import unittest
+
+from DARNprocessing.utils.scheduler import Scheduler, Task, CPU, IO
+
+"""
+Unit test suite for the dependency aware task scheduler
+"""
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_dependencies_run_first(self):
+        order = []
+        scheduler = Scheduler(cpu_slots=4)
+        first = scheduler.add_task('first', order.append, ('first',))
+        second = scheduler.add_task('second', order.append, ('second',),
+                                    dependencies=[first])
+        scheduler.add_task('third', order.append, ('third',),
+                           dependencies=[second])
+        scheduler.run()
+        self.assertEqual(order, ['first', 'second', 'third'])
+
+    def test_slot_limits(self):
+        lock = threading.Lock()
+        running = {CPU: 0, IO: 0}
+        highest = {CPU: 0, IO: 0}
+
+        def work(resource):
+            with lock:
+                running[resource] += 1
+                highest[resource] = max(highest[resource], running[resource])
+            time.sleep(0.05)
+            with lock:
+                running[resource] -= 1
+
+        scheduler = Scheduler(cpu_slots=2, io_slots=1)
+        for i in range(6):
+            scheduler.add_task('cpu {}'.format(i), work, (CPU,))
+            scheduler.add_task('io {}'.format(i), work, (IO,), resource=IO)
+        scheduler.run()
+        self.assertEqual(highest[CPU], 2)
+        self.assertEqual(highest[IO], 1)
+
+    def test_tasks_taking_several_slots(self):
+        lock = threading.Lock()
+        used = [0]
+        highest = [0]
+
+        def work(slots):
+            with lock:
+                used[0] += slots
+                highest[0] = max(highest[0], used[0])
+            time.sleep(0.02)
+            with lock:
+                used[0] -= slots
+
+        scheduler = Scheduler(cpu_slots=3)
+        for i in range(4):
+            scheduler.add_task('decompress {}'.format(i), work, (2,),
+                               slots=2)
+            scheduler.add_task('grid {}'.format(i), work, (1,))
+        # more than the scheduler has is capped
+        large = scheduler.add_task('large', work, (3,), slots=8)
+        scheduler.run()
+        self.assertEqual(large.slots, 3)
+        self.assertEqual(highest[0], 3)
+
+    def test_task_taking_several_slots_is_not_starved(self):
+        order = []
+
+        def work(name):
+            order.append(name)
+            time.sleep(0.02)
+
+        scheduler = Scheduler(cpu_slots=2)
+        scheduler.add_task('first', work, ('first',))
+        scheduler.add_task('large', work, ('large',), slots=2)
+        for i in range(6):
+            scheduler.add_task('small {}'.format(i), work,
+                               ('small {}'.format(i),))
+        scheduler.run()
+        # the small tasks wait for the slots held for the large one
+        self.assertEqual(order[:2], ['first', 'large'])
+
+    def test_failure_skips_dependents(self):
+        def fail():
+            raise RuntimeError("make_grid failed")
+
+        done = []
+        scheduler = Scheduler()
+        failing = scheduler.add_task('failing', fail)
+        dependent = scheduler.add_task('dependent', done.append, (1,),
+                                       dependencies=[failing])
+        independent = scheduler.add_task('independent', done.append, (2,))
+        with self.assertRaises(RuntimeError):
+            scheduler.run()
+        self.assertEqual(dependent.state, Task.SKIPPED)
+        self.assertEqual(independent.state, Task.DONE)
+        self.assertEqual(done, [2])
+
+    def test_tasks_added_while_running(self):
+        frames = []
+        scheduler = Scheduler(cpu_slots=2)
+
+        def plot():
+            for frame in range(3):
+                scheduler.add_task('convert {}'.format(frame),
+                                   frames.append, (frame,))
+
+        scheduler.add_task('map_plot', plot)
+        scheduler.run()
+        self.assertEqual(sorted(frames), [0, 1, 2])
+
+    def test_critical_path(self):
+        scheduler = Scheduler(cpu_slots=2)
+        slow = scheduler.add_task('slow', time.sleep, (0.1,))
+        fast = scheduler.add_task('fast', time.sleep, (0.01,))
+        scheduler.add_task('combine', time.sleep, (0.01,),
+                           dependencies=[slow, fast])
+        scheduler.run()
+        self.assertEqual([task.name for task in scheduler.critical_path()],
+                         ['slow', 'combine'])
+        self.assertIn('Critical path', scheduler.report())
+
+    def test_duplicate_name(self):
+        scheduler = Scheduler()
+        scheduler.add_task('grid sas', time.sleep, (0,))
+        with self.assertRaises(ValueError):
+            scheduler.add_task('grid sas', time.sleep, (0,))
+
+
+if __name__ == '__main__':
+    unittest.main()
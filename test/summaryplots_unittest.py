@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime
+from unittest import mock
+
+try:
+    import numpy as np
+    import matplotlib
+except ImportError:
+    np = None
+
+from test.records import fitacf_record
+
+"""
+Unit test suite for the RTI summary plots
+"""
+
+
+@unittest.skipIf(np is None, "numpy or matplotlib is not installed")
+class TestRti(unittest.TestCase):
+
+    def setUp(self):
+        # two records per pixel column of a 6 column, one hour grid
+        self.records = [
+            fitacf_record(datetime(2016, 1, 1, 0, minute), gates=gates,
+                          velocities=velocities, ground_scatter=ground_scatter)
+            for minute, gates, velocities, ground_scatter in (
+                (0, [1, 2], [100.0, 300.0], [0, 1]),
+                (5, [1, 4], [300.0, -50.0], [0, 0]),
+                (50, [0], [20.0], [1]))]
+
+    def decimate(self, **options):
+        from DARNprocessing.plotting_scripts.summaryplots import decimate
+        return decimate(self.records, 'velocity', datetime(2016, 1, 1),
+                        datetime(2016, 1, 1, 1), 6, **options)
+
+    def test_mean(self):
+        grid = self.decimate()
+        self.assertEqual(grid.values.shape, (6, 5))
+        self.assertEqual(grid.values[0, 1], 200.0)
+        self.assertEqual(grid.values[0, 4], -50.0)
+        self.assertTrue(np.isnan(grid.values[1]).all())
+        self.assertTrue(grid.ground_scatter[0, 2])
+        self.assertTrue(grid.ground_scatter[5, 0])
+        self.assertFalse(grid.ground_scatter[0, 1])
+
+    def test_max_without_ground_scatter(self):
+        grid = self.decimate(decimation='max', ground_scatter=False)
+        self.assertEqual(grid.values[0, 1], 300.0)
+        self.assertTrue(np.isnan(grid.values[0, 2]))
+        self.assertFalse(grid.ground_scatter.any())
+
+    def test_image(self):
+        from DARNprocessing.plotting_scripts.summaryplots import rti_image
+        image = rti_image(self.decimate(), 'velocity')
+        self.assertEqual(image.shape, (5, 6, 4))
+        # empty pixels are transparent
+        self.assertEqual(image[3, 0, 3], 0)
+        self.assertEqual(image[1, 0, 3], 1)
+
+    def test_plot_has_a_column_per_pixel_of_the_axes(self):
+        from DARNprocessing.plotting_scripts import summaryplots
+        tmp_path = tempfile.mkdtemp()
+        try:
+            with mock.patch.object(summaryplots, 'beam_records',
+                                   return_value=self.records), \
+                    mock.patch.object(summaryplots, 'decimate',
+                                      wraps=summaryplots.decimate) as decimate:
+                summaryplots.plot_rti([], os.path.join(tmp_path, 'rti.png'),
+                                      'sas', 7, datetime(2016, 1, 1),
+                                      duration=1, figure_size=(12, 5),
+                                      dpi=100)
+            self.assertTrue(os.path.exists(os.path.join(tmp_path, 'rti.png')))
+        finally:
+            shutil.rmtree(tmp_path)
+        columns = decimate.call_args[0][4]
+        # the margins and the colour bar are not part of the grid
+        self.assertLess(columns, 1000)
+        self.assertGreater(columns, 600)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import bz2
+import shutil
+import tempfile
+import unittest
+
+from DARNprocessing.utils.dmap import DmapFormatError, encode_record
+from DARNprocessing.utils.validate import validate_dmap, Quarantine
+
+from test.records import fitacf_record
+
+"""
+Unit test suite for the dmap validator and the quarantine
+"""
+
+
+class TestValidate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.data = b''.join(encode_record(fitacf_record(beam=beam,
+                                                           gates=[0, 1]))
+                             for beam in range(3))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def write(self, name, data):
+        filename = os.path.join(self.tmp_path, name)
+        opener = bz2.open if name.endswith('.bz2') else open
+        with opener(filename, 'wb') as dmap_file:
+            dmap_file.write(data)
+        return filename
+
+    def test_valid_files(self):
+        self.assertEqual(validate_dmap(self.write('rkn.fitacf', self.data)), 3)
+        self.assertEqual(validate_dmap(self.write('rkn.fitacf.bz2',
+                                                  self.data)), 3)
+
+    def test_truncated_files(self):
+        for name in ('rkn.fitacf', 'rkn.fitacf.bz2'):
+            filename = self.write(name, self.data[:-5])
+            with self.assertRaisesRegex(DmapFormatError, 'truncated'):
+                validate_dmap(filename)
+        filename = self.write('header.fitacf', self.data + b'\x01\x00')
+        with self.assertRaisesRegex(DmapFormatError, 'Truncated record header'):
+            validate_dmap(filename)
+
+    def test_bad_size_and_empty(self):
+        data = bytearray(self.data)
+        # size of the first record smaller than a header
+        data[4:8] = (8).to_bytes(4, 'little')
+        with self.assertRaisesRegex(DmapFormatError, 'Bad record size'):
+            validate_dmap(self.write('size.fitacf', bytes(data)))
+        with self.assertRaisesRegex(DmapFormatError, 'No records'):
+            validate_dmap(self.write('empty.fitacf.bz2', b''))
+
+    def test_quarantine(self):
+        filename = self.write('rkn.fitacf.bz2', self.data[:-5])
+        quarantine_path = os.path.join(self.tmp_path, 'quarantine.json')
+        Quarantine(quarantine_path).add(filename, 'truncated')
+        quarantine = Quarantine(quarantine_path)
+        self.assertEqual(quarantine.reason(filename), 'truncated')
+        # downloaded again
+        self.write('rkn.fitacf.bz2', self.data)
+        os.utime(filename, (0, 0))
+        self.assertIsNone(quarantine.reason(filename))
+        quarantine.release(filename)
+        self.assertEqual(Quarantine(quarantine_path).files, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+
+from DARNprocessing.utils.workqueue import (WorkQueue,
+                                            run_worker,
+                                            DONE,
+                                            FAILED,
+                                            PENDING,
+                                            RUNNING)
+
+"""
+Unit test suite for the work queue distributing convection map runs
+"""
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_path, 'queue.db')
+        self.queue = WorkQueue(self.db_path, lease_time=60, max_attempts=2)
+        for date in ('20170301', '20170302', '20170303'):
+            self.queue.enqueue(date, 'north', {'integration_time': 120})
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmp_path)
+
+    def test_duplicate_tasks(self):
+        self.assertFalse(self.queue.enqueue('20170301', 'north',
+                                            {'integration_time': 120}))
+        self.assertTrue(self.queue.enqueue('20170301', 'south',
+                                           {'integration_time': 120}))
+
+    def test_tasks_are_claimed_once(self):
+        claimed = []
+        lock = threading.Lock()
+
+        def claim(worker):
+            queue = WorkQueue(self.db_path)
+            while True:
+                task = queue.claim(worker)
+                if task is None:
+                    break
+                with lock:
+                    claimed.append(task['date'])
+            queue.close()
+
+        threads = [threading.Thread(target=claim, args=('w{}'.format(i),))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed), ['20170301', '20170302', '20170303'])
+
+    def test_expired_lease_is_claimed_again(self):
+        queue = WorkQueue(self.db_path, lease_time=0.1)
+        task = queue.claim('crashed')
+        time.sleep(0.2)
+        claims = [self.queue.claim('node2') for i in range(3)]
+        self.assertIn(task['id'], [claim['id'] for claim in claims])
+        # the crashed worker can no longer record its task
+        self.assertFalse(queue.complete(task['id'], 'crashed'))
+        queue.close()
+
+    def test_heartbeat_keeps_the_lease(self):
+        queue = WorkQueue(self.db_path, lease_time=0.3)
+        task = queue.claim('node1')
+        for i in range(3):
+            time.sleep(0.15)
+            self.assertTrue(queue.heartbeat(task['id'], 'node1'))
+        self.assertNotEqual(self.queue.claim('node2')['id'], task['id'])
+        queue.close()
+
+    def test_run_worker(self):
+        def run_task(task):
+            if task['date'] == '20170302':
+                raise ValueError("no grid files")
+
+        self.assertEqual(run_worker(self.queue, run_task, 'node1',
+                                    heartbeat_interval=0.05), 4)
+        status = self.queue.status()
+        self.assertEqual(status['counts'], {PENDING: 0, RUNNING: 0,
+                                            DONE: 2, FAILED: 1})
+        self.assertEqual(status['errors'],
+                         [('20170302', 'north', 'no grid files')])
+        self.assertGreater(status['throughput'], 0)
+        self.assertEqual(self.queue.retry_failed(), 1)
+
+    def test_task_is_stopped_when_the_lease_is_lost(self):
+        marker = os.path.join(self.tmp_path, 'finished')
+
+        def run_task(task):
+            time.sleep(30)
+            open(marker, 'w').close()
+
+        def steal():
+            # the lease expires before the first heartbeat
+            time.sleep(0.3)
+            queue = WorkQueue(self.db_path)
+            claimed.append(queue.claim('node2'))
+            queue.close()
+
+        claimed = []
+        thief = threading.Thread(target=steal)
+        thief.start()
+        queue = WorkQueue(self.db_path, lease_time=0.2)
+        start = time.time()
+        self.assertEqual(run_worker(queue, run_task, 'node1',
+                                    heartbeat_interval=0.5, max_tasks=1), 1)
+        thief.join()
+        queue.close()
+        self.assertLess(time.time() - start, 10)
+        self.assertFalse(os.path.exists(marker))
+        self.assertEqual(claimed[0]['date'], '20170301')
+        workers = self.queue.status()['workers']
+        self.assertEqual(list(workers), ['node2'])
+
+
+if __name__ == '__main__':
+    unittest.main()